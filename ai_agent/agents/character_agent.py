@@ -3,19 +3,70 @@
 每个角色有独特的个性、对话风格和记忆系统
 """
 
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Tuple, AsyncGenerator
 from datetime import datetime
 import json
 import re
 import asyncio
-from openai import OpenAI
 from config import Config, CHARACTER_CONFIGS
-from tools.web_search import web_search_tool, should_use_web_search
+from tools.web_search import web_search_tool
+from memory.session_store import SessionState
+from services.llm_gateway import llm_gateway
+from services.concurrency_limiter import UpstreamOverloadedError
+from services.trigger_detector import trigger_detector, MEMORY_CATEGORIES
+from agents.prompt_assembler import (
+    AssembledPrompt, PromptSection, MESSAGE_OVERHEAD_TOKENS, prompt_assembler
+)
+from agents.prompt_templates import PromptTemplate, prompt_templates
+from prompts.structured_reply_prompts import (
+    STRUCTURED_REPLY_INSTRUCTION, STRUCTURED_ROUTE_TYPES, STRUCTURED_EMOTIONS
+)
+
+
+def parse_structured_reply(content: str) -> Dict[str, str]:
+    """
+    解析单次结构化回复的JSON输出
+    
+    Args:
+        content: LLM返回的文本
+        
+    Returns:
+        {route, analysis, emotion, reply}；字段缺失或取值不合法时使用默认值，
+        无法解析为JSON时把整段文本作为回复
+    """
+    data = None
+    try:
+        data = json.loads(content)
+    except (json.JSONDecodeError, TypeError):
+        # 模型偶尔在JSON前后附带说明文字，取第一个完整的JSON对象
+        match = re.search(r"\{.*\}", content or "", re.S)
+        if match:
+            try:
+                data = json.loads(match.group(0))
+            except json.JSONDecodeError:
+                data = None
+    if not isinstance(data, dict):
+        data = {"reply": (content or "").strip()}
+    
+    route = data.get("route")
+    emotion = data.get("emotion")
+    return {
+        "route": route if route in STRUCTURED_ROUTE_TYPES else "general-query",
+        "analysis": str(data.get("analysis") or ""),
+        "emotion": emotion if emotion in STRUCTURED_EMOTIONS else "neutral",
+        "reply": str(data.get("reply") or "").strip()
+    }
 
 
 class CharacterAgent:
     """角色代理基类"""
     
+    # 结构化回复中route、analysis、emotion等字段额外占用的token预算
+    STRUCTURED_FIELD_TOKENS = 120
+    
+    # 初始化时预编译静态前缀的聊天类型（detect_chat_type的全部取值）
+    CHAT_TYPES = ("greeting", "casual", "emotional_support", "problem_solving", "real_time_info", "document_related")
+    
     def __init__(self, character_id: str):
         """
         初始化角色代理
@@ -28,55 +79,139 @@ class CharacterAgent:
             
         self.character_id = character_id
         self.config = CHARACTER_CONFIGS[character_id]
-        self.client = OpenAI(
-            api_key=Config.DASHSCOPE_API_KEY,
-            base_url=Config.DASHSCOPE_BASE_URL
+        
+        # 默认会话状态（未传入会话时使用，兼容直接调用代理的脚本）
+        # 代理本身是进程级共享的，多用户场景必须传入各自的SessionState
+        self.default_session = SessionState(
+            user_id="default",
+            character_id=character_id,
+            thread_id="default"
         )
         
-        # 角色状态
-        self.conversation_history: List[Dict[str, Any]] = []
-        self.context_memory: Dict[str, Any] = {}
-        self.emotional_state = "neutral"  # 情绪状态
+        # 预编译各聊天类型的静态前缀，首轮对话不再拼接角色设定和回复指导
+        for chat_type in self.CHAT_TYPES:
+            self.prompt_template(chat_type)
+    
+    @property
+    def conversation_history(self) -> List[Dict[str, Any]]:
+        """默认会话的对话历史"""
+        return self.default_session.conversation_history
+    
+    @conversation_history.setter
+    def conversation_history(self, value: List[Dict[str, Any]]):
+        self.default_session.conversation_history = value
+    
+    @property
+    def context_memory(self) -> Dict[str, Any]:
+        """默认会话的上下文记忆"""
+        return self.default_session.context_memory
+    
+    @property
+    def emotional_state(self) -> str:
+        """默认会话的情绪状态"""
+        return self.default_session.emotional_state
         
-    def get_system_prompt(self, user_context: Optional[Dict] = None, chat_analysis: Optional[Dict] = None) -> str:
+    def get_system_prompt(
+        self, 
+        user_context: Optional[Dict] = None, 
+        chat_analysis: Optional[Dict] = None,
+        session: Optional[SessionState] = None,
+        instruction: str = ""
+    ) -> str:
         """
-        获取角色的系统提示词
+        获取角色的系统提示词（按token预算裁剪）
         
         Args:
             user_context: 用户上下文信息
+            chat_analysis: 聊天类型分析结果
+            session: 会话状态（为空时使用默认会话）
+            instruction: 追加在静态前缀末尾的输出要求
             
         Returns:
             系统提示词
         """
-        base_prompt = self.config["system_prompt"]
+        sections = self.build_prompt_sections(
+            user_context, chat_analysis, session or self.default_session, instruction
+        )
+        assembled = prompt_assembler.assemble(sections)
+        self._record_prefix_usage(assembled)
+        return self._render_sections(sections, assembled)
+    
+    def prompt_template(self, chat_type: str = "", instruction: str = "") -> PromptTemplate:
+        """
+        获取 (角色, 聊天类型) 的静态前缀模板：角色设定 + 回复指导 + 输出要求
+        
+        Args:
+            chat_type: 聊天类型（为空时不带回复指导）
+            instruction: 输出要求
+            
+        Returns:
+            编译后的静态前缀模板
+        """
+        return prompt_templates.get(
+            self.character_id,
+            chat_type,
+            lambda: self.config["system_prompt"] + self._reply_guidance(chat_type),
+            instruction
+        )
+    
+    def build_prompt_sections(
+        self, 
+        user_context: Optional[Dict], 
+        chat_analysis: Optional[Dict],
+        session: SessionState,
+        instruction: str = ""
+    ) -> List[PromptSection]:
+        """
+        按在系统提示词中的先后顺序构建各段落：
+        静态前缀（角色设定、回复指导、输出要求）、联网搜索、文档参考、上下文信息、CoT分析、重要记忆
+        
+        静态前缀放在最前面且逐字节不变，供应商侧的提示词前缀缓存才能命中
+        
+        Args:
+            user_context: 用户上下文信息
+            chat_analysis: 聊天类型分析结果
+            session: 会话状态
+            instruction: 追加在静态前缀末尾的输出要求
+            
+        Returns:
+            提示词段落列表
+        """
+        user_context = user_context or {}
+        template = self.prompt_template(chat_analysis["type"] if chat_analysis else "", instruction)
+        sections = [PromptSection("prefix", [template.prefix], required=True)]
         
         # 如果有联网搜索结果，添加实时信息
-        if user_context and "web_search_result" in user_context:
-            search_result = user_context["web_search_result"]
-            if search_result and search_result.get("status") == "success" and search_result.get("results"):
-                web_info = "\n\n【🔍 最新实时信息】\n"
-                web_info += f"基于联网搜索「{search_result.get('query', '')}」的最新结果，请结合以下信息回答：\n\n"
-                web_info += search_result.get("summary", "")
-                web_info += "\n\n重要提示：请仅使用上述搜索信息的内容来回答用户问题，但不要在回复中包含任何链接、URL或「📎 信息来源」部分。只需要基于这些信息给出自然的回答即可。\n"
-                base_prompt += web_info
-            elif search_result and search_result.get("status") == "error":
-                web_info = "\n\n【搜索提示】\n"
-                web_info += f"联网搜索暂时不可用：{search_result.get('summary', '未知错误')}。请基于已有知识回答，并告知用户当前无法获取最新信息。\n"
-                base_prompt += web_info
-        
-        # 如果有RAG搜索结果，添加相关文档信息
-        if user_context and "rag_result" in user_context:
-            rag_result = user_context["rag_result"]
-            if hasattr(rag_result, 'relevant_contexts') and rag_result.relevant_contexts:
-                document_info = "\n\n【📚 文档参考信息】\n"
-                document_info += "基于用户上传的文档，以下是相关内容，请优先使用这些信息回答用户问题：\n\n"
-                
-                for i, ctx in enumerate(rag_result.relevant_contexts):
-                    source_type = "上传文档" if ctx["source"] == "character_document" else "知识库"
-                    document_info += f"{i+1}. 【{source_type}】{ctx['content'][:200]}...\n\n"
-                
-                document_info += "请根据以上信息准确回答用户问题，不要编造或臆测。如果上述信息中没有相关内容，可以说明没有找到相关信息。\n"
-                base_prompt += document_info
+        search_result = user_context.get("web_search_result")
+        if search_result and search_result.get("status") == "success" and search_result.get("results"):
+            sections.append(PromptSection(
+                "search",
+                [search_result.get("summary", "")],
+                header="\n\n【🔍 最新实时信息】\n"
+                       f"基于联网搜索「{search_result.get('query', '')}」的最新结果，请结合以下信息回答：\n\n",
+                footer="\n\n重要提示：请仅使用上述搜索信息的内容来回答用户问题，但不要在回复中包含任何链接、URL或「📎 信息来源」部分。只需要基于这些信息给出自然的回答即可。\n",
+                truncatable=True
+            ))
+        elif search_result and search_result.get("status") == "error":
+            sections.append(PromptSection(
+                "search",
+                [f"联网搜索暂时不可用：{search_result.get('summary', '未知错误')}。请基于已有知识回答，并告知用户当前无法获取最新信息。\n"],
+                header="\n\n【搜索提示】\n"
+            ))
+        
+        # 如果有RAG搜索结果，添加相关文档信息（按相关度排序，预算不足时丢弃靠后的片段）
+        rag_result = user_context.get("rag_result")
+        if hasattr(rag_result, 'relevant_contexts') and rag_result.relevant_contexts:
+            document_items = []
+            for i, ctx in enumerate(rag_result.relevant_contexts):
+                source_type = "上传文档" if ctx["source"] == "character_document" else "知识库"
+                document_items.append(f"{i+1}. 【{source_type}】{ctx['content'][:200]}...\n\n")
+            sections.append(PromptSection(
+                "rag",
+                document_items,
+                header="\n\n【📚 文档参考信息】\n基于用户上传的文档，以下是相关内容，请优先使用这些信息回答用户问题：\n\n",
+                footer="请根据以上信息准确回答用户问题，不要编造或臆测。如果上述信息中没有相关内容，可以说明没有找到相关信息。\n"
+            ))
         
         # 添加上下文信息
         if user_context:
@@ -87,45 +222,75 @@ class CharacterAgent:
                 context_info += f"- 用户位置：{user_context['location']}\n"
             if "mood" in user_context:
                 context_info += f"- 用户情绪：{user_context['mood']}\n"
-            
-            base_prompt += context_info
-            
-        # 添加记忆信息
-        if self.context_memory:
-            memory_info = "\n\n重要记忆：\n"
-            for key, value in self.context_memory.items():
-                memory_info += f"- {key}: {value}\n"
-            base_prompt += memory_info
-        
-        # 根据聊天类型添加相应指令
-        if chat_analysis:
-            if chat_analysis["type"] == "greeting":
-                length_instruction = "\n\n回复指导：\n- 给出简短亲切的问候回复（1-2句话）\n- 保持温暖自然的语调"
-                base_prompt += length_instruction
-                
-            elif chat_analysis["type"] == "casual":
-                length_instruction = "\n\n回复指导：\n- 给出简洁自然的回复（2-3句话）\n- 适当延续话题，保持轻松愉快"
-                base_prompt += length_instruction
-                
-            elif chat_analysis["type"] == "emotional_support":
-                length_instruction = "\n\n回复指导：\n- 给出温暖体贴的回复（3-4句话）\n- 重点关注情感共鸣和心理安慰"
-                base_prompt += length_instruction
-                
-            elif chat_analysis["type"] == "problem_solving":
-                # 问题解决场景需要Chain of Thought思维
-                cot_instruction = "\n\n深度思考指导（Chain of Thought）：\n"
-                cot_instruction += "请在内心进行以下思考过程（但不要在回复中显示思考过程）：\n"
-                cot_instruction += "1. **问题分析**: 具体是什么问题？严重程度如何？\n"
-                cot_instruction += "2. **原因判断**: 可能的原因有哪些？最主要的是什么？\n"
-                cot_instruction += "3. **知识调用**: 需要什么专业知识？有什么相关经验？\n"
-                cot_instruction += "4. **方案制定**: 有哪些解决方案？优先级如何？\n"
-                cot_instruction += "5. **可行性评估**: 方案是否适合父母的实际情况？\n"
-                cot_instruction += "6. **风险考虑**: 有什么需要注意的风险或副作用？\n\n"
-                cot_instruction += "然后给出详细实用的建议（4-6句话），包含：\n"
-                cot_instruction += "- 具体的解决步骤\n- 注意事项\n- 何时需要寻求专业帮助"
-                base_prompt += cot_instruction
-        
-        return base_prompt
+            sections.append(PromptSection("context", [context_info], required=True))
+        
+        # 添加CoT推理得出的分析
+        if user_context.get("cot_analysis"):
+            sections.append(PromptSection(
+                "cot",
+                [user_context["cot_analysis"]],
+                header="\n\n回复前的思考结论（据此组织回复，不要在回复中复述思考过程）：\n",
+                truncatable=True
+            ))
+        
+        # 添加记忆信息（最新的记忆优先保留）
+        memory_items = [
+            (category, item)
+            for category, items in session.context_memory.items()
+            for item in (items if isinstance(items, list) else [{"content": str(items)}])
+        ]
+        memory_items.sort(key=lambda entry: entry[1].get("timestamp", ""), reverse=True)
+        if memory_items:
+            sections.append(PromptSection(
+                "memory",
+                memory_items,
+                header="\n\n重要记忆：\n",
+                render=lambda entry: f"- {entry[0]}: {entry[1].get('content', '')}\n"
+            ))
+        
+        return sections
+    
+    @staticmethod
+    def _reply_guidance(chat_type: str) -> str:
+        """按聊天类型生成回复长度和风格指导（只在编译静态前缀时调用）"""
+        if chat_type == "greeting":
+            return "\n\n回复指导：\n- 给出简短亲切的问候回复（1-2句话）\n- 保持温暖自然的语调"
+        if chat_type == "casual":
+            return "\n\n回复指导：\n- 给出简洁自然的回复（2-3句话）\n- 适当延续话题，保持轻松愉快"
+        if chat_type == "emotional_support":
+            return "\n\n回复指导：\n- 给出温暖体贴的回复（3-4句话）\n- 重点关注情感共鸣和心理安慰"
+        if chat_type == "problem_solving":
+            # 问题解决场景需要Chain of Thought思维
+            cot_instruction = "\n\n深度思考指导（Chain of Thought）：\n"
+            cot_instruction += "请在内心进行以下思考过程（但不要在回复中显示思考过程）：\n"
+            cot_instruction += "1. **问题分析**: 具体是什么问题？严重程度如何？\n"
+            cot_instruction += "2. **原因判断**: 可能的原因有哪些？最主要的是什么？\n"
+            cot_instruction += "3. **知识调用**: 需要什么专业知识？有什么相关经验？\n"
+            cot_instruction += "4. **方案制定**: 有哪些解决方案？优先级如何？\n"
+            cot_instruction += "5. **可行性评估**: 方案是否适合父母的实际情况？\n"
+            cot_instruction += "6. **风险考虑**: 有什么需要注意的风险或副作用？\n\n"
+            cot_instruction += "然后给出详细实用的建议（4-6句话），包含：\n"
+            cot_instruction += "- 具体的解决步骤\n- 注意事项\n- 何时需要寻求专业帮助"
+            return cot_instruction
+        return ""
+    
+    @staticmethod
+    def _record_prefix_usage(assembled: AssembledPrompt):
+        """记录静态前缀占系统提示词的token数（不含历史对话和当前消息）"""
+        system_tokens = sum(
+            count for name, count in assembled.tokens.items() if name not in ("history", "user")
+        )
+        prompt_templates.record_usage(assembled.tokens["prefix"], system_tokens)
+    
+    @staticmethod
+    def _render_sections(sections: List[PromptSection], assembled: AssembledPrompt) -> str:
+        """按段落顺序拼接预算内保留的条目"""
+        parts = []
+        for section in sections:
+            kept = assembled.items.get(section.name)
+            if kept:
+                parts.append(section.header + "".join(section.render(item) for item in kept) + section.footer)
+        return "".join(parts)
     
     def detect_chat_type(self, user_message: str, user_context: Optional[Dict] = None) -> Dict[str, Any]:
         """
@@ -138,10 +303,11 @@ class CharacterAgent:
         Returns:
             包含聊天类型、长度级别等信息的字典
         """
-        message_lower = user_message.lower()
+        # 所有关键词规则共用一次扫描的结果（同一条消息的扫描结果会被缓存）
+        features = trigger_detector.detect(user_message)
         
         # 实时信息类型（需要联网搜索 - 最长回复）
-        if should_use_web_search(user_message):
+        if features.needs_web_search:
             return {
                 "type": "real_time_info",
                 "confidence": 0.95,
@@ -150,6 +316,16 @@ class CharacterAgent:
                 "needs_web_search": True
             }
         
+        # 询问时间日期（按上下文中的当前时间简短回答；答案随时间变化，同样归为实时信息类）
+        if features.has("clock"):
+            return {
+                "type": "real_time_info",
+                "confidence": 0.9,
+                "max_tokens": 60,
+                "length_level": "short",
+                "needs_web_search": False
+            }
+        
         # 文档相关类型（涉及RAG文档 - 长回复）
         if user_context and "rag_result" in user_context:
             rag_result = user_context["rag_result"]
@@ -162,62 +338,28 @@ class CharacterAgent:
                     "needs_web_search": False
                 }
         
-        # 问题解决类关键词（需要详细回复）
-        problem_keywords = [
-            '怎么办', '如何', '什么原因', '为什么', '怎样', '方法', '建议', '帮助',
-            '问题', '困难', '麻烦', '不会', '不知道', '解决', '治疗', '病', '疼',
-            '头疼', '失眠', '感冒', '咳嗽', '血压', '糖尿病', '心脏'
-        ]
-        
-        # 情感支持类关键词（需要适中回复）
-        emotional_keywords = [
-            '想你', '想念', '孤独', '寂寞', '难过', '担心', '害怕', '紧张',
-            '开心', '高兴', '感动', '回忆', '以前', '小时候'
-        ]
-        
-        # 日常闲聊关键词（简短回复）
-        casual_keywords = [
-            '你好', '早上好', '晚安', '吃饭', '天气', '今天', '昨天', '明天',
-            '看电视', '散步', '睡觉', '起床', '在干什么', '忙吗'
-        ]
-        
-        # 问候语模式（简短回复）
-        greeting_patterns = [
-            r'^(你好|早上好|中午好|晚上好|晚安)',
-            r'(最近.*好吗|身体.*好吗|还好吗)$',
-            r'^(在.*吗|忙.*吗)'
-        ]
-        
-        # 检测类型
+        # 检测类型（问题解决类、情感支持类和问候语的关键词见 TRIGGER_LEXICONS）
         chat_type = "casual"
         confidence = 0.5
         max_tokens = 80  # 默认简短回复
         
         # 检查问题解决类
-        for keyword in problem_keywords:
-            if keyword in user_message:
-                chat_type = "problem_solving"
-                confidence = 0.9
-                max_tokens = 250  # 允许较长回复
-                break
+        if features.has("problem"):
+            chat_type = "problem_solving"
+            confidence = 0.9
+            max_tokens = 250  # 允许较长回复
         
         # 检查情感支持类
-        if chat_type == "casual":
-            for keyword in emotional_keywords:
-                if keyword in user_message:
-                    chat_type = "emotional_support"
-                    confidence = 0.8
-                    max_tokens = 150  # 中等长度
-                    break
+        if chat_type == "casual" and features.has("emotional"):
+            chat_type = "emotional_support"
+            confidence = 0.8
+            max_tokens = 150  # 中等长度
         
         # 检查问候语
-        if chat_type == "casual":
-            for pattern in greeting_patterns:
-                if re.search(pattern, user_message):
-                    chat_type = "greeting"
-                    confidence = 0.9
-                    max_tokens = 60  # 很简短
-                    break
+        if chat_type == "casual" and features.greeting:
+            chat_type = "greeting"
+            confidence = 0.9
+            max_tokens = 60  # 很简短
         
         # 根据消息长度调整
         if len(user_message) < 10:
@@ -233,166 +375,373 @@ class CharacterAgent:
             "needs_web_search": False
         }
     
-    def generate_response(
+    async def _prepare_messages(
         self, 
         user_message: str, 
-        user_context: Optional[Dict] = None
+        user_context: Optional[Dict],
+        session: SessionState,
+        instruction: str = ""
+    ) -> Tuple[List[Dict[str, str]], Dict[str, Any], Dict[str, Any]]:
+        """
+        构建发送给LLM的消息列表
+        
+        Args:
+            user_message: 用户消息
+            user_context: 用户上下文
+            session: 会话状态
+            instruction: 追加在系统提示词末尾的输出要求（不参与裁剪）
+            
+        Returns:
+            (消息列表, 聊天类型分析结果, 实际使用的上下文（含本次联网搜索结果）)
+        """
+        # 检测聊天类型和输出长度
+        chat_analysis = self.detect_chat_type(user_message, user_context)
+        
+        # 确保chat_analysis不为None
+        if not chat_analysis:
+            print("⚠️ 聊天分析返回空结果，使用默认配置")
+            chat_analysis = {
+                "type": "casual",
+                "confidence": 0.5,
+                "max_tokens": 100,
+                "length_level": "medium",
+                "needs_web_search": False
+            }
+        
+        # 如果需要联网搜索，执行搜索（调用方已在增强阶段搜索过时不再重复搜索）
+        web_search_result = None
+        already_searched = bool(user_context) and "web_search_result" in user_context
+        if chat_analysis and chat_analysis.get("needs_web_search", False) and not already_searched:
+            print(f"🔍 检测到需要联网搜索: {user_message}")
+            try:
+                web_search_result = await web_search_tool.search(user_message)
+                if web_search_result:
+                    print(f"✅ 联网搜索完成: {web_search_result.get('total_results', 0)} 个结果")
+                else:
+                    print("⚠️ 联网搜索返回空结果")
+            except Exception as search_error:
+                print(f"❌ 联网搜索失败: {search_error}")
+                web_search_result = None
+        
+        # 构建消息历史
+        # 将搜索结果添加到用户上下文中
+        enhanced_context = user_context.copy() if user_context else {}
+        if web_search_result:
+            enhanced_context["web_search_result"] = web_search_result
+        
+        # 按token预算组装系统提示词、历史对话（最近几轮，最新的优先保留）和当前消息
+        system_sections = self.build_prompt_sections(enhanced_context, chat_analysis, session, instruction)
+        recent_history = session.conversation_history[-Config.MEMORY_WINDOW_SIZE:]
+        assembled = prompt_assembler.assemble(system_sections + [
+            PromptSection(
+                "history",
+                list(reversed(recent_history)),
+                render=lambda item: item["user_message"] + item["assistant_response"],
+                item_overhead=2 * MESSAGE_OVERHEAD_TOKENS
+            ),
+            PromptSection("user", [user_message], required=True, item_overhead=MESSAGE_OVERHEAD_TOKENS)
+        ])
+        chat_analysis["prompt_tokens"] = assembled.report()
+        self._record_prefix_usage(assembled)
+        
+        messages = [
+            {
+                "role": "system", 
+                "content": self._render_sections(system_sections, assembled)
+            }
+        ]
+        
+        for item in reversed(assembled.items["history"]):
+            messages.append({
+                "role": "user",
+                "content": item["user_message"]
+            })
+            messages.append({
+                "role": "assistant", 
+                "content": item["assistant_response"]
+            })
+        
+        # 添加当前用户消息
+        messages.append({
+            "role": "user",
+            "content": user_message
+        })
+        
+        return messages, chat_analysis, enhanced_context
+    
+    def _record_turn(
+        self, 
+        user_message: str, 
+        assistant_response: str,
+        user_context: Optional[Dict],
+        chat_analysis: Dict[str, Any],
+        session: SessionState
     ) -> Dict[str, Any]:
         """
-        生成角色回应
+        记录本轮对话到会话状态并构建回应数据
         
         Args:
             user_message: 用户消息
+            assistant_response: 助手回应
             user_context: 用户上下文
+            chat_analysis: 聊天类型分析结果
+            session: 会话状态
             
         Returns:
             包含回应内容、情绪等信息的字典
         """
-        try:
-            # 检测聊天类型和输出长度
-            chat_analysis = self.detect_chat_type(user_message, user_context)
-            
-            # 确保chat_analysis不为None
-            if not chat_analysis:
-                print("⚠️ 聊天分析返回空结果，使用默认配置")
-                chat_analysis = {
-                    "type": "casual",
-                    "confidence": 0.5,
-                    "max_tokens": 100,
-                    "length_level": "medium",
-                    "needs_web_search": False
-                }
+        # 更新对话历史
+        session.conversation_history.append({
+            "timestamp": datetime.now().isoformat(),
+            "user_message": user_message,
+            "assistant_response": assistant_response,
+            "user_context": user_context or {},
+            "chat_analysis": chat_analysis or {}
+        })
+        
+        # 限制历史长度
+        if len(session.conversation_history) > Config.MAX_CONVERSATION_HISTORY:
+            session.conversation_history = session.conversation_history[-Config.MAX_CONVERSATION_HISTORY:]
+        
+        # 情绪分析和上下文更新
+        self._update_context_memory(user_message, assistant_response, session)
+        
+        return {
+            "character_id": self.character_id,
+            "character_name": self.config["name"],
+            "response": assistant_response,
+            "emotion": session.emotional_state,
+            "timestamp": datetime.now().isoformat(),
+            "voice_config": {
+                "voice": self.config["voice"],
+                "speed": self.config.get("voice_speed", 1.0)
+            }
+        }
+    
+    async def draft_response(
+        self, 
+        user_message: str, 
+        user_context: Optional[Dict] = None,
+        session: Optional[SessionState] = None
+    ) -> Dict[str, Any]:
+        """
+        生成回复文本但不写入会话状态（推测执行时可以同时生成多个候选回复，只提交最终采用的一个）
+        
+        Args:
+            user_message: 用户消息
+            user_context: 用户上下文
+            session: 会话状态（为空时使用默认会话）
             
-            # 如果需要联网搜索，执行搜索
-            web_search_result = None
-            if chat_analysis and chat_analysis.get("needs_web_search", False):
-                print(f"🔍 检测到需要联网搜索: {user_message}")
-                try:
-                    # 创建事件循环来运行异步搜索
-                    loop = asyncio.new_event_loop()
-                    asyncio.set_event_loop(loop)
-                    web_search_result = loop.run_until_complete(web_search_tool.search(user_message))
-                    loop.close()
-                    if web_search_result:
-                        print(f"✅ 联网搜索完成: {web_search_result.get('total_results', 0)} 个结果")
-                    else:
-                        print("⚠️ 联网搜索返回空结果")
-                except Exception as search_error:
-                    print(f"❌ 联网搜索失败: {search_error}")
-                    web_search_result = None
+        Returns:
+            {"response": 回复文本, "chat_analysis": 聊天类型分析结果, "context": 实际使用的上下文}
+        """
+        session = session or self.default_session
+        messages, chat_analysis, context = await self._prepare_messages(user_message, user_context, session)
+        
+        # 调用LLM生成回应（动态调整max_tokens）
+        response = await llm_gateway.chat_completion(
+            task="reply",
+            messages=messages,
+            max_tokens=chat_analysis.get("max_tokens", Config.LLM_TASKS["reply"]["max_tokens"])
+        )
+        
+        # 安全地提取回应内容
+        if not response or not response.choices or not response.choices[0] or not response.choices[0].message:
+            raise Exception("LLM返回无效响应")
+        
+        assistant_response = response.choices[0].message.content
+        if not assistant_response:
+            raise Exception("LLM返回空内容")
+        
+        return {"response": assistant_response, "chat_analysis": chat_analysis, "context": context}
+    
+    def commit_response(
+        self, 
+        user_message: str, 
+        draft: Dict[str, Any],
+        user_context: Optional[Dict] = None,
+        session: Optional[SessionState] = None
+    ) -> Dict[str, Any]:
+        """
+        把采用的候选回复写入会话状态并构建回应数据
+        
+        Args:
+            user_message: 用户消息
+            draft: draft_response的返回值
+            user_context: 用户上下文
+            session: 会话状态（为空时使用默认会话）
             
-            # 构建消息历史
-            # 将搜索结果添加到用户上下文中
-            enhanced_context = user_context.copy() if user_context else {}
-            if web_search_result:
-                enhanced_context["web_search_result"] = web_search_result
+        Returns:
+            包含回应内容、情绪等信息的字典
+        """
+        return self._record_turn(
+            user_message, draft["response"], user_context, draft["chat_analysis"], session or self.default_session
+        )
+    
+    async def generate_response(
+        self, 
+        user_message: str, 
+        user_context: Optional[Dict] = None,
+        session: Optional[SessionState] = None
+    ) -> Dict[str, Any]:
+        """
+        生成角色回应
+        
+        Args:
+            user_message: 用户消息
+            user_context: 用户上下文
+            session: 会话状态（为空时使用默认会话）
             
-            messages = [
-                {
-                    "role": "system", 
-                    "content": self.get_system_prompt(enhanced_context, chat_analysis)
-                }
-            ]
+        Returns:
+            包含回应内容、情绪等信息的字典
+        """
+        session = session or self.default_session
+        try:
+            draft = await self.draft_response(user_message, user_context, session)
+            return self.commit_response(user_message, draft, user_context, session)
             
-            # 添加历史对话（最近几轮）
-            recent_history = self.conversation_history[-Config.MEMORY_WINDOW_SIZE:]
-            for item in recent_history:
-                messages.append({
-                    "role": "user",
-                    "content": item["user_message"]
-                })
-                messages.append({
-                    "role": "assistant", 
-                    "content": item["assistant_response"]
-                })
+        except UpstreamOverloadedError:
+            # 上游繁忙时原样抛出，由调用方返回429/503
+            raise
+        except Exception as e:
+            print(f"❌ 生成回应时出错: {e}")
+            # 抛出异常让调用方处理，不使用fallback
+            raise Exception(f"AI Agent生成回应失败: {str(e)}")
+    
+    async def generate_structured_response(
+        self, 
+        user_message: str, 
+        user_context: Optional[Dict] = None,
+        session: Optional[SessionState] = None
+    ) -> Dict[str, Any]:
+        """
+        单次结构化调用生成角色回应：一次LLM调用同时返回路由、简要分析、情绪和回复，
+        代替路由 + CoT推理 + 角色回复的多次调用
+        
+        Args:
+            user_message: 用户消息
+            user_context: 用户上下文
+            session: 会话状态（为空时使用默认会话）
             
-            # 添加当前用户消息
-            messages.append({
-                "role": "user",
-                "content": user_message
-            })
+        Returns:
+            与generate_response相同的回应字典，另含route、analysis字段
+        """
+        session = session or self.default_session
+        try:
+            messages, chat_analysis, _ = await self._prepare_messages(
+                user_message, user_context, session, instruction=STRUCTURED_REPLY_INSTRUCTION
+            )
             
-            # 调用LLM生成回应（动态调整max_tokens）
-            response = self.client.chat.completions.create(
-                model=Config.LLM_MODEL,
+            # 回复长度预算之外再留出route、analysis、emotion等字段的token
+            response = await llm_gateway.chat_completion(
+                task="structured_reply",
                 messages=messages,
-                temperature=0.7,
-                max_tokens=chat_analysis.get("max_tokens", 100)
+                max_tokens=chat_analysis.get("max_tokens", Config.LLM_TASKS["reply"]["max_tokens"])
+                + self.STRUCTURED_FIELD_TOKENS,
+                response_format={"type": "json_object"}
             )
             
-            # 安全地提取回应内容
-            if not response or not response.choices or not response.choices[0] or not response.choices[0].message:
+            if not response or not response.choices or not response.choices[0].message:
                 raise Exception("LLM返回无效响应")
             
-            assistant_response = response.choices[0].message.content
-            if not assistant_response:
+            structured = parse_structured_reply(response.choices[0].message.content)
+            if not structured["reply"]:
                 raise Exception("LLM返回空内容")
             
-            # 更新对话历史
-            self.conversation_history.append({
-                "timestamp": datetime.now().isoformat(),
-                "user_message": user_message,
-                "assistant_response": assistant_response,
-                "user_context": user_context or {},
-                "chat_analysis": chat_analysis or {}
-            })
+            session.emotional_state = structured["emotion"]
+            response_data = self._record_turn(
+                user_message, structured["reply"], user_context, chat_analysis, session
+            )
+            response_data["route"] = structured["route"]
+            response_data["analysis"] = structured["analysis"]
+            return response_data
             
-            # 限制历史长度
-            if len(self.conversation_history) > Config.MAX_CONVERSATION_HISTORY:
-                self.conversation_history = self.conversation_history[-Config.MAX_CONVERSATION_HISTORY:]
+        except UpstreamOverloadedError:
+            raise
+        except Exception as e:
+            print(f"❌ 结构化生成回应时出错: {e}")
+            raise Exception(f"AI Agent生成回应失败: {str(e)}")
+    
+    async def generate_response_stream(
+        self, 
+        user_message: str, 
+        user_context: Optional[Dict] = None,
+        session: Optional[SessionState] = None
+    ) -> AsyncGenerator[Dict[str, Any], None]:
+        """
+        流式生成角色回应，LLM每返回一段文本就立即产出
+        
+        Args:
+            user_message: 用户消息
+            user_context: 用户上下文
+            session: 会话状态（为空时使用默认会话）
             
-            # 情绪分析和上下文更新
-            self._update_context_memory(user_message, assistant_response)
+        Yields:
+            {"type": "token", "content": 文本片段}，最后产出
+            {"type": "done", "data": 与generate_response相同的回应字典}
+        """
+        session = session or self.default_session
+        try:
+            messages, chat_analysis, _ = await self._prepare_messages(user_message, user_context, session)
             
-            return {
-                "character_id": self.character_id,
-                "character_name": self.config["name"],
-                "response": assistant_response,
-                "emotion": self.emotional_state,
-                "timestamp": datetime.now().isoformat(),
-                "voice_config": {
-                    "voice": self.config["voice"],
-                    "speed": self.config.get("voice_speed", 1.0)
-                }
+            parts = []
+            stream = llm_gateway.chat_completion_stream(
+                task="reply",
+                messages=messages,
+                max_tokens=chat_analysis.get("max_tokens", Config.LLM_TASKS["reply"]["max_tokens"])
+            )
+            
+            async for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content if chunk.choices[0].delta else None
+                if delta:
+                    parts.append(delta)
+                    yield {"type": "token", "content": delta}
+            
+            assistant_response = "".join(parts)
+            if not assistant_response:
+                raise Exception("LLM返回空内容")
+            
+            yield {
+                "type": "done",
+                "data": self._record_turn(user_message, assistant_response, user_context, chat_analysis, session)
             }
             
+        except UpstreamOverloadedError:
+            # 上游繁忙时原样抛出，由调用方返回429/503
+            raise
         except Exception as e:
-            print(f"❌ 生成回应时出错: {e}")
-            # 抛出异常让调用方处理，不使用fallback
+            print(f"❌ 流式生成回应时出错: {e}")
             raise Exception(f"AI Agent生成回应失败: {str(e)}")
     
-    def _update_context_memory(self, user_message: str, assistant_response: str):
+    def _update_context_memory(self, user_message: str, assistant_response: str, session: SessionState):
         """
         更新上下文记忆
         
         Args:
             user_message: 用户消息
             assistant_response: 助手回应
+            session: 会话状态
         """
-        # 简单的关键词提取和记忆更新
-        keywords = {
-            "health": ["身体", "健康", "生病", "医院", "药"],
-            "family": ["家人", "孩子", "孙子", "女儿", "儿子"],
-            "mood": ["开心", "难过", "生气", "担心", "想念"],
-            "activity": ["吃饭", "睡觉", "散步", "看电视", "出门"]
-        }
-        
-        for category, words in keywords.items():
-            for word in words:
-                if word in user_message:
-                    if category not in self.context_memory:
-                        self.context_memory[category] = []
-                    
-                    memory_item = {
-                        "content": user_message,
-                        "timestamp": datetime.now().isoformat()
-                    }
-                    
-                    self.context_memory[category].append(memory_item)
-                    
-                    # 保持记忆条目不超过5个
-                    if len(self.context_memory[category]) > 5:
-                        self.context_memory[category] = self.context_memory[category][-5:]
+        # 简单的关键词提取和记忆更新（各分类的关键词见 TRIGGER_LEXICONS 的 memory_<分类>）
+        features = trigger_detector.detect(user_message)
+        for category in MEMORY_CATEGORIES:
+            if not features.has(f"memory_{category}"):
+                continue
+            if category not in session.context_memory:
+                session.context_memory[category] = []
+            
+            memory_item = {
+                "content": user_message,
+                "timestamp": datetime.now().isoformat()
+            }
+            
+            session.context_memory[category].append(memory_item)
+            
+            # 保持记忆条目不超过5个
+            if len(session.context_memory[category]) > 5:
+                session.context_memory[category] = session.context_memory[category][-5:]
     
     def get_greeting(self) -> str:
         """获取角色的问候语"""
@@ -409,13 +758,13 @@ class CharacterAgent:
             "greeting": self.config["greeting"]
         }
     
-    def clear_conversation_history(self):
+    def clear_conversation_history(self, session: Optional[SessionState] = None):
         """清除对话历史"""
-        self.conversation_history = []
+        (session or self.default_session).conversation_history = []
         
-    def export_conversation_history(self) -> List[Dict[str, Any]]:
+    def export_conversation_history(self, session: Optional[SessionState] = None) -> List[Dict[str, Any]]:
         """导出对话历史"""
-        return self.conversation_history.copy()
+        return (session or self.default_session).conversation_history.copy()
 
 
 class CharacterManager:
@@ -457,11 +806,12 @@ class CharacterManager:
         """获取所有角色信息"""
         return [agent.get_character_info() for agent in self.agents.values()]
     
-    def generate_response(
+    async def generate_response(
         self, 
         user_message: str, 
         character_id: Optional[str] = None,
-        user_context: Optional[Dict] = None
+        user_context: Optional[Dict] = None,
+        session: Optional[SessionState] = None
     ) -> Dict[str, Any]:
         """
         生成指定角色的回应
@@ -470,15 +820,41 @@ class CharacterManager:
             user_message: 用户消息
             character_id: 角色ID（None则使用当前角色）
             user_context: 用户上下文
+            session: 会话状态
+            
+        Returns:
+            角色回应
+        """
+        return await self._resolve_agent(character_id).generate_response(user_message, user_context, session)
+    
+    async def generate_structured_response(
+        self, 
+        user_message: str, 
+        character_id: Optional[str] = None,
+        user_context: Optional[Dict] = None,
+        session: Optional[SessionState] = None
+    ) -> Dict[str, Any]:
+        """
+        单次结构化调用生成指定角色的回应（含路由、简要分析和情绪）
+        
+        Args:
+            user_message: 用户消息
+            character_id: 角色ID（None则使用当前角色）
+            user_context: 用户上下文
+            session: 会话状态
             
         Returns:
             角色回应
         """
+        return await self._resolve_agent(character_id).generate_structured_response(
+            user_message, user_context, session
+        )
+    
+    def _resolve_agent(self, character_id: Optional[str]) -> CharacterAgent:
+        """按角色ID取代理（None则使用当前角色）"""
         if character_id:
             agent = self.get_agent(character_id)
             if not agent:
                 raise ValueError(f"角色 {character_id} 不存在")
-        else:
-            agent = self.get_current_agent()
-        
-        return agent.generate_response(user_message, user_context)
+            return agent
+        return self.get_current_agent()
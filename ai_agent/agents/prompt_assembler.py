@@ -0,0 +1,218 @@
+"""
+提示词组装器 - 按输入token预算组装角色代理的提示词
+角色设定、回复指导和当前消息必须保留；联网搜索、文档参考、CoT分析、历史对话和重要记忆
+按优先级依次分配剩余预算（每段不超过各自的占比上限），预算不足时先裁剪优先级低的段落，
+段落内先丢弃价值最低的条目（最旧的历史、排名靠后的文档片段），并统计各段落的token数
+"""
+
+import math
+import re
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+from config import Config
+
+
+# 中日韩文字和全角标点：中文大约每个字1个token
+_WIDE_CHAR_PATTERN = re.compile(r"[\u2e80-\u9fff\uac00-\ud7af\uf900-\ufaff\ufe30-\ufe4f\uff00-\uffef]")
+# 英文、数字等其余字符大约每4个字符1个token
+_NARROW_CHARS_PER_TOKEN = 4
+# 每条消息的角色标记等固定开销
+MESSAGE_OVERHEAD_TOKENS = 4
+# 剩余预算少于该值时不再截断条目，直接丢弃
+MIN_TRUNCATED_TOKENS = 20
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    估算文本的token数（适用于中英文混排，宁多勿少）
+
+    Args:
+        text: 文本
+
+    Returns:
+        估算的token数
+    """
+    if not text:
+        return 0
+    wide = len(_WIDE_CHAR_PATTERN.findall(text))
+    return wide + math.ceil((len(text) - wide) / _NARROW_CHARS_PER_TOKEN)
+
+
+def truncate_to_tokens(text: str, max_tokens: int, suffix: str = "…") -> str:
+    """
+    把文本截断到不超过max_tokens个token（含省略号）
+
+    Args:
+        text: 文本
+        max_tokens: token上限
+        suffix: 截断后追加的后缀
+
+    Returns:
+        截断后的文本（未超出时原样返回）
+    """
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    limit = max_tokens - estimate_tokens(suffix)
+    used = 0.0
+    for index, char in enumerate(text):
+        used += 1 if _WIDE_CHAR_PATTERN.match(char) else 1 / _NARROW_CHARS_PER_TOKEN
+        if used > limit:
+            return text[:index] + suffix
+    return text
+
+
+@dataclass
+class PromptSection:
+    """提示词的一个段落"""
+    name: str
+    items: List[Any] = field(default_factory=list)  # 按价值从高到低排列，预算不足时从末尾开始丢弃
+    header: str = ""  # 有条目保留时才计入的标题
+    footer: str = ""  # 有条目保留时才计入的结尾说明
+    required: bool = False  # 必须完整保留（静态前缀、上下文信息、当前消息）
+    render: Callable[[Any], str] = str  # 条目 -> 计入token的文本
+    truncatable: bool = False  # 放不下时可以截断最后一个条目（否则整条丢弃）
+    item_overhead: int = 0  # 每个条目的固定开销（如历史对话每轮两条消息的角色标记）
+
+
+@dataclass
+class AssembledPrompt:
+    """组装结果：各段落保留的条目和token数"""
+    items: Dict[str, List[Any]]
+    tokens: Dict[str, int]
+    trimmed: Dict[str, int]  # 各段落被丢弃或截断的条目数
+    budget: int
+
+    @property
+    def total_tokens(self) -> int:
+        return sum(self.tokens.values())
+
+    def report(self) -> Dict[str, Any]:
+        """各段落token数报告"""
+        return {
+            "budget": self.budget,
+            "total_tokens": self.total_tokens,
+            "sections": dict(self.tokens),
+            "trimmed": {name: count for name, count in self.trimmed.items() if count}
+        }
+
+
+class PromptAssembler:
+    """按token预算和段落优先级组装提示词"""
+
+    def __init__(
+        self,
+        budget: Optional[int] = None,
+        priorities: Optional[List[str]] = None,
+        shares: Optional[Dict[str, float]] = None
+    ):
+        """
+        初始化提示词组装器
+
+        Args:
+            budget: 输入token总预算
+            priorities: 可裁剪段落的预算分配顺序（靠前的先分配）
+            shares: 可裁剪段落最多占总预算的比例
+        """
+        self.budget = budget or Config.PROMPT_TOKEN_BUDGET
+        self.priorities = priorities or Config.PROMPT_SECTION_PRIORITIES
+        self.shares = shares if shares is not None else Config.PROMPT_SECTION_SHARES
+
+        self._lock = threading.Lock()
+        self.assembled = 0
+        self.over_budget = 0
+        self.section_tokens: Dict[str, int] = {}
+        self.section_trimmed: Dict[str, int] = {}
+
+    def _priority(self, section: PromptSection) -> int:
+        if section.name in self.priorities:
+            return self.priorities.index(section.name)
+        return len(self.priorities)
+
+    def _fit(self, section: PromptSection, available: int):
+        """在available个token内保留尽可能多的高价值条目，返回(保留的条目, token数, 裁剪数)"""
+        if not section.items:
+            return [], 0, 0
+        framing = estimate_tokens(section.header) + estimate_tokens(section.footer)
+        used = framing
+        kept = []
+        for index, item in enumerate(section.items):
+            cost = estimate_tokens(section.render(item)) + section.item_overhead
+            if used + cost <= available:
+                kept.append(item)
+                used += cost
+                continue
+            remaining = available - used
+            trimmed = len(section.items) - index
+            if section.truncatable and isinstance(item, str) and remaining >= MIN_TRUNCATED_TOKENS:
+                item = truncate_to_tokens(item, remaining)
+                kept.append(item)
+                used += estimate_tokens(item)
+            break
+        else:
+            trimmed = 0
+        if not kept:
+            return [], 0, len(section.items)
+        return kept, used, trimmed
+
+    def assemble(self, sections: List[PromptSection]) -> AssembledPrompt:
+        """
+        按预算组装各段落
+
+        Args:
+            sections: 提示词段落
+
+        Returns:
+            各段落保留的条目和token数
+        """
+        items: Dict[str, List[Any]] = {}
+        tokens: Dict[str, int] = {}
+        trimmed: Dict[str, int] = {}
+
+        # 必须保留的段落先完整计入
+        remaining = self.budget
+        for section in sections:
+            if section.required:
+                kept, used, _ = self._fit(section, math.inf)
+                items[section.name], tokens[section.name], trimmed[section.name] = kept, used, 0
+                remaining -= used
+
+        # 其余段落按优先级分配剩余预算
+        optional = sorted((s for s in sections if not s.required), key=self._priority)
+        for section in optional:
+            cap = int(self.budget * self.shares.get(section.name, 1.0))
+            kept, used, dropped = self._fit(section, max(0, min(cap, remaining)))
+            items[section.name], tokens[section.name], trimmed[section.name] = kept, used, dropped
+            remaining -= used
+
+        assembled = AssembledPrompt(items=items, tokens=tokens, trimmed=trimmed, budget=self.budget)
+        self._record(assembled)
+        return assembled
+
+    def _record(self, assembled: AssembledPrompt):
+        with self._lock:
+            self.assembled += 1
+            if assembled.total_tokens > self.budget:
+                self.over_budget += 1
+            for name, count in assembled.tokens.items():
+                self.section_tokens[name] = self.section_tokens.get(name, 0) + count
+            for name, count in assembled.trimmed.items():
+                self.section_trimmed[name] = self.section_trimmed.get(name, 0) + count
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取各段落的平均token数和累计裁剪条目数"""
+        with self._lock:
+            return {
+                "budget": self.budget,
+                "assembled": self.assembled,
+                "over_budget": self.over_budget,
+                "avg_section_tokens": {
+                    name: round(total / self.assembled, 1) for name, total in self.section_tokens.items()
+                } if self.assembled else {},
+                "trimmed_items": dict(self.section_trimmed)
+            }
+
+
+# 全局提示词组装器实例
+prompt_assembler = PromptAssembler()
@@ -0,0 +1,103 @@
+"""
+角色系统提示词模板 - 每个 (角色, 聊天类型) 的静态前缀只编译一次
+静态前缀（角色设定 + 该聊天类型的回复指导 + 输出要求）放在系统提示词最前面且逐字节不变，
+每轮只在其后填充动态内容（联网搜索、文档参考、上下文、CoT分析、记忆），
+供应商侧的提示词前缀缓存因此可以命中；统计模板复用次数和静态前缀占系统提示词的token比例
+"""
+
+import hashlib
+import threading
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Tuple
+
+from agents.prompt_assembler import estimate_tokens
+
+
+@dataclass(frozen=True)
+class PromptTemplate:
+    """编译后的静态提示词前缀（不可变）"""
+    character_id: str
+    chat_type: str
+    prefix: str
+    prefix_tokens: int
+    digest: str
+
+
+class PromptTemplateCache:
+    """按 (角色, 聊天类型, 输出要求) 缓存的静态提示词前缀"""
+
+    def __init__(self):
+        self._templates: Dict[Tuple[str, str, str], PromptTemplate] = {}
+        self._lock = threading.Lock()
+        self.compiled = 0
+        self.reused = 0
+        self.prefix_tokens = 0
+        self.system_tokens = 0
+
+    def get(
+        self,
+        character_id: str,
+        chat_type: str,
+        build: Callable[[], str],
+        instruction: str = ""
+    ) -> PromptTemplate:
+        """
+        获取静态前缀模板，首次使用时编译
+
+        Args:
+            character_id: 角色ID
+            chat_type: 聊天类型（detect_chat_type的type）
+            build: 生成静态前缀文本的函数（只在编译时调用）
+            instruction: 追加在前缀末尾的输出要求（不同输出要求分别编译）
+
+        Returns:
+            静态前缀模板
+        """
+        key = (character_id, chat_type, instruction)
+        template = self._templates.get(key)
+        if template is not None:
+            with self._lock:
+                self.reused += 1
+            return template
+
+        prefix = build() + instruction
+        template = PromptTemplate(
+            character_id=character_id,
+            chat_type=chat_type,
+            prefix=prefix,
+            prefix_tokens=estimate_tokens(prefix),
+            digest=hashlib.sha1(prefix.encode("utf-8")).hexdigest()[:12]
+        )
+        with self._lock:
+            # 并发编译时保留先写入的模板，保证同一个键的前缀始终是同一个对象
+            template = self._templates.setdefault(key, template)
+            self.compiled += 1
+        return template
+
+    def record_usage(self, prefix_tokens: int, system_tokens: int):
+        """
+        记录一次系统提示词中静态前缀的token数
+
+        Args:
+            prefix_tokens: 静态前缀token数
+            system_tokens: 系统提示词总token数
+        """
+        with self._lock:
+            self.prefix_tokens += prefix_tokens
+            self.system_tokens += system_tokens
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取模板数量、复用率和静态前缀占比"""
+        with self._lock:
+            lookups = self.compiled + self.reused
+            return {
+                "templates": len(self._templates),
+                "compiled": self.compiled,
+                "reused": self.reused,
+                "reuse_rate": round(self.reused / lookups, 3) if lookups else None,
+                "prefix_token_ratio": round(self.prefix_tokens / self.system_tokens, 3) if self.system_tokens else None
+            }
+
+
+# 全局提示词模板缓存实例
+prompt_templates = PromptTemplateCache()
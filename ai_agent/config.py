@@ -3,6 +3,7 @@ FamilyBot AI Agent 配置文件
 集中管理所有配置项，支持环境变量和默认值
 """
 
+import json
 import os
 from typing import Dict, Any
 from dotenv import load_dotenv
@@ -11,6 +12,13 @@ from dotenv import load_dotenv
 dotenv_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '.env'))
 load_dotenv(dotenv_path=dotenv_path, override=True)
 
+
+def _merge_json_overrides(env_name: str, defaults: Dict[str, Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """用JSON环境变量逐项覆盖嵌套配置的默认值"""
+    overrides = json.loads(os.getenv(env_name, "{}"))
+    return {name: {**defaults.get(name, {}), **overrides.get(name, {})} for name in {**defaults, **overrides}}
+
+
 class Config:
     """配置管理类"""
     
@@ -26,6 +34,40 @@ class Config:
     LLM_MODEL = os.getenv("LLM_MODEL", "qwen3-max-preview")
     TTS_MODEL = os.getenv("TTS_MODEL", "tts-1-hd")  # OpenAI TTS高质量模型
     ASR_MODEL = os.getenv("ASR_MODEL", "qwen3-asr-flash")
+    LLM_FAST_MODEL = os.getenv("LLM_FAST_MODEL", "qwen-flash")  # 查询扩展、路由、摘要等辅助调用使用的快速模型
+
+    # === 按任务划分的LLM调用配置 ===
+    # 每类调用使用的模型、max_tokens、temperature和单次请求超时（秒）；调用处显式传入的参数优先
+    # 可用JSON环境变量覆盖部分任务的部分参数，如 LLM_TASKS='{"cot": {"model": "qwen-plus"}}'
+    LLM_TASKS = _merge_json_overrides("LLM_TASKS", {
+        "expand": {"model": LLM_FAST_MODEL, "max_tokens": 200, "temperature": 0.5, "timeout": 5},      # 查询扩展
+        "route": {"model": LLM_FAST_MODEL, "max_tokens": 200, "temperature": 0.3, "timeout": 8},       # 对话路由
+        "intent": {"model": LLM_FAST_MODEL, "max_tokens": 300, "temperature": 0.2, "timeout": 8},      # 意图分析
+        "cot": {"model": LLM_MODEL, "max_tokens": 800, "temperature": 0.4, "timeout": 20},             # CoT推理
+        "summarize": {"model": LLM_FAST_MODEL, "max_tokens": 300, "temperature": 0.3, "timeout": 15},  # 文档摘要
+        "keywords": {"model": LLM_FAST_MODEL, "max_tokens": 200, "temperature": 0.3, "timeout": 10},   # 关键词提取
+        "reply": {"model": LLM_MODEL, "max_tokens": 100, "temperature": 0.7, "timeout": 30},           # 角色回复
+        "structured_reply": {"model": LLM_MODEL, "max_tokens": 400, "temperature": 0.6, "timeout": 30}  # 单次结构化回复
+    })
+    
+    # === 路由本地快速路径 ===
+    # 未指定角色时先用本地加权词表分类，最高分达到下限、相对第二高分领先足够多且证据充分时不再调用LLM路由
+    ROUTER_LOCAL_ENABLED = os.getenv("ROUTER_LOCAL_ENABLED", "true").lower() == "true"
+    ROUTER_LOCAL_MARGIN = float(os.getenv("ROUTER_LOCAL_MARGIN", "0.5"))
+    ROUTER_LOCAL_MIN_SCORE = float(os.getenv("ROUTER_LOCAL_MIN_SCORE", "1.5"))
+    # 只命中一个词时，该词权重至少达到此值才本地决策（单独的“疼”“药”交给LLM）
+    ROUTER_LOCAL_STRONG_WEIGHT = float(os.getenv("ROUTER_LOCAL_STRONG_WEIGHT", "2.0"))
+    
+    # === 关键词触发检测 ===
+    # 联网搜索、图片生成、聊天类型、上下文记忆和知识检索的关键词规则合并为一个多模式匹配器，
+    # 每条消息只扫描一次，特征按消息缓存（最多缓存的消息条数）
+    TRIGGER_CACHE_SIZE = int(os.getenv("TRIGGER_CACHE_SIZE", "512"))
+    
+    # === 回复模式 ===
+    # multi_call：路由、CoT推理、角色回复分别调用LLM（默认）
+    # structured：一次结构化输出调用同时返回路由、简要分析、情绪和回复；可按请求通过reply_mode覆盖
+    REPLY_MODE = os.getenv("REPLY_MODE", "multi_call")
+    REPLY_MODES = ("multi_call", "structured")
     
     # === 语音配置 ===
     SAMPLE_RATE = int(os.getenv("SAMPLE_RATE", "24000"))
@@ -38,10 +80,155 @@ class Config:
     # === 角色配置 ===
     DEFAULT_CHARACTER = os.getenv("DEFAULT_CHARACTER", "xiyang")
     
+    # === LLM客户端连接配置 ===
+    LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "100"))
+    LLM_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", "20"))
+    LLM_KEEPALIVE_EXPIRY = float(os.getenv("LLM_KEEPALIVE_EXPIRY", "30"))  # 秒
+    LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "5"))  # 秒
+    LLM_REQUEST_TIMEOUT = float(os.getenv("LLM_REQUEST_TIMEOUT", "60"))  # 秒
+    LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))  # LLM网关在429/5xx/连接错误时的重试次数
+
+    # === LLM网关配置 ===
+    LLM_RETRY_BASE_DELAY = float(os.getenv("LLM_RETRY_BASE_DELAY", "0.5"))  # 指数退避基数（秒）
+    LLM_RETRY_MAX_DELAY = float(os.getenv("LLM_RETRY_MAX_DELAY", "8"))  # 单次退避上限（秒）
+    LLM_HEDGE_ENABLED = os.getenv("LLM_HEDGE_ENABLED", "true").lower() == "true"  # 超过p95延迟未返回时发出对冲请求
+    LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))  # 延迟样本不足时不对冲
+    LLM_HEDGE_MIN_DELAY = float(os.getenv("LLM_HEDGE_MIN_DELAY", "1.0"))  # 对冲等待时间下限（秒）
+
+    # === LLM多供应商配置 ===
+    OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1")
+    OPENAI_CHAT_MODEL = os.getenv("OPENAI_CHAT_MODEL", "gpt-4o-mini")  # DashScope不可用时的备用对话模型
+    # 按优先级排列；models为 请求的模型 -> 供应商模型 的映射，"*"匹配任意模型，值为null表示沿用请求的模型名
+    LLM_PROVIDERS = json.loads(os.getenv("LLM_PROVIDERS", "null")) or [
+        {"name": "dashscope", "api_key": DASHSCOPE_API_KEY, "base_url": DASHSCOPE_BASE_URL, "models": {"*": None}},
+        {"name": "openai", "api_key": OPENAI_API_KEY, "base_url": OPENAI_BASE_URL, "models": {"*": OPENAI_CHAT_MODEL}}
+    ]
+    LLM_PROVIDER_TIMEOUT = float(os.getenv("LLM_PROVIDER_TIMEOUT", "20"))  # 还有备用供应商时单个供应商的超时（秒）
+    LLM_PROVIDER_WINDOW = int(os.getenv("LLM_PROVIDER_WINDOW", "50"))  # 统计延迟和错误率的最近调用数
+    LLM_PROVIDER_ERROR_THRESHOLD = float(os.getenv("LLM_PROVIDER_ERROR_THRESHOLD", "0.5"))  # 错误率超过该值视为不健康
+    LLM_PROVIDER_COOLDOWN_SECONDS = float(os.getenv("LLM_PROVIDER_COOLDOWN_SECONDS", "30"))  # 不健康供应商的降级时长
+    LLM_PROVIDER_LATENCY_RATIO = float(os.getenv("LLM_PROVIDER_LATENCY_RATIO", "2.0"))  # 备用供应商快这么多倍时优先使用
+
     # === 对话配置 ===
     MAX_CONVERSATION_HISTORY = int(os.getenv("MAX_CONVERSATION_HISTORY", "20"))
     MEMORY_WINDOW_SIZE = int(os.getenv("MEMORY_WINDOW_SIZE", "10"))
-    
+
+    # === 提示词token预算 ===
+    # 角色回复的输入token总预算（角色设定、回复指导和当前消息必须保留，其余段落按优先级分配剩余预算）
+    PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "4000"))
+    # 可裁剪段落的预算分配顺序，预算不足时排在后面的段落先被裁剪
+    PROMPT_SECTION_PRIORITIES = ["search", "rag", "cot", "history", "memory"]
+    # 各可裁剪段落最多占总预算的比例，如 PROMPT_SECTION_SHARES='{"history": 0.5}'
+    PROMPT_SECTION_SHARES = {
+        "search": 0.3,
+        "rag": 0.3,
+        "cot": 0.1,
+        "history": 0.4,
+        "memory": 0.1,
+        **json.loads(os.getenv("PROMPT_SECTION_SHARES", "{}"))
+    }
+
+    # === 重复提问答案缓存配置 ===
+    ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+    # 各聊天类型的保鲜时间（秒），0表示不缓存；实时信息类时效性强，不缓存
+    # 可用JSON环境变量覆盖，如 ANSWER_CACHE_TTL_SECONDS='{"casual": 300}'
+    ANSWER_CACHE_TTL_SECONDS = {
+        "greeting": 1800,
+        "casual": 600,
+        "emotional_support": 300,
+        "problem_solving": 3600,
+        "document_related": 1800,
+        "real_time_info": 0,
+        **json.loads(os.getenv("ANSWER_CACHE_TTL_SECONDS", "{}"))
+    }
+    ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.8"))  # 近似匹配的最低相似度
+    # 只做精确匹配的聊天类型（问题求助、情感支持差一个字答案就可能完全不同）
+    ANSWER_CACHE_EXACT_ONLY = tuple(
+        chat_type.strip()
+        for chat_type in os.getenv("ANSWER_CACHE_EXACT_ONLY", "problem_solving,emotional_support").split(",")
+        if chat_type.strip()
+    )
+    ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "20"))  # 每个 (用户, 角色) 的问答数上限
+    ANSWER_CACHE_MAX_USERS = int(os.getenv("ANSWER_CACHE_MAX_USERS", "1000"))
+    # 命中时给回复加“再跟您说一遍”之类的引导语（改写后需重新合成音频，仍跳过LLM和RAG）
+    ANSWER_CACHE_REPHRASE = os.getenv("ANSWER_CACHE_REPHRASE", "false").lower() == "true"
+
+    # === LLM辅助调用结果缓存配置（查询扩展、文档摘要、关键词） ===
+    LLM_MEMO_CACHE_ENABLED = os.getenv("LLM_MEMO_CACHE_ENABLED", "true").lower() == "true"
+    LLM_MEMO_CACHE_DB = os.getenv("LLM_MEMO_CACHE_DB", "")  # 为空时使用 ai_agent/data/llm_memo_cache.db
+    LLM_MEMO_TTL_SECONDS = float(os.getenv("LLM_MEMO_TTL_SECONDS", str(7 * 86400)))
+    LLM_MEMO_MAX_ENTRIES = int(os.getenv("LLM_MEMO_MAX_ENTRIES", "10000"))
+
+    # === 用量与费用统计配置 ===
+    USAGE_DB = os.getenv("USAGE_DB", "")  # 为空时使用 ai_agent/data/usage.db
+    USAGE_FLUSH_INTERVAL_SECONDS = float(os.getenv("USAGE_FLUSH_INTERVAL_SECONDS", "60"))
+    # 各模型单价（元）：LLM按每千输入/输出token，TTS按每千字符，图片按每张；未配置单价的模型只统计用量
+    # 可用JSON环境变量覆盖，如 USAGE_PRICES='{"qwen-flash": {"prompt_per_1k": 0.0002}}'
+    USAGE_PRICES = _merge_json_overrides("USAGE_PRICES", {
+        LLM_MODEL: {"prompt_per_1k": 0.006, "completion_per_1k": 0.024},
+        LLM_FAST_MODEL: {"prompt_per_1k": 0.00015, "completion_per_1k": 0.0015},
+        TTS_MODEL: {"per_1k_chars": 0.216},
+        "dall-e-3": {"per_image": 0.29}
+    })
+
+    # === 会话状态配置 ===
+    SESSION_STORE_MAX_SESSIONS = int(os.getenv("SESSION_STORE_MAX_SESSIONS", "1000"))
+    SESSION_TTL_SECONDS = float(os.getenv("SESSION_TTL_SECONDS", "3600"))
+
+    # === 对话图检查点 ===
+    # none: 每轮重新构建状态；memory: 进程内按线程保留；sqlite: 本地SQLite按线程保留（重启后仍可恢复）
+    GRAPH_CHECKPOINTER = os.getenv("GRAPH_CHECKPOINTER", "none")
+    GRAPH_CHECKPOINT_DB = os.getenv("GRAPH_CHECKPOINT_DB", "")  # 为空时使用 ai_agent/data/graph_checkpoints.db
+
+    # === 并发增强配置（单位：秒） ===
+    WEB_SEARCH_TIMEOUT = float(os.getenv("WEB_SEARCH_TIMEOUT", "10"))
+    RAG_TIMEOUT = float(os.getenv("RAG_TIMEOUT", "8"))
+    MEMORY_LOOKUP_TIMEOUT = float(os.getenv("MEMORY_LOOKUP_TIMEOUT", "2"))
+    IMAGE_TIMEOUT = float(os.getenv("IMAGE_TIMEOUT", "45"))
+
+    # === 请求时间预算配置（单位：秒） ===
+    # Java后端AIAgentService的WebClient超时为60秒，预留余量后作为单次请求的总预算
+    REQUEST_DEADLINE_SECONDS = float(os.getenv("REQUEST_DEADLINE_SECONDS", "55"))
+    # 生成回复前的可选阶段需要为主回复生成预留的时间
+    DEADLINE_REPLY_RESERVE_SECONDS = float(os.getenv("DEADLINE_REPLY_RESERVE_SECONDS", "15"))
+    # 各可选阶段至少需要的剩余时间，不足时跳过该阶段
+    DEADLINE_MIN_QUERY_EXPANSION_SECONDS = float(os.getenv("DEADLINE_MIN_QUERY_EXPANSION_SECONDS", "2"))
+    DEADLINE_MIN_COT_SECONDS = float(os.getenv("DEADLINE_MIN_COT_SECONDS", "5"))
+    DEADLINE_MIN_IMAGE_SECONDS = float(os.getenv("DEADLINE_MIN_IMAGE_SECONDS", "15"))
+    DEADLINE_MIN_TTS_SECONDS = float(os.getenv("DEADLINE_MIN_TTS_SECONDS", "3"))
+    QUERY_EXPANSION_TIMEOUT = float(os.getenv("QUERY_EXPANSION_TIMEOUT", "5"))
+    COT_TIMEOUT = float(os.getenv("COT_TIMEOUT", "20"))
+    # CoT在该时间内完成才生成CoT增强回复，否则直接使用草稿（从CoT开始计算，不超过COT_TIMEOUT）
+    COT_SPECULATIVE_BUDGET_SECONDS = float(os.getenv("COT_SPECULATIVE_BUDGET_SECONDS", "6"))
+    # CoT分支与记忆、RAG分支并行，汇合时最多等待CoT这么久；未完成的CoT在回复节点与草稿回复推测执行
+    COT_BRANCH_TIMEOUT = float(os.getenv("COT_BRANCH_TIMEOUT", "3"))
+    TTS_TIMEOUT = float(os.getenv("TTS_TIMEOUT", "30"))
+
+    # === 音频产物存储配置 ===
+    ARTIFACT_STORE_DIR = os.getenv("ARTIFACT_STORE_DIR", "")  # 为空时使用 ai_agent/data/artifacts
+    ARTIFACT_TTL_SECONDS = float(os.getenv("ARTIFACT_TTL_SECONDS", "86400"))
+    ARTIFACT_MAX_BYTES = int(os.getenv("ARTIFACT_MAX_BYTES", str(512 * 1024 * 1024)))
+    # 聊天响应默认是否内联audio_base64（Java后端和前端目前依赖内联音频，请求中可单独指定）
+    AUDIO_INLINE_BASE64 = os.getenv("AUDIO_INLINE_BASE64", "true").lower() == "true"
+
+    # === 问候语音频缓存配置 ===
+    GREETING_AUDIO_CACHE_DIR = os.getenv("GREETING_AUDIO_CACHE_DIR", "")  # 为空时使用 ai_agent/data/greeting_audio
+    GREETING_AUDIO_PREWARM = os.getenv("GREETING_AUDIO_PREWARM", "true").lower() == "true"  # 启动时后台预生成
+
+    # === 上游并发限制配置 ===
+    # 每个上游：最大并发调用数、最大排队数、最长排队时间（秒）；可用JSON环境变量覆盖部分上游
+    UPSTREAM_LIMITS = _merge_json_overrides("UPSTREAM_LIMITS", {
+        "llm": {"max_in_flight": 32, "max_queue": 64, "max_queue_wait": 5.0},         # DashScope LLM
+        "tts": {"max_in_flight": 8, "max_queue": 32, "max_queue_wait": 5.0},          # OpenAI TTS
+        "image": {"max_in_flight": 2, "max_queue": 4, "max_queue_wait": 3.0},         # DALL-E
+        "web_search": {"max_in_flight": 8, "max_queue": 32, "max_queue_wait": 3.0},   # 搜索API
+        "asr": {"max_in_flight": 8, "max_queue": 16, "max_queue_wait": 5.0}           # DashScope ASR
+    })
+
+    # === 分句流水线TTS配置 ===
+    TTS_PIPELINE_MAX_CONCURRENCY = int(os.getenv("TTS_PIPELINE_MAX_CONCURRENCY", "3"))
+    TTS_PIPELINE_MIN_SENTENCE_CHARS = int(os.getenv("TTS_PIPELINE_MIN_SENTENCE_CHARS", "4"))
+
     @classmethod
     def validate(cls) -> bool:
         """验证必要的配置项"""
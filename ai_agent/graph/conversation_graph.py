@@ -1,72 +1,219 @@
 """
 对话图工作流 - 使用LangGraph管理对话状态和流程
-实现ASR -> 意图分析 -> 路由 -> 角色节点 -> GraphRAG -> 输出 -> TTS的完整流程
+实现ASR -> 意图分析 -> 路由 -> 记忆/GraphRAG/CoT并行分支 -> 角色节点 -> 输出 -> TTS的完整流程
+结构化回复模式下由单次结构化调用代替意图分析、路由和角色节点
 """
 
-from typing import Dict, List, Any, Optional, Literal
+from typing import Dict, List, Any, Optional, Literal, Tuple
+from pathlib import Path
+import asyncio
+from collections import deque
 from langgraph.graph import StateGraph, END
+from langgraph.checkpoint.memory import InMemorySaver
+from langchain_core.runnables import RunnableConfig
 from langchain.schema import BaseMessage, HumanMessage, AIMessage
+import inspect
 import json
 import random
+import time
 from datetime import datetime
 
 from agents.character_agent import CharacterManager
 from memory.conversation_memory import ConversationMemory
-from models.state import ConversationState, Router
+from memory.session_store import session_store, SessionState
+from models.state import ConversationState, Router, GraphRAGResult
 from graph.router import router
 from rag.graph_rag import graph_rag
 from services.audio_service import audio_service
+from config import Config
+from services.deadline import Deadline
+from services.concurrency_limiter import UpstreamOverloadedError
+from services.usage_tracker import usage_tracker
+from services.trigger_detector import trigger_detector
 from reasoning.cot_processor import cot_processor
+from reasoning.speculative_cot import speculative_cot
+
+try:
+    import aiosqlite
+    from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+    SQLITE_CHECKPOINT_AVAILABLE = True
+except ImportError:
+    SQLITE_CHECKPOINT_AVAILABLE = False
 
 
 class ConversationGraph:
     """对话图工作流管理器 - 基于新的路由架构"""
     
-    def __init__(self):
-        """初始化对话图"""
+    # 功能路由类型 -> 回复类型
+    ROUTE_RESPONSE_TYPES = {
+        "health-concern": "health_focused",
+        "emotional-support": "emotional_support",
+        "knowledge-query": "knowledge_query"
+    }
+    
+    # 路由类型 -> 回复角色（健康和知识问题由儿子回复，更理性和专业；情感支持由女儿回复，更温暖贴心）
+    ROUTE_CHARACTERS = {
+        "character-xiyang": "xiyang",
+        "character-meiyang": "meiyang",
+        "character-lanyang": "lanyang",
+        "health-concern": "xiyang",
+        "emotional-support": "meiyang",
+        "knowledge-query": "xiyang"
+    }
+    
+    # 生成回复前并行执行的分支
+    BRANCHES = ("memory_branch", "rag_branch", "cot_branch")
+    
+    # 检查点中跨轮次保留的字段，其余字段每轮由请求重新设置
+    # （记忆上下文按本轮消息查询相关记忆，每轮重新查询，不从检查点恢复）
+    RESUMED_FIELDS = {"messages"}
+    
+    def __init__(self, checkpointer: Optional[str] = None, checkpoint_db: Optional[str] = None):
+        """
+        初始化对话图
+        
+        Args:
+            checkpointer: 检查点类型（none/memory/sqlite，为空时使用Config.GRAPH_CHECKPOINTER）
+            checkpoint_db: SQLite检查点数据库路径
+        """
         self.character_manager = CharacterManager()
         self.memory = ConversationMemory()
         self.graph = self._build_graph()
         
-        print("✅ 对话图工作流初始化完成")
+        self.checkpointer = (checkpointer or Config.GRAPH_CHECKPOINTER).lower()
+        if self.checkpointer == "sqlite" and not SQLITE_CHECKPOINT_AVAILABLE:
+            print("⚠️ 未安装langgraph-checkpoint-sqlite，改用进程内检查点")
+            self.checkpointer = "memory"
+        self.checkpoint_db = checkpoint_db or Config.GRAPH_CHECKPOINT_DB or str(
+            Path(__file__).parent.parent / "data" / "graph_checkpoints.db"
+        )
+        self.compilations = 0
+        self.turns = 0
+        self.resumed_turns = 0
+        # 知识检索分支：各状态（retrieved/reused/skipped/timeout/error）的轮数和最近的检索耗时
+        self.rag_retrievals: Dict[str, int] = {}
+        self.rag_latencies_ms: deque = deque(maxlen=1000)
+        
+        # 图只编译一次；SQLite检查点的连接需要在事件循环中创建，在首轮对话时编译
+        self._app = None
+        self._app_loop: Optional[asyncio.AbstractEventLoop] = None
+        self._saver = None
+        if self.checkpointer != "sqlite":
+            self._app = self._compile(InMemorySaver() if self.checkpointer == "memory" else None)
+        
+        print(f"✅ 对话图工作流初始化完成（检查点: {self.checkpointer}）")
+    
+    def _compile(self, saver=None):
+        """编译对话图"""
+        self.compilations += 1
+        return self.graph.compile(checkpointer=saver)
+    
+    async def _get_app(self):
+        """获取编译好的图（SQLite检查点按事件循环创建连接，事件循环不变时只编译一次）"""
+        if self.checkpointer != "sqlite":
+            return self._app
+        loop = asyncio.get_running_loop()
+        if self._app is None or self._app_loop is not loop:
+            if self._saver is not None:
+                await self._saver.conn.close()
+            Path(self.checkpoint_db).parent.mkdir(parents=True, exist_ok=True)
+            self._saver = AsyncSqliteSaver(aiosqlite.connect(self.checkpoint_db))
+            self._app = self._compile(self._saver)
+            self._app_loop = loop
+        return self._app
+    
+    async def _prune_checkpoints(self, thread_id: str):
+        """
+        只保留线程每个命名空间最新的检查点（恢复对话只需要最新状态）
+        只使用检查点保存器的公开接口（SQLite保存器没有实现aprune）：取出各命名空间最新的检查点及其待处理写入，
+        删除整个线程后重新写入
+        """
+        if self.checkpointer != "sqlite" or self._saver is None:
+            return
+        counts: Dict[str, int] = {}
+        async for checkpoint in self._saver.alist({"configurable": {"thread_id": thread_id}}):
+            checkpoint_ns = checkpoint.config["configurable"].get("checkpoint_ns", "")
+            counts[checkpoint_ns] = counts.get(checkpoint_ns, 0) + 1
+        if all(count <= 1 for count in counts.values()):
+            return
+        
+        latest = [
+            await self._saver.aget_tuple({"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns}})
+            for checkpoint_ns in counts
+        ]
+        await self._saver.adelete_thread(thread_id)
+        for checkpoint in latest:
+            config = await self._saver.aput(
+                {"configurable": {
+                    "thread_id": thread_id,
+                    "checkpoint_ns": checkpoint.config["configurable"].get("checkpoint_ns", "")
+                }},
+                checkpoint.checkpoint,
+                checkpoint.metadata,
+                checkpoint.checkpoint["channel_versions"]
+            )
+            writes_by_task: Dict[str, List[Tuple[str, Any]]] = {}
+            for task_id, channel, value in checkpoint.pending_writes or []:
+                writes_by_task.setdefault(task_id, []).append((channel, value))
+            for task_id, writes in writes_by_task.items():
+                await self._saver.aput_writes(config, writes, task_id)
+    
+    async def aclose(self):
+        """关闭SQLite检查点连接"""
+        if self._saver is not None:
+            await self._saver.conn.close()
+            self._saver, self._app, self._app_loop = None, None, None
     
     def _build_graph(self) -> StateGraph:
         """构建新的对话处理图"""
         # 创建状态图
         graph = StateGraph(ConversationState)
         
-        # === 添加所有节点 ===
-        graph.add_node("start", self._start_node)
-        graph.add_node("analyze_and_route_query", self._analyze_and_route_query)
-        graph.add_node("route_query", self._route_query_placeholder)  # 路由决策节点
+        # === 添加所有节点（每个节点的耗时记录在state.context["node_timings"]中） ===
+        def add_node(name: str, node):
+            graph.add_node(name, self._timed(name, node))
+        
+        add_node("start", self._start_node)
+        add_node("analyze_and_route_query", self._analyze_and_route_query)
+        add_node("route_query", self._route_query_placeholder)  # 路由决策节点
+        add_node("structured_reply", self._structured_reply_node)  # 单次结构化回复
+        
+        # 并行分支：记忆查询、RAG检索、CoT推理互不依赖，在生成回复前汇合
+        add_node("memory_branch", self._memory_branch)
+        add_node("rag_branch", self._rag_branch)
+        add_node("cot_branch", self._cot_branch)
+        add_node("join_branches", self._join_branches)
         
         # 角色节点
-        graph.add_node("xiyang_node", self._xiyang_character_node)
-        graph.add_node("meiyang_node", self._meiyang_character_node)
-        graph.add_node("lanyang_node", self._lanyang_character_node)
-        graph.add_node("general_response", self._general_response_node)
+        add_node("xiyang_node", self._xiyang_character_node)
+        add_node("meiyang_node", self._meiyang_character_node)
+        add_node("lanyang_node", self._lanyang_character_node)
+        add_node("general_response", self._general_response_node)
         
         # 功能节点
-        graph.add_node("health_concern_node", self._health_concern_node)
-        graph.add_node("emotional_support_node", self._emotional_support_node)
-        graph.add_node("knowledge_query_node", self._knowledge_query_node)
+        add_node("health_concern_node", self._health_concern_node)
+        add_node("emotional_support_node", self._emotional_support_node)
+        add_node("knowledge_query_node", self._knowledge_query_node)
         
-        # Graph RAG 和输出节点
-        graph.add_node("graphrag", self._graphrag_node)
-        graph.add_node("model_response_check", self._model_response_check)
-        graph.add_node("output", self._output_node)
+        # 输出节点
+        add_node("model_response_check", self._model_response_check)
+        add_node("output", self._output_node)
         
         # === 定义边和条件路由 ===
         graph.set_entry_point("start")
-        
-        # 基本流程
         graph.add_edge("start", "analyze_and_route_query")
         
-        # 条件路由 - 从analyze_and_route_query到不同的角色/功能节点
+        # 路由确定回复角色后，同时启动各分支，全部完成（或超时）后汇合
+        for branch in self.BRANCHES:
+            graph.add_edge("analyze_and_route_query", branch)
+        graph.add_edge(list(self.BRANCHES), "join_branches")
+        
+        # 结构化回复模式一次调用完成路由、分析和回复，否则按路由结果进入角色/功能节点
         graph.add_conditional_edges(
-            "analyze_and_route_query",
-            lambda state: router.route_query(state),
+            "join_branches",
+            lambda state: "structured_reply" if state.reply_mode == "structured" else router.route_query(state),
             {
+                "structured_reply": "structured_reply",
                 "xiyang_node": "xiyang_node",
                 "meiyang_node": "meiyang_node", 
                 "lanyang_node": "lanyang_node",
@@ -77,18 +224,39 @@ class ConversationGraph:
             }
         )
         
-        # 所有角色/功能节点都连接到graphrag
+        # 所有角色/功能节点都连接到回复检查
         for node_name in ["xiyang_node", "meiyang_node", "lanyang_node", "general_response", 
-                         "health_concern_node", "emotional_support_node", "knowledge_query_node"]:
-            graph.add_edge(node_name, "graphrag")
+                         "health_concern_node", "emotional_support_node", "knowledge_query_node",
+                         "structured_reply"]:
+            graph.add_edge(node_name, "model_response_check")
         
-        # graphrag -> model_response_check -> output -> END
-        graph.add_edge("graphrag", "model_response_check")
+        # model_response_check -> output -> END
         graph.add_edge("model_response_check", "output")
         graph.add_edge("output", END)
         
         return graph
     
+    @staticmethod
+    def _timed(name: str, node):
+        """包装节点并记录耗时：顺序节点直接写入context，并行分支写入branch_timings，在汇合节点合并"""
+        pass_config = "config" in inspect.signature(node).parameters
+        
+        async def timed_node(state: ConversationState, config: RunnableConfig):
+            started_at = time.perf_counter()
+            if pass_config:
+                result = node(state, config)
+            else:
+                result = node(state)
+            if inspect.isawaitable(result):
+                result = await result
+            elapsed_ms = round((time.perf_counter() - started_at) * 1000, 1)
+            if isinstance(result, ConversationState):
+                result.context.setdefault("node_timings", {})[name] = elapsed_ms
+            else:
+                result = {**(result or {}), "branch_timings": {name: elapsed_ms}}
+            return result
+        return timed_node
+    
     def _start_node(self, state: ConversationState) -> ConversationState:
         """
         开始节点 - 初始化和预处理
@@ -104,9 +272,13 @@ class ConversationGraph:
         # 清理和标准化输入
         state.user_input = state.user_input.strip()
         
-        # 添加到消息历史
+        # 检查点中恢复了该线程之前的消息
+        resumed = bool(state.messages)
+        
+        # 添加到消息历史（恢复的线程只保留最近的消息）
         if state.user_input:
             state.messages.append(HumanMessage(content=state.user_input))
+        state.messages = state.messages[-Config.MAX_CONVERSATION_HISTORY:]
             
         # 更新时间戳
         state.timestamp = datetime.now().isoformat()
@@ -115,7 +287,8 @@ class ConversationGraph:
         if not state.context:
             state.context = {
                 "conversation_turn": len(state.messages),
-                "session_start": state.timestamp
+                "session_start": state.timestamp,
+                "resumed": resumed
             }
         
         print(f"📝 用户输入已处理: {state.user_input}")
@@ -131,18 +304,24 @@ class ConversationGraph:
         Returns:
             包含路由信息的状态
         """
+        # 结构化回复模式由回复本身给出路由，这里只确定角色
+        if state.reply_mode == "structured":
+            state.selected_character = state.selected_character or Config.DEFAULT_CHARACTER
+            return state
+        
         print("🔍 开始意图分析和路由...")
         
         # 调用路由器进行分析
         state = await router.analyze_and_route_query(state)
         
-        # 从记忆系统获取相关上下文
-        memory_context = self.memory.get_relevant_memory(
-            user_id=state.user_id,
-            character_id=state.selected_character,
-            query=state.user_input
-        )
-        state.memory_context = memory_context
+        # 在并行分支开始前确定回复角色和回复类型（记忆查询和CoT推理都按回复角色进行）
+        route = state.router.type if state.router else "general-query"
+        state.selected_character = self.ROUTE_CHARACTERS.get(route) or state.selected_character or "xiyang"
+        response_type = self.ROUTE_RESPONSE_TYPES.get(route)
+        if response_type:
+            state.context["response_type"] = response_type
+        if route == "knowledge-query":
+            state.context["needs_rag"] = True
         
         return state
     
@@ -153,50 +332,48 @@ class ConversationGraph:
         # 这个节点实际上不会被执行，路由逻辑在条件边中
         return state
     
-    async def _xiyang_character_node(self, state: ConversationState) -> ConversationState:
+    async def _xiyang_character_node(self, state: ConversationState, config: RunnableConfig) -> ConversationState:
         """喜羊羊（儿子）角色节点"""
-        return await self._generate_character_response(state, "xiyang")
+        return await self._generate_character_response(state, "xiyang", config)
     
-    async def _meiyang_character_node(self, state: ConversationState) -> ConversationState:
+    async def _meiyang_character_node(self, state: ConversationState, config: RunnableConfig) -> ConversationState:
         """美羊羊（女儿）角色节点"""
-        return await self._generate_character_response(state, "meiyang")
+        return await self._generate_character_response(state, "meiyang", config)
     
-    async def _lanyang_character_node(self, state: ConversationState) -> ConversationState:
+    async def _lanyang_character_node(self, state: ConversationState, config: RunnableConfig) -> ConversationState:
         """懒羊羊（孙子）角色节点"""
-        return await self._generate_character_response(state, "lanyang")
+        return await self._generate_character_response(state, "lanyang", config)
     
-    async def _general_response_node(self, state: ConversationState) -> ConversationState:
+    async def _general_response_node(self, state: ConversationState, config: RunnableConfig) -> ConversationState:
         """通用回复节点"""
-        # 根据上下文选择合适的角色
-        preferred_character = state.selected_character or "xiyang"
-        return await self._generate_character_response(state, preferred_character)
-    
-    async def _health_concern_node(self, state: ConversationState) -> ConversationState:
-        """健康关注处理节点"""
-        # 健康问题优先使用儿子角色（更理性和专业）
-        state.context["response_type"] = "health_focused"
-        return await self._generate_character_response(state, "xiyang")
-    
-    async def _emotional_support_node(self, state: ConversationState) -> ConversationState:
-        """情感支持处理节点"""
-        # 情感支持优先使用女儿角色（更温暖贴心）
-        state.context["response_type"] = "emotional_support"
-        return await self._generate_character_response(state, "meiyang")
-    
-    async def _knowledge_query_node(self, state: ConversationState) -> ConversationState:
-        """知识查询处理节点"""
-        # 知识查询需要更多理性思考，使用儿子角色
-        state.context["response_type"] = "knowledge_query"
-        state.context["needs_rag"] = True
-        return await self._generate_character_response(state, "xiyang")
-    
-    async def _generate_character_response(self, state: ConversationState, character_id: str) -> ConversationState:
+        # 使用路由时确定的角色
+        return await self._generate_character_response(state, state.selected_character, config)
+    
+    async def _health_concern_node(self, state: ConversationState, config: RunnableConfig) -> ConversationState:
+        """健康关注处理节点（回复类型和角色在路由时确定）"""
+        return await self._generate_character_response(state, self.ROUTE_CHARACTERS["health-concern"], config)
+    
+    async def _emotional_support_node(self, state: ConversationState, config: RunnableConfig) -> ConversationState:
+        """情感支持处理节点（回复类型和角色在路由时确定）"""
+        return await self._generate_character_response(state, self.ROUTE_CHARACTERS["emotional-support"], config)
+    
+    async def _knowledge_query_node(self, state: ConversationState, config: RunnableConfig) -> ConversationState:
+        """知识查询处理节点（回复类型、角色和知识增强在路由时确定）"""
+        return await self._generate_character_response(state, self.ROUTE_CHARACTERS["knowledge-query"], config)
+    
+    async def _generate_character_response(
+        self, 
+        state: ConversationState, 
+        character_id: str, 
+        config: Optional[RunnableConfig] = None
+    ) -> ConversationState:
         """
         生成角色回应的通用方法（支持CoT推理）
         
         Args:
             state: 对话状态
             character_id: 角色ID
+            config: 图运行配置（configurable中携带请求时间预算）
             
         Returns:
             更新后的状态
@@ -206,53 +383,26 @@ class ConversationGraph:
             state.selected_character = character_id
             
             # 构建用户上下文
-            user_context = {
-                "intent": state.intent,
-                "time": datetime.now().strftime("%Y-%m-%d %H:%M"),
-                "memory": state.memory_context,
-                "router_info": state.router.model_dump() if state.router else {},
-                "response_type": state.context.get("response_type", "normal")
-            }
+            user_context = self._user_context(state)
             
-            # Step 1: 执行CoT推理（仅对成年角色）
-            cot_result = await cot_processor.perform_cot_reasoning(
-                character_id=character_id,
-                user_message=state.user_input,
-                context=user_context
+            # Step 1-2: 按CoT分支的结果生成回复（仅对成年角色），使用该用户/角色/线程独立的会话状态
+            deadline = self._get_deadline(config)
+            session = self.get_session(state.user_id, character_id, state.session_id)
+            response_data, cot_result = await self._reply_with_cot(
+                state, character_id, user_context, session, deadline, self._pop_pending_cot(config)
             )
             
-            # 确保cot_result不为None
-            if not cot_result:
-                print("⚠️ CoT推理返回空结果，使用默认配置")
-                cot_result = {
-                    "use_cot": False,
-                    "reasoning_steps": [],
-                    "final_analysis": "使用默认回应"
-                }
-            
-            # 将CoT结果添加到上下文
-            if cot_result.get("use_cot", False):
-                user_context["cot_analysis"] = cot_result["final_analysis"]
-                user_context["reasoning_depth"] = "deep_thinking"
-                
-                # 保存推理过程到状态中
+            # 保存推理过程到状态中
+            if cot_result:
                 state.context["cot_reasoning"] = {
                     "steps_count": len(cot_result.get("reasoning_steps", [])),
                     "analysis": cot_result["final_analysis"],
                     "character_focus": cot_result.get("character_focus", [])
                 }
-                
                 print(f"🧠 {character_id} 完成CoT推理，{len(cot_result.get('reasoning_steps', []))} 个思考步骤")
             
-            # Step 2: 生成角色回应
-            response_data = self.character_manager.generate_response(
-                user_message=state.user_input,
-                character_id=character_id,
-                user_context=user_context
-            )
-            
             # Step 3: 用CoT结果增强回复
-            if cot_result and cot_result.get("use_cot", False):
+            if cot_result:
                 enhanced_response = cot_processor.enhance_response_with_cot(
                     original_response=response_data["response"],
                     cot_result=cot_result,
@@ -277,6 +427,9 @@ class ConversationGraph:
             
             return state
             
+        except UpstreamOverloadedError:
+            # 上游繁忙时不生成错误回复，交给接口返回429/503
+            raise
         except Exception as e:
             print(f"❌ 角色回应生成失败: {e}")
             # 返回明确的错误信息，不使用模糊的fallback
@@ -285,53 +438,350 @@ class ConversationGraph:
             state.error = str(e)
             return state
     
-    async def _graphrag_node(self, state: ConversationState) -> ConversationState:
+    async def _reply_with_cot(
+        self,
+        state: ConversationState,
+        character_id: str,
+        user_context: Dict[str, Any],
+        session: SessionState,
+        deadline: Optional[Deadline],
+        pending_cot: Optional[Tuple[asyncio.Task, float]]
+    ) -> Tuple[Dict[str, Any], Optional[Dict[str, Any]]]:
         """
-        Graph RAG 知识增强节点
+        按CoT分支的结果生成回复：
+        - CoT在分支汇合前完成：直接生成CoT增强回复
+        - CoT在汇合时仍在进行：与草稿回复同时进行，CoT在预算内完成时改用CoT增强回复，否则直接使用草稿
+        - 没有CoT（懒羊羊、预算不足）：直接生成回复
         
         Args:
             state: 对话状态
+            character_id: 角色ID
+            user_context: 用户上下文（不含CoT分析）
+            session: 会话状态
+            deadline: 请求时间预算
+            pending_cot: 汇合时仍在进行的CoT任务及其截止时间（perf_counter）
             
         Returns:
-            增强了知识的状态
+            (回应数据, 采用的CoT结果（使用草稿时为None）)
+        """
+        agent = self.character_manager.get_agent(character_id)
+        if not agent:
+            raise ValueError(f"角色 {character_id} 不存在")
+        
+        def cot_context(cot_result: Dict[str, Any]) -> Dict[str, Any]:
+            informed_context = dict(user_context)
+            informed_context["cot_analysis"] = cot_result["final_analysis"]
+            informed_context["reasoning_depth"] = "deep_thinking"
+            return informed_context
+        
+        if state.cot_result and state.cot_result.get("use_cot", False):
+            informed_context = cot_context(state.cot_result)
+            reply = await agent.draft_response(state.user_input, informed_context, session)
+            return agent.commit_response(state.user_input, reply, informed_context, session), state.cot_result
+        if pending_cot is None:
+            draft = await agent.draft_response(state.user_input, user_context, session)
+            return agent.commit_response(state.user_input, draft, user_context, session), None
+        
+        cot_task, cot_deadline = pending_cot
+        drafted = {}
+        
+        async def run_draft():
+            drafted["draft"] = await agent.draft_response(state.user_input, user_context, session)
+            return drafted["draft"]
+        
+        async def run_informed(cot_result: Dict[str, Any]):
+            informed_context = cot_context(cot_result)
+            # 草稿已完成联网搜索时直接复用结果，不再重复搜索
+            draft_context = drafted.get("draft", {}).get("context", {})
+            if "web_search_result" in draft_context:
+                informed_context["web_search_result"] = draft_context["web_search_result"]
+            return await agent.draft_response(state.user_input, informed_context, session)
+        
+        reply, cot_result, path = await speculative_cot.run(
+            cot=lambda: cot_task,
+            draft=run_draft,
+            informed=run_informed,
+            budget=max(0.0, cot_deadline - time.perf_counter())
+        )
+        state.context["speculative_cot"] = path
+        if path == "draft_timeout" and deadline:
+            deadline.degrade("cot", "timeout")
+        
+        committed_context = cot_context(cot_result) if cot_result else user_context
+        return agent.commit_response(state.user_input, reply, committed_context, session), cot_result
+    
+    async def _structured_reply_node(self, state: ConversationState) -> ConversationState:
         """
-        print("📚 开始Graph RAG知识增强...")
+        单次结构化回复节点 - 一次LLM调用同时返回路由、简要分析、情绪和回复
+        角色由请求指定，模型给出的路由类型只用于标记回复类型和后续的知识增强判断
         
+        Args:
+            state: 对话状态
+            
+        Returns:
+            更新后的状态
+        """
+        character_id = state.selected_character or Config.DEFAULT_CHARACTER
         try:
-            # 检查是否需要知识增强
+            state.selected_character = character_id
+            user_context = {**self._user_context(state), "router_info": {}, "response_type": "normal"}
+            
+            session = self.get_session(state.user_id, character_id, state.session_id)
+            response_data = await self.character_manager.generate_structured_response(
+                user_message=state.user_input,
+                character_id=character_id,
+                user_context=user_context,
+                session=session
+            )
+            
+            state.router = Router(
+                type=response_data["route"],
+                logic=response_data["analysis"] or "单次结构化回复",
+                confidence=1.0,
+                character_preference=character_id
+            )
+            response_type = self.ROUTE_RESPONSE_TYPES.get(response_data["route"])
+            if response_type:
+                state.context["response_type"] = response_type
+            if response_data["route"] == "knowledge-query":
+                state.context["needs_rag"] = True
+            state.context["structured_reply"] = {"analysis": response_data["analysis"]}
+            
+            state.assistant_response = response_data["response"]
+            state.emotion = response_data["emotion"]
+            state.voice_config = response_data.get("voice_config", {})
+            state.messages.append(AIMessage(content=response_data["response"]))
+            
+            print(f"🧩 {response_data['character_name']} 单次结构化回复 ({response_data['route']}): "
+                  f"{response_data['response'][:50]}...")
+            return state
+            
+        except UpstreamOverloadedError:
+            raise
+        except Exception as e:
+            print(f"❌ 结构化回复生成失败: {e}")
+            state.assistant_response = f"抱歉，系统遇到技术问题：{str(e)[:50]}..."
+            state.emotion = "error"
+            state.error = str(e)
+            return state
+    
+    def _user_context(self, state: ConversationState) -> Dict[str, Any]:
+        """构建角色回复和CoT推理使用的用户上下文（有知识检索结果时附带，用于回复提示词的文档参考信息）"""
+        user_context = {
+            "intent": state.intent,
+            "time": datetime.now().strftime("%Y-%m-%d %H:%M"),
+            "memory": state.memory_context,
+            "router_info": state.router.model_dump() if state.router else {},
+            "response_type": state.context.get("response_type", "normal")
+        }
+        if state.rag_context:
+            user_context["rag_result"] = GraphRAGResult(relevant_contexts=state.rag_context)
+        return user_context
+    
+    async def _run_branch(
+        self,
+        stage: str,
+        factory,
+        timeout: float,
+        config: Optional[RunnableConfig],
+        min_seconds: float = 0.0
+    ) -> Any:
+        """
+        在分支自身的超时内执行（有请求时间预算时不超过剩余预算，并为回复生成预留时间）
+        
+        Args:
+            stage: 阶段名称
+            factory: 返回协程的工厂函数
+            timeout: 分支自身的超时
+            config: 图运行配置
+            min_seconds: 该分支至少需要的时间，不足时跳过
+            
+        Returns:
+            分支结果，跳过或超时时返回None
+        """
+        deadline = self._get_deadline(config)
+        if deadline:
+            return await deadline.run(
+                stage, factory, timeout, min_seconds=min_seconds, reserve=Config.DEADLINE_REPLY_RESERVE_SECONDS
+            )
+        try:
+            return await asyncio.wait_for(factory(), timeout=timeout)
+        except asyncio.TimeoutError:
+            print(f"⏳ 分支超时: {stage}")
+            return None
+    
+    async def _memory_branch(self, state: ConversationState, config: RunnableConfig) -> Dict[str, Any]:
+        """
+        记忆查询分支 - 按回复角色和本轮消息查询相关记忆
+        
+        Args:
+            state: 对话状态
+            config: 图运行配置
+            
+        Returns:
+            状态更新（只包含memory_context）
+        """
+        memory_context = await self._run_branch(
+            "memory",
+            lambda: asyncio.to_thread(
+                self.memory.get_relevant_memory,
+                user_id=state.user_id,
+                character_id=state.selected_character,
+                query=state.user_input
+            ),
+            Config.MEMORY_LOOKUP_TIMEOUT,
+            config
+        )
+        if memory_context is None:
+            return {}
+        return {"memory_context": {**memory_context, "character_id": state.selected_character}}
+    
+    async def _rag_branch(self, state: ConversationState, config: RunnableConfig) -> Dict[str, Any]:
+        """
+        Graph RAG 知识检索分支 - 在RAG_TIMEOUT内检索知识图谱和角色文档，检索结果在汇合后用于生成回复
+        
+        Args:
+            state: 对话状态
+            config: 图运行配置
+            
+        Returns:
+            状态更新（rag_context和本轮检索的状态、耗时rag_retrieval）
+        """
+        started_at = time.perf_counter()
+        
+        def retrieval(status: str, contexts: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
+            rag_context = contexts or []
+            return {
+                "rag_context": rag_context,
+                "rag_retrieval": {
+                    "status": status,
+                    "latency_ms": round((time.perf_counter() - started_at) * 1000, 1),
+                    "contexts": len(rag_context)
+                }
+            }
+        
+        # 同一请求中已完成的检索直接复用
+        reused = (config or {}).get("configurable", {}).get("rag_result")
+        if reused is not None:
+            print(f"♻️ 复用本次请求已完成的Graph RAG检索: {len(reused.relevant_contexts)} 个知识上下文")
+            return retrieval("reused", reused.relevant_contexts)
+        
+        try:
+            # 检查是否需要知识增强（按路由结果和知识类触发词判断；需要检索时角色上传的文档一并检索）
+            character_id = state.selected_character
+            features = trigger_detector.detect(state.user_input)
             needs_rag = (
                 state.context.get("needs_rag", False) or
                 state.router and state.router.type == "knowledge-query" or
-                any(keyword in state.user_input.lower() for keyword in 
-                    ["怎么", "为什么", "什么是", "如何", "健康", "养生", "疾病"])
+                features.has("knowledge")
             )
-            
-            if needs_rag:
-                # 根据路由类型确定知识域
-                domain = None
-                if state.router:
-                    if "health" in state.router.type or "健康" in state.user_input:
-                        domain = "health"
-                    elif "emotion" in state.router.type or any(word in state.user_input for word in ["孤单", "难过", "开心"]):
-                        domain = "emotion"
-                    elif "family" in state.router.type:
-                        domain = "family"
-                
-                # 简化知识检索（临时跳过异步调用）
-                print("🔍 Graph RAG 查询: 跳过异步调用（临时修复）")
-                state.rag_context = []
-                
-                print(f"✅ Graph RAG增强完成，获得 0 个知识上下文")
-            else:
+            if not needs_rag:
                 print("ℹ️ 当前对话不需要知识增强")
-                state.rag_context = []
+                return retrieval("skipped")
             
-            return state
+            # 根据路由类型确定知识域
+            domain = None
+            if state.router:
+                if "health" in state.router.type or features.has("health_domain"):
+                    domain = "health"
+                elif "emotion" in state.router.type or features.has("emotion_domain"):
+                    domain = "emotion"
+                elif "family" in state.router.type:
+                    domain = "family"
+            
+            print(f"📚 开始Graph RAG知识检索（知识域: {domain or '全部'}）...")
+            rag_result = await self._run_branch(
+                "rag",
+                lambda: graph_rag.query_knowledge(
+                    query=state.user_input,
+                    character_id=character_id,
+                    domain=domain,
+                    deadline=self._get_deadline(config)
+                ),
+                Config.RAG_TIMEOUT,
+                config
+            )
+            if rag_result is None:
+                deadline = self._get_deadline(config)
+                return retrieval(deadline.degraded_stages.get("rag", "timeout") if deadline else "timeout")
+            
+            print(f"✅ Graph RAG检索完成，获得 {len(rag_result.relevant_contexts)} 个知识上下文")
+            return retrieval("retrieved", rag_result.relevant_contexts)
             
         except Exception as e:
             print(f"❌ Graph RAG处理失败: {e}")
-            state.rag_context = []
-            return state
+            return retrieval("error")
+    
+    async def _cot_branch(self, state: ConversationState, config: RunnableConfig) -> Dict[str, Any]:
+        """
+        CoT推理分支 - 按回复角色进行推理（懒羊羊和结构化回复模式不做CoT）
+        汇合时最多等待COT_BRANCH_TIMEOUT，仍未完成的CoT留给回复节点与草稿回复同时进行
+        
+        Args:
+            state: 对话状态
+            config: 图运行配置
+            
+        Returns:
+            状态更新（CoT在汇合前完成时包含cot_result）
+        """
+        character_id = state.selected_character
+        if state.reply_mode == "structured" or character_id not in cot_processor.character_thinking_templates:
+            return {}
+        
+        # CoT总预算从分支开始计算，剩余预算不足时跳过CoT
+        budget = min(Config.COT_SPECULATIVE_BUDGET_SECONDS, Config.COT_TIMEOUT)
+        deadline = self._get_deadline(config)
+        if deadline:
+            budget = deadline.budget_for(
+                "cot",
+                budget,
+                min_seconds=Config.DEADLINE_MIN_COT_SECONDS,
+                reserve=Config.DEADLINE_REPLY_RESERVE_SECONDS
+            )
+        if budget is None:
+            return {}
+        
+        cot_deadline = time.perf_counter() + budget
+        cot_task = asyncio.ensure_future(cot_processor.perform_cot_reasoning(
+            character_id=character_id,
+            user_message=state.user_input,
+            context=self._user_context(state)
+        ))
+        done, _ = await asyncio.wait({cot_task}, timeout=min(Config.COT_BRANCH_TIMEOUT, budget))
+        if done:
+            if cot_task.exception():
+                print(f"⚠️ CoT推理失败: {cot_task.exception()}")
+                return {}
+            return {"cot_result": cot_task.result()}
+        
+        pending = self._branch_tasks(config)
+        if pending is None:
+            cot_task.cancel()
+            return {}
+        pending["cot"] = (cot_task, cot_deadline)
+        print(f"⏩ CoT未在分支汇合前完成，回复节点继续等待（剩余 {cot_deadline - time.perf_counter():.1f}s）")
+        return {}
+    
+    def _join_branches(self, state: ConversationState) -> ConversationState:
+        """
+        分支汇合节点 - 记录各分支的耗时和本轮知识检索的状态
+        
+        Args:
+            state: 汇合后的对话状态
+            
+        Returns:
+            记录了分支耗时的状态
+        """
+        state.context.setdefault("node_timings", {}).update(state.branch_timings)
+        print("⚡ 并行分支完成: " + ", ".join(f"{name} {ms:.0f}ms" for name, ms in state.branch_timings.items()))
+        
+        if state.rag_retrieval:
+            state.context["rag_retrieval"] = state.rag_retrieval
+            status = state.rag_retrieval["status"]
+            self.rag_retrievals[status] = self.rag_retrievals.get(status, 0) + 1
+            if status == "retrieved":
+                self.rag_latencies_ms.append(state.rag_retrieval["latency_ms"])
+        return state
     
     def _model_response_check(self, state: ConversationState) -> ConversationState:
         """
@@ -435,7 +885,10 @@ class ConversationGraph:
         character_id: str = "xiyang",
         audio_input: Optional[bytes] = None,
         role: str = "elderly",
-        thread_id: Optional[str] = None
+        thread_id: Optional[str] = None,
+        deadline: Optional[Deadline] = None,
+        reply_mode: Optional[str] = None,
+        rag_result: Optional[GraphRAGResult] = None
     ) -> Dict[str, Any]:
         """
         处理完整的对话流程 - 异步版本
@@ -445,10 +898,18 @@ class ConversationGraph:
             user_id: 用户ID
             character_id: 角色ID (初始偏好，可能被路由器覆盖)
             audio_input: 音频输入（可选）
+            thread_id: 线程ID（启用检查点时按线程恢复消息，为空时使用默认线程）
+            deadline: 请求时间预算（为空时按默认预算新建）
+            reply_mode: 回复模式（multi_call/structured，为空时使用Config.REPLY_MODE）
+            rag_result: 本次请求中已完成的Graph RAG检索结果（传入时知识检索分支直接复用，不再检索）
             
         Returns:
-            处理结果
+            处理结果（degraded_stages记录因时间预算被降级的阶段，rag_retrieval记录本轮知识检索的状态和耗时）
         """
+        # 节点和分支中的LLM调用按该预算截短超时
+        deadline = (deadline or Deadline()).bind()
+        usage_tracker.bind(user_id, character_id)
+        branch_tasks: Dict[str, Any] = {}
         try:
             # 创建初始状态
             initial_state = ConversationState(
@@ -456,6 +917,7 @@ class ConversationGraph:
                 user_input=user_input,
                 selected_character=character_id,
                 role=role,
+                reply_mode=reply_mode or Config.REPLY_MODE,
                 timestamp=datetime.now().isoformat(),
                 messages=[],
                 context={},
@@ -467,24 +929,37 @@ class ConversationGraph:
             # 设置线程ID（用于对话连续性）
             if thread_id:
                 initial_state.session_id = thread_id
+            thread_id = thread_id or session_store.default_thread_id(user_id, character_id)
             
             if audio_input:
                 initial_state.audio_input = audio_input
             
             print(f"🚀 开始新的对话流程: {user_input[:30]}...")
             
-            # 编译并运行图
-            app = self.graph.compile()
-            final_state = await app.ainvoke(initial_state)
+            # 运行编译好的图；时间预算通过运行配置传递给各节点，不放入可序列化的对话状态
+            app = await self._get_app()
+            config = {"configurable": {
+                "deadline": deadline,
+                "thread_id": thread_id,
+                "branch_tasks": branch_tasks,
+                "rag_result": rag_result
+            }}
+            # 只传入本轮的字段，启用检查点时消息从该线程的检查点恢复
+            turn_input = initial_state.model_dump(exclude=self.RESUMED_FIELDS)
+            # 检查点只在整轮结束时写入一次
+            durability = {"durability": "exit"} if app.checkpointer else {}
+            final_state = await app.ainvoke(turn_input, config=config, **durability)
+            await self._prune_checkpoints(thread_id)
             
             # 确保final_state是ConversationState对象
-            if not hasattr(final_state, 'selected_character'):
-                print(f"⚠️ final_state类型异常: {type(final_state)}")
-                # 如果是字典，转换为对象属性访问
-                if isinstance(final_state, dict):
-                    final_state = type('obj', (object,), final_state)
-                else:
-                    raise Exception(f"Unexpected final_state type: {type(final_state)}")
+            if isinstance(final_state, dict):
+                final_state = ConversationState(**final_state)
+            elif not hasattr(final_state, 'selected_character'):
+                raise Exception(f"Unexpected final_state type: {type(final_state)}")
+            
+            self.turns += 1
+            if final_state.context.get("resumed"):
+                self.resumed_turns += 1
             
             # 构建返回结果
             try:
@@ -503,12 +978,17 @@ class ConversationGraph:
                 "timestamp": final_state.timestamp,
                 "context": final_state.context,
                 "router_info": final_state.router.model_dump() if final_state.router else None,
-                "rag_enhanced": len(final_state.rag_context) > 0
+                "rag_enhanced": len(final_state.rag_context) > 0,
+                "rag_retrieval": final_state.rag_retrieval,
+                "reply_mode": final_state.reply_mode,
+                "degraded_stages": dict(deadline.degraded_stages)
             }
             
             print(f"✅ 对话流程完成: {final_state.assistant_response[:50]}...")
             return result
             
+        except UpstreamOverloadedError:
+            raise
         except Exception as e:
             print(f"❌ 对话处理出错: {e}")
             error_message = f"对话处理异常: {str(e)[:80]}..."
@@ -518,8 +998,88 @@ class ConversationGraph:
                 "response": error_message,
                 "emotion": "error",
                 "timestamp": datetime.now().isoformat(),
-                "error": str(e)
+                "error": str(e),
+                "degraded_stages": dict(deadline.degraded_stages)
             }
+        finally:
+            # 回复节点没有取走的CoT任务（如回复生成失败）不再需要
+            for task, _ in branch_tasks.values():
+                task.cancel()
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """获取图编译次数和检查点恢复统计"""
+        return {
+            "checkpointer": self.checkpointer,
+            "compilations": self.compilations,
+            "turns": self.turns,
+            "resumed_turns": self.resumed_turns
+        }
+    
+    def get_rag_stats(self) -> Dict[str, Any]:
+        """获取知识检索分支各状态的轮数和检索耗时p50/p95（毫秒）"""
+        latencies = sorted(self.rag_latencies_ms)
+        
+        def percentile(q: float) -> Optional[float]:
+            return latencies[min(len(latencies) - 1, int(len(latencies) * q))] if latencies else None
+        
+        return {
+            "turns": dict(self.rag_retrievals),
+            "latency_p50_ms": percentile(0.5),
+            "latency_p95_ms": percentile(0.95)
+        }
+    
+    @staticmethod
+    def _get_deadline(config: Optional[RunnableConfig]) -> Optional[Deadline]:
+        """从图运行配置中取出请求时间预算"""
+        if not config:
+            return None
+        return config.get("configurable", {}).get("deadline")
+    
+    @staticmethod
+    def _branch_tasks(config: Optional[RunnableConfig]) -> Optional[Dict[str, Any]]:
+        """从图运行配置中取出本轮分支留给后续节点的任务（不放入可序列化的对话状态）"""
+        if not config:
+            return None
+        return config.get("configurable", {}).get("branch_tasks")
+    
+    def _pop_pending_cot(self, config: Optional[RunnableConfig]) -> Optional[Tuple[asyncio.Task, float]]:
+        """取出汇合时仍在进行的CoT任务"""
+        pending = self._branch_tasks(config)
+        return pending.pop("cot", None) if pending else None
+    
+    def get_session(self, user_id: str, character_id: str, thread_id: Optional[str] = None) -> SessionState:
+        """
+        获取会话状态，首次访问时从长期记忆加载最近的对话历史
+        
+        Args:
+            user_id: 用户ID
+            character_id: 角色ID
+            thread_id: 线程ID
+            
+        Returns:
+            会话状态
+        """
+        session = session_store.get_or_create(user_id, character_id, thread_id)
+        
+        if not session.hydrated:
+            conversation_history = self.memory.get_conversation_history(
+                user_id, character_id, limit=Config.MEMORY_WINDOW_SIZE
+            )
+            print(f"📚 加载历史对话: {len(conversation_history)} 条记录")
+            
+            session.conversation_history = [
+                {
+                    "timestamp": conv.get("timestamp", ""),
+                    "user_message": conv.get("user_message", ""),
+                    "assistant_response": conv.get("assistant_response", ""),
+                    "user_context": conv.get("context", {}),
+                    "chat_analysis": {}
+                }
+                for conv in conversation_history if conv
+            ]
+            session.hydrated = True
+        
+        return session
     
     def switch_character(self, character_id: str) -> bool:
         """切换角色"""
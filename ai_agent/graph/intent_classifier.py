@@ -0,0 +1,203 @@
+"""
+本地意图分类器 - 路由器的快速路径
+未指定角色时，路由器原本每条消息都要用完整的ROUTER_SYSTEM_PROMPT调用一次LLM，只为从7个路由类型中选一个：
+这里按各路由类型的加权词表给消息打分（前面紧跟否定词的词不计分，如“头不疼”“不难过”），
+最高分明显领先（相对差距不小于阈值）且证据充分（命中高权重词，或至少命中两个词）时直接给出路由，
+只有本地判断不够确定时才调用LLM
+"""
+
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from config import Config
+
+
+# 各路由类型（models.state.Router.type）的加权词表：明确指向角色或主题的词权重高，泛泛的词权重低
+ROUTE_LEXICONS: Dict[str, Dict[str, float]] = {
+    "character-xiyang": {
+        "儿子": 3.0, "喜羊羊": 4.0, "工作": 1.0, "事业": 1.0, "上班": 1.0, "加班": 1.0,
+        "出差": 1.0, "公司": 1.0, "单位": 1.0, "升职": 1.5, "领导": 1.0, "责任": 1.0
+    },
+    "character-meiyang": {
+        "女儿": 3.0, "闺女": 3.0, "美羊羊": 4.0, "想你": 1.5, "想念": 1.5, "贴心": 1.5,
+        "温暖": 1.0, "陪陪": 1.5, "陪我": 1.5, "说说话": 1.0, "聊聊天": 1.0
+    },
+    "character-lanyang": {
+        "孙子": 3.0, "孙儿": 3.0, "大孙子": 3.0, "乖孙": 3.0, "懒羊羊": 4.0, "学校": 1.0,
+        "考试": 1.0, "作业": 1.0, "放假": 1.0, "游戏": 1.0, "动画片": 1.5, "笑话": 2.0,
+        "开心一点": 1.5, "逗我": 1.5
+    },
+    "health-concern": {
+        "头疼": 2.5, "头痛": 2.5, "头晕": 2.5, "血压": 2.5, "血糖": 2.5, "糖尿病": 2.5,
+        "心脏": 2.0, "胸闷": 2.5, "发烧": 2.5, "咳嗽": 2.0, "感冒": 2.0, "失眠": 2.0,
+        "不舒服": 2.0, "难受": 1.0, "疼": 1.5, "痛": 1.5, "吃药": 2.0, "降压药": 2.5, "药": 1.0,
+        "医院": 2.0, "医生": 1.5, "体检": 2.0, "摔": 2.0, "膝盖": 1.5, "腰": 1.0, "身体": 1.0
+    },
+    "emotional-support": {
+        "难过": 2.0, "伤心": 2.0, "孤独": 2.0, "孤单": 2.0, "寂寞": 2.0, "害怕": 1.5, "担心": 1.5,
+        "心情不好": 2.5, "心烦": 2.0, "烦": 1.0, "委屈": 2.0, "哭": 2.0, "没意思": 1.5,
+        "想不开": 3.0, "一个人": 1.0, "没人管": 2.0, "睡不着": 1.0, "闷": 1.0
+    },
+    "knowledge-query": {
+        "什么是": 2.0, "是什么": 1.5, "为什么": 1.5, "怎么回事": 1.5, "如何": 1.5,
+        "原理": 2.0, "历史": 1.5, "介绍一下": 2.0, "解释": 2.0, "区别": 1.5,
+        "文档": 2.0, "资料": 1.5, "知识": 1.5, "说明书": 2.0
+    },
+    "general-query": {
+        "你好": 1.5, "早上好": 2.0, "中午好": 2.0, "晚上好": 2.0, "晚安": 2.0, "吃饭": 1.0,
+        "吃了吗": 1.5, "天气": 1.0, "在干嘛": 1.5, "在干什么": 1.5, "忙吗": 1.5, "散步": 1.0
+    }
+}
+
+# 词前面紧跟这些否定词时不计分（“头不疼了”“我不难过”“没有发烧”）
+NEGATION_PREFIXES = ("没有", "不", "没")
+
+# 角色路由对应的角色ID
+ROUTE_CHARACTERS = {
+    "character-xiyang": "xiyang",
+    "character-meiyang": "meiyang",
+    "character-lanyang": "lanyang"
+}
+
+
+@dataclass
+class IntentScore:
+    """一次本地分类的结果"""
+    route: str
+    confidence: float
+    margin: float  # (最高分 - 第二高分) / 最高分
+    decisive: bool  # 本地结果足够确定，不需要调用LLM
+    scores: Dict[str, float] = field(default_factory=dict)
+    matched: List[str] = field(default_factory=list)  # 最高分路由命中的词
+    negated: List[str] = field(default_factory=list)  # 前面有否定词、没有计分的词
+
+    @property
+    def character_preference(self) -> Optional[str]:
+        return ROUTE_CHARACTERS.get(self.route)
+
+
+class LocalIntentClassifier:
+    """基于加权词表的本地意图分类器"""
+
+    def __init__(
+        self,
+        lexicons: Optional[Dict[str, Dict[str, float]]] = None,
+        margin: Optional[float] = None,
+        min_score: Optional[float] = None,
+        strong_weight: Optional[float] = None
+    ):
+        """
+        初始化分类器
+
+        Args:
+            lexicons: 路由类型 -> {词: 权重}
+            margin: 最高分相对第二高分至少领先的比例，低于该值时交给LLM
+            min_score: 最高分至少达到的分数，低于该值时交给LLM
+            strong_weight: 单独命中即可作为充分证据的词权重，最高分路由只命中一个低于该权重的词时交给LLM
+        """
+        self.lexicons = lexicons or ROUTE_LEXICONS
+        self.margin = margin if margin is not None else Config.ROUTER_LOCAL_MARGIN
+        self.min_score = min_score if min_score is not None else Config.ROUTER_LOCAL_MIN_SCORE
+        self.strong_weight = strong_weight if strong_weight is not None else Config.ROUTER_LOCAL_STRONG_WEIGHT
+        # 词按长度从长到短匹配，已被长词覆盖的位置不再计入短词（“头疼”不再额外计一次“疼”）
+        self._terms: List[Tuple[str, str, float]] = sorted(
+            ((term, route, weight) for route, terms in self.lexicons.items() for term, weight in terms.items()),
+            key=lambda item: len(item[0]),
+            reverse=True
+        )
+
+        self._lock = threading.Lock()
+        self.classified = 0
+        self.decisive = 0
+        self.negated = 0
+        self.route_counts: Dict[str, int] = {}
+        self.total_seconds = 0.0
+
+    def score(self, text: str) -> Tuple[Dict[str, float], Dict[str, List[str]], List[str]]:
+        """
+        计算各路由类型的得分（被否定的词占住位置但不计分）
+
+        Args:
+            text: 用户消息
+
+        Returns:
+            (路由类型 -> 得分, 路由类型 -> 命中的词, 被否定的词)
+        """
+        scores = {route: 0.0 for route in self.lexicons}
+        matched: Dict[str, List[str]] = {route: [] for route in self.lexicons}
+        negated: List[str] = []
+        covered = [False] * len(text)
+        for term, route, weight in self._terms:
+            start = text.find(term)
+            while start != -1:
+                end = start + len(term)
+                if not any(covered[start:end]):
+                    covered[start:end] = [True] * len(term)
+                    if text.endswith(NEGATION_PREFIXES, 0, start):
+                        negated.append(term)
+                    else:
+                        scores[route] += weight
+                        matched[route].append(term)
+                start = text.find(term, end)
+        return scores, matched, negated
+
+    def classify(self, text: str) -> IntentScore:
+        """
+        本地分类
+
+        Args:
+            text: 用户消息
+
+        Returns:
+            分类结果（decisive为False时应交给LLM）
+        """
+        started_at = time.perf_counter()
+        scores, matched, negated = self.score(text or "")
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        (route, top), second = ranked[0], ranked[1][1] if len(ranked) > 1 else 0.0
+
+        margin = (top - second) / top if top > 0 else 0.0
+        # 只命中一个低权重的词（如单独的“疼”）证据不足，交给LLM结合语境判断
+        weights = self.lexicons.get(route, {})
+        enough_evidence = len(matched[route]) >= 2 or any(
+            weights[term] >= self.strong_weight for term in matched[route]
+        )
+        decisive = top >= self.min_score and margin >= self.margin and enough_evidence
+        result = IntentScore(
+            route=route if top > 0 else "general-query",
+            confidence=round(min(0.95, 0.5 + 0.5 * margin), 3) if top > 0 else 0.0,
+            margin=round(margin, 3),
+            decisive=decisive,
+            scores={name: value for name, value in scores.items() if value},
+            matched=matched[route],
+            negated=negated
+        )
+
+        with self._lock:
+            self.classified += 1
+            self.total_seconds += time.perf_counter() - started_at
+            if negated:
+                self.negated += 1
+            if decisive:
+                self.decisive += 1
+                self.route_counts[route] = self.route_counts.get(route, 0) + 1
+        return result
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取本地分类的覆盖率（不需要调用LLM的比例）和平均耗时"""
+        with self._lock:
+            return {
+                "classified": self.classified,
+                "decisive": self.decisive,
+                "llm_fallbacks": self.classified - self.decisive,
+                "negated": self.negated,
+                "coverage": round(self.decisive / self.classified, 3) if self.classified else None,
+                "avg_us": round(self.total_seconds / self.classified * 1e6, 1) if self.classified else None,
+                "routes": dict(self.route_counts)
+            }
+
+
+# 全局本地意图分类器实例
+intent_classifier = LocalIntentClassifier()
@@ -5,11 +5,12 @@
 
 import json
 from typing import Literal, cast
-from openai import OpenAI
 from langchain.schema import HumanMessage
 
 from config import Config
+from services.llm_gateway import llm_gateway
 from models.state import ConversationState, Router
+from graph.intent_classifier import intent_classifier
 from prompts.router_prompts import ROUTER_SYSTEM_PROMPT
 
 
@@ -18,10 +19,6 @@ class FamilyBotRouter:
     
     def __init__(self):
         """初始化路由器"""
-        self.client = OpenAI(
-            api_key=Config.DASHSCOPE_API_KEY,
-            base_url=Config.DASHSCOPE_BASE_URL
-        )
         print("✅ FamilyBot路由器初始化完成")
     
     async def analyze_and_route_query(self, state: ConversationState) -> ConversationState:
@@ -50,6 +47,22 @@ class FamilyBotRouter:
                 )
                 return state
             
+            # 本地词表分类足够确定时直接路由，不调用LLM
+            if Config.ROUTER_LOCAL_ENABLED:
+                local = intent_classifier.classify(state.user_input)
+                if local.decisive:
+                    state.router = Router(
+                        type=local.route,
+                        logic=f"本地意图分类（命中: {'、'.join(local.matched[:3])}）",
+                        confidence=local.confidence,
+                        character_preference=local.character_preference
+                    )
+                    if local.character_preference:
+                        state.selected_character = local.character_preference
+                    print(f"⚡ 本地路由: {local.route} (置信度: {local.confidence:.2f})")
+                    return state
+                print(f"🤔 本地路由不确定（差距 {local.margin:.2f}），调用LLM路由")
+            
             # 构建分析消息
             messages = [
                 {"role": "system", "content": ROUTER_SYSTEM_PROMPT}
@@ -66,11 +79,9 @@ class FamilyBotRouter:
             messages.append({"role": "user", "content": state.user_input})
             
             # 调用LLM进行路由分析
-            response = self.client.chat.completions.create(
-                model=Config.LLM_MODEL,
+            response = await llm_gateway.chat_completion(
+                task="route",  # 快速模型、较低温度确保路由一致性
                 messages=messages,
-                temperature=0.3,  # 较低温度确保路由一致性
-                max_tokens=200,
                 response_format={"type": "json_object"}  # 强制JSON输出
             )
             
@@ -185,11 +196,9 @@ class FamilyBotRouter:
             ]
             
             # 调用LLM进行详细分析
-            response = self.client.chat.completions.create(
-                model=Config.LLM_MODEL,
-                messages=messages,
-                temperature=0.2,
-                max_tokens=300
+            response = await llm_gateway.chat_completion(
+                task="intent",
+                messages=messages
             )
             
             analysis_text = response.choices[0].message.content
@@ -3,13 +3,18 @@ FamilyBot AI Agent 主服务
 提供FastAPI接口，集成所有AI功能模块
 """
 
-from fastapi import FastAPI, UploadFile, File, HTTPException, BackgroundTasks, Form
+from fastapi import FastAPI, UploadFile, File, HTTPException, BackgroundTasks, Form, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse, Response, JSONResponse
 from pydantic import BaseModel, Field
 import uvicorn
-from typing import Optional, Dict, Any, List
+import aiofiles
+from typing import Optional, Dict, Any, List, Literal, Tuple
 import asyncio
+import base64
+import json
 import os
+import time
 from datetime import datetime
 
 from config import Config
@@ -17,6 +22,25 @@ from graph.conversation_graph import ConversationGraph
 from services.audio_service import audio_service
 from rag.graph_rag import graph_rag
 from tools.web_search import web_search_tool, perform_web_search
+from services.image_service import image_service
+from services.enrichment_service import enrichment_stage, EnrichmentBranch
+from services.tts_pipeline import TTSPipeline, SpeechSegment, tts_pipeline_stats
+from memory.session_store import session_store
+from services.llm_client import llm_client_pool
+from services.llm_gateway import llm_gateway
+from services.deadline import Deadline
+from services.artifact_store import artifact_store, parse_range_header
+from services.greeting_audio_cache import greeting_audio_cache
+from services.concurrency_limiter import upstream_limiters, UpstreamOverloadedError
+from services.single_flight import single_flight
+from services.answer_cache import answer_cache, AnswerCacheHit, depends_on_context, context_fingerprint
+from services.llm_memo_cache import llm_memo_cache
+from services.usage_tracker import usage_tracker, GROUP_FIELDS
+from reasoning.speculative_cot import speculative_cot
+from graph.intent_classifier import intent_classifier
+from services.trigger_detector import trigger_detector
+from agents.prompt_assembler import prompt_assembler
+from agents.prompt_templates import prompt_templates
 
 
 # === 数据模型 ===
@@ -31,6 +55,8 @@ class ChatRequest(BaseModel):
     thread_id: Optional[str] = None
     voice_config: Optional[Dict[str, Any]] = None
     force_web_search: Optional[bool] = False  # 强制启用联网搜索
+    include_audio_base64: Optional[bool] = None  # 是否内联音频Base64（为空时使用配置默认值，audio_url始终返回）
+    reply_mode: Optional[Literal["multi_call", "structured"]] = None  # 回复模式（为空时使用Config.REPLY_MODE）
 
 
 class ChatResponse(BaseModel):
@@ -51,6 +77,11 @@ class ChatResponse(BaseModel):
     image_base64: Optional[str] = None  # 生成的图片Base64编码
     image_description: Optional[str] = None  # 用户提供的图片描述
     enhanced_prompt: Optional[str] = None  # AI增强后的提示词
+    enrichment: Optional[Dict[str, Any]] = None  # 各增强分支的执行状态
+    degraded_stages: Optional[Dict[str, str]] = None  # 因时间预算被跳过(skipped)或截断(timeout)的阶段
+    reply_mode: Optional[str] = None  # 实际使用的回复模式
+    route: Optional[str] = None  # 结构化回复模式下模型给出的路由类型
+    cached_answer: Optional[bool] = False  # 重复提问，直接使用了缓存的回答
 
 
 class WebSearchResponse(BaseModel):
@@ -92,6 +123,8 @@ class VoiceChatResponse(BaseModel):
     emotion: str
     audio_url: Optional[str] = None
     timestamp: str
+    degraded_stages: Optional[Dict[str, str]] = None  # 因时间预算被降级的阶段
+    rag_retrieval: Optional[Dict[str, Any]] = None  # 本轮知识检索的状态、耗时（毫秒）和上下文数
 
 
 class CharacterInfo(BaseModel):
@@ -124,6 +157,52 @@ app.add_middleware(
 conversation_graph = ConversationGraph()
 
 
+@app.exception_handler(UpstreamOverloadedError)
+async def upstream_overloaded_handler(request: Request, exc: UpstreamOverloadedError):
+    """上游并发池已满：排队数已满返回429，排队超时返回503，均附带Retry-After"""
+    status_code = 429 if exc.reason == "queue_full" else 503
+    print(f"🚦 上游繁忙，拒绝请求: {exc.upstream} ({exc.reason}) {request.url.path}")
+    return JSONResponse(
+        status_code=status_code,
+        content={"detail": str(exc), "upstream": exc.upstream, "reason": exc.reason},
+        headers={"Retry-After": str(max(1, int(exc.retry_after)))}
+    )
+
+
+@app.on_event("startup")
+async def prewarm_greeting_audio():
+    """后台预生成问候语和开场白音频，不阻塞服务启动"""
+    if Config.GREETING_AUDIO_PREWARM:
+        app.state.greeting_audio_warmup = asyncio.create_task(greeting_audio_cache.warm_up())
+
+
+@app.on_event("startup")
+async def start_usage_flush():
+    """后台定期把内存中聚合的用量写入SQLite"""
+    app.state.usage_flush = asyncio.create_task(usage_tracker.run_periodic_flush())
+
+
+@app.on_event("shutdown")
+async def close_llm_clients():
+    """应用关闭时释放共享LLM客户端的连接池"""
+    await llm_client_pool.aclose()
+
+
+@app.on_event("shutdown")
+async def flush_usage():
+    """应用关闭时写入尚未写入的用量"""
+    usage_flush = getattr(app.state, "usage_flush", None)
+    if usage_flush:
+        usage_flush.cancel()
+    await asyncio.to_thread(usage_tracker.flush)
+
+
+@app.on_event("shutdown")
+async def close_graph_checkpoints():
+    """应用关闭时关闭对话图的SQLite检查点连接"""
+    await conversation_graph.aclose()
+
+
 # === 健康检查 ===
 @app.get("/")
 async def root():
@@ -144,6 +223,31 @@ async def health_check():
         "version": "1.0.0"
     }
 
+@app.get("/metrics")
+async def get_metrics():
+    """性能指标接口：汇总各组件的运行统计"""
+    return {
+        "timestamp": datetime.now().isoformat(),
+        "session_store": session_store.get_stats(),
+        "llm_client": llm_client_pool.get_stats(),
+        "llm_gateway": llm_gateway.get_stats(),
+        "tts_pipeline": tts_pipeline_stats.get_stats(),
+        "artifact_store": artifact_store.get_stats(),
+        "greeting_audio_cache": greeting_audio_cache.get_stats(),
+        "upstream_limiters": upstream_limiters.get_stats(),
+        "single_flight": single_flight.get_stats(),
+        "conversation_graph": conversation_graph.get_stats(),
+        "graph_rag_branch": conversation_graph.get_rag_stats(),
+        "speculative_cot": speculative_cot.get_stats(),
+        "intent_classifier": intent_classifier.get_stats(),
+        "trigger_detector": trigger_detector.get_stats(),
+        "prompt_assembler": prompt_assembler.get_stats(),
+        "prompt_templates": prompt_templates.get_stats(),
+        "answer_cache": answer_cache.get_stats(),
+        "llm_memo_cache": llm_memo_cache.get_stats(),
+        "usage_tracker": usage_tracker.get_stats()
+    }
+
 
 # === 角色管理接口 ===
 @app.get("/characters", response_model=List[CharacterInfo])
@@ -171,278 +275,724 @@ async def switch_character(character_id: str):
 
 @app.get("/characters/{character_id}/greeting")
 async def get_character_greeting(character_id: str):
-    """获取角色问候语，包含TTS音频"""
+    """获取角色问候语，包含TTS音频（问候语音频预生成并缓存）"""
+    agent = conversation_graph.character_manager.get_agent(character_id)
+    if not agent:
+        raise HTTPException(status_code=404, detail=f"角色 {character_id} 不存在")
+    
     try:
-        agent = conversation_graph.character_manager.get_agent(character_id)
-        if not agent:
-            raise HTTPException(status_code=404, detail=f"角色 {character_id} 不存在")
-        
         greeting = agent.get_greeting()
-        
-        # 生成问候语的TTS音频
-        try:
-            from services.audio_service import AudioService
-            audio_service = AudioService()
-            
-            # 获取角色的音色配置
-            voice_config = agent.config.get("voice_config", {})
-            voice_speed = voice_config.get("speed", agent.config.get("voice_speed", 1.0))
-            
-            print(f"🎵 为角色 {character_id} 生成问候语TTS...")
-            tts_audio = await audio_service.generate_character_voice(
-                character_id=character_id,
-                text=greeting,
-                speed=voice_speed
-            )
-            
-            if tts_audio:
-                import base64
-                from datetime import datetime
-                audio_base64 = base64.b64encode(tts_audio).decode('utf-8')
-                audio_url = f"/audio/greeting_{character_id}_{datetime.now().timestamp()}.wav"
-                print(f"✅ 问候语TTS生成成功: {len(tts_audio)} 字节")
-                
-                return {
-                    "character_id": character_id,
-                    "character_name": agent.config["name"],
-                    "greeting": greeting,
-                    "audio_base64": audio_base64,
-                    "audio_url": audio_url
-                }
-            else:
-                print("⚠️ 问候语TTS生成失败，返回纯文本")
-                
-        except Exception as tts_error:
-            print(f"❌ 问候语TTS生成出错: {tts_error}")
-            # TTS失败不影响问候语返回
-        
-        # 如果TTS失败，只返回文本
-        return {
+        result = {
             "character_id": character_id,
             "character_name": agent.config["name"],
             "greeting": greeting
         }
         
+        # TTS失败不影响问候语返回，只返回文本
+        greeting_audio = await greeting_audio_cache.get(character_id, greeting)
+        if greeting_audio:
+            result["audio_base64"] = base64.b64encode(greeting_audio.audio).decode('utf-8')
+            result["audio_url"] = greeting_audio.audio_url
+        else:
+            print("⚠️ 问候语TTS生成失败，返回纯文本")
+        
+        return result
+        
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"获取问候语失败: {str(e)}")
 
 
+@app.get("/characters/{character_id}/opening-phrases")
+async def get_character_opening_phrases(character_id: str):
+    """获取角色开场白列表及其缓存的TTS音频链接"""
+    agent = conversation_graph.character_manager.get_agent(character_id)
+    if not agent:
+        raise HTTPException(status_code=404, detail=f"角色 {character_id} 不存在")
+    
+    phrases = []
+    for phrase in agent.config.get("opening_phrases", []):
+        phrase_audio = await greeting_audio_cache.get(character_id, phrase)
+        phrases.append({
+            "text": phrase,
+            "audio_url": phrase_audio.audio_url if phrase_audio else None
+        })
+    
+    return {
+        "character_id": character_id,
+        "character_name": agent.config["name"],
+        "opening_phrases": phrases
+    }
+
+
 # === 文本聊天接口 ===
-@app.post("/chat", response_model=ChatResponse)
-async def text_chat(request: ChatRequest):
-    """文本聊天接口"""
-    try:
-        print(f"📝 收到聊天请求: {request.user_id} -> {request.character_id}: {request.message[:50]}...")
-        print(f"🎯 使用Agent: {request.use_agent}, 角色: {request.role}, 线程ID: {request.thread_id}")
-        print(f"🎵 接收到音色配置: {request.voice_config}")  # 添加调试日志
+class ChatTurn:
+    """一次聊天请求在生成回复之前准备好的上下文"""
+    
+    def __init__(self, agent, session, enrichment, user_context: Dict[str, Any],
+                 web_search_result: Optional[Dict[str, Any]], image_result: Optional[Dict[str, Any]],
+                 image_description: Optional[str], deadline: Deadline):
+        self.agent = agent
+        self.session = session
+        self.enrichment = enrichment
+        self.user_context = user_context
+        self.web_search_result = web_search_result
+        self.web_search_used = web_search_result is not None
+        self.image_result = image_result
+        self.image_description = image_description
+        self.deadline = deadline
+
+
+async def _prepare_chat_turn(request: ChatRequest, deadline: Deadline) -> ChatTurn:
+    """
+    准备聊天上下文：获取角色代理和会话状态，并发执行增强分支
+    
+    Args:
+        request: 聊天请求
+        deadline: 请求时间预算（增强分支需为主回复生成预留时间）
         
-        # 使用简化的记忆系统 - 直接调用角色管理器但添加记忆功能
-        from agents.character_agent import CharacterManager
-        from datetime import datetime
-        
-        character_manager = CharacterManager()
-        agent = character_manager.get_agent(request.character_id)
-        
-        if not agent:
-            raise HTTPException(status_code=404, detail=f"角色 {request.character_id} 不存在")
-        
-        print(f"🧠 启用记忆系统 - 用户ID: {request.user_id}, 角色: {request.character_id}")
-        
-        # 从记忆系统获取历史对话
-        conversation_history = conversation_graph.get_conversation_history(request.user_id, request.character_id)
-        print(f"📚 加载历史对话: {len(conversation_history)} 条记录")
-        
-        # 如果有历史记录，更新agent的对话历史
-        if conversation_history:
-            agent.conversation_history = []
-            for conv in conversation_history[-10:]:  # 最近10条
-                # 检查conv是否为None
-                if conv:
-                    agent.conversation_history.append({
-                        "timestamp": conv.get("timestamp", ""),
-                        "user_message": conv.get("user_message", ""),
-                        "assistant_response": conv.get("assistant_response", ""),
-                        "user_context": conv.get("context", {}),
-                        "chat_analysis": {}
-                    })
-                else:
-                    print("⚠️ 发现空的历史对话记录，跳过")
-        
-        # 检查是否需要联网搜索
-        web_search_result = None
-        web_search_used = False
-        if request.force_web_search or web_search_tool.should_search(request.message):
+    Returns:
+        聊天上下文
+    """
+    # 角色代理是进程级单例，对话状态按 (用户, 角色, 线程) 隔离在会话存储中
+    agent = conversation_graph.character_manager.get_agent(request.character_id)
+    
+    if not agent:
+        raise HTTPException(status_code=404, detail=f"角色 {request.character_id} 不存在")
+    
+    print(f"🧠 启用记忆系统 - 用户ID: {request.user_id}, 角色: {request.character_id}")
+    
+    # 获取会话状态（首次访问时从记忆系统加载历史对话）
+    session = conversation_graph.get_session(request.user_id, request.character_id, request.thread_id)
+    print(f"📚 会话历史: {len(session.conversation_history)} 条记录")
+    
+    # 并发执行增强分支：联网搜索、GraphRAG检索、图片生成互不依赖
+    # 各分支的超时不超过剩余预算（扣除主回复生成的预留时间）
+    branches = {}
+    reserve = Config.DEADLINE_REPLY_RESERVE_SECONDS
+    
+    if request.force_web_search or web_search_tool.should_search(request.message):
+        web_search_timeout = deadline.budget_for("web_search", Config.WEB_SEARCH_TIMEOUT, reserve=reserve)
+        if web_search_timeout:
             print(f"🔍 启动联网搜索: {request.message}")
-            try:
-                web_search_result = await perform_web_search(request.message)
-                web_search_used = True
-                print(f"✅ 联网搜索完成: {web_search_result.get('total_results', 0)} 个结果")
-            except Exception as search_error:
-                print(f"❌ 联网搜索失败: {search_error}")
-                web_search_result = None
-
-        # 使用GraphRAG搜索相关知识（包括角色文档）
+            branches["web_search"] = EnrichmentBranch(
+                name="web_search",
+                factory=lambda: perform_web_search(request.message),
+                timeout=web_search_timeout
+            )
+    
+    # 使用GraphRAG搜索相关知识（包括角色文档）
+    rag_timeout = deadline.budget_for("rag", Config.RAG_TIMEOUT, reserve=reserve)
+    if rag_timeout:
         print(f"🔍 使用GraphRAG搜索相关知识...")
-        rag_result = await graph_rag.query_knowledge(
-            query=request.message,
-            character_id=request.character_id
-        )
-        
-        # 确保rag_result不为None
-        if not rag_result:
-            print("⚠️ GraphRAG搜索返回空结果")
-            rag_result = type('RAGResult', (), {'relevant_contexts': []})()
-        
-        print(f"📚 GraphRAG搜索结果: {len(rag_result.relevant_contexts) if rag_result.relevant_contexts else 0} 个相关上下文")
-        if rag_result.relevant_contexts:
-            for ctx in rag_result.relevant_contexts:
-                print(f"   - {ctx['source']}: {ctx['content'][:50]}...")
-        
-        # 检查是否需要生成图片
-        image_result = None
-        image_description = None
-        from services.image_service import image_service
-        
-        if image_service.should_generate_image(request.message):
-            print(f"🎨 检测到图片生成请求，开始生成图片...")
-            image_description = image_service.extract_image_description(request.message)
-            print(f"🖼️ 图片描述: {image_description}")
-            
-            # 生成图片
-            image_result = await image_service.generate_image(
-                user_prompt=image_description,
+        branches["rag"] = EnrichmentBranch(
+            name="rag",
+            factory=lambda: graph_rag.query_knowledge(
+                query=request.message,
                 character_id=request.character_id,
-                style_preference=None
-            )
-            
-            print(f"🎨 图片生成结果: {'成功' if image_result.get('success') else '失败'}")
-        
-        # 构建用户上下文
-        user_context = {
-            "time": datetime.now().strftime("%Y-%m-%d %H:%M"),
-            "user_id": request.user_id,
-            "thread_id": request.thread_id or f"{request.user_id}_{request.character_id}",
-            "rag_result": rag_result,  # 添加GraphRAG搜索结果
-            "web_search_result": web_search_result,  # 添加联网搜索结果
-            "image_result": image_result,  # 添加图片生成结果
-            "image_description": image_description  # 添加图片描述
-        }
-        
-        # 生成回复
-        response_data = agent.generate_response(request.message, user_context)
-        
-        # 如果生成了图片，获取角色对图片的回应并添加到响应中
-        if image_result:
-            character_image_response = await image_service.get_character_image_response(
-                request.character_id, image_result
+                deadline=deadline
+            ),
+            timeout=rag_timeout
+        )
+    
+    # 检查是否需要生成图片（可选阶段，剩余时间不足时跳过）
+    image_description = None
+    image_requested = image_service.should_generate_image(request.message)
+    if image_requested:
+        print(f"🎨 检测到图片生成请求，开始生成图片...")
+        image_description = image_service.extract_image_description(request.message)
+        print(f"🖼️ 图片描述: {image_description}")
+        image_timeout = deadline.budget_for(
+            "image", Config.IMAGE_TIMEOUT, min_seconds=Config.DEADLINE_MIN_IMAGE_SECONDS, reserve=reserve
+        )
+        if image_timeout:
+            branches["image"] = EnrichmentBranch(
+                name="image",
+                factory=lambda: image_service.generate_image(
+                    user_prompt=image_description,
+                    character_id=request.character_id,
+                    style_preference=None
+                ),
+                timeout=image_timeout
             )
-            # 将角色的图片回应添加到原回复中
-            if image_result.get("success"):
-                response_data["response"] = character_image_response
-                response_data["image_url"] = image_result.get("image_url")
-                response_data["image_base64"] = image_result.get("image_base64") 
-                response_data["image_description"] = image_description
-                response_data["enhanced_prompt"] = image_result.get("enhanced_prompt")
-            else:
-                response_data["response"] = character_image_response
-        
-        # 保存对话到记忆系统
-        conversation_data = {
-            "user_message": request.message,
-            "assistant_response": response_data.get("response", ""),
+    
+    enrichment = await enrichment_stage.run(branches)
+    for name, branch_result in enrichment.branches.items():
+        if branch_result.status == "timeout":
+            deadline.degrade(name, "timeout")
+    
+    # 联网搜索结果（失败或超时时为None）
+    web_search_result = enrichment.get("web_search")
+    if web_search_result is not None:
+        print(f"✅ 联网搜索完成: {web_search_result.get('total_results', 0)} 个结果")
+    
+    # 确保rag_result不为None
+    rag_result = enrichment.get("rag")
+    if not rag_result:
+        print("⚠️ GraphRAG搜索返回空结果")
+        rag_result = type('RAGResult', (), {'relevant_contexts': []})()
+    
+    print(f"📚 GraphRAG搜索结果: {len(rag_result.relevant_contexts) if rag_result.relevant_contexts else 0} 个相关上下文")
+    if rag_result.relevant_contexts:
+        for ctx in rag_result.relevant_contexts:
+            print(f"   - {ctx['source']}: {ctx['content'][:50]}...")
+    
+    # 图片生成超时或异常时按生成失败处理，让角色给出相应回应
+    image_result = None
+    if image_requested:
+        image_branch = enrichment.branches.get("image")
+        image_result = enrichment.get("image") or {
+            "success": False,
+            "error": image_branch.error if image_branch else "剩余时间不足，跳过图片生成",
             "character_id": request.character_id,
-            "intent": response_data.get("intent", "general"),
-            "emotion": response_data.get("emotion", "neutral"),
-            "timestamp": datetime.now().isoformat(),
-            "context": request.context or {}
+            "timestamp": datetime.now().isoformat()
         }
+        print(f"🎨 图片生成结果: {'成功' if image_result.get('success') else '失败'}")
+    
+    # 构建用户上下文
+    user_context = {
+        "time": datetime.now().strftime("%Y-%m-%d %H:%M"),
+        "user_id": request.user_id,
+        "thread_id": request.thread_id or f"{request.user_id}_{request.character_id}",
+        "rag_result": rag_result,  # 添加GraphRAG搜索结果
+        "web_search_result": web_search_result,  # 添加联网搜索结果
+        "image_result": image_result,  # 添加图片生成结果
+        "image_description": image_description  # 添加图片描述
+    }
+    
+    return ChatTurn(
+        agent=agent,
+        session=session,
+        enrichment=enrichment,
+        user_context=user_context,
+        web_search_result=web_search_result,
+        image_result=image_result,
+        image_description=image_description,
+        deadline=deadline
+    )
+
+
+def _reply_mode(request: ChatRequest) -> str:
+    """请求使用的回复模式"""
+    return request.reply_mode or Config.REPLY_MODE
+
+
+async def _generate_reply(request: ChatRequest, turn: ChatTurn) -> Dict[str, Any]:
+    """按回复模式生成回复（structured：单次结构化调用同时返回路由、分析、情绪和回复）"""
+    if _reply_mode(request) == "structured":
+        return await turn.agent.generate_structured_response(request.message, turn.user_context, turn.session)
+    return await turn.agent.generate_response(request.message, turn.user_context, turn.session)
+
+
+async def _complete_chat_turn(request: ChatRequest, turn: ChatTurn, response_data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    完成聊天回合：合并图片结果、保存记忆、确定音色配置
+    
+    Args:
+        request: 聊天请求
+        turn: 聊天上下文
+        response_data: 角色代理生成的回应
         
-        conversation_graph.memory.store_conversation(
-            user_id=request.user_id,
+    Returns:
+        最终回应数据
+    """
+    image_result = turn.image_result
+    
+    # 如果生成了图片，获取角色对图片的回应并添加到响应中
+    if image_result:
+        character_image_response = await image_service.get_character_image_response(
+            request.character_id, image_result
+        )
+        # 将角色的图片回应添加到原回复中
+        if image_result.get("success"):
+            response_data["response"] = character_image_response
+            response_data["image_url"] = image_result.get("image_url")
+            response_data["image_base64"] = image_result.get("image_base64") 
+            response_data["image_description"] = turn.image_description
+            response_data["enhanced_prompt"] = image_result.get("enhanced_prompt")
+        else:
+            response_data["response"] = character_image_response
+    
+    _store_conversation(request, response_data)
+    
+    # 如果前端传递了voice_config，优先使用前端的配置
+    if request.voice_config:
+        print(f"🎵 使用前端传递的音色配置: {request.voice_config}")
+        response_data["voice_config"] = request.voice_config
+    else:
+        print(f"🎵 使用默认角色音色配置: {response_data.get('voice_config')}")
+    
+    print(f"✅ 生成回复: {response_data['character_name']} -> {response_data['response'][:50]}...")
+    return response_data
+
+
+def _store_conversation(request: ChatRequest, response_data: Dict[str, Any]):
+    """保存对话到记忆系统"""
+    conversation_data = {
+        "user_message": request.message,
+        "assistant_response": response_data.get("response", ""),
+        "character_id": request.character_id,
+        "intent": response_data.get("intent", "general"),
+        "emotion": response_data.get("emotion", "neutral"),
+        "timestamp": datetime.now().isoformat(),
+        "context": request.context or {}
+    }
+    
+    conversation_graph.memory.store_conversation(
+        user_id=request.user_id,
+        character_id=request.character_id,
+        conversation=conversation_data
+    )
+    print(f"💾 对话已保存到记忆系统")
+
+
+def _include_audio_base64(request: ChatRequest) -> bool:
+    """请求是否需要内联音频数据"""
+    if request.include_audio_base64 is not None:
+        return request.include_audio_base64
+    return Config.AUDIO_INLINE_BASE64
+
+
+async def _synthesize_reply_audio(
+    request: ChatRequest, 
+    response_data: Dict[str, Any], 
+    deadline: Optional[Deadline] = None
+) -> Dict[str, Optional[str]]:
+    """
+    为回复生成语音音频，失败或剩余时间不足时返回空值而不影响文本回复
+    
+    Args:
+        request: 聊天请求
+        response_data: 最终回应数据
+        deadline: 请求时间预算
+        
+    Returns:
+        包含audio_url和audio_base64的字典
+    """
+    final_voice_config = response_data.get("voice_config", {})
+    character_voice = final_voice_config.get("voice", "Cherry")
+    voice_speed = final_voice_config.get("speed", 1.0)
+    
+    print(f"🎵 开始生成语音: voice={character_voice}, speed={voice_speed}")
+    
+    try:
+        # 调用TTS服务（使用全局音频服务实例，复用客户端连接池）
+        tts_audio = await audio_service.generate_character_voice(
             character_id=request.character_id,
-            conversation=conversation_data
+            text=response_data["response"],
+            speed=voice_speed,
+            deadline=deadline
         )
-        print(f"💾 对话已保存到记忆系统")
         
-        # 如果前端传递了voice_config，优先使用前端的配置
-        if request.voice_config:
-            print(f"🎵 使用前端传递的音色配置: {request.voice_config}")
-            response_data["voice_config"] = request.voice_config
-        else:
-            print(f"🎵 使用默认角色音色配置: {response_data.get('voice_config')}")
+        if tts_audio:
+            # 音频保存到产物存储，响应中默认只需要URL
+            audio_url = (await artifact_store.save(tts_audio)).url
+            audio_base64 = base64.b64encode(tts_audio).decode('utf-8') if _include_audio_base64(request) else None
+            print(f"✅ TTS生成成功: {len(tts_audio)} 字节, URL: {audio_url}")
+            return {"audio_url": audio_url, "audio_base64": audio_base64}
         
-        print(f"✅ 生成回复: {response_data['character_name']} -> {response_data['response'][:50]}...")
+        print("⚠️ TTS生成失败")
+            
+    except Exception as e:
+        print(f"❌ TTS处理失败: {e}")
+    
+    return {"audio_url": None, "audio_base64": None}
+
+
+def _build_chat_response(
+    request: ChatRequest, 
+    turn: ChatTurn, 
+    response_data: Dict[str, Any], 
+    audio: Dict[str, Optional[str]]
+) -> ChatResponse:
+    """组装聊天响应模型"""
+    web_search_result = turn.web_search_result
+    return ChatResponse(
+        character_id=response_data["character_id"],
+        character_name=response_data["character_name"],
+        response=response_data["response"],
+        emotion=response_data["emotion"],
+        timestamp=response_data["timestamp"],
+        voice_config=response_data.get("voice_config"),
+        audio_url=audio.get("audio_url"),  # 添加音频URL
+        audio_base64=audio.get("audio_base64"),  # 添加音频Base64
+        web_search_used=turn.web_search_used,  # 是否使用了联网搜索
+        web_search_query=request.message if turn.web_search_used else None,  # 搜索查询词
+        web_search_results_count=web_search_result.get('total_results', 0) if web_search_result else 0,  # 搜索结果数量
+        # 图片生成相关字段
+        image_url=response_data.get("image_url"),
+        image_base64=response_data.get("image_base64"),
+        image_description=response_data.get("image_description"),
+        enhanced_prompt=response_data.get("enhanced_prompt"),
+        enrichment=turn.enrichment.summary(),
+        degraded_stages=dict(turn.deadline.degraded_stages),
+        reply_mode=_reply_mode(request),
+        route=response_data.get("route")
+    )
+
+
+def _build_error_response(request: ChatRequest, error: Exception) -> ChatResponse:
+    """返回明确的错误信息，不使用模糊的fallback"""
+    try:
+        from config import CHARACTER_CONFIGS
+    except ImportError:
+        CHARACTER_CONFIGS = {}
+    
+    character_config = CHARACTER_CONFIGS.get(request.character_id, {})
+    error_message = f"处理失败: {str(error)[:100]}..."
+    return ChatResponse(
+        character_id=request.character_id,
+        character_name=character_config.get("name", "系统"),
+        response=error_message,
+        emotion="error",
+        timestamp=datetime.now().isoformat()
+    )
+
+
+def _answer_cache_key(request: ChatRequest) -> Optional[Tuple[str, str]]:
+    """
+    重复提问答案缓存使用的 (聊天类型, 上下文指纹)，聊天类型按消息本身判断，不依赖RAG结果
+    追问和指代上文的消息（“然后呢”“为什么呀”）带上上一轮回复的指纹，只在上一轮回复相同时复用
+    
+    Returns:
+        (聊天类型, 上下文指纹)；强制联网搜索、图片请求或角色不存在时返回None（不使用缓存）
+    """
+    if request.force_web_search or image_service.should_generate_image(request.message):
+        return None
+    agent = conversation_graph.character_manager.get_agent(request.character_id)
+    if not agent:
+        return None
+    chat_type = agent.detect_chat_type(request.message)["type"]
+    if chat_type == "greeting" or not answer_cache.cacheable(chat_type) or not depends_on_context(request.message):
+        return chat_type, ""
+    session = conversation_graph.get_session(request.user_id, request.character_id, request.thread_id)
+    history = session.conversation_history
+    return chat_type, context_fingerprint(history[-1]["assistant_response"] if history else "")
+
+
+async def _cached_answer_audio(
+    request: ChatRequest, 
+    hit: AnswerCacheHit, 
+    response_data: Dict[str, Any]
+) -> Optional[Dict[str, Optional[str]]]:
+    """缓存的回复音频仍然可用（文本和音色未变、产物未过期）时直接复用"""
+    if hit.rephrased or not hit.answer.audio_url or response_data.get("voice_config") != hit.answer.voice_config:
+        return None
+    artifact = artifact_store.get(hit.answer.audio_url.rsplit("/", 1)[1])
+    if not artifact:
+        return None
+    audio_base64 = None
+    if _include_audio_base64(request):
+        audio_base64 = base64.b64encode(await asyncio.to_thread(artifact.path.read_bytes)).decode('utf-8')
+    return {"audio_url": artifact.url, "audio_base64": audio_base64}
+
+
+async def _answer_from_cache(
+    request: ChatRequest, 
+    cache_key: Optional[Tuple[str, str]], 
+    deadline: Deadline, 
+    started_at: float
+):
+    """
+    重复提问时使用缓存的回答：跳过联网搜索、RAG和LLM，音频未过期时也跳过TTS
+    
+    Args:
+        request: 聊天请求
+        cache_key: _answer_cache_key的结果
+        deadline: 请求时间预算
+        started_at: 收到请求的时间（perf_counter）
+        
+    Returns:
+        (回应数据, 音频)；未命中时返回None
+    """
+    if not cache_key:
+        return None
+    chat_type, context = cache_key
+    hit = answer_cache.lookup(request.user_id, request.character_id, request.message, chat_type, context)
+    if not hit:
+        return None
+    
+    print(f"♻️ 重复提问命中缓存（相似度 {hit.similarity}）: {hit.answer.question[:30]}")
+    agent = conversation_graph.character_manager.get_agent(request.character_id)
+    session = conversation_graph.get_session(request.user_id, request.character_id, request.thread_id)
+    user_context = {
+        "time": datetime.now().strftime("%Y-%m-%d %H:%M"),
+        "user_id": request.user_id,
+        "thread_id": request.thread_id or f"{request.user_id}_{request.character_id}"
+    }
+    # 重复提问同样记入会话历史和记忆，保持对话上下文连贯
+    response_data = agent.commit_response(
+        request.message,
+        {"response": hit.response, "chat_analysis": {"type": chat_type, "cached_answer": True}},
+        user_context,
+        session
+    )
+    if request.voice_config:
+        response_data["voice_config"] = request.voice_config
+    _store_conversation(request, response_data)
+    
+    audio = await _cached_answer_audio(request, hit, response_data)
+    if audio is None:
+        audio = await _synthesize_reply_audio(request, response_data, deadline)
+        if audio.get("audio_url") and not hit.rephrased:
+            hit.answer.audio_url = audio["audio_url"]
+    
+    answer_cache.record_served(hit, (time.perf_counter() - started_at) * 1000)
+    return response_data, audio
+
+
+def _remember_answer(
+    request: ChatRequest, 
+    cache_key: Optional[Tuple[str, str]], 
+    response_data: Dict[str, Any], 
+    audio_url: Optional[str], 
+    started_at: float,
+    deadline: Deadline,
+    web_search_used: bool = False,
+    image_result: Optional[Dict[str, Any]] = None
+):
+    """
+    缓存完整生成的回答
+    用了联网搜索、生成了图片、有阶段被降级，或对话图路由到了其他角色（回复的人设和音色不属于请求的角色）时不缓存
+    """
+    if not cache_key or web_search_used or image_result or deadline.degraded_stages:
+        return
+    if response_data.get("character_id", request.character_id) != request.character_id:
+        return
+    chat_type, context = cache_key
+    answer_cache.store(
+        user_id=request.user_id,
+        character_id=request.character_id,
+        question=request.message,
+        chat_type=chat_type,
+        response=response_data["response"],
+        emotion=response_data["emotion"],
+        voice_config=response_data.get("voice_config"),
+        audio_url=audio_url,
+        latency_ms=(time.perf_counter() - started_at) * 1000,
+        context=context
+    )
+
+
+def _build_cached_chat_response(
+    request: ChatRequest, 
+    response_data: Dict[str, Any], 
+    audio: Dict[str, Optional[str]], 
+    deadline: Deadline
+) -> ChatResponse:
+    """组装使用缓存回答的聊天响应"""
+    return ChatResponse(
+        character_id=response_data["character_id"],
+        character_name=response_data["character_name"],
+        response=response_data["response"],
+        emotion=response_data["emotion"],
+        timestamp=response_data["timestamp"],
+        voice_config=response_data.get("voice_config"),
+        audio_url=audio.get("audio_url"),
+        audio_base64=audio.get("audio_base64"),
+        degraded_stages=dict(deadline.degraded_stages),
+        reply_mode=_reply_mode(request),
+        cached_answer=True
+    )
+
+
+@app.post("/chat", response_model=ChatResponse)
+async def text_chat(request: ChatRequest):
+    """文本聊天接口"""
+    try:
+        print(f"📝 收到聊天请求: {request.user_id} -> {request.character_id}: {request.message[:50]}...")
+        print(f"🎯 使用Agent: {request.use_agent}, 角色: {request.role}, 线程ID: {request.thread_id}")
+        print(f"🎵 接收到音色配置: {request.voice_config}")  # 添加调试日志
+        
+        # LLM并发池已满时立即拒绝，不再执行搜索、RAG等前置阶段
+        upstream_limiters.get("llm").ensure_capacity()
+        # 本轮的上游调用用量记在该用户和角色名下
+        usage_tracker.begin_turn(request.user_id, request.character_id)
+        
+        # Java后端在60秒后放弃等待，按剩余预算裁剪可选阶段
+        started_at = time.perf_counter()
+        deadline = Deadline().bind()
+        
+        # 重复提问直接使用缓存的回答
+        cache_key = _answer_cache_key(request)
+        cached = await _answer_from_cache(request, cache_key, deadline, started_at)
+        if cached:
+            return _build_cached_chat_response(request, *cached, deadline)
+        
+        turn = await _prepare_chat_turn(request, deadline)
+        
+        # 生成回复
+        response_data = await _generate_reply(request, turn)
+        response_data = await _complete_chat_turn(request, turn, response_data)
         
         # 生成语音音频
-        final_voice_config = response_data.get("voice_config", {})
-        character_voice = final_voice_config.get("voice", "Cherry")
-        voice_speed = final_voice_config.get("speed", 1.0)
+        audio = await _synthesize_reply_audio(request, response_data, deadline)
+        _remember_answer(
+            request, cache_key, response_data, audio.get("audio_url"), started_at,
+            deadline, turn.web_search_used, turn.image_result
+        )
         
-        print(f"🎵 开始生成语音: voice={character_voice}, speed={voice_speed}")
+        return _build_chat_response(request, turn, response_data, audio)
         
+    except UpstreamOverloadedError:
+        raise
+    except Exception as e:
+        print(f"❌ 聊天处理失败: {str(e)}")
+        return _build_error_response(request, e)
+
+
+def _sse_event(event: str, data: Dict[str, Any]) -> str:
+    """格式化一条Server-Sent Events消息"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+async def _audio_segment_event(segment: SpeechSegment, include_base64: bool) -> str:
+    """把分句TTS结果保存为产物并格式化为audio_segment事件"""
+    audio_url = None
+    audio_base64 = None
+    if segment.audio:
+        audio_url = (await artifact_store.save(segment.audio)).url
+        if include_base64:
+            audio_base64 = base64.b64encode(segment.audio).decode('utf-8')
+    return _sse_event("audio_segment", {
+        "index": segment.index,
+        "text": segment.text,
+        "audio_url": audio_url,
+        "audio_base64": audio_base64,
+        "error": segment.error
+    })
+
+
+@app.post("/chat/stream")
+async def text_chat_stream(request: ChatRequest):
+    """
+    流式文本聊天接口（Server-Sent Events）
+    
+    事件顺序：
+    - start: 角色信息和增强分支状态
+    - token: LLM逐段生成的回复文本
+    - audio_segment: 按句合成的语音片段（按index顺序发送，与token事件交错）
+    - metadata: 最终回复文本、情绪、联网搜索和图片信息
+    - done: 流结束，附带分句TTS统计（含首段音频时间）
+    出错时发送 error 事件后结束；LLM并发池已满时直接返回429
+    """
+    print(f"📡 收到流式聊天请求: {request.user_id} -> {request.character_id}: {request.message[:50]}...")
+    upstream_limiters.get("llm").ensure_capacity()
+    request_started_at = time.perf_counter()
+    deadline = Deadline()
+    include_base64 = _include_audio_base64(request)
+    
+    async def event_stream():
+        pipeline = None
+        # 响应体在单独的任务中生成，在这里绑定用户和角色以及时间预算
+        usage_tracker.begin_turn(request.user_id, request.character_id)
+        deadline.bind()
         try:
-            # 调用TTS服务
-            from services.audio_service import AudioService
-            audio_service = AudioService()
+            # 重复提问直接发送缓存的回答和整段音频
+            cache_key = _answer_cache_key(request)
+            cached = await _answer_from_cache(request, cache_key, deadline, request_started_at)
+            if cached:
+                response_data, audio = cached
+                yield _sse_event("start", {
+                    "character_id": request.character_id,
+                    "character_name": response_data["character_name"],
+                    "enrichment": {},
+                    "cached_answer": True
+                })
+                yield _sse_event("token", {"content": response_data["response"]})
+                metadata = _build_cached_chat_response(request, response_data, {}, deadline).model_dump(
+                    exclude={"audio_url", "audio_base64"}
+                )
+                yield _sse_event("metadata", metadata)
+                yield _sse_event("audio_segment", {
+                    "index": 0,
+                    "text": response_data["response"],
+                    "audio_url": audio.get("audio_url"),
+                    "audio_base64": audio.get("audio_base64") if include_base64 else None,
+                    "error": None if audio.get("audio_url") else "TTS生成失败"
+                })
+                yield _sse_event("done", {"tts": None, "degraded_stages": dict(deadline.degraded_stages)})
+                return
             
-            tts_audio = await audio_service.generate_character_voice(
-                character_id=request.character_id,
-                text=response_data["response"],
-                speed=voice_speed
+            turn = await _prepare_chat_turn(request, deadline)
+            
+            yield _sse_event("start", {
+                "character_id": request.character_id,
+                "character_name": turn.agent.config["name"],
+                "enrichment": turn.enrichment.summary()
+            })
+            
+            # 音色在生成前即可确定，每凑齐一句就提交TTS，与LLM生成重叠执行
+            voice_config = request.voice_config or {}
+            voice_speed = voice_config.get("speed", turn.agent.config.get("voice_speed", 1.0))
+            pipeline = TTSPipeline(
+                synthesize=lambda text: audio_service.generate_character_voice(
+                    character_id=request.character_id,
+                    text=text,
+                    speed=voice_speed,
+                    deadline=deadline
+                ),
+                started_at=request_started_at
             )
             
-            if tts_audio:
-                # 保存音频文件（简化处理）
-                import base64
-                audio_base64 = base64.b64encode(tts_audio).decode('utf-8')
-                audio_url = f"/audio/{request.user_id}_{request.character_id}_{datetime.now().timestamp()}.wav"
-                print(f"✅ TTS生成成功: {len(tts_audio)} 字节, URL: {audio_url}")
+            if turn.image_result or _reply_mode(request) == "structured":
+                # 图片请求的回复会被角色的图片回应替换，结构化回复需要完整JSON才能取出回复，直接发送最终文本
+                response_data = await _generate_reply(request, turn)
+                response_data = await _complete_chat_turn(request, turn, response_data)
+                yield _sse_event("token", {"content": response_data["response"]})
+                pipeline.feed(response_data["response"])
             else:
-                audio_base64 = None
-                audio_url = None
-                print("⚠️ TTS生成失败")
-                
+                response_data = None
+                async for chunk in turn.agent.generate_response_stream(
+                    request.message, turn.user_context, turn.session
+                ):
+                    if chunk["type"] == "token":
+                        yield _sse_event("token", {"content": chunk["content"]})
+                        pipeline.feed(chunk["content"])
+                        for segment in pipeline.pop_ready():
+                            yield await _audio_segment_event(segment, include_base64)
+                    elif chunk["type"] == "done":
+                        response_data = chunk["data"]
+                response_data = await _complete_chat_turn(request, turn, response_data)
+            
+            metadata = _build_chat_response(request, turn, response_data, {}).model_dump(
+                exclude={"audio_url", "audio_base64"}
+            )
+            yield _sse_event("metadata", metadata)
+            
+            async for segment in pipeline.finish():
+                yield await _audio_segment_event(segment, include_base64)
+            # 分句音频没有整段音频URL，缓存命中时重新合成整段音频
+            _remember_answer(
+                request, cache_key, response_data, None, request_started_at,
+                deadline, turn.web_search_used, turn.image_result
+            )
+            
+            yield _sse_event("done", {
+                "tts": pipeline.summary(),
+                "degraded_stages": dict(deadline.degraded_stages)
+            })
+            
+        except UpstreamOverloadedError as e:
+            # 响应头已发送，无法再改为429，通过error事件告知重试时间
+            print(f"🚦 流式聊天上游繁忙: {e.upstream} ({e.reason})")
+            yield _sse_event("error", {
+                "message": str(e),
+                "upstream": e.upstream,
+                "reason": e.reason,
+                "retry_after": e.retry_after
+            })
         except Exception as e:
-            print(f"❌ TTS处理失败: {e}")
-            audio_base64 = None
-            audio_url = None
-        
-        return ChatResponse(
-            character_id=response_data["character_id"],
-            character_name=response_data["character_name"],
-            response=response_data["response"],
-            emotion=response_data["emotion"],
-            timestamp=response_data["timestamp"],
-            voice_config=response_data.get("voice_config"),
-            audio_url=audio_url,  # 添加音频URL
-            audio_base64=audio_base64,  # 添加音频Base64
-            web_search_used=web_search_used,  # 是否使用了联网搜索
-            web_search_query=request.message if web_search_used else None,  # 搜索查询词
-            web_search_results_count=web_search_result.get('total_results', 0) if web_search_result else 0,  # 搜索结果数量
-            # 图片生成相关字段
-            image_url=response_data.get("image_url"),
-            image_base64=response_data.get("image_base64"),
-            image_description=response_data.get("image_description"),
-            enhanced_prompt=response_data.get("enhanced_prompt")
-        )
-        
-    except Exception as e:
-        print(f"❌ 聊天处理失败: {str(e)}")
-        # 返回明确的错误信息，不使用模糊的fallback
-        try:
-            from config import CHARACTER_CONFIGS
-        except ImportError:
-            CHARACTER_CONFIGS = {}
-        
-        character_config = CHARACTER_CONFIGS.get(request.character_id, {})
-        error_message = f"处理失败: {str(e)[:100]}..."
-        return ChatResponse(
-            character_id=request.character_id,
-            character_name=character_config.get("name", "系统"),
-            response=error_message,
-            emotion="error",
-            timestamp=datetime.now().isoformat()
-        )
+            print(f"❌ 流式聊天处理失败: {str(e)}")
+            yield _sse_event("error", {"message": f"处理失败: {str(e)[:100]}..."})
+        finally:
+            if pipeline:
+                await pipeline.aclose()
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 
 # === 语音聊天接口 ===
@@ -450,9 +1000,13 @@ async def text_chat(request: ChatRequest):
 async def voice_chat(
     audio_file: UploadFile = File(...),
     user_id: str = "default",
-    character_id: str = "xiyang"
+    character_id: str = "xiyang",
+    reply_mode: Optional[Literal["multi_call", "structured"]] = None
 ):
     """语音聊天接口"""
+    started_at = time.perf_counter()
+    deadline = Deadline().bind()
+    usage_tracker.begin_turn(user_id, character_id)
     try:
         # 读取音频文件
         audio_data = await audio_file.read()
@@ -470,11 +1024,35 @@ async def voice_chat(
         if not user_text.strip():
             raise HTTPException(status_code=400, detail="未识别到有效语音内容")
         
-        # 处理对话（异步）
+        # 重复提问直接使用缓存的回答
+        chat_request = ChatRequest(
+            message=user_text,
+            user_id=user_id,
+            character_id=character_id,
+            include_audio_base64=False,
+            reply_mode=reply_mode
+        )
+        cache_key = _answer_cache_key(chat_request)
+        cached = await _answer_from_cache(chat_request, cache_key, deadline, started_at)
+        if cached:
+            response_data, audio = cached
+            return VoiceChatResponse(
+                character_id=response_data["character_id"],
+                character_name=response_data["character_name"],
+                response=response_data["response"],
+                emotion=response_data["emotion"],
+                audio_url=audio.get("audio_url"),
+                timestamp=response_data["timestamp"],
+                degraded_stages=dict(deadline.degraded_stages)
+            )
+        
+        # 处理对话（异步），时间预算从收到请求时开始计算
         result = await conversation_graph.process_conversation(
             user_input=user_text,
             user_id=user_id,
-            character_id=character_id
+            character_id=character_id,
+            deadline=deadline,
+            reply_mode=reply_mode
         )
         
         # 语音合成 - 使用角色专属TTS函数
@@ -486,11 +1064,17 @@ async def voice_chat(
         tts_audio = await audio_service.generate_character_voice(
             character_id=character_id,
             text=result["response"],
-            speed=voice_speed
+            speed=voice_speed,
+            deadline=deadline
         )
         
-        # 这里简化处理，实际应该保存音频文件并返回URL
-        audio_url = f"/audio/{user_id}_{character_id}_{datetime.now().timestamp()}.wav"
+        audio_url = (await artifact_store.save(tts_audio)).url if tts_audio else None
+        # 对话图中的回复代理在消息触发联网搜索时自行搜索；语音聊天不生成图片；对话图出错时的提示不缓存
+        if not result.get("error"):
+            _remember_answer(
+                chat_request, cache_key, result, audio_url, started_at,
+                deadline, web_search_used=trigger_detector.detect(user_text).needs_web_search
+            )
         
         return VoiceChatResponse(
             character_id=result["character_id"],
@@ -498,10 +1082,12 @@ async def voice_chat(
             response=result["response"],
             emotion=result["emotion"],
             audio_url=audio_url,
-            timestamp=result["timestamp"]
+            timestamp=result["timestamp"],
+            degraded_stages=dict(deadline.degraded_stages),
+            rag_retrieval=result.get("rag_retrieval")
         )
         
-    except HTTPException:
+    except (HTTPException, UpstreamOverloadedError):
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"语音聊天处理失败: {str(e)}")
@@ -523,21 +1109,75 @@ async def text_to_speech_endpoint(
             speed=speed
         )
         
-        # 这里应该保存文件并返回URL，简化处理
-        filename = f"tts_{user_id}_{datetime.now().timestamp()}.wav"
+        artifact = await artifact_store.save(audio_data)
         
         return {
             "success": True,
-            "audio_url": f"/audio/{filename}",
+            "audio_url": artifact.url,
             "text": text,
             "voice": voice,
             "duration": len(audio_data) / 24000  # 估算时长
         }
         
+    except UpstreamOverloadedError:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"语音合成失败: {str(e)}")
 
 
+# === 音频文件接口 ===
+AUDIO_CHUNK_SIZE = 64 * 1024
+
+
+@app.get("/audio/{artifact_id}")
+async def get_audio(artifact_id: str, request: Request):
+    """
+    获取TTS音频文件（支持Range请求，流式返回）
+    
+    Args:
+        artifact_id: 音频产物ID（聊天响应中的audio_url）
+    """
+    artifact = artifact_store.get(artifact_id)
+    if not artifact:
+        raise HTTPException(status_code=404, detail="音频不存在或已过期")
+    
+    file_size = artifact.size
+    headers = {
+        "Accept-Ranges": "bytes",
+        # 内容寻址的产物不会变化，可以长期缓存
+        "Cache-Control": "public, max-age=86400, immutable",
+        "ETag": f'"{artifact_id.split(".")[0]}"'
+    }
+    
+    try:
+        byte_range = parse_range_header(request.headers.get("range"), file_size)
+    except ValueError:
+        return Response(status_code=416, headers={"Content-Range": f"bytes */{file_size}"})
+    
+    start, end = byte_range if byte_range else (0, file_size - 1)
+    headers["Content-Length"] = str(end - start + 1)
+    if byte_range:
+        headers["Content-Range"] = f"bytes {start}-{end}/{file_size}"
+    
+    async def file_chunks():
+        async with aiofiles.open(artifact.path, "rb") as f:
+            await f.seek(start)
+            remaining = end - start + 1
+            while remaining > 0:
+                chunk = await f.read(min(AUDIO_CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+    
+    return StreamingResponse(
+        file_chunks(),
+        status_code=206 if byte_range else 200,
+        media_type=artifact.content_type,
+        headers=headers
+    )
+
+
 # === ASR接口 ===
 @app.post("/asr")
 async def speech_to_text_endpoint(audio_file: UploadFile = File(...)):
@@ -552,6 +1192,8 @@ async def speech_to_text_endpoint(audio_file: UploadFile = File(...)):
         
         return result
         
+    except UpstreamOverloadedError:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"语音识别失败: {str(e)}")
 
@@ -594,6 +1236,45 @@ async def get_user_stats(user_id: str):
         raise HTTPException(status_code=500, detail=f"获取统计信息失败: {str(e)}")
 
 
+# === 用量与费用接口 ===
+@app.get("/usage")
+async def get_usage(
+    group_by: str = "stage",
+    user_id: Optional[str] = None,
+    character_id: Optional[str] = None,
+    stage: Optional[str] = None,
+    days: int = 7
+):
+    """
+    按维度汇总最近几天的token用量、TTS字符数、图片张数和费用（按费用从高到低排列）
+    
+    Args:
+        group_by: 逗号分隔的分组维度（day、user_id、character_id、stage、model）
+        user_id: 只统计该用户
+        character_id: 只统计该角色
+        stage: 只统计该阶段（route、expand、cot、reply、summarize、tts、image等）
+        days: 统计最近几天
+    """
+    dimensions = [name.strip() for name in group_by.split(",") if name.strip()]
+    unknown = [name for name in dimensions if name not in GROUP_FIELDS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"不支持的分组维度: {', '.join(unknown)}")
+    rows = await asyncio.to_thread(
+        usage_tracker.query, dimensions, user_id, character_id, stage, days
+    )
+    return {"group_by": dimensions, "days": days, "rows": rows}
+
+
+@app.get("/usage/summary")
+async def get_usage_summary(
+    user_id: Optional[str] = None,
+    character_id: Optional[str] = None,
+    days: int = 7
+):
+    """用量汇总：总量、平均每轮对话的token数和费用，以及按费用排序的各阶段"""
+    return await asyncio.to_thread(usage_tracker.summary, user_id, character_id, days)
+
+
 # === 文件上传接口 ===
 @app.post("/upload-document", response_model=FileUploadResponse)
 async def upload_document(
@@ -606,6 +1287,7 @@ async def upload_document(
     """
     try:
         print(f"📤 接收文档上传请求: {file.filename} -> 角色: {character_id}")
+        usage_tracker.bind(user_id, character_id)
         
         # 检查文件大小（限制为10MB）
         if file.size and file.size > 10 * 1024 * 1024:
@@ -627,6 +1309,8 @@ async def upload_document(
         
         if success:
             print(f"✅ 文档上传成功: {file.filename}")
+            # 角色文档变化后，该角色缓存的回答可能不再准确
+            answer_cache.invalidate(character_id=character_id)
             return FileUploadResponse(
                 success=True,
                 message=message,
@@ -674,6 +1358,7 @@ async def delete_character_document(character_id: str, file_id: str):
         success = graph_rag.delete_character_document(character_id, file_id)
         
         if success:
+            answer_cache.invalidate(character_id=character_id)
             return {
                 "success": True, 
                 "message": "文档删除成功"
@@ -0,0 +1,147 @@
+"""
+会话状态存储 - 按 (user_id, character_id, thread_id) 隔离的短期对话状态
+角色代理和客户端作为进程级单例共享，每个会话的对话历史、上下文记忆和情绪状态保存在这里
+内存有上限：超过最大会话数时按LRU淘汰，长时间不活跃的会话按TTL过期
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from config import Config
+
+
+SessionKey = Tuple[str, str, str]
+
+
+@dataclass
+class SessionState:
+    """单个会话的对话状态"""
+    user_id: str
+    character_id: str
+    thread_id: str
+    conversation_history: List[Dict[str, Any]] = field(default_factory=list)
+    context_memory: Dict[str, Any] = field(default_factory=dict)
+    emotional_state: str = "neutral"
+    hydrated: bool = False  # 是否已从长期记忆加载历史
+    created_at: float = field(default_factory=time.time)
+    last_access: float = field(default_factory=time.time)
+
+    @property
+    def key(self) -> SessionKey:
+        return (self.user_id, self.character_id, self.thread_id)
+
+
+class SessionStore:
+    """有界的会话状态存储（LRU + TTL）"""
+
+    def __init__(self, max_sessions: Optional[int] = None, ttl_seconds: Optional[float] = None):
+        """
+        初始化会话存储
+
+        Args:
+            max_sessions: 最多保留的会话数
+            ttl_seconds: 会话不活跃多久后过期
+        """
+        self.max_sessions = max_sessions or Config.SESSION_STORE_MAX_SESSIONS
+        self.ttl_seconds = ttl_seconds or Config.SESSION_TTL_SECONDS
+
+        self._sessions: "OrderedDict[SessionKey, SessionState]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @staticmethod
+    def default_thread_id(user_id: str, character_id: str) -> str:
+        """未指定线程ID时使用的默认值（与Java后端的约定一致）"""
+        return f"{user_id}_{character_id}"
+
+    def get_or_create(self, user_id: str, character_id: str, thread_id: Optional[str] = None) -> SessionState:
+        """
+        获取会话状态，不存在或已过期时新建
+
+        Args:
+            user_id: 用户ID
+            character_id: 角色ID
+            thread_id: 线程ID（为空时使用默认线程）
+
+        Returns:
+            会话状态
+        """
+        key = (user_id, character_id, thread_id or self.default_thread_id(user_id, character_id))
+        now = time.time()
+
+        with self._lock:
+            session = self._sessions.get(key)
+            if session and now - session.last_access > self.ttl_seconds:
+                del self._sessions[key]
+                self.expirations += 1
+                session = None
+
+            if session:
+                self.hits += 1
+                session.last_access = now
+                self._sessions.move_to_end(key)
+                return session
+
+            self.misses += 1
+            session = SessionState(user_id=key[0], character_id=key[1], thread_id=key[2])
+            self._sessions[key] = session
+            self._evict_locked()
+            return session
+
+    def get(self, user_id: str, character_id: str, thread_id: Optional[str] = None) -> Optional[SessionState]:
+        """获取已存在的会话状态（不新建）"""
+        key = (user_id, character_id, thread_id or self.default_thread_id(user_id, character_id))
+        with self._lock:
+            session = self._sessions.get(key)
+            if session and time.time() - session.last_access > self.ttl_seconds:
+                del self._sessions[key]
+                self.expirations += 1
+                return None
+            return session
+
+    def remove(self, user_id: str, character_id: str, thread_id: Optional[str] = None) -> bool:
+        """删除会话状态"""
+        key = (user_id, character_id, thread_id or self.default_thread_id(user_id, character_id))
+        with self._lock:
+            return self._sessions.pop(key, None) is not None
+
+    def evict_expired(self) -> int:
+        """清理所有过期会话，返回清理数量"""
+        now = time.time()
+        with self._lock:
+            expired = [key for key, session in self._sessions.items()
+                       if now - session.last_access > self.ttl_seconds]
+            for key in expired:
+                del self._sessions[key]
+            self.expirations += len(expired)
+            return len(expired)
+
+    def _evict_locked(self):
+        """超出容量时淘汰最久未使用的会话（调用方需持有锁）"""
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+            self.evictions += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取会话存储统计信息"""
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "max_sessions": self.max_sessions,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations
+            }
+
+
+# 全局会话存储实例
+session_store = SessionStore()
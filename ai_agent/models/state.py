@@ -3,11 +3,16 @@
 定义LangGraph中使用的状态数据结构
 """
 
-from typing import Dict, List, Any, Optional, Literal
+from typing import Annotated, Dict, List, Any, Optional, Literal
 from pydantic import BaseModel, Field
 from langchain.schema import BaseMessage
 
 
+def merge_timings(current: Dict[str, float], update: Dict[str, float]) -> Dict[str, float]:
+    """合并并行分支各自写入的耗时（空字典表示新一轮开始，清空上一轮的耗时）"""
+    return {**current, **update} if update else {}
+
+
 class Router(BaseModel):
     """路由器模型 - 用于意图识别和路由决策"""
     
@@ -53,6 +58,7 @@ class ConversationState(BaseModel):
     router: Optional[Router] = Field(default=None, description="路由信息")
     selected_character: str = Field(default="xiyang", description="选中的角色ID")
     role: str = Field(default="elderly", description="用户角色（elderly/adult/child）")
+    reply_mode: str = Field(default="multi_call", description="回复模式（multi_call/structured）")
     
     # 意图和情绪
     intent: str = Field(default="general", description="用户意图")
@@ -63,6 +69,12 @@ class ConversationState(BaseModel):
     context: Dict[str, Any] = Field(default_factory=dict, description="对话上下文")
     memory_context: Dict[str, Any] = Field(default_factory=dict, description="记忆上下文")
     rag_context: List[Dict[str, Any]] = Field(default_factory=list, description="RAG检索的上下文")
+    cot_result: Optional[Dict[str, Any]] = Field(default=None, description="CoT分支在汇合前完成的推理结果")
+    rag_retrieval: Dict[str, Any] = Field(default_factory=dict, description="本轮知识检索的状态和耗时")
+    branch_timings: Annotated[Dict[str, float], merge_timings] = Field(
+        default_factory=dict,
+        description="并行分支的耗时（毫秒），各分支同时写入时合并"
+    )
     
     # 音频相关（可选）
     audio_input: Optional[bytes] = Field(default=None, description="音频输入数据")
@@ -0,0 +1,35 @@
+"""
+单次结构化回复的提示词模板
+一次调用同时完成路由判断、简要分析、情绪识别和角色回复
+"""
+
+# 可选的路由类型（与models.state.Router.type一致）
+STRUCTURED_ROUTE_TYPES = (
+    "character-xiyang",
+    "character-meiyang",
+    "character-lanyang",
+    "general-query",
+    "health-concern",
+    "emotional-support",
+    "knowledge-query"
+)
+
+# 可选的回复情绪
+STRUCTURED_EMOTIONS = ("neutral", "happy", "caring", "worried", "comforting", "excited")
+
+# 追加在角色系统提示词之后的输出要求
+STRUCTURED_REPLY_INSTRUCTION = """
+
+## 输出格式
+先在心里简要分析用户的需求，再以你的角色身份回复。必须只输出一个JSON对象，包含：
+- route: 本轮对话类型，取值之一：{route_types}
+- analysis: 对用户需求和回复思路的简要分析（一两句话，不展示给用户）
+- emotion: 回复的情绪，取值之一：{emotions}
+- reply: 直接说给用户听的回复内容（遵守上面对回复长度和风格的要求）
+
+示例：
+{{"route": "health-concern", "analysis": "父母最近睡不好，需要关心并给出简单可行的建议", "emotion": "caring", "reply": "爸，睡不好可别硬撑着……"}}
+""".format(
+    route_types="、".join(STRUCTURED_ROUTE_TYPES),
+    emotions="、".join(STRUCTURED_EMOTIONS)
+)
@@ -27,8 +27,8 @@ try:
 except ImportError:
     DOCX_AVAILABLE = False
 
-from openai import OpenAI
-from config import Config
+from services.single_flight import single_flight
+from services.llm_memo_cache import llm_memo_cache
 
 
 @dataclass
@@ -86,11 +86,6 @@ class DocumentProcessor:
         self.storage_path = Path(storage_path)
         self.storage_path.mkdir(exist_ok=True)
         
-        self.client = OpenAI(
-            api_key=Config.DASHSCOPE_API_KEY,
-            base_url=Config.DASHSCOPE_BASE_URL
-        )
-        
         self._init_database()
         print("✅ 文档处理器初始化完成")
     
@@ -412,11 +407,19 @@ class DocumentProcessor:
             return []
     
     async def _generate_document_summary(self, chunks: List[DocumentChunk]) -> Tuple[str, List[str]]:
-        """生成文档摘要和关键词"""
+        """生成文档摘要和关键词（相同内容的摘要进行中时复用其结果）"""
+        # 取前几个chunk作为样本
+        sample_content = "\n\n".join([chunk.content for chunk in chunks[:5]])
+        sample_hash = hashlib.sha256(sample_content[:1000].encode('utf-8')).hexdigest()
+        return await single_flight.do(
+            "document_summary",
+            sample_hash,
+            lambda: self._request_document_summary(sample_content)
+        )
+    
+    async def _request_document_summary(self, sample_content: str) -> Tuple[str, List[str]]:
+        """调用LLM生成文档摘要和关键词"""
         try:
-            # 取前几个chunk作为样本
-            sample_content = "\n\n".join([chunk.content for chunk in chunks[:5]])
-            
             summary_prompt = f"""
 请为以下文档内容生成一个简洁的摘要（不超过200字）：
 
@@ -430,14 +433,11 @@ class DocumentProcessor:
 只返回摘要内容：
 """
             
-            response = self.client.chat.completions.create(
-                model=Config.LLM_MODEL,
-                messages=[{"role": "user", "content": summary_prompt}],
-                temperature=0.3,
-                max_tokens=300
-            )
-            
-            summary = response.choices[0].message.content.strip()
+            # 同一内容上传给其他角色时直接使用缓存的摘要和关键词
+            summary = (await llm_memo_cache.complete(
+                task="summarize",
+                messages=[{"role": "user", "content": summary_prompt}]
+            )).strip()
             
             # 生成关键词
             keywords_prompt = f"""
@@ -448,14 +448,10 @@ class DocumentProcessor:
 只返回关键词列表，每行一个：
 """
             
-            response = self.client.chat.completions.create(
-                model=Config.LLM_MODEL,
-                messages=[{"role": "user", "content": keywords_prompt}],
-                temperature=0.3,
-                max_tokens=200
-            )
-            
-            keywords_text = response.choices[0].message.content.strip()
+            keywords_text = (await llm_memo_cache.complete(
+                task="keywords",
+                messages=[{"role": "user", "content": keywords_prompt}]
+            )).strip()
             keywords = [kw.strip('- ').strip() for kw in keywords_text.split('\n') if kw.strip()]
             
             return summary, keywords[:10]
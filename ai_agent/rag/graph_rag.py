@@ -11,11 +11,13 @@ from pathlib import Path
 from dataclasses import dataclass
 from datetime import datetime
 import numpy as np
-from openai import OpenAI
 
 from config import Config
+from services.single_flight import single_flight
+from services.llm_memo_cache import llm_memo_cache
 from models.state import GraphRAGResult
 from rag.document_processor import document_processor
+from services.deadline import Deadline
 
 
 @dataclass
@@ -51,10 +53,6 @@ class GraphRAGSystem:
             db_path = str(db_dir / "knowledge_graph.db")
         
         self.db_path = db_path
-        self.client = OpenAI(
-            api_key=Config.DASHSCOPE_API_KEY,
-            base_url=Config.DASHSCOPE_BASE_URL
-        )
         
         self._init_database()
         self._populate_initial_knowledge()
@@ -284,7 +282,8 @@ class GraphRAGSystem:
         query: str, 
         character_id: Optional[str] = None,
         domain: Optional[str] = None, 
-        limit: int = 5
+        limit: int = 5,
+        deadline: Optional[Deadline] = None
     ) -> dict:
         """
         查询知识图谱和角色文档
@@ -294,6 +293,7 @@ class GraphRAGSystem:
             character_id: 角色ID，用于搜索角色专属文档
             domain: 知识域限制
             limit: 返回结果数量限制
+            deadline: 请求时间预算（剩余时间不足时跳过查询扩展）
             
         Returns:
             知识检索结果
@@ -303,8 +303,18 @@ class GraphRAGSystem:
             if character_id:
                 print(f"🎭 角色: {character_id}")
             
-            # 1. 查询扩展 - 生成相关关键词
-            expanded_query = await self._expand_query(query)
+            # 1. 查询扩展 - 生成相关关键词（可选阶段，预算不足时直接使用原始查询）
+            if deadline:
+                expanded_query = await deadline.run(
+                    "query_expansion",
+                    lambda: self._expand_query(query),
+                    timeout=Config.QUERY_EXPANSION_TIMEOUT,
+                    min_seconds=Config.DEADLINE_MIN_QUERY_EXPANSION_SECONDS,
+                    reserve=Config.DEADLINE_REPLY_RESERVE_SECONDS,
+                    default=[query]
+                )
+            else:
+                expanded_query = await self._expand_query(query)
             
             # 2. 检索相关节点（基础知识图谱）
             relevant_nodes = self._search_nodes(expanded_query, domain, limit)
@@ -384,7 +394,11 @@ class GraphRAGSystem:
             )
     
     async def _expand_query(self, query: str) -> List[str]:
-        """查询扩展 - 生成相关关键词"""
+        """查询扩展 - 生成相关关键词（相同查询进行中时复用其结果）"""
+        return await single_flight.do("query_expansion", query.strip(), lambda: self._request_query_expansion(query))
+    
+    async def _request_query_expansion(self, query: str) -> List[str]:
+        """调用LLM生成查询扩展关键词"""
         try:
             expansion_prompt = f"""
 请为以下查询生成相关的关键词和同义词，帮助更好地检索知识：
@@ -399,14 +413,13 @@ class GraphRAGSystem:
 只返回关键词列表，每行一个：
 """
             
-            response = self.client.chat.completions.create(
-                model=Config.LLM_MODEL,
-                messages=[{"role": "user", "content": expansion_prompt}],
-                temperature=0.5,
-                max_tokens=200
+            # 相同查询的扩展结果持久化缓存，不必每条消息都调用LLM
+            expansion = await llm_memo_cache.complete(
+                task="expand",
+                messages=[{"role": "user", "content": expansion_prompt}]
             )
             
-            expanded_terms = response.choices[0].message.content.strip().split('\n')
+            expanded_terms = expansion.strip().split('\n')
             expanded_terms = [term.strip('- ').strip() for term in expanded_terms if term.strip()]
             
             # 添加原始查询
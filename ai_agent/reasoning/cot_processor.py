@@ -5,10 +5,9 @@ Chain of Thought (CoT) 推理处理器
 
 import json
 from typing import Dict, List, Any, Optional
-from openai import OpenAI
 from datetime import datetime
 
-from config import Config
+from services.llm_gateway import llm_gateway
 
 
 class CoTStep:
@@ -25,10 +24,6 @@ class CoTProcessor:
     
     def __init__(self):
         """初始化CoT处理器"""
-        self.client = OpenAI(
-            api_key=Config.DASHSCOPE_API_KEY,
-            base_url=Config.DASHSCOPE_BASE_URL
-        )
         
         # 为不同角色定制的推理模板
         self.character_thinking_templates = {
@@ -169,14 +164,12 @@ class CoTProcessor:
     async def _execute_reasoning(self, reasoning_prompt: str) -> str:
         """执行推理过程"""
         try:
-            response = self.client.chat.completions.create(
-                model=Config.LLM_MODEL,
+            response = await llm_gateway.chat_completion(
+                task="cot",
                 messages=[{
                     "role": "user",
                     "content": reasoning_prompt
-                }],
-                temperature=0.4,  # 较低温度确保逻辑性
-                max_tokens=800
+                }]
             )
             
             return response.choices[0].message.content
@@ -0,0 +1,115 @@
+"""
+推测执行的CoT推理
+CoT推理与不含CoT分析的草稿回复同时开始：
+- CoT在时间预算内完成时，用CoT分析生成增强回复（增强回复失败时仍使用草稿）
+- CoT超出预算或没有给出分析时，直接使用草稿回复，不再为CoT多等一次LLM往返
+统计每条路径胜出的次数，以及相对"先CoT、后回复"的串行执行节省的时间
+"""
+
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from services.llm_gateway import LatencyHistogram
+
+
+class SpeculativeCoT:
+    """CoT推理与草稿回复的推测执行及胜出统计"""
+
+    # cot: CoT增强回复；draft_timeout: CoT超出预算；draft_no_cot: CoT未给出分析；draft_fallback: 增强回复失败
+    PATHS = ("cot", "draft_timeout", "draft_no_cot", "draft_fallback")
+
+    def __init__(self):
+        self.wins: Dict[str, int] = {path: 0 for path in self.PATHS}
+        self.saved = LatencyHistogram()
+        self.saved_total = 0.0
+
+    async def run(
+        self,
+        cot: Callable[[], Awaitable[Optional[Dict[str, Any]]]],
+        draft: Callable[[], Awaitable[Any]],
+        informed: Callable[[Dict[str, Any]], Awaitable[Any]],
+        budget: float
+    ) -> Tuple[Any, Optional[Dict[str, Any]], str]:
+        """
+        同时执行CoT推理和草稿回复，按CoT是否在预算内完成选择回复
+
+        Args:
+            cot: 返回CoT结果的协程工厂
+            draft: 返回草稿回复（不含CoT分析）的协程工厂
+            informed: 接收CoT结果、返回CoT增强回复的协程工厂
+            budget: CoT可用时间（秒，从开始计算）
+
+        Returns:
+            (采用的回复, 采用的CoT结果（使用草稿时为None）, 胜出路径)
+        """
+        started_at = time.perf_counter()
+        draft_elapsed = {}
+
+        async def timed_draft():
+            result = await draft()
+            draft_elapsed["seconds"] = time.perf_counter() - started_at
+            return result
+
+        draft_task = asyncio.ensure_future(timed_draft())
+        # 采用增强回复时不再读取草稿结果，避免未读取的异常产生警告
+        draft_task.add_done_callback(lambda task: task.cancelled() or task.exception())
+        try:
+            try:
+                cot_result = await asyncio.wait_for(cot(), timeout=budget)
+            except asyncio.TimeoutError:
+                cot_result = None
+            cot_elapsed = time.perf_counter() - started_at
+
+            if cot_result is None:
+                path = "draft_timeout"
+            elif not cot_result.get("use_cot", False):
+                path = "draft_no_cot"
+            else:
+                informed_started_at = time.perf_counter()
+                try:
+                    reply = await informed(cot_result)
+                except Exception as e:
+                    print(f"⚠️ CoT增强回复失败，使用草稿回复: {e}")
+                    path = "draft_fallback"
+                else:
+                    self._record("cot", started_at, cot_elapsed + time.perf_counter() - informed_started_at)
+                    return reply, cot_result, "cot"
+
+            reply = await draft_task
+            self._record(path, started_at, cot_elapsed + draft_elapsed["seconds"])
+            return reply, None, path
+        finally:
+            if not draft_task.done():
+                draft_task.cancel()
+
+    def _record(self, path: str, started_at: float, sequential_estimate: float):
+        """
+        记录胜出路径和节省的时间
+
+        Args:
+            path: 胜出路径
+            started_at: 开始时间（perf_counter）
+            sequential_estimate: 串行执行（CoT完成后再生成回复）的估计耗时（秒）；
+                CoT超出预算时按已等待的时间计算，是节省时间的下限
+        """
+        saved = max(0.0, sequential_estimate - (time.perf_counter() - started_at))
+        self.wins[path] += 1
+        self.saved.record(saved)
+        self.saved_total += saved
+        print(f"🏁 推测CoT: {path} 胜出，节省 {saved * 1000:.0f}ms")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取各路径胜出次数和节省时间统计"""
+        turns = sum(self.wins.values())
+        return {
+            "turns": turns,
+            "wins": dict(self.wins),
+            "cot_win_rate": round(self.wins["cot"] / turns, 3) if turns else None,
+            "saved_total_ms": round(self.saved_total * 1000, 1),
+            "saved": self.saved.snapshot()
+        }
+
+
+# 全局推测CoT实例
+speculative_cot = SpeculativeCoT()
@@ -0,0 +1,356 @@
+"""
+重复提问答案缓存 - 按 (用户, 角色) 缓存最近的问答和回复音频
+老人经常在几分钟到几小时内重复问同一件事（“今天几号”“药吃了吗”、同样的问候），
+重复提问直接使用缓存的回复和音频，跳过LLM、RAG和TTS；
+各聊天类型有各自的保鲜时间，实时信息类不缓存；问题归一化后精确匹配，或在相似度足够高且只差虚词时近似匹配。
+问题求助和情感支持类只做精确匹配（“头疼”和“牙疼”、“高血压”和“低血压”只差一个字，但答案完全不同）。
+追问和指代上文的消息（“然后呢”“为什么呀”“那个药怎么吃”）的含义取决于上一轮回复，只在上一轮回复相同时复用
+"""
+
+import hashlib
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from difflib import SequenceMatcher
+from typing import Any, Dict, Optional, Tuple
+
+from config import Config
+
+
+# 句末语气词不影响问题含义
+_TRAILING_PARTICLES = re.compile(r"[啊呀呢吧嘛哦哈啦呐]+$")
+# 句末的“没/没有”表示询问，与“吗”同义（“药吃了没” = “药吃了吗”）
+_TRAILING_QUESTION = re.compile(r"没有?$")
+# 标点和空白（Python的\w包含汉字）
+_NON_WORD = re.compile(r"[\W_]+")
+_DIGITS = re.compile(r"\d+")
+# 否定词不同的问题含义相反，不做近似匹配
+_NEGATIONS = frozenset("不没别未")
+# 虚词（副词、助词、语气词和称呼）：两个问题只差这些字时才算相近，差实词（部位、病名、药名）时不算
+_FUNCTION_CHARS = frozenset("的地得了着过吗呢吧呀啊嘛哦啦还都也就又再才请您你")
+# 指代和承接上文的词：含这些词的消息要结合上一轮回复才能理解
+_ANAPHORA = re.compile(r"这个|那个|这些|那些|这样|那样|这种|那种|它|他|她|刚才|后来|然后|还有|接着|继续")
+# 疑问词和应答词：去掉它们和虚词后不剩实词的消息（“为什么呀”“怎么办”“真的吗”）没有独立的含义
+_BARE_WORDS = re.compile(r"为什么|为啥|怎么办|怎么样|怎么|咋办|咋样|什么|真的|是吗|对吗|好吗|是的|好的|嗯")
+# 开启轻度改写时，重复回答前加的引导语（按命中次数轮换）
+REPHRASE_PREFIXES = ("再跟您说一遍，", "就像刚才说的，", "还是刚才那句话，")
+
+AnswerKey = Tuple[str, str]
+QuestionKey = Tuple[str, str]
+
+
+def normalize_question(text: str) -> str:
+    """
+    归一化问题文本：全角转半角、小写、去掉标点空白和句末语气词，统一句末疑问词
+
+    Args:
+        text: 用户消息
+
+    Returns:
+        归一化后的问题
+    """
+    text = unicodedata.normalize("NFKC", text or "").lower()
+    text = _NON_WORD.sub("", text)
+    return _TRAILING_QUESTION.sub("吗", _TRAILING_PARTICLES.sub("", text))
+
+
+def question_similarity(a: str, b: str) -> float:
+    """
+    两个归一化问题的相似度（数字、否定词或虚词以外的字不同时为0）
+
+    Args:
+        a: 归一化问题
+        b: 归一化问题
+
+    Returns:
+        0~1之间的相似度
+    """
+    if a == b:
+        return 1.0
+    if _DIGITS.findall(a) != _DIGITS.findall(b):
+        return 0.0
+    if _NEGATIONS.intersection(a) != _NEGATIONS.intersection(b):
+        return 0.0
+    matcher = SequenceMatcher(None, a, b)
+    for tag, a_start, a_end, b_start, b_end in matcher.get_opcodes():
+        if tag != "equal" and not _FUNCTION_CHARS.issuperset(a[a_start:a_end] + b[b_start:b_end]):
+            return 0.0
+    return matcher.ratio()
+
+
+def depends_on_context(question: str) -> bool:
+    """
+    消息的含义是否取决于上一轮回复（追问、指代上文，或去掉疑问词和虚词后不剩实词）
+
+    Args:
+        question: 用户消息
+
+    Returns:
+        是否依赖上下文
+    """
+    normalized = normalize_question(question)
+    if _ANAPHORA.search(normalized):
+        return True
+    content = [char for char in _BARE_WORDS.sub("", normalized) if char not in _FUNCTION_CHARS]
+    return len(content) < 2
+
+
+def context_fingerprint(previous_reply: str) -> str:
+    """上一轮回复的指纹，作为依赖上下文的消息的缓存键的一部分"""
+    return hashlib.sha1((previous_reply or "").encode("utf-8")).hexdigest()[:16]
+
+
+@dataclass
+class CachedAnswer:
+    """一条缓存的问答"""
+    question: str
+    normalized: str
+    chat_type: str
+    response: str
+    emotion: str
+    voice_config: Dict[str, Any]
+    audio_url: Optional[str]  # 音频保存在产物存储中，过期后命中时重新合成
+    latency_ms: float  # 首次生成（含TTS）的耗时
+    context: str = ""  # 上一轮回复的指纹（只对依赖上下文的消息设置）
+    created_at: float = field(default_factory=time.time)
+    hits: int = 0
+
+
+@dataclass
+class AnswerCacheHit:
+    """一次缓存命中"""
+    answer: CachedAnswer
+    similarity: float
+    response: str  # 实际回复文本（开启轻度改写时带引导语）
+
+    @property
+    def exact(self) -> bool:
+        return self.similarity >= 1.0
+
+    @property
+    def rephrased(self) -> bool:
+        return self.response != self.answer.response
+
+
+class AnswerCache:
+    """按 (用户, 角色) 隔离的重复提问答案缓存"""
+
+    def __init__(
+        self,
+        ttl_seconds: Optional[Dict[str, float]] = None,
+        similarity: Optional[float] = None,
+        max_entries: Optional[int] = None,
+        max_users: Optional[int] = None,
+        rephrase: Optional[bool] = None,
+        exact_only: Optional[Tuple[str, ...]] = None,
+        enabled: Optional[bool] = None
+    ):
+        """
+        初始化答案缓存
+
+        Args:
+            ttl_seconds: 各聊天类型的保鲜时间（秒，0或未配置表示不缓存）
+            similarity: 近似匹配的最低相似度
+            max_entries: 每个 (用户, 角色) 最多缓存的问答数
+            max_users: 最多缓存的 (用户, 角色) 数
+            rephrase: 命中时是否给回复加引导语（改写后需要重新合成音频）
+            exact_only: 只做精确匹配的聊天类型
+            enabled: 是否启用
+        """
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else Config.ANSWER_CACHE_TTL_SECONDS
+        self.similarity = similarity if similarity is not None else Config.ANSWER_CACHE_SIMILARITY
+        self.max_entries = max_entries or Config.ANSWER_CACHE_MAX_ENTRIES
+        self.max_users = max_users or Config.ANSWER_CACHE_MAX_USERS
+        self.rephrase = rephrase if rephrase is not None else Config.ANSWER_CACHE_REPHRASE
+        self.exact_only = frozenset(exact_only if exact_only is not None else Config.ANSWER_CACHE_EXACT_ONLY)
+        self.enabled = enabled if enabled is not None else Config.ANSWER_CACHE_ENABLED
+
+        self._answers: "OrderedDict[AnswerKey, OrderedDict[QuestionKey, CachedAnswer]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.lookups = 0
+        self.skipped = 0
+        self.exact_hits = 0
+        self.near_hits = 0
+        self.expirations = 0
+        self.stores = 0
+        self.served = 0
+        self.saved_total_ms = 0.0
+
+    def cacheable(self, chat_type: str) -> bool:
+        """该聊天类型是否缓存（实时信息类等时效性强的类型不缓存）"""
+        return self.enabled and self.ttl_seconds.get(chat_type, 0) > 0
+
+    def lookup(
+        self,
+        user_id: str,
+        character_id: str,
+        question: str,
+        chat_type: str,
+        context: str = ""
+    ) -> Optional[AnswerCacheHit]:
+        """
+        查找同一用户对同一角色最近问过的相同或相近问题
+
+        Args:
+            user_id: 用户ID
+            character_id: 角色ID
+            question: 用户消息
+            chat_type: 聊天类型（detect_chat_type的type）
+            context: 上一轮回复的指纹（依赖上下文的消息只匹配上一轮回复相同时的回答）
+
+        Returns:
+            命中结果；未命中或该类型不缓存时返回None
+        """
+        if not self.cacheable(chat_type):
+            with self._lock:
+                self.skipped += 1
+            return None
+
+        normalized = normalize_question(question)
+        now = time.time()
+        with self._lock:
+            self.lookups += 1
+            answers = self._answers.get((user_id, character_id))
+            if not answers or not normalized:
+                return None
+
+            best, best_similarity = None, 0.0
+            min_similarity = 1.0 if chat_type in self.exact_only else self.similarity
+            for key, answer in list(answers.items()):
+                if now - answer.created_at > self.ttl_seconds.get(answer.chat_type, 0):
+                    del answers[key]
+                    self.expirations += 1
+                    continue
+                if answer.chat_type != chat_type or answer.context != context:
+                    continue
+                similarity = question_similarity(normalized, answer.normalized)
+                if similarity > best_similarity:
+                    best, best_similarity = answer, similarity
+
+            if not best or best_similarity < min_similarity:
+                return None
+
+            best.hits += 1
+            answers.move_to_end((best.normalized, best.context))
+            self._answers.move_to_end((user_id, character_id))
+            if best_similarity >= 1.0:
+                self.exact_hits += 1
+            else:
+                self.near_hits += 1
+
+        response = best.response
+        if self.rephrase:
+            response = REPHRASE_PREFIXES[(best.hits - 1) % len(REPHRASE_PREFIXES)] + response
+        return AnswerCacheHit(answer=best, similarity=round(best_similarity, 3), response=response)
+
+    def store(
+        self,
+        user_id: str,
+        character_id: str,
+        question: str,
+        chat_type: str,
+        response: str,
+        emotion: str,
+        voice_config: Optional[Dict[str, Any]],
+        audio_url: Optional[str],
+        latency_ms: float,
+        context: str = ""
+    ):
+        """
+        缓存一次完整生成的问答
+
+        Args:
+            user_id: 用户ID
+            character_id: 角色ID
+            question: 用户消息
+            chat_type: 聊天类型
+            response: 回复文本
+            emotion: 情绪
+            voice_config: 音色配置
+            audio_url: 回复音频的产物URL（没有完整音频时为None）
+            latency_ms: 生成回复和音频的耗时
+            context: 上一轮回复的指纹（依赖上下文的消息才设置）
+        """
+        normalized = normalize_question(question)
+        if not self.cacheable(chat_type) or not normalized or not response:
+            return
+
+        answer = CachedAnswer(
+            question=question,
+            normalized=normalized,
+            chat_type=chat_type,
+            response=response,
+            emotion=emotion,
+            voice_config=dict(voice_config or {}),
+            audio_url=audio_url,
+            latency_ms=latency_ms,
+            context=context
+        )
+        with self._lock:
+            answers = self._answers.setdefault((user_id, character_id), OrderedDict())
+            answers[(normalized, context)] = answer
+            answers.move_to_end((normalized, context))
+            while len(answers) > self.max_entries:
+                answers.popitem(last=False)
+            self._answers.move_to_end((user_id, character_id))
+            while len(self._answers) > self.max_users:
+                self._answers.popitem(last=False)
+            self.stores += 1
+
+    def record_served(self, hit: AnswerCacheHit, served_ms: float):
+        """
+        记录一次缓存回答的耗时，节省的时间 = 首次生成耗时 - 本次耗时
+
+        Args:
+            hit: 命中结果
+            served_ms: 本次从收到请求到返回的耗时
+        """
+        with self._lock:
+            self.served += 1
+            self.saved_total_ms += max(0.0, hit.answer.latency_ms - served_ms)
+
+    def invalidate(self, character_id: Optional[str] = None, user_id: Optional[str] = None) -> int:
+        """
+        清除缓存（角色文档变化后该角色的回答可能不再准确）
+
+        Args:
+            character_id: 只清除该角色的缓存
+            user_id: 只清除该用户的缓存
+
+        Returns:
+            清除的问答数
+        """
+        removed = 0
+        with self._lock:
+            for key in list(self._answers):
+                if (character_id is None or key[1] == character_id) and (user_id is None or key[0] == user_id):
+                    removed += len(self._answers.pop(key))
+        return removed
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取命中率和节省的时间"""
+        with self._lock:
+            hits = self.exact_hits + self.near_hits
+            return {
+                "enabled": self.enabled,
+                "users": len(self._answers),
+                "entries": sum(len(answers) for answers in self._answers.values()),
+                "lookups": self.lookups,
+                "skipped": self.skipped,
+                "hits": hits,
+                "exact_hits": self.exact_hits,
+                "near_hits": self.near_hits,
+                "hit_rate": round(hits / self.lookups, 3) if self.lookups else None,
+                "expirations": self.expirations,
+                "stores": self.stores,
+                "saved_total_ms": round(self.saved_total_ms, 1),
+                "avg_saved_ms": round(self.saved_total_ms / self.served, 1) if self.served else None
+            }
+
+
+# 全局答案缓存实例
+answer_cache = AnswerCache()
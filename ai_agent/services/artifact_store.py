@@ -0,0 +1,276 @@
+"""
+音频产物存储 - 本地磁盘上按内容寻址的TTS音频文件
+聊天响应只携带 /audio/{artifact_id} 链接，音频本身由该路由按需（支持Range）流式返回
+文件按TTL过期，总大小超过上限时按最近最少访问淘汰
+"""
+
+import asyncio
+import hashlib
+import os
+import re
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+from config import Config
+
+
+# 产物ID：sha256十六进制 + 扩展名，校验后才拼接路径，避免路径穿越
+ARTIFACT_ID_PATTERN = re.compile(r"^[0-9a-f]{64}\.(wav|mp3|ogg|bin)$")
+
+CONTENT_TYPES = {
+    "wav": "audio/wav",
+    "mp3": "audio/mpeg",
+    "ogg": "audio/ogg",
+    "bin": "application/octet-stream"
+}
+
+
+def detect_audio_format(data: bytes) -> str:
+    """
+    根据文件头识别音频格式
+
+    Args:
+        data: 音频数据
+
+    Returns:
+        扩展名（wav/mp3/ogg/bin）
+    """
+    if data[:4] == b"RIFF" and data[8:12] == b"WAVE":
+        return "wav"
+    if data[:3] == b"ID3" or (len(data) > 1 and data[0] == 0xFF and (data[1] & 0xE0) == 0xE0):
+        return "mp3"
+    if data[:4] == b"OggS":
+        return "ogg"
+    return "bin"
+
+
+def parse_range_header(range_header: str, file_size: int) -> Optional[Tuple[int, int]]:
+    """
+    解析单个区间的HTTP Range请求头
+
+    Args:
+        range_header: Range请求头，如 "bytes=0-1023"、"bytes=1024-"、"bytes=-500"
+        file_size: 文件大小
+
+    Returns:
+        (start, end) 闭区间；请求头无法解析或包含多个区间时返回None（按完整文件响应）
+
+    Raises:
+        ValueError: 区间超出文件范围（应返回416）
+    """
+    match = re.fullmatch(r"\s*bytes=(\d*)-(\d*)\s*", range_header or "")
+    if not match or (not match.group(1) and not match.group(2)):
+        return None
+
+    start_text, end_text = match.groups()
+    if not start_text:
+        # 后缀区间：最后N个字节
+        suffix_length = int(end_text)
+        if suffix_length == 0:
+            raise ValueError("请求的区间为空")
+        return max(0, file_size - suffix_length), file_size - 1
+
+    start = int(start_text)
+    end = int(end_text) if end_text else file_size - 1
+    if start >= file_size or start > end:
+        raise ValueError(f"请求的区间超出文件范围: {range_header}")
+    return start, min(end, file_size - 1)
+
+
+@dataclass
+class Artifact:
+    """已存储的产物"""
+    artifact_id: str
+    path: Path
+    size: int
+    content_type: str
+    last_access: float
+
+    @property
+    def url(self) -> str:
+        return f"/audio/{self.artifact_id}"
+
+
+class ArtifactStore:
+    """按内容寻址的本地产物存储（TTL + 总大小上限）"""
+
+    def __init__(
+        self,
+        root_dir: Optional[str] = None,
+        ttl_seconds: Optional[float] = None,
+        max_bytes: Optional[int] = None
+    ):
+        """
+        初始化产物存储
+
+        Args:
+            root_dir: 存储目录
+            ttl_seconds: 产物最后访问后保留的时间
+            max_bytes: 存储总大小上限
+        """
+        if not root_dir:
+            root_dir = Config.ARTIFACT_STORE_DIR or str(Path(__file__).parent.parent / "data" / "artifacts")
+        self.root_dir = Path(root_dir)
+        self.root_dir.mkdir(parents=True, exist_ok=True)
+        self.ttl_seconds = ttl_seconds or Config.ARTIFACT_TTL_SECONDS
+        self.max_bytes = max_bytes or Config.ARTIFACT_MAX_BYTES
+
+        self._artifacts: "OrderedDict[str, Artifact]" = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+
+        self.writes = 0
+        self.dedup_hits = 0
+        self.evictions = 0
+        self.expirations = 0
+
+        self._load_existing()
+
+    def _load_existing(self):
+        """启动时登记磁盘上已有的产物（按修改时间排序）"""
+        entries = []
+        for path in self.root_dir.iterdir():
+            if path.is_file() and ARTIFACT_ID_PATTERN.match(path.name):
+                stat = path.stat()
+                entries.append((stat.st_mtime, path, stat.st_size))
+
+        for mtime, path, size in sorted(entries):
+            extension = path.name.rsplit(".", 1)[1]
+            self._artifacts[path.name] = Artifact(
+                artifact_id=path.name,
+                path=path,
+                size=size,
+                content_type=CONTENT_TYPES[extension],
+                last_access=mtime
+            )
+            self._total_bytes += size
+
+        with self._lock:
+            self._evict_locked(time.time())
+
+    def put(self, data: bytes) -> Artifact:
+        """
+        保存产物（相同内容只保存一份）
+
+        Args:
+            data: 产物内容
+
+        Returns:
+            产物信息
+        """
+        extension = detect_audio_format(data)
+        artifact_id = f"{hashlib.sha256(data).hexdigest()}.{extension}"
+        now = time.time()
+
+        with self._lock:
+            artifact = self._artifacts.get(artifact_id)
+            if artifact and artifact.path.exists():
+                self.dedup_hits += 1
+                artifact.last_access = now
+                self._artifacts.move_to_end(artifact_id)
+                return artifact
+
+        # 先写临时文件再原子重命名，读取方不会看到写了一半的文件
+        path = self.root_dir / artifact_id
+        fd, tmp_path = tempfile.mkstemp(dir=self.root_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        artifact = Artifact(
+            artifact_id=artifact_id,
+            path=path,
+            size=len(data),
+            content_type=CONTENT_TYPES[extension],
+            last_access=now
+        )
+        with self._lock:
+            previous = self._artifacts.pop(artifact_id, None)
+            if previous:
+                self._total_bytes -= previous.size
+            self._artifacts[artifact_id] = artifact
+            self._total_bytes += artifact.size
+            self.writes += 1
+            self._evict_locked(now)
+        return artifact
+
+    async def save(self, data: bytes) -> Artifact:
+        """异步保存产物（文件写入放到线程中执行）"""
+        return await asyncio.to_thread(self.put, data)
+
+    def get(self, artifact_id: str) -> Optional[Artifact]:
+        """
+        获取产物（过期或不存在时返回None）
+
+        Args:
+            artifact_id: 产物ID
+
+        Returns:
+            产物信息
+        """
+        if not ARTIFACT_ID_PATTERN.match(artifact_id):
+            return None
+
+        now = time.time()
+        with self._lock:
+            artifact = self._artifacts.get(artifact_id)
+            if not artifact:
+                return None
+            if now - artifact.last_access > self.ttl_seconds or not artifact.path.exists():
+                self._remove_locked(artifact_id)
+                self.expirations += 1
+                return None
+            artifact.last_access = now
+            self._artifacts.move_to_end(artifact_id)
+            return artifact
+
+    def _remove_locked(self, artifact_id: str):
+        """删除产物文件和索引（调用方需持有锁）"""
+        artifact = self._artifacts.pop(artifact_id, None)
+        if artifact:
+            self._total_bytes -= artifact.size
+            try:
+                artifact.path.unlink()
+            except FileNotFoundError:
+                pass
+
+    def _evict_locked(self, now: float):
+        """清理过期产物，并在超出容量时淘汰最久未访问的产物（调用方需持有锁）"""
+        expired = [artifact_id for artifact_id, artifact in self._artifacts.items()
+                   if now - artifact.last_access > self.ttl_seconds]
+        for artifact_id in expired:
+            self._remove_locked(artifact_id)
+        self.expirations += len(expired)
+
+        while self._total_bytes > self.max_bytes and len(self._artifacts) > 1:
+            oldest_id = next(iter(self._artifacts))
+            self._remove_locked(oldest_id)
+            self.evictions += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取产物存储统计信息"""
+        with self._lock:
+            return {
+                "artifacts": len(self._artifacts),
+                "total_bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl_seconds,
+                "writes": self.writes,
+                "dedup_hits": self.dedup_hits,
+                "evictions": self.evictions,
+                "expirations": self.expirations
+            }
+
+
+# 全局产物存储实例
+artifact_store = ArtifactStore()
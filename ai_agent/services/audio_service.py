@@ -16,6 +16,10 @@ from openai import OpenAI
 import asyncio
 
 from config import Config
+from services.deadline import Deadline
+from services.concurrency_limiter import upstream_limiters, UpstreamOverloadedError
+from services.single_flight import single_flight
+from services.usage_tracker import usage_tracker
 
 
 class AudioService:
@@ -118,6 +122,8 @@ class AudioService:
             识别结果
         """
         try:
+            import dashscope
+            
             # 处理音频数据
             if isinstance(audio_data, bytes):
                 audio_base64 = self.prepare_audio_for_asr(audio_data, source_format)
@@ -138,17 +144,19 @@ class AudioService:
                 }
             ]
             
-            # 调用DashScope ASR API
-            response = dashscope.MultiModalConversation.call(
-                api_key=self.api_key,
-                model=Config.ASR_MODEL,
-                messages=messages,
-                result_format="message",
-                asr_options={
-                    "enable_lid": True,  # 语言识别
-                    "enable_itn": True   # 数字转换
-                }
-            )
+            # 调用DashScope ASR API（同步SDK在线程中执行，不阻塞事件循环）
+            async with upstream_limiters.get("asr").slot():
+                response = await asyncio.to_thread(
+                    dashscope.MultiModalConversation.call,
+                    api_key=self.api_key,
+                    model=Config.ASR_MODEL,
+                    messages=messages,
+                    result_format="message",
+                    asr_options={
+                        "enable_lid": True,  # 语言识别
+                        "enable_itn": True   # 数字转换
+                    }
+                )
             
             if response.status_code == 200:
                 # 提取识别结果
@@ -173,6 +181,8 @@ class AudioService:
                     "text": ""
                 }
                 
+        except UpstreamOverloadedError:
+            raise
         except Exception as e:
             print(f"❌ 语音识别失败: {e}")
             return {
@@ -204,7 +214,11 @@ class AudioService:
             if stream:
                 return self._text_to_speech_stream(text, voice, speed)
             else:
-                return await self._text_to_speech_batch(text, voice, speed)
+                return await single_flight.do(
+                    "tts",
+                    ("voice", voice, text, speed),
+                    lambda: self._tracked_tts(text, lambda: self._text_to_speech_batch(text, voice, speed))
+                )
                 
         except Exception as e:
             print(f"❌ 语音合成失败: {e}")
@@ -213,12 +227,14 @@ class AudioService:
     async def _generate_xiyang_voice(self, text: str, speed: float) -> bytes:
         """喜羊羊专用TTS - 深沉男声onyx"""
         print(f"🎭 生成喜羊羊声音 - voice=onyx, text={text[:20]}...")
-        response = self.openai_client.audio.speech.create(
-            model=Config.TTS_MODEL,
-            voice="onyx",  # 固定使用onyx深沉男声
-            input=text,
-            speed=speed
-        )
+        async with upstream_limiters.get("tts").slot():
+            response = await asyncio.to_thread(
+                self.openai_client.audio.speech.create,
+                model=Config.TTS_MODEL,
+                voice="onyx",  # 固定使用onyx深沉男声
+                input=text,
+                speed=speed
+            )
         audio_data = response.content
         print(f"✅ 喜羊羊TTS成功，生成 {len(audio_data)} 字节音频数据")
         return audio_data
@@ -226,12 +242,14 @@ class AudioService:
     async def _generate_meiyang_voice(self, text: str, speed: float) -> bytes:
         """美羊羊专用TTS - 优雅女声nova"""
         print(f"🌸 生成美羊羊声音 - voice=nova, text={text[:20]}...")
-        response = self.openai_client.audio.speech.create(
-            model=Config.TTS_MODEL,
-            voice="nova",  # 固定使用nova优雅女声
-            input=text,
-            speed=speed
-        )
+        async with upstream_limiters.get("tts").slot():
+            response = await asyncio.to_thread(
+                self.openai_client.audio.speech.create,
+                model=Config.TTS_MODEL,
+                voice="nova",  # 固定使用nova优雅女声
+                input=text,
+                speed=speed
+            )
         audio_data = response.content
         print(f"✅ 美羊羊TTS成功，生成 {len(audio_data)} 字节音频数据")
         return audio_data
@@ -239,18 +257,61 @@ class AudioService:
     async def _generate_lanyang_voice(self, text: str, speed: float) -> bytes:
         """懒羊羊专用TTS - 英国口音fable"""
         print(f"🇬🇧 生成懒羊羊声音 - voice=fable, text={text[:20]}...")
-        response = self.openai_client.audio.speech.create(
-            model=Config.TTS_MODEL,
-            voice="fable",  # 固定使用fable英国口音
-            input=text,
-            speed=speed
-        )
+        async with upstream_limiters.get("tts").slot():
+            response = await asyncio.to_thread(
+                self.openai_client.audio.speech.create,
+                model=Config.TTS_MODEL,
+                voice="fable",  # 固定使用fable英国口音
+                input=text,
+                speed=speed
+            )
         audio_data = response.content
         print(f"✅ 懒羊羊TTS成功，生成 {len(audio_data)} 字节音频数据")
         return audio_data
 
-    async def generate_character_voice(self, character_id: str, text: str, speed: float = 1.0) -> bytes:
-        """根据角色ID生成专用声音"""
+    async def generate_character_voice(
+        self, 
+        character_id: str, 
+        text: str, 
+        speed: float = 1.0,
+        deadline: Optional[Deadline] = None
+    ) -> Optional[bytes]:
+        """
+        根据角色ID生成专用声音
+        
+        Args:
+            character_id: 角色ID
+            text: 要合成的文本
+            speed: 语速倍率
+            deadline: 请求时间预算（剩余时间不足或超时时返回None，只返回文本）
+            
+        Returns:
+            音频数据
+        """
+        if deadline:
+            return await deadline.run(
+                "tts",
+                lambda: self.generate_character_voice(character_id, text, speed),
+                timeout=Config.TTS_TIMEOUT,
+                min_seconds=Config.DEADLINE_MIN_TTS_SECONDS
+            )
+        
+        # 同一角色、同一文本、同一语速的合成进行中时（如多人同时打开问候语）复用其结果
+        return await single_flight.do(
+            "tts",
+            ("character", character_id, text, speed),
+            lambda: self._tracked_tts(text, lambda: self._generate_voice_for_character(character_id, text, speed))
+        )
+    
+    @staticmethod
+    async def _tracked_tts(text: str, synthesize) -> bytes:
+        """执行一次TTS合成并记录合成的字符数（合并的重复请求只记一次）"""
+        audio_data = await synthesize()
+        usage_tracker.record_tts(len(text))
+        return audio_data
+    
+    async def _generate_voice_for_character(self, character_id: str, text: str, speed: float) -> bytes:
+        """根据角色ID调用对应的专用TTS函数"""
         print(f"🎯 根据角色ID选择专用TTS - character_id={character_id}")
         
         if character_id == "xiyang":
@@ -286,12 +347,14 @@ class AudioService:
                 else:
                     # 默认情况下使用通用方法
                     print(f"🎵 使用通用OpenAI TTS - model={Config.TTS_MODEL}, voice={voice}, text={text[:20]}...")
-                    response = self.openai_client.audio.speech.create(
-                        model=Config.TTS_MODEL,
-                        voice=voice,
-                        input=text,
-                        speed=speed
-                    )
+                    async with upstream_limiters.get("tts").slot():
+                        response = await asyncio.to_thread(
+                            self.openai_client.audio.speech.create,
+                            model=Config.TTS_MODEL,
+                            voice=voice,
+                            input=text,
+                            speed=speed
+                        )
                     audio_data = response.content
                     print(f"✅ 通用OpenAI TTS成功，生成 {len(audio_data)} 字节音频数据")
                     return audio_data
@@ -304,13 +367,15 @@ class AudioService:
                 # 设置API key
                 dashscope.api_key = self.api_key
                 
-                response = SpeechSynthesizer.call(
-                    model=Config.TTS_MODEL,
-                    text=text,
-                    voice=voice,
-                    sample_rate=24000,
-                    format='wav'
-                )
+                async with upstream_limiters.get("tts").slot():
+                    response = await asyncio.to_thread(
+                        SpeechSynthesizer.call,
+                        model=Config.TTS_MODEL,
+                        text=text,
+                        voice=voice,
+                        sample_rate=24000,
+                        format='wav'
+                    )
                 
                 print(f"🎵 DashScope TTS调用参数: model={Config.TTS_MODEL}, voice={voice}, text={text[:20]}...")
                 
@@ -347,8 +412,7 @@ class AudioService:
                                 print(f"✅ 使用字典方式获得URL: {audio_url}")
                                 
                                 # 下载音频数据
-                                import requests
-                                audio_response = requests.get(audio_url)
+                                audio_response = await asyncio.to_thread(requests.get, audio_url)
                                 audio_response.raise_for_status()
                                 
                                 audio_data = audio_response.content
@@ -366,7 +430,7 @@ class AudioService:
                         print(f"✅ 使用属性方式获得URL: {audio_url}")
                         
                         # 下载音频数据
-                        audio_response = requests.get(audio_url)
+                        audio_response = await asyncio.to_thread(requests.get, audio_url)
                         audio_response.raise_for_status()
                         
                         audio_data = audio_response.content
@@ -392,35 +456,42 @@ class AudioService:
             # 流式模式使用SpeechSynthesizer
             from dashscope.audio.qwen_tts import SpeechSynthesizer
             
-            response = SpeechSynthesizer.call(
-                model=Config.TTS_MODEL,
-                api_key=self.api_key,
-                text=text,
-                voice=voice,
-                language_type="Chinese",
-                stream=True
-            )
+            # 流式合成在整个读取过程中都占用TTS并发槽位；同步SDK的调用和每次读取分片都在线程中执行
+            async with upstream_limiters.get("tts").slot():
+                response = await asyncio.to_thread(
+                    SpeechSynthesizer.call,
+                    model=Config.TTS_MODEL,
+                    api_key=self.api_key,
+                    text=text,
+                    voice=voice,
+                    language_type="Chinese",
+                    stream=True
+                )
+                chunks = iter(response)
             
-            for chunk in response:
-                if (hasattr(chunk, 'output') and 
-                    hasattr(chunk.output, 'audio') and 
-                    chunk.output.audio is not None):
+                while True:
+                    chunk = await asyncio.to_thread(next, chunks, None)
+                    if chunk is None:
+                        break
+                    if (hasattr(chunk, 'output') and 
+                        hasattr(chunk.output, 'audio') and 
+                        chunk.output.audio is not None):
                     
-                    if hasattr(chunk.output.audio, 'data'):
-                        # 流式数据直接返回
-                        audio_data = base64.b64decode(chunk.output.audio.data)
-                        yield audio_data
-                    elif hasattr(chunk.output.audio, 'url'):
-                        # 如果流式返回URL，下载并返回
-                        audio_url = chunk.output.audio.url
-                        audio_response = requests.get(audio_url)
-                        audio_response.raise_for_status()
-                        yield audio_response.content
+                        if hasattr(chunk.output.audio, 'data'):
+                            # 流式数据直接返回
+                            audio_data = base64.b64decode(chunk.output.audio.data)
+                            yield audio_data
+                        elif hasattr(chunk.output.audio, 'url'):
+                            # 如果流式返回URL，下载并返回
+                            audio_url = chunk.output.audio.url
+                            audio_response = await asyncio.to_thread(requests.get, audio_url)
+                            audio_response.raise_for_status()
+                            yield audio_response.content
                     
-                if (hasattr(chunk, 'output') and 
-                    hasattr(chunk.output, 'finish_reason') and 
-                    chunk.output.finish_reason == "stop"):
-                    break
+                    if (hasattr(chunk, 'output') and 
+                        hasattr(chunk.output, 'finish_reason') and 
+                        chunk.output.finish_reason == "stop"):
+                        break
                     
         except Exception as e:
             print(f"❌ 流式TTS处理失败: {e}")
@@ -0,0 +1,212 @@
+"""
+上游并发限制 - 按上游（LLM、TTS、图片、搜索、ASR）划分的并发池和准入控制
+每个上游限制同时在途的调用数，超出的调用在有界队列中等待；
+队列已满或等待超时时立即拒绝（对外返回429/503），而不是让请求堆积到上游超时
+"""
+
+import asyncio
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, Deque, Dict, Optional
+
+from config import Config
+
+
+class UpstreamOverloadedError(Exception):
+    """上游并发池已满，调用被拒绝"""
+
+    def __init__(self, upstream: str, reason: str, retry_after: float):
+        """
+        Args:
+            upstream: 上游名称
+            reason: 拒绝原因（queue_full: 排队数已满；queue_timeout: 排队超时）
+            retry_after: 建议的重试等待时间（秒）
+        """
+        self.upstream = upstream
+        self.reason = reason
+        self.retry_after = retry_after
+        super().__init__(f"上游 {upstream} 繁忙（{reason}），请 {retry_after:.0f} 秒后重试")
+
+
+class UpstreamLimiter:
+    """单个上游的并发池：最大在途调用数 + 有界等待队列"""
+
+    def __init__(self, name: str, max_in_flight: int, max_queue: int, max_queue_wait: float):
+        """
+        初始化并发池
+
+        Args:
+            name: 上游名称
+            max_in_flight: 最大同时在途调用数
+            max_queue: 最大排队数
+            max_queue_wait: 最长排队时间（秒）
+        """
+        self.name = name
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.max_queue_wait = max_queue_wait
+
+        self.in_flight = 0
+        self.waiting = 0
+        self.peak_in_flight = 0
+        self.peak_waiting = 0
+        self.admitted = 0
+        self.rejected_queue_full = 0
+        self.rejected_queue_timeout = 0
+        self._queue_times: Deque[float] = deque(maxlen=500)
+        self._condition: Optional[asyncio.Condition] = None
+        self._loop = None
+
+    def _get_condition(self) -> asyncio.Condition:
+        """按事件循环惰性创建条件变量（测试中每个asyncio.run都是新的事件循环）"""
+        loop = asyncio.get_running_loop()
+        if self._condition is None or self._loop is not loop:
+            self._condition = asyncio.Condition()
+            self._loop = loop
+            self.in_flight = 0
+            self.waiting = 0
+        return self._condition
+
+    def has_capacity(self) -> bool:
+        """当前是否还能接收新的调用（有空闲槽位或队列未满）"""
+        return self.in_flight < self.max_in_flight or self.waiting < self.max_queue
+
+    def ensure_capacity(self):
+        """
+        提前准入检查：队列已满时立即拒绝，不必等到真正调用上游
+
+        Raises:
+            UpstreamOverloadedError: 队列已满
+        """
+        if not self.has_capacity():
+            self.rejected_queue_full += 1
+            raise UpstreamOverloadedError(self.name, "queue_full", self.max_queue_wait)
+
+    async def acquire(self):
+        """
+        获取一个调用槽位，必要时排队等待
+
+        Raises:
+            UpstreamOverloadedError: 队列已满或排队超时
+        """
+        condition = self._get_condition()
+        async with condition:
+            if self.in_flight < self.max_in_flight and self.waiting == 0:
+                self._admit(0.0)
+                return
+
+            if self.waiting >= self.max_queue:
+                self.rejected_queue_full += 1
+                raise UpstreamOverloadedError(self.name, "queue_full", self.max_queue_wait)
+
+            started_at = time.perf_counter()
+            self.waiting += 1
+            self.peak_waiting = max(self.peak_waiting, self.waiting)
+            try:
+                await asyncio.wait_for(
+                    condition.wait_for(lambda: self.in_flight < self.max_in_flight),
+                    timeout=self.max_queue_wait
+                )
+            except asyncio.TimeoutError:
+                self.rejected_queue_timeout += 1
+                # 超时前可能刚好被唤醒，把唤醒传给下一个排队的调用
+                condition.notify()
+                raise UpstreamOverloadedError(self.name, "queue_timeout", self.max_queue_wait)
+            finally:
+                self.waiting -= 1
+            self._admit(time.perf_counter() - started_at)
+
+    def _admit(self, queue_time: float):
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        self.admitted += 1
+        self._queue_times.append(queue_time)
+
+    async def release(self):
+        """释放调用槽位并唤醒一个排队的调用"""
+        condition = self._get_condition()
+        async with condition:
+            self.in_flight -= 1
+            condition.notify()
+
+    @asynccontextmanager
+    async def slot(self):
+        """
+        在并发池中执行一次上游调用
+
+        用法:
+            async with upstream_limiters.get("llm").slot():
+                response = await client.chat.completions.create(...)
+        """
+        await self.acquire()
+        try:
+            yield
+        finally:
+            await self.release()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取并发池统计信息（排队时间单位：毫秒）"""
+        queue_times = sorted(self._queue_times)
+
+        def percentile(p: float) -> Optional[float]:
+            if not queue_times:
+                return None
+            return round(queue_times[min(len(queue_times) - 1, int(len(queue_times) * p))] * 1000, 1)
+
+        return {
+            "max_in_flight": self.max_in_flight,
+            "max_queue": self.max_queue,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "peak_in_flight": self.peak_in_flight,
+            "peak_waiting": self.peak_waiting,
+            "admitted": self.admitted,
+            "rejected_queue_full": self.rejected_queue_full,
+            "rejected_queue_timeout": self.rejected_queue_timeout,
+            "queue_time_avg_ms": round(sum(queue_times) / len(queue_times) * 1000, 1) if queue_times else None,
+            "queue_time_p95_ms": percentile(0.95),
+            "queue_time_max_ms": round(queue_times[-1] * 1000, 1) if queue_times else None
+        }
+
+
+class LimiterRegistry:
+    """按名称管理各上游的并发池"""
+
+    def __init__(self, limits: Optional[Dict[str, Dict[str, Any]]] = None):
+        """
+        Args:
+            limits: 上游名称 -> {max_in_flight, max_queue, max_queue_wait}
+        """
+        self.limits = limits if limits is not None else Config.UPSTREAM_LIMITS
+        self._limiters: Dict[str, UpstreamLimiter] = {}
+
+    def get(self, name: str) -> UpstreamLimiter:
+        """
+        获取上游的并发池（未配置的上游使用LLM的默认限制）
+
+        Args:
+            name: 上游名称
+
+        Returns:
+            并发池
+        """
+        limiter = self._limiters.get(name)
+        if limiter is None:
+            limits = self.limits.get(name) or self.limits.get("llm") or {}
+            limiter = UpstreamLimiter(
+                name=name,
+                max_in_flight=int(limits.get("max_in_flight", 32)),
+                max_queue=int(limits.get("max_queue", 64)),
+                max_queue_wait=float(limits.get("max_queue_wait", 5.0))
+            )
+            self._limiters[name] = limiter
+        return limiter
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取所有上游并发池的统计信息"""
+        return {name: limiter.get_stats() for name, limiter in self._limiters.items()}
+
+
+# 全局上游并发池实例
+upstream_limiters = LimiterRegistry()
@@ -0,0 +1,130 @@
+"""
+请求时间预算 - 每个请求创建一个Deadline，沿调用链传递
+Java后端在60秒后放弃等待，Python侧据此为各阶段分配剩余时间：
+剩余时间不足时跳过可选阶段（查询扩展、CoT、图片、TTS），或把它们的超时截短，
+并记录哪些阶段被降级，随响应一起返回。
+请求入口把预算绑定为当前请求的预算，LLM网关据此截短每次调用的超时，预算用完后不再重试或切换供应商
+"""
+
+import asyncio
+import time
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from config import Config
+
+
+# 当前请求的时间预算（本请求中创建的任务继承该绑定）
+_current_deadline: ContextVar[Optional["Deadline"]] = ContextVar("current_deadline", default=None)
+
+
+class Deadline:
+    """单个请求的时间预算"""
+
+    def __init__(self, budget: Optional[float] = None, started_at: Optional[float] = None):
+        """
+        初始化时间预算
+
+        Args:
+            budget: 总预算（秒），默认使用 Config.REQUEST_DEADLINE_SECONDS
+            started_at: 预算起点（time.monotonic()），默认为创建时刻
+        """
+        self.budget = budget if budget is not None else Config.REQUEST_DEADLINE_SECONDS
+        self.started_at = started_at if started_at is not None else time.monotonic()
+        # 被降级的阶段 -> 原因（skipped: 剩余时间不足直接跳过；timeout: 执行中超时被截断）
+        self.degraded_stages: Dict[str, str] = {}
+
+    def bind(self) -> "Deadline":
+        """绑定为当前请求的时间预算，返回自身"""
+        _current_deadline.set(self)
+        return self
+
+    @staticmethod
+    def current() -> Optional["Deadline"]:
+        """当前请求的时间预算（请求之外的调用为None）"""
+        return _current_deadline.get()
+
+    def elapsed(self) -> float:
+        """已用时间（秒）"""
+        return time.monotonic() - self.started_at
+
+    def remaining(self) -> float:
+        """剩余时间（秒），不小于0"""
+        return max(0.0, self.budget - self.elapsed())
+
+    def expired(self) -> bool:
+        """预算是否已耗尽"""
+        return self.remaining() <= 0
+
+    def degrade(self, stage: str, reason: str):
+        """记录阶段降级（同一阶段只保留第一次的原因）"""
+        if stage not in self.degraded_stages:
+            self.degraded_stages[stage] = reason
+            print(f"⏳ 阶段降级: {stage} ({reason})，剩余预算 {self.remaining():.1f}s")
+
+    def budget_for(
+        self,
+        stage: str,
+        timeout: float,
+        min_seconds: float = 0.0,
+        reserve: float = 0.0
+    ) -> Optional[float]:
+        """
+        计算某个阶段可用的超时时间
+
+        Args:
+            stage: 阶段名称
+            timeout: 该阶段自身配置的超时
+            min_seconds: 该阶段至少需要的时间，不足时跳过
+            reserve: 需要为后续阶段预留的时间
+
+        Returns:
+            可用超时（秒）；返回None表示跳过该阶段（已记录降级）
+        """
+        available = self.remaining() - reserve
+        if available <= 0 or available < min_seconds:
+            self.degrade(stage, "skipped")
+            return None
+        return min(timeout, available)
+
+    async def run(
+        self,
+        stage: str,
+        factory: Callable[[], Awaitable[Any]],
+        timeout: float,
+        min_seconds: float = 0.0,
+        reserve: float = 0.0,
+        default: Any = None
+    ) -> Any:
+        """
+        在剩余预算内执行一个可选阶段
+
+        Args:
+            stage: 阶段名称
+            factory: 返回协程的工厂函数
+            timeout: 该阶段自身配置的超时
+            min_seconds: 该阶段至少需要的时间，不足时跳过
+            reserve: 需要为后续阶段预留的时间
+            default: 跳过或超时时的返回值
+
+        Returns:
+            阶段结果，降级时返回default
+        """
+        stage_timeout = self.budget_for(stage, timeout, min_seconds, reserve)
+        if stage_timeout is None:
+            return default
+
+        try:
+            return await asyncio.wait_for(factory(), timeout=stage_timeout)
+        except asyncio.TimeoutError:
+            self.degrade(stage, "timeout")
+            return default
+
+    def summary(self) -> Dict[str, Any]:
+        """获取预算使用摘要"""
+        return {
+            "budget_ms": round(self.budget * 1000),
+            "elapsed_ms": round(self.elapsed() * 1000, 1),
+            "remaining_ms": round(self.remaining() * 1000, 1),
+            "degraded_stages": dict(self.degraded_stages)
+        }
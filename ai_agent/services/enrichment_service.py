@@ -0,0 +1,127 @@
+"""
+并发增强服务模块
+在生成回复之前并发执行联网搜索、GraphRAG检索、图片生成等增强任务
+每个分支独立超时，单个分支失败或超时不会取消其他分支
+"""
+
+import asyncio
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+
+@dataclass
+class EnrichmentBranch:
+    """增强分支定义"""
+    name: str
+    factory: Callable[[], Awaitable[Any]]  # 每次调用返回一个新的协程
+    timeout: float
+
+
+@dataclass
+class EnrichmentBranchResult:
+    """单个增强分支的执行结果"""
+    name: str
+    status: str  # ok / timeout / error
+    value: Any = None
+    error: Optional[str] = None
+    elapsed: float = 0.0
+
+
+@dataclass
+class EnrichmentResult:
+    """增强阶段的整体结果（允许部分成功）"""
+    branches: Dict[str, EnrichmentBranchResult] = field(default_factory=dict)
+    elapsed: float = 0.0
+
+    def get(self, name: str, default: Any = None) -> Any:
+        """获取成功分支的结果，未执行、超时或失败时返回默认值"""
+        branch = self.branches.get(name)
+        if branch and branch.status == "ok":
+            return branch.value
+        return default
+
+    def succeeded(self, name: str) -> bool:
+        """分支是否成功完成"""
+        branch = self.branches.get(name)
+        return bool(branch and branch.status == "ok")
+
+    def summary(self) -> Dict[str, Any]:
+        """生成各分支状态摘要（用于日志和响应）"""
+        return {
+            name: {
+                "status": branch.status,
+                "elapsed_ms": round(branch.elapsed * 1000, 1),
+                "error": branch.error
+            }
+            for name, branch in self.branches.items()
+        }
+
+
+class EnrichmentStage:
+    """并发增强阶段 - 同时启动所有适用的增强分支"""
+
+    async def run(self, branches: Dict[str, EnrichmentBranch]) -> EnrichmentResult:
+        """
+        并发执行所有增强分支
+
+        Args:
+            branches: 分支名称到分支定义的映射
+
+        Returns:
+            增强结果，包含每个分支的状态和值
+        """
+        start = time.perf_counter()
+
+        if not branches:
+            return EnrichmentResult()
+
+        print(f"⚡ 并发启动增强分支: {', '.join(branches.keys())}")
+
+        results = await asyncio.gather(
+            *(self._run_branch(branch) for branch in branches.values())
+        )
+
+        result = EnrichmentResult(
+            branches={branch_result.name: branch_result for branch_result in results},
+            elapsed=time.perf_counter() - start
+        )
+
+        for branch_result in results:
+            if branch_result.status == "ok":
+                print(f"✅ 增强分支 {branch_result.name} 完成: {branch_result.elapsed * 1000:.0f}ms")
+            else:
+                print(f"⚠️ 增强分支 {branch_result.name} {branch_result.status}: {branch_result.error}")
+
+        print(f"⚡ 增强阶段完成，总耗时 {result.elapsed * 1000:.0f}ms")
+        return result
+
+    async def _run_branch(self, branch: EnrichmentBranch) -> EnrichmentBranchResult:
+        """执行单个分支，超时和异常都转换为分支结果而不向外抛出"""
+        start = time.perf_counter()
+        try:
+            value = await asyncio.wait_for(branch.factory(), timeout=branch.timeout)
+            return EnrichmentBranchResult(
+                name=branch.name,
+                status="ok",
+                value=value,
+                elapsed=time.perf_counter() - start
+            )
+        except asyncio.TimeoutError:
+            return EnrichmentBranchResult(
+                name=branch.name,
+                status="timeout",
+                error=f"超过 {branch.timeout:.1f}s 未完成",
+                elapsed=time.perf_counter() - start
+            )
+        except Exception as e:
+            return EnrichmentBranchResult(
+                name=branch.name,
+                status="error",
+                error=str(e),
+                elapsed=time.perf_counter() - start
+            )
+
+
+# 全局增强阶段实例
+enrichment_stage = EnrichmentStage()
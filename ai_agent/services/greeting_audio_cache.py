@@ -0,0 +1,215 @@
+"""
+问候语音频缓存 - 预生成并持久化角色问候语和开场白的TTS音频
+问候语和开场白都是CHARACTER_CONFIGS中的固定文本，没有必要每次打开页面都重新合成：
+音频按 (角色, 文本, 音色, 语速, 模型) 缓存在磁盘上，启动时后台预生成，未命中时首次访问生成；
+角色配置变化后缓存键随之变化，旧音频在下次预生成时清理
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import tempfile
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from config import Config, CHARACTER_CONFIGS
+from services.audio_service import audio_service
+from services.artifact_store import artifact_store, detect_audio_format
+
+
+GreetingKey = Tuple[str, str, str, float, str]
+
+
+@dataclass
+class GreetingAudio:
+    """一条缓存的问候语音频"""
+    character_id: str
+    text: str
+    audio: bytes
+    audio_url: str
+
+
+class GreetingAudioCache:
+    """问候语和开场白的持久化TTS音频缓存"""
+
+    def __init__(self, cache_dir: Optional[str] = None):
+        """
+        初始化问候语音频缓存
+
+        Args:
+            cache_dir: 音频缓存目录
+        """
+        if not cache_dir:
+            cache_dir = Config.GREETING_AUDIO_CACHE_DIR or str(Path(__file__).parent.parent / "data" / "greeting_audio")
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+        self._memory: Dict[str, GreetingAudio] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.renders = 0
+        self.failures = 0
+
+    @staticmethod
+    def build_key(character_id: str, text: str) -> GreetingKey:
+        """
+        根据当前角色配置构建缓存键
+
+        Args:
+            character_id: 角色ID
+            text: 问候语文本
+
+        Returns:
+            (角色, 文本, 音色, 语速, 模型)
+        """
+        character_config = CHARACTER_CONFIGS[character_id]
+        voice_config = character_config.get("voice_config", {})
+        voice = character_config.get("voice", "")
+        speed = float(voice_config.get("speed", character_config.get("voice_speed", 1.0)))
+        return (character_id, text, voice, speed, Config.TTS_MODEL)
+
+    @staticmethod
+    def _key_hash(key: GreetingKey) -> str:
+        return hashlib.sha256(json.dumps(key, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+    def _find_file(self, key_hash: str) -> Optional[Path]:
+        for path in self.cache_dir.glob(f"{key_hash}.*"):
+            if not path.name.endswith(".tmp"):
+                return path
+        return None
+
+    def _write_file(self, key_hash: str, audio: bytes) -> Path:
+        """原子写入缓存文件"""
+        path = self.cache_dir / f"{key_hash}.{detect_audio_format(audio)}"
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(audio)
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return path
+
+    async def _publish(self, key_hash: str, character_id: str, text: str, audio: bytes) -> GreetingAudio:
+        """把音频登记到产物存储以便通过 /audio/{id} 访问，并放入内存缓存"""
+        artifact = await artifact_store.save(audio)
+        entry = GreetingAudio(character_id=character_id, text=text, audio=audio, audio_url=artifact.url)
+        self._memory[key_hash] = entry
+        return entry
+
+    async def get(self, character_id: str, text: str) -> Optional[GreetingAudio]:
+        """
+        获取问候语音频，未缓存时生成并持久化
+
+        Args:
+            character_id: 角色ID
+            text: 问候语或开场白文本
+
+        Returns:
+            缓存的音频；TTS失败时返回None
+        """
+        key = self.build_key(character_id, text)
+        key_hash = self._key_hash(key)
+
+        entry = self._memory.get(key_hash)
+        if entry:
+            self.hits += 1
+            # 产物存储按TTL过期，命中时确认链接仍然有效
+            if not artifact_store.get(entry.audio_url.rsplit("/", 1)[1]):
+                entry = await self._publish(key_hash, character_id, text, entry.audio)
+            return entry
+
+        # 同一条文本只合成一次，并发请求等待同一个结果
+        lock = self._locks.setdefault(key_hash, asyncio.Lock())
+        async with lock:
+            entry = self._memory.get(key_hash)
+            if entry:
+                self.hits += 1
+                return entry
+
+            path = self._find_file(key_hash)
+            if path:
+                self.hits += 1
+                audio = await asyncio.to_thread(path.read_bytes)
+                return await self._publish(key_hash, character_id, text, audio)
+
+            self.misses += 1
+            _, _, _, speed, _ = key
+            try:
+                print(f"🎵 生成问候语音频: {character_id} - {text[:20]}...")
+                audio = await audio_service.generate_character_voice(
+                    character_id=character_id,
+                    text=text,
+                    speed=speed
+                )
+            except Exception as e:
+                self.failures += 1
+                print(f"❌ 问候语音频生成失败: {e}")
+                return None
+
+            if not audio:
+                self.failures += 1
+                return None
+
+            self.renders += 1
+            await asyncio.to_thread(self._write_file, key_hash, audio)
+            return await self._publish(key_hash, character_id, text, audio)
+
+    def current_texts(self) -> List[Tuple[str, str]]:
+        """当前角色配置中所有需要缓存的 (角色ID, 文本)"""
+        texts = []
+        for character_id, character_config in CHARACTER_CONFIGS.items():
+            if character_config.get("greeting"):
+                texts.append((character_id, character_config["greeting"]))
+            for phrase in character_config.get("opening_phrases", []):
+                texts.append((character_id, phrase))
+        return texts
+
+    def prune_stale(self) -> int:
+        """删除与当前角色配置不再匹配的缓存音频，返回删除数量"""
+        valid_hashes = {self._key_hash(self.build_key(c, t)) for c, t in self.current_texts()}
+        removed = 0
+        for path in self.cache_dir.iterdir():
+            if path.is_file() and path.name.split(".")[0] not in valid_hashes:
+                path.unlink()
+                removed += 1
+        for key_hash in list(self._memory):
+            if key_hash not in valid_hashes:
+                del self._memory[key_hash]
+        if removed:
+            print(f"🧹 清理过期问候语音频: {removed} 个")
+        return removed
+
+    async def warm_up(self) -> Dict[str, Any]:
+        """
+        预生成所有角色的问候语和开场白音频（已缓存的直接加载）
+
+        Returns:
+            预生成统计
+        """
+        await asyncio.to_thread(self.prune_stale)
+        texts = self.current_texts()
+        results = await asyncio.gather(*[self.get(c, t) for c, t in texts])
+        ready = sum(1 for result in results if result)
+        print(f"✅ 问候语音频预生成完成: {ready}/{len(texts)}")
+        return {"total": len(texts), "ready": ready}
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取缓存统计信息"""
+        return {
+            "cached": len(self._memory),
+            "hits": self.hits,
+            "misses": self.misses,
+            "renders": self.renders,
+            "failures": self.failures
+        }
+
+
+# 全局问候语音频缓存实例
+greeting_audio_cache = GreetingAudioCache()
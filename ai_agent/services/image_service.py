@@ -11,6 +11,9 @@ from datetime import datetime
 from typing import Dict, Any, Optional
 from openai import OpenAI
 from config import Config
+from services.concurrency_limiter import upstream_limiters
+from services.usage_tracker import usage_tracker
+from services.trigger_detector import trigger_detector
 
 
 class ImageService:
@@ -50,20 +53,24 @@ class ImageService:
             print(f"🎯 优化后的提示词: {enhanced_prompt[:100]}...")
             
             # 2. 调用OpenAI DALL-E生成图片
-            response = self.openai_client.images.generate(
-                model="dall-e-3",
-                prompt=enhanced_prompt,
-                size=self.default_size,
-                quality=self.default_quality,
-                n=1,
-                response_format="url"
-            )
+            # 同步客户端放到线程中执行，避免阻塞事件循环
+            async with upstream_limiters.get("image").slot():
+                response = await asyncio.to_thread(
+                    self.openai_client.images.generate,
+                    model="dall-e-3",
+                    prompt=enhanced_prompt,
+                    size=self.default_size,
+                    quality=self.default_quality,
+                    n=1,
+                    response_format="url"
+                )
             
             # 3. 处理响应
             image_url = response.data[0].url
             revised_prompt = getattr(response.data[0], 'revised_prompt', enhanced_prompt)
             
             print(f"✅ 图片生成成功: {image_url}")
+            usage_tracker.record_image("dall-e-3")
             
             # 4. 下载图片并转换为base64（可选）
             image_base64 = await self._download_and_encode_image(image_url)
@@ -176,6 +183,8 @@ class ImageService:
         try:
             print(f"📥 下载图片: {image_url}")
             
+            # 从CDN下载成品图不占用图片生成的并发槽位（下载慢时不应让生成请求排队或被拒绝），
+            # 下载只在生成成功后发生，并发数已受生成槽位限制
             async with aiohttp.ClientSession() as session:
                 async with session.get(image_url) as response:
                     if response.status == 200:
@@ -201,17 +210,7 @@ class ImageService:
         Returns:
             是否应该生成图片
         """
-        image_keywords = [
-            "画", "画个", "画一个", "画一张", "画出",
-            "图", "图片", "生成图", "来张图", "来个图",
-            "画画", "绘制", "制作图片", "做张图",
-            "想看", "给我看看", "展示一下",
-            "创作", "设计", "描绘",
-            "draw", "paint", "image", "picture", "show me"
-        ]
-        
-        user_message_lower = user_message.lower()
-        return any(keyword in user_message_lower for keyword in image_keywords)
+        return trigger_detector.detect(user_message).wants_image
     
     def extract_image_description(self, user_message: str) -> str:
         """
@@ -0,0 +1,127 @@
+"""
+异步LLM客户端模块 - 路由、CoT推理、RAG、文档处理和角色代理共用的AsyncOpenAI客户端
+所有LLM调用共享同一个HTTP连接池（keep-alive复用连接），并统一配置连接数上限和超时，
+调用在事件循环中以await方式执行，多个聊天请求的LLM往返可以真正重叠
+"""
+
+import asyncio
+import threading
+import weakref
+from typing import Any, Dict, Optional, Tuple
+
+import httpx
+from openai import AsyncOpenAI
+
+from config import Config
+
+
+ClientKey = Tuple[str, str]
+
+
+class LLMClientPool:
+    """共享的异步LLM客户端池（按API地址和事件循环复用）"""
+
+    def __init__(
+        self,
+        max_connections: Optional[int] = None,
+        max_keepalive_connections: Optional[int] = None,
+        keepalive_expiry: Optional[float] = None,
+        connect_timeout: Optional[float] = None,
+        request_timeout: Optional[float] = None,
+        max_retries: Optional[int] = None
+    ):
+        """
+        初始化客户端池
+
+        Args:
+            max_connections: 每个上游的最大并发连接数
+            max_keepalive_connections: 保持空闲的keep-alive连接数
+            keepalive_expiry: 空闲连接保持时间（秒）
+            connect_timeout: 建立连接超时（秒）
+            request_timeout: 单次请求总超时（秒）
+            max_retries: SDK层面的自动重试次数（默认0，重试由LLM网关统一负责）
+        """
+        self.max_connections = max_connections or Config.LLM_MAX_CONNECTIONS
+        self.max_keepalive_connections = max_keepalive_connections or Config.LLM_MAX_KEEPALIVE_CONNECTIONS
+        self.keepalive_expiry = keepalive_expiry or Config.LLM_KEEPALIVE_EXPIRY
+        self.connect_timeout = connect_timeout or Config.LLM_CONNECT_TIMEOUT
+        self.request_timeout = request_timeout or Config.LLM_REQUEST_TIMEOUT
+        self.max_retries = max_retries if max_retries is not None else 0
+
+        # httpx的连接绑定在创建它的事件循环上，因此按事件循环分别缓存客户端
+        # （uvicorn只有一个事件循环，所有请求共享同一组客户端；脚本中多次asyncio.run也能正常工作）
+        self._clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[ClientKey, AsyncOpenAI]]" = \
+            weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+        self.clients_created = 0
+
+    def _build_http_client(self) -> httpx.AsyncClient:
+        return httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=self.max_connections,
+                max_keepalive_connections=self.max_keepalive_connections,
+                keepalive_expiry=self.keepalive_expiry
+            ),
+            timeout=httpx.Timeout(self.request_timeout, connect=self.connect_timeout)
+        )
+
+    def get_client(self, api_key: Optional[str] = None, base_url: Optional[str] = None) -> AsyncOpenAI:
+        """
+        获取共享的异步客户端（需在事件循环中调用）
+
+        Args:
+            api_key: API密钥（默认DashScope）
+            base_url: API地址（默认DashScope兼容模式）
+
+        Returns:
+            AsyncOpenAI客户端
+        """
+        api_key = api_key or Config.DASHSCOPE_API_KEY
+        base_url = base_url or Config.DASHSCOPE_BASE_URL
+        loop = asyncio.get_running_loop()
+
+        with self._lock:
+            clients = self._clients.setdefault(loop, {})
+            client = clients.get((api_key, base_url))
+            if client is None:
+                client = AsyncOpenAI(
+                    api_key=api_key,
+                    base_url=base_url,
+                    http_client=self._build_http_client(),
+                    max_retries=self.max_retries
+                )
+                clients[(api_key, base_url)] = client
+                self.clients_created += 1
+            return client
+
+    async def aclose(self):
+        """关闭当前事件循环上的所有客户端连接（应用关闭时调用）"""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            clients = self._clients.pop(loop, {})
+        for client in clients.values():
+            await client.close()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取客户端池配置和统计信息"""
+        with self._lock:
+            active_clients = sum(len(clients) for clients in self._clients.values())
+        return {
+            "active_clients": active_clients,
+            "clients_created": self.clients_created,
+            "max_connections": self.max_connections,
+            "max_keepalive_connections": self.max_keepalive_connections,
+            "keepalive_expiry": self.keepalive_expiry,
+            "connect_timeout": self.connect_timeout,
+            "request_timeout": self.request_timeout,
+            "max_retries": self.max_retries
+        }
+
+
+# 全局LLM客户端池实例
+llm_client_pool = LLMClientPool()
+
+
+def get_llm_client(api_key: Optional[str] = None, base_url: Optional[str] = None) -> AsyncOpenAI:
+    """获取共享的异步LLM客户端（默认DashScope兼容模式）"""
+    return llm_client_pool.get_client(api_key, base_url)
@@ -0,0 +1,499 @@
+"""
+LLM网关 - 所有模块调用聊天补全的统一入口
+在共享的异步客户端和LLM并发池之上提供：
+- 按供应商注册表给出的顺序选择供应商，某个供应商超时或出错时立即切换到下一个
+- 所有供应商都失败时，429/5xx/连接错误按带随机抖动的指数退避重试
+- 对冲请求：超过该任务在该模型上的p95延迟仍未返回时向提供同一模型的供应商再发一次相同请求，先返回者胜出，另一个被取消
+- 按供应商实际使用的模型统计的延迟直方图；对冲等待时间取自按 (任务, 模型) 统计的直方图
+  （路由、意图等短调用和CoT、角色回复等长调用可能使用同一模型，混在一起的p95会让长调用几乎每次都触发对冲）
+- 按任务（Config.LLM_TASKS：查询扩展、路由、CoT、摘要、关键词、角色回复等）选择模型和默认参数，并按任务统计调用次数、延迟和token用量
+- 请求时间预算（services.deadline）：每次调用的超时不超过请求剩余的预算，预算用完后不再重试或切换供应商
+"""
+
+import asyncio
+import bisect
+import random
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+
+import openai
+
+from config import Config
+from services.concurrency_limiter import UpstreamLimiter, upstream_limiters
+from services.deadline import Deadline
+from services.llm_providers import ProviderRegistry, provider_registry
+from services.usage_tracker import usage_tracker
+
+
+# 延迟直方图分桶上界（秒）
+LATENCY_BUCKETS = (0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 16.0, 32.0)
+
+
+class LatencyHistogram:
+    """延迟直方图：固定分桶计数 + 最近样本窗口（用于分位数）"""
+
+    def __init__(self, window: int = 1000):
+        self.bucket_counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.samples: Deque[float] = deque(maxlen=window)
+        self.count = 0
+        self.total = 0.0
+
+    def record(self, seconds: float):
+        self.bucket_counts[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self.samples.append(seconds)
+        self.count += 1
+        self.total += seconds
+
+    def quantile(self, q: float) -> Optional[float]:
+        """最近样本的分位数（秒），没有样本时返回None"""
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+    def snapshot(self) -> Dict[str, Any]:
+        """导出统计（毫秒）"""
+        def ms(value: Optional[float]) -> Optional[float]:
+            return round(value * 1000, 1) if value is not None else None
+
+        labels = [f"le_{int(bound * 1000)}ms" for bound in LATENCY_BUCKETS] + ["gt_32000ms"]
+        return {
+            "count": self.count,
+            "avg_ms": ms(self.total / self.count) if self.count else None,
+            "p50_ms": ms(self.quantile(0.5)),
+            "p95_ms": ms(self.quantile(0.95)),
+            "p99_ms": ms(self.quantile(0.99)),
+            "buckets": dict(zip(labels, self.bucket_counts))
+        }
+
+
+def is_retryable_error(error: BaseException) -> bool:
+    """429、5xx和连接/超时错误可以重试，其余（参数错误、鉴权失败等）直接抛出"""
+    if isinstance(error, openai.APIConnectionError):  # 包含APITimeoutError
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code == 429 or error.status_code >= 500
+    return False
+
+
+class LLMGateway:
+    """聊天补全统一入口：供应商切换、重试、对冲和延迟统计"""
+
+    def __init__(
+        self,
+        registry: Optional[ProviderRegistry] = None,
+        limiter: Optional[UpstreamLimiter] = None,
+        max_retries: Optional[int] = None,
+        retry_base_delay: Optional[float] = None,
+        retry_max_delay: Optional[float] = None,
+        hedge_enabled: Optional[bool] = None,
+        hedge_min_samples: Optional[int] = None,
+        hedge_min_delay: Optional[float] = None,
+        tasks: Optional[Dict[str, Dict[str, Any]]] = None
+    ):
+        """
+        初始化LLM网关
+
+        Args:
+            registry: LLM供应商注册表（默认全局注册表）
+            limiter: LLM并发池（默认全局的llm并发池）
+            max_retries: 最大重试次数
+            retry_base_delay: 指数退避基数（秒）
+            retry_max_delay: 单次退避上限（秒）
+            hedge_enabled: 是否启用对冲请求
+            hedge_min_samples: 启用对冲所需的最少延迟样本数
+            hedge_min_delay: 对冲等待时间下限（秒）
+            tasks: 任务 -> {model, max_tokens, temperature, timeout}（默认Config.LLM_TASKS）
+        """
+        self._registry = registry
+        self._limiter = limiter
+        self.max_retries = max_retries if max_retries is not None else Config.LLM_MAX_RETRIES
+        self.retry_base_delay = retry_base_delay if retry_base_delay is not None else Config.LLM_RETRY_BASE_DELAY
+        self.retry_max_delay = retry_max_delay if retry_max_delay is not None else Config.LLM_RETRY_MAX_DELAY
+        self.hedge_enabled = hedge_enabled if hedge_enabled is not None else Config.LLM_HEDGE_ENABLED
+        self.hedge_min_samples = hedge_min_samples if hedge_min_samples is not None else Config.LLM_HEDGE_MIN_SAMPLES
+        self.hedge_min_delay = hedge_min_delay if hedge_min_delay is not None else Config.LLM_HEDGE_MIN_DELAY
+
+        self.tasks = tasks if tasks is not None else Config.LLM_TASKS
+
+        self.histograms: Dict[str, LatencyHistogram] = {}
+        self.hedge_histograms: Dict[Tuple[str, str], LatencyHistogram] = {}
+        self.task_histograms: Dict[str, LatencyHistogram] = {}
+        self.task_counters: Dict[str, Dict[str, int]] = {}
+        self.calls = 0
+        self.errors = 0
+        self.retries = 0
+        self.failovers = 0
+        self.hedges_fired = 0
+        self.hedge_wins = 0
+
+    @property
+    def registry(self) -> ProviderRegistry:
+        return self._registry or provider_registry
+
+    @property
+    def limiter(self) -> UpstreamLimiter:
+        return self._limiter or upstream_limiters.get("llm")
+
+    def _histogram(self, name: str) -> LatencyHistogram:
+        return self.histograms.setdefault(name, LatencyHistogram())
+
+    def _resolve_task(self, task: Optional[str], model: Optional[str], params: Dict[str, Any]) -> str:
+        """
+        按任务配置补全模型和默认参数（调用处显式传入的参数优先）
+
+        Args:
+            task: 任务名称
+            model: 调用处指定的模型
+            params: chat.completions.create参数（会被就地补全）
+
+        Returns:
+            实际使用的模型名称
+        """
+        if task:
+            spec = self.tasks.get(task)
+            if spec is None:
+                raise ValueError(f"未知的LLM任务: {task}")
+            for key in ("max_tokens", "temperature", "timeout"):
+                if key in spec:
+                    params.setdefault(key, spec[key])
+            model = model or spec.get("model")
+        return model or Config.LLM_MODEL
+
+    def task_model(self, task: str, model: Optional[str] = None) -> str:
+        """任务实际使用的模型名称（调用处指定的模型优先）"""
+        return self._resolve_task(task, model, {})
+
+    def _task_counters(self, task: str) -> Dict[str, int]:
+        return self.task_counters.setdefault(
+            task, {"calls": 0, "errors": 0, "prompt_tokens": 0, "completion_tokens": 0}
+        )
+
+    def _record_task(self, task: str, started_at: float, success: bool):
+        counters = self._task_counters(task)
+        counters["calls"] += 1
+        if success:
+            self.task_histograms.setdefault(task, LatencyHistogram()).record(time.perf_counter() - started_at)
+        else:
+            counters["errors"] += 1
+
+    def _record_usage(self, task: str, usage: Any):
+        """累计任务的输入/输出token数（响应不带usage时忽略）"""
+        if usage is None:
+            return
+        counters = self._task_counters(task)
+        counters["prompt_tokens"] += getattr(usage, "prompt_tokens", 0) or 0
+        counters["completion_tokens"] += getattr(usage, "completion_tokens", 0) or 0
+
+    def _backoff_delay(self, attempt: int, error: BaseException) -> float:
+        """带完全抖动的指数退避；服务端给出Retry-After时以其为下限"""
+        delay = random.uniform(0, min(self.retry_max_delay, self.retry_base_delay * (2 ** attempt)))
+        response = getattr(error, "response", None)
+        retry_after = response.headers.get("retry-after") if response is not None else None
+        if retry_after:
+            try:
+                delay = max(delay, min(float(retry_after), self.retry_max_delay))
+            except ValueError:
+                pass
+        return delay
+
+    async def _with_retries(self, operation: Callable[[], Awaitable[Any]], deadline: Optional[Deadline] = None) -> Any:
+        """执行operation，可重试的错误按指数退避重试（退避结束时请求预算已用完则不再重试）"""
+        for attempt in range(self.max_retries + 1):
+            try:
+                return await operation()
+            except Exception as e:
+                if attempt >= self.max_retries or not is_retryable_error(e):
+                    raise
+                delay = self._backoff_delay(attempt, e)
+                if deadline and deadline.remaining() <= delay:
+                    raise
+                self.retries += 1
+                print(f"🔁 LLM调用失败，{delay:.2f}秒后重试（第{attempt + 1}次）: {e}")
+                await asyncio.sleep(delay)
+
+    async def _create_with_failover(
+        self,
+        model: str,
+        request: Dict[str, Any],
+        alternate: bool = False,
+        stream: bool = False,
+        deadline: Optional[Deadline] = None
+    ) -> Tuple[Any, str]:
+        """
+        按供应商注册表的顺序发出请求，超时或可重试的错误时切换到下一个供应商
+
+        Args:
+            model: 请求的模型名称
+            request: chat.completions.create参数
+            alternate: 对冲请求：只发往与首选供应商使用同一模型的供应商，有其他这样的供应商时从它开始
+            stream: 是否为流式请求
+            deadline: 请求时间预算（每个供应商的超时不超过剩余预算，预算用完后不再切换）
+
+        Returns:
+            (ChatCompletion响应或流, 实际应答的供应商模型)
+        """
+        candidates = self.registry.candidates(model)
+        if not candidates:
+            raise RuntimeError(f"没有可提供模型 {model} 的LLM供应商")
+        if alternate:
+            # 对冲请求不能换成别的模型（备用供应商可能把模型映射为更小的模型），否则先返回的可能是另一个模型的回答
+            preferred_model = candidates[0][1]
+            same_model = [candidate for candidate in candidates[1:] if candidate[1] == preferred_model]
+            candidates = same_model + candidates[:1]
+
+        last_error = None
+        for index, (provider, provider_model) in enumerate(candidates):
+            params = dict(request)
+            has_fallback = index < len(candidates) - 1
+            if has_fallback:
+                # 还有备用供应商时用较短的超时，及时切换
+                params["timeout"] = min(params.get("timeout", self.registry.attempt_timeout), self.registry.attempt_timeout)
+            cut_short = False
+            if deadline:
+                remaining = deadline.remaining()
+                if remaining <= 0:
+                    break
+                cut_short = remaining < params.get("timeout", Config.LLM_REQUEST_TIMEOUT)
+                if cut_short:
+                    params["timeout"] = remaining
+            started_at = time.perf_counter()
+            try:
+                response = await self.registry.get_client(provider).chat.completions.create(
+                    model=provider_model, stream=stream, **params
+                )
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.errors += 1
+                if not is_retryable_error(e):
+                    raise
+                if cut_short and isinstance(e, openai.APITimeoutError):
+                    # 被请求预算截短的超时不算供应商故障，预算已用完，不再切换
+                    raise
+                self.registry.record_failure(provider.name, provider_model)
+                last_error = e
+                if has_fallback:
+                    self.failovers += 1
+                    print(f"🔀 LLM供应商 {provider.name} 调用失败，切换到备用供应商: {e}")
+                continue
+            latency = None if stream else time.perf_counter() - started_at
+            self.registry.record_success(provider.name, provider_model, latency)
+            return response, provider_model
+        if last_error is None:
+            raise asyncio.TimeoutError("请求时间预算已用完，不再调用LLM")
+        raise last_error
+
+    async def _attempt(
+        self,
+        model: str,
+        request: Dict[str, Any],
+        alternate: bool = False,
+        deadline: Optional[Deadline] = None,
+        task: Optional[str] = None
+    ) -> Tuple[Any, str]:
+        """在LLM并发池中发出一次请求（含供应商切换），按实际应答的供应商模型以及 (任务, 模型) 记录延迟"""
+        async with self.limiter.slot():
+            started_at = time.perf_counter()
+            response, provider_model = await self._create_with_failover(
+                model, request, alternate=alternate, deadline=deadline
+            )
+            latency = time.perf_counter() - started_at
+            self._histogram(provider_model).record(latency)
+            self.hedge_histograms.setdefault((task or "", provider_model), LatencyHistogram()).record(latency)
+            return response, provider_model
+
+    def _preferred_model(self, model: str) -> str:
+        """首选供应商为请求的模型实际使用的模型"""
+        candidates = self.registry.candidates(model)
+        return candidates[0][1] if candidates else model
+
+    def hedge_delay(self, model: str, task: Optional[str] = None) -> Optional[float]:
+        """对冲等待时间：该任务在该供应商模型上的p95延迟；样本不足时返回None（不对冲）"""
+        histogram = self.hedge_histograms.get((task or "", model))
+        if not histogram or len(histogram.samples) < self.hedge_min_samples:
+            return None
+        return max(self.hedge_min_delay, histogram.quantile(0.95))
+
+    async def chat_completion(
+        self,
+        messages: List[Dict[str, Any]],
+        task: Optional[str] = None,
+        model: Optional[str] = None,
+        hedge: Optional[bool] = None,
+        deadline: Optional[Deadline] = None,
+        **params
+    ) -> Any:
+        """
+        调用聊天补全（非流式）
+
+        Args:
+            messages: 消息列表
+            task: 任务名称（expand、route、intent、cot、summarize、keywords、reply、structured_reply），决定模型和默认参数
+            model: 模型名称（默认取任务配置，其次Config.LLM_MODEL）
+            hedge: 是否允许对冲请求（默认按配置）
+            deadline: 请求时间预算（默认取当前请求绑定的预算，请求之外的调用不限）
+            **params: 其他chat.completions.create参数（temperature、max_tokens、response_format、timeout等）
+
+        Returns:
+            ChatCompletion响应
+        """
+        model = self._resolve_task(task, model, params)
+        deadline = deadline or Deadline.current()
+        request = {"messages": messages, **params}
+        self.calls += 1
+
+        started_at = time.perf_counter()
+        try:
+            response, provider_model = await self._hedged_completion(model, request, hedge, task, deadline)
+        except Exception:
+            if task:
+                self._record_task(task, started_at, success=False)
+            raise
+        if task:
+            self._record_task(task, started_at, success=True)
+            self._record_usage(task, getattr(response, "usage", None))
+        # 用量记在实际应答的模型名下（切换供应商后可能不是请求的模型）
+        usage_tracker.record_llm(task, provider_model, getattr(response, "usage", None))
+        return response
+
+    async def _hedged_completion(
+        self,
+        model: str,
+        request: Dict[str, Any],
+        hedge: Optional[bool],
+        task: Optional[str] = None,
+        deadline: Optional[Deadline] = None
+    ) -> Tuple[Any, str]:
+        """
+        发出请求，超过p95延迟仍未返回时发出对冲请求
+
+        Returns:
+            (ChatCompletion响应, 实际应答的供应商模型)
+        """
+        primary = asyncio.ensure_future(
+            self._with_retries(lambda: self._attempt(model, request, deadline=deadline, task=task), deadline)
+        )
+        hedge_model = self._preferred_model(model)
+        delay = self.hedge_delay(hedge_model, task) if (self.hedge_enabled if hedge is None else hedge) else None
+        if delay is None:
+            return await primary
+
+        tasks = {primary}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if done:
+                return primary.result()
+
+            # 对冲请求不排队：并发池没有空闲槽位时只等待原请求
+            if self.limiter.in_flight >= self.limiter.max_in_flight:
+                return await primary
+
+            self.hedges_fired += 1
+            hedged = asyncio.ensure_future(
+                self._attempt(model, request, alternate=True, deadline=deadline, task=task)
+            )
+            tasks.add(hedged)
+            while tasks:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for attempt in done:
+                    if not attempt.exception():
+                        if attempt is hedged:
+                            self.hedge_wins += 1
+                        return attempt.result()
+                if not tasks:
+                    # 两个请求都失败时抛出原请求的错误
+                    return primary.result()
+        finally:
+            for attempt in tasks:
+                if attempt.done():
+                    continue
+                attempt.cancel()
+                # 被取消的请求已经发往供应商，没有usage也要计入调用次数
+                usage_tracker.record_llm(task, hedge_model, None)
+
+    async def chat_completion_stream(
+        self,
+        messages: List[Dict[str, Any]],
+        task: Optional[str] = None,
+        model: Optional[str] = None,
+        deadline: Optional[Deadline] = None,
+        **params
+    ) -> AsyncIterator[Any]:
+        """
+        调用流式聊天补全，整个读取过程占用一个LLM并发槽位
+        只在建立流（收到首个响应）之前重试，已经产出的内容不会重复
+
+        Args:
+            messages: 消息列表
+            task: 任务名称，决定模型和默认参数
+            model: 模型名称（默认取任务配置，其次Config.LLM_MODEL）
+            deadline: 请求时间预算（默认取当前请求绑定的预算），建立流的超时不超过剩余预算
+            **params: 其他chat.completions.create参数
+
+        Yields:
+            ChatCompletionChunk
+        """
+        model = self._resolve_task(task, model, params)
+        deadline = deadline or Deadline.current()
+        # 最后一个分片携带本次调用的token用量
+        params.setdefault("stream_options", {"include_usage": True})
+        self.calls += 1
+        request = {"messages": messages, **params}
+        usage = None
+        async with self.limiter.slot():
+            started_at = time.perf_counter()
+            try:
+                stream, provider_model = await self._with_retries(
+                    lambda: self._create_with_failover(model, request, stream=True, deadline=deadline),
+                    deadline
+                )
+            except Exception:
+                if task:
+                    self._record_task(f"{task}:stream", started_at, success=False)
+                raise
+            first_chunk = True
+            async for chunk in stream:
+                if first_chunk:
+                    # 流式调用记录首个分片的延迟，与非流式的完整延迟分开统计
+                    self._histogram(f"{provider_model}:stream_first_chunk").record(time.perf_counter() - started_at)
+                    if task:
+                        self._record_task(f"{task}:stream", started_at, success=True)
+                    first_chunk = False
+                if getattr(chunk, "usage", None):
+                    usage = chunk.usage
+                    if task:
+                        self._record_usage(f"{task}:stream", usage)
+                yield chunk
+            usage_tracker.record_llm(task, provider_model, usage)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取网关统计信息和按模型的延迟直方图"""
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "retries": self.retries,
+            "failovers": self.failovers,
+            "hedges_fired": self.hedges_fired,
+            "hedge_wins": self.hedge_wins,
+            "latency": {name: histogram.snapshot() for name, histogram in self.histograms.items()},
+            "hedge_delay_ms": {
+                f"{task or '-'}/{model}": round(delay * 1000, 1) if delay is not None else None
+                for (task, model) in self.hedge_histograms
+                for delay in [self.hedge_delay(model, task)]
+            },
+            "tasks": {
+                task: {
+                    **counters,
+                    "model": self.tasks.get(task.split(":")[0], {}).get("model"),
+                    "latency": self.task_histograms[task].snapshot() if task in self.task_histograms else None
+                }
+                for task, counters in self.task_counters.items()
+            },
+            "providers": self.registry.get_stats()
+        }
+
+
+# 全局LLM网关实例
+llm_gateway = LLMGateway()
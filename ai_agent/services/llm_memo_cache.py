@@ -0,0 +1,212 @@
+"""
+LLM辅助调用结果缓存 - 持久化缓存只取决于输入文本和模型的辅助LLM调用
+查询扩展每条消息都要调用一次，文档摘要和关键词每次上传调用两次（同一内容上传给其他角色时也重复调用），
+这些结果只取决于 (任务, 模型, 提示词)：按三者的哈希缓存在SQLite中，跨进程重启保留，
+按TTL过期并按最近访问时间淘汰（LRU），条目数不超过上限
+"""
+
+import asyncio
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from contextlib import closing
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from config import Config
+from services.llm_gateway import llm_gateway
+
+
+class LLMMemoCache:
+    """按 (任务, 模型, 提示词哈希) 缓存辅助LLM调用的文本结果"""
+
+    def __init__(
+        self,
+        db_path: Optional[str] = None,
+        ttl_seconds: Optional[float] = None,
+        max_entries: Optional[int] = None,
+        enabled: Optional[bool] = None
+    ):
+        """
+        初始化缓存
+
+        Args:
+            db_path: SQLite数据库路径
+            ttl_seconds: 结果写入后的保留时间
+            max_entries: 最多缓存的结果数（超出时淘汰最久未访问的）
+            enabled: 是否启用（关闭时直接调用LLM）
+        """
+        if not db_path:
+            db_path = Config.LLM_MEMO_CACHE_DB or str(Path(__file__).parent.parent / "data" / "llm_memo_cache.db")
+        self.db_path = db_path
+        self.ttl_seconds = ttl_seconds or Config.LLM_MEMO_TTL_SECONDS
+        self.max_entries = max_entries or Config.LLM_MEMO_MAX_ENTRIES
+        self.enabled = enabled if enabled is not None else Config.LLM_MEMO_CACHE_ENABLED
+
+        self._lock = threading.Lock()
+        self._task_stats: Dict[str, Dict[str, int]] = {}
+        self.evictions = 0
+        self.expirations = 0
+        self.errors = 0
+        # 数据库在首次使用时才创建，导入模块不会在磁盘上建库
+        self._db_ready = False
+
+    def _connect(self) -> closing:
+        """
+        打开数据库连接（首次使用时初始化缓存表）
+
+        用法为 ``with self._connect() as conn, conn:``：内层在退出时提交（出错时回滚），外层关闭连接
+        """
+        if not self._db_ready:
+            self._init_database()
+        return closing(sqlite3.connect(self.db_path))
+
+    def _init_database(self):
+        """初始化缓存表"""
+        Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
+        with closing(sqlite3.connect(self.db_path)) as conn, conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS llm_memo (
+                    key TEXT PRIMARY KEY,
+                    task TEXT NOT NULL,
+                    model TEXT NOT NULL,
+                    value TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_access REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_memo_last_access ON llm_memo(last_access)")
+        self._db_ready = True
+
+    @staticmethod
+    def build_key(task: str, model: str, messages: List[Dict[str, Any]], params: Dict[str, Any]) -> str:
+        """
+        构建缓存键
+
+        Args:
+            task: 任务名称
+            model: 模型名称
+            messages: 消息列表
+            params: 调用处显式传入的其他参数
+
+        Returns:
+            (任务, 模型, 提示词, 参数) 的SHA-256
+        """
+        payload = json.dumps(
+            {"task": task, "model": model, "messages": messages, "params": params},
+            ensure_ascii=False, sort_keys=True
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _counters(self, task: str) -> Dict[str, int]:
+        return self._task_stats.setdefault(task, {"hits": 0, "misses": 0, "stores": 0})
+
+    def _get(self, key: str) -> Optional[str]:
+        """读取未过期的结果并更新最近访问时间"""
+        now = time.time()
+        with self._connect() as conn, conn:
+            row = conn.execute("SELECT value, created_at FROM llm_memo WHERE key = ?", (key,)).fetchone()
+            if not row:
+                return None
+            value, created_at = row
+            if now - created_at > self.ttl_seconds:
+                conn.execute("DELETE FROM llm_memo WHERE key = ?", (key,))
+                with self._lock:
+                    self.expirations += 1
+                return None
+            conn.execute("UPDATE llm_memo SET last_access = ? WHERE key = ?", (now, key))
+            return value
+
+    def _put(self, key: str, task: str, model: str, value: str):
+        """写入结果，超出条目上限时淘汰最久未访问的结果（同时清理已过期的结果）"""
+        now = time.time()
+        with self._connect() as conn, conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO llm_memo (key, task, model, value, created_at, last_access) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, task, model, value, now, now)
+            )
+            expired = conn.execute("DELETE FROM llm_memo WHERE created_at < ?", (now - self.ttl_seconds,)).rowcount
+            (count,) = conn.execute("SELECT COUNT(*) FROM llm_memo").fetchone()
+            evicted = 0
+            if count > self.max_entries:
+                evicted = conn.execute(
+                    "DELETE FROM llm_memo WHERE key IN (SELECT key FROM llm_memo ORDER BY last_access ASC LIMIT ?)",
+                    (count - self.max_entries,)
+                ).rowcount
+        with self._lock:
+            self.expirations += expired
+            self.evictions += evicted
+
+    async def complete(self, task: str, messages: List[Dict[str, Any]], **params) -> str:
+        """
+        调用聊天补全并返回文本，相同 (任务, 模型, 提示词) 的结果直接从缓存读取
+
+        Args:
+            task: 任务名称（决定模型和默认参数）
+            messages: 消息列表
+            **params: 其他chat.completions.create参数
+
+        Returns:
+            回复文本（LLM调用失败时抛出异常，失败结果不缓存）
+        """
+        if not self.enabled:
+            response = await llm_gateway.chat_completion(messages=messages, task=task, **params)
+            return response.choices[0].message.content
+
+        model = llm_gateway.task_model(task, params.get("model"))
+        key = self.build_key(task, model, messages, params)
+        counters = self._counters(task)
+
+        try:
+            value = await asyncio.to_thread(self._get, key)
+        except sqlite3.Error as e:
+            print(f"⚠️ LLM结果缓存读取失败: {e}")
+            self.errors += 1
+            value = None
+        if value is not None:
+            counters["hits"] += 1
+            return value
+
+        counters["misses"] += 1
+        response = await llm_gateway.chat_completion(messages=messages, task=task, **params)
+        content = response.choices[0].message.content
+        if content and content.strip():
+            try:
+                await asyncio.to_thread(self._put, key, task, model, content)
+                counters["stores"] += 1
+            except sqlite3.Error as e:
+                print(f"⚠️ LLM结果缓存写入失败: {e}")
+                self.errors += 1
+        return content
+
+    def clear(self):
+        """清空缓存"""
+        with self._connect() as conn, conn:
+            conn.execute("DELETE FROM llm_memo")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取各任务的命中率和缓存条目数"""
+        try:
+            with self._connect() as conn, conn:
+                (entries,) = conn.execute("SELECT COUNT(*) FROM llm_memo").fetchone()
+        except sqlite3.Error:
+            entries = None
+        tasks = {}
+        for task, counters in self._task_stats.items():
+            lookups = counters["hits"] + counters["misses"]
+            tasks[task] = {**counters, "hit_rate": round(counters["hits"] / lookups, 3) if lookups else None}
+        return {
+            "enabled": self.enabled,
+            "entries": entries,
+            "max_entries": self.max_entries,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "errors": self.errors,
+            "tasks": tasks
+        }
+
+
+# 全局LLM辅助调用结果缓存实例
+llm_memo_cache = LLMMemoCache()
@@ -0,0 +1,215 @@
+"""
+LLM供应商注册表 - 多个OpenAI兼容供应商之间的健康度跟踪和选择
+按供应商和模型统计最近调用的延迟和错误率，每次调用按优先级选择最健康的供应商：
+- 错误率过高或连续失败的供应商进入冷却期，只作为最后的备选
+- 备用供应商明显更快（超过配置的倍数）时优先使用
+LLM网关在某个供应商超时或出错时按这里给出的顺序切换到下一个供应商
+"""
+
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from openai import AsyncOpenAI
+
+from config import Config
+from services.llm_client import LLMClientPool, llm_client_pool
+
+
+@dataclass
+class ProviderConfig:
+    """一个OpenAI兼容的LLM供应商"""
+    name: str
+    api_key: str
+    base_url: str
+    models: Dict[str, Optional[str]] = field(default_factory=lambda: {"*": None})
+
+    def resolve_model(self, model: str) -> Optional[str]:
+        """
+        把请求的模型映射为该供应商的模型
+
+        Args:
+            model: 请求的模型名称
+
+        Returns:
+            供应商模型名称；该供应商不能提供该模型时返回None
+        """
+        for key in (model, "*"):
+            if key in self.models:
+                return self.models[key] or model
+        return None
+
+
+class ProviderHealth:
+    """单个 (供应商, 模型) 的滚动健康统计"""
+
+    def __init__(self, window: int):
+        self.outcomes: Deque[bool] = deque(maxlen=window)
+        self.latencies: Deque[float] = deque(maxlen=window)
+        self.consecutive_failures = 0
+        self.cooldown_until = 0.0
+        self.successes = 0
+        self.failures = 0
+
+    @property
+    def error_rate(self) -> float:
+        if not self.outcomes:
+            return 0.0
+        return self.outcomes.count(False) / len(self.outcomes)
+
+    @property
+    def avg_latency(self) -> Optional[float]:
+        if not self.latencies:
+            return None
+        return sum(self.latencies) / len(self.latencies)
+
+    def is_healthy(self, now: float) -> bool:
+        return now >= self.cooldown_until
+
+
+class ProviderRegistry:
+    """LLM供应商注册表：健康度跟踪和按调用选择供应商"""
+
+    # 判定不健康或比较延迟前至少需要的样本数
+    MIN_SAMPLES = 5
+    # 连续失败达到该次数时立即进入冷却
+    MAX_CONSECUTIVE_FAILURES = 3
+
+    def __init__(
+        self,
+        providers: Optional[List[Dict[str, Any]]] = None,
+        client_pool: Optional[LLMClientPool] = None,
+        attempt_timeout: Optional[float] = None,
+        window: Optional[int] = None,
+        error_threshold: Optional[float] = None,
+        cooldown_seconds: Optional[float] = None,
+        latency_ratio: Optional[float] = None
+    ):
+        """
+        初始化供应商注册表
+
+        Args:
+            providers: 按优先级排列的供应商配置（name、api_key、base_url、models）
+            client_pool: 异步客户端池
+            attempt_timeout: 还有备用供应商时单个供应商的超时（秒）
+            window: 统计延迟和错误率的最近调用数
+            error_threshold: 错误率超过该值时进入冷却
+            cooldown_seconds: 冷却时长（秒）
+            latency_ratio: 备用供应商的平均延迟快这么多倍时优先使用
+        """
+        provider_configs = providers if providers is not None else Config.LLM_PROVIDERS
+        # 未配置API密钥的供应商不参与选择
+        self.providers = [ProviderConfig(**provider) for provider in provider_configs if provider.get("api_key")]
+        self.client_pool = client_pool or llm_client_pool
+        self.attempt_timeout = attempt_timeout or Config.LLM_PROVIDER_TIMEOUT
+        self.window = window or Config.LLM_PROVIDER_WINDOW
+        self.error_threshold = error_threshold if error_threshold is not None else Config.LLM_PROVIDER_ERROR_THRESHOLD
+        self.cooldown_seconds = cooldown_seconds if cooldown_seconds is not None else Config.LLM_PROVIDER_COOLDOWN_SECONDS
+        self.latency_ratio = latency_ratio or Config.LLM_PROVIDER_LATENCY_RATIO
+
+        self._health: Dict[Tuple[str, str], ProviderHealth] = {}
+        self._lock = threading.Lock()
+
+    def _get_health(self, provider_name: str, provider_model: str) -> ProviderHealth:
+        key = (provider_name, provider_model)
+        health = self._health.get(key)
+        if health is None:
+            health = self._health[key] = ProviderHealth(self.window)
+        return health
+
+    def get_client(self, provider: ProviderConfig) -> AsyncOpenAI:
+        """获取供应商的共享异步客户端"""
+        return self.client_pool.get_client(provider.api_key, provider.base_url)
+
+    def candidates(self, model: str) -> List[Tuple[ProviderConfig, str]]:
+        """
+        按推荐顺序列出能提供该模型的供应商
+
+        Args:
+            model: 请求的模型名称
+
+        Returns:
+            [(供应商, 供应商模型)]，第一个为首选，其余为依次切换的备选
+        """
+        now = time.monotonic()
+        healthy, cooling = [], []
+        with self._lock:
+            for provider in self.providers:
+                provider_model = provider.resolve_model(model)
+                if provider_model is None:
+                    continue
+                health = self._get_health(provider.name, provider_model)
+                (healthy if health.is_healthy(now) else cooling).append((provider, provider_model, health))
+
+            # 优先级最高的健康供应商为首选，除非某个备用供应商明显更快
+            if len(healthy) > 1:
+                preferred = healthy[0]
+                preferred_latency = preferred[2].avg_latency
+                if preferred_latency is not None and len(preferred[2].latencies) >= self.MIN_SAMPLES:
+                    for candidate in healthy[1:]:
+                        latency = candidate[2].avg_latency
+                        if (latency is not None and len(candidate[2].latencies) >= self.MIN_SAMPLES
+                                and latency * self.latency_ratio < preferred_latency):
+                            healthy.remove(candidate)
+                            healthy.insert(0, candidate)
+                            break
+
+            # 冷却中的供应商按冷却结束时间排在最后，全部不健康时仍会尝试
+            cooling.sort(key=lambda item: item[2].cooldown_until)
+        return [(provider, provider_model) for provider, provider_model, _ in healthy + cooling]
+
+    def record_success(self, provider_name: str, provider_model: str, latency: Optional[float] = None):
+        """
+        记录一次成功调用
+
+        Args:
+            provider_name: 供应商名称
+            provider_model: 供应商模型
+            latency: 调用延迟（秒）；流式调用只记录成功，不计入延迟
+        """
+        with self._lock:
+            health = self._get_health(provider_name, provider_model)
+            health.outcomes.append(True)
+            if latency is not None:
+                health.latencies.append(latency)
+            health.consecutive_failures = 0
+            health.successes += 1
+
+    def record_failure(self, provider_name: str, provider_model: str):
+        """记录一次超时或可重试的失败，错误率过高或连续失败时进入冷却"""
+        with self._lock:
+            health = self._get_health(provider_name, provider_model)
+            health.outcomes.append(False)
+            health.consecutive_failures += 1
+            health.failures += 1
+            too_many_errors = (len(health.outcomes) >= self.MIN_SAMPLES
+                               and health.error_rate >= self.error_threshold)
+            if too_many_errors or health.consecutive_failures >= self.MAX_CONSECUTIVE_FAILURES:
+                if health.is_healthy(time.monotonic()):
+                    print(f"⚠️ LLM供应商 {provider_name}/{provider_model} 暂时降级 {self.cooldown_seconds:.0f} 秒")
+                health.cooldown_until = time.monotonic() + self.cooldown_seconds
+                # 冷却结束后重新探测，不让旧的失败记录立刻再次触发冷却
+                health.outcomes.clear()
+                health.consecutive_failures = 0
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取各供应商和模型的健康统计"""
+        now = time.monotonic()
+        with self._lock:
+            return {
+                f"{provider_name}/{provider_model}": {
+                    "healthy": health.is_healthy(now),
+                    "successes": health.successes,
+                    "failures": health.failures,
+                    "error_rate": round(health.error_rate, 3),
+                    "avg_latency_ms": round(health.avg_latency * 1000, 1) if health.avg_latency is not None else None,
+                    "cooldown_remaining": round(max(0.0, health.cooldown_until - now), 1)
+                }
+                for (provider_name, provider_model), health in self._health.items()
+            }
+
+
+# 全局LLM供应商注册表实例
+provider_registry = ProviderRegistry()
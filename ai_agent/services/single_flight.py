@@ -0,0 +1,64 @@
+"""
+请求合并（single-flight） - 相同的上游调用在进行中时，后来的调用者直接等待同一个结果
+多个用户同时打开同一角色的问候语、热门问题触发相同的搜索和查询扩展时，只向上游发出一次请求
+"""
+
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+
+class SingleFlight:
+    """按 (调用类型, 键) 合并进行中的相同调用"""
+
+    def __init__(self):
+        self._in_flight: Dict[Tuple[str, Hashable], asyncio.Task] = {}
+        self._stats: Dict[str, Dict[str, int]] = {}
+
+    def _counters(self, name: str) -> Dict[str, int]:
+        return self._stats.setdefault(name, {"issued": 0, "coalesced": 0})
+
+    async def do(self, name: str, key: Hashable, factory: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        执行调用；相同键的调用正在进行时等待其结果而不重复发起
+
+        Args:
+            name: 调用类型（tts、web_search、query_expansion、document_summary等，用于统计）
+            key: 调用键，参数相同的调用应得到相同的键
+            factory: 真正发起调用的协程工厂
+
+        Returns:
+            调用结果（合并的调用者共享同一个结果对象，异常也会同样抛给所有调用者）
+        """
+        flight_key = (name, key)
+        counters = self._counters(name)
+        task = self._in_flight.get(flight_key)
+
+        if task is not None and not task.done() and task.get_loop() is asyncio.get_running_loop():
+            counters["coalesced"] += 1
+        else:
+            counters["issued"] += 1
+            task = asyncio.ensure_future(factory())
+            self._in_flight[flight_key] = task
+            task.add_done_callback(lambda t: self._on_done(flight_key, t))
+
+        # shield：某个调用者被取消（如时间预算超时）时，不影响其他等待同一结果的调用者
+        return await asyncio.shield(task)
+
+    def _on_done(self, flight_key: Tuple[str, Hashable], task: asyncio.Task):
+        if self._in_flight.get(flight_key) is task:
+            del self._in_flight[flight_key]
+        if not task.cancelled():
+            # 所有调用者都已取消时异常无人读取，这里读取一次避免asyncio告警
+            task.exception()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取各调用类型的发起次数和合并次数"""
+        stats = {}
+        for name, counters in self._stats.items():
+            in_flight = sum(1 for (flight_name, _) in self._in_flight if flight_name == name)
+            stats[name] = {**counters, "in_flight": in_flight}
+        return stats
+
+
+# 全局请求合并实例
+single_flight = SingleFlight()
@@ -0,0 +1,249 @@
+"""
+关键词触发检测器 - 所有关键词启发式规则的单次扫描
+联网搜索判断、图片生成判断、聊天类型检测、上下文记忆更新和知识检索判断原本各自用一组 `in` 循环和正则扫描同一条消息，
+每次对话同一条消息要被扫描十几遍（联网搜索判断还会执行两次）。这里把所有触发词表编译成一个Aho-Corasick自动机，
+一次扫描得到整条消息的特征，结果按消息缓存，各调用处只读取特征
+"""
+
+import threading
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from config import Config
+
+
+# 各触发分组的词表（匹配前消息转为小写，词表中的英文词须为小写）
+TRIGGER_LEXICONS: Dict[str, Tuple[str, ...]] = {
+    # 实时信息，需要联网搜索
+    "web_search": (
+        "今天", "现在", "最新", "当前", "实时", "最近",
+        "新闻", "股价", "汇率", "天气", "疫情", "政策",
+        "发布", "更新", "宣布", "公布", "报道", "消息",
+        "今年", "2024", "2025", "本月", "这周", "昨天",
+        "价格", "市场", "股市", "比特币", "房价", "油价"
+    ),
+    # 询问时间日期（按上下文中的当前时间回答，不需要联网搜索）
+    "clock": ("几点", "几号", "星期几", "礼拜几", "周几", "几月", "日期", "什么日子"),
+    # 图片生成请求
+    "image": (
+        "画", "画个", "画一个", "画一张", "画出",
+        "图", "图片", "生成图", "来张图", "来个图",
+        "画画", "绘制", "制作图片", "做张图",
+        "想看", "给我看看", "展示一下",
+        "创作", "设计", "描绘",
+        "draw", "paint", "image", "picture", "show me"
+    ),
+    # 聊天类型：问题解决（详细回复）
+    "problem": (
+        "怎么办", "如何", "什么原因", "为什么", "怎样", "方法", "建议", "帮助",
+        "问题", "困难", "麻烦", "不会", "不知道", "解决", "治疗", "病", "疼",
+        "头疼", "失眠", "感冒", "咳嗽", "血压", "糖尿病", "心脏"
+    ),
+    # 聊天类型：情感支持（适中回复）
+    "emotional": (
+        "想你", "想念", "孤独", "寂寞", "难过", "担心", "害怕", "紧张",
+        "开心", "高兴", "感动", "回忆", "以前", "小时候"
+    ),
+    # 聊天类型：问候语开头
+    "greeting": ("你好", "早上好", "中午好", "晚上好", "晚安"),
+    # 问候语“最近/身体……好吗”的位置标记，只在 _is_greeting 中使用
+    "greeting_marker": ("最近", "身体"),
+    # 上下文记忆分类
+    "memory_health": ("身体", "健康", "生病", "医院", "药"),
+    "memory_family": ("家人", "孩子", "孙子", "女儿", "儿子"),
+    "memory_mood": ("开心", "难过", "生气", "担心", "想念"),
+    "memory_activity": ("吃饭", "睡觉", "散步", "看电视", "出门"),
+    # 知识检索
+    "knowledge": ("怎么", "为什么", "什么是", "如何", "健康", "养生", "疾病"),
+    "health_domain": ("健康",),
+    "emotion_domain": ("孤单", "难过", "开心")
+}
+
+# 上下文记忆分类（对应 memory_<分类> 分组）
+MEMORY_CATEGORIES = ("health", "family", "mood", "activity")
+
+
+@dataclass(frozen=True)
+class TriggerFeatures:
+    """一条消息的触发特征（按消息缓存并共享，调用方不应修改）"""
+    matched: Dict[str, Tuple[str, ...]] = field(default_factory=dict)  # 分组 -> 按出现顺序命中的词（去重）
+    greeting: bool = False  # 符合问候语模式
+
+    def has(self, group: str) -> bool:
+        return group in self.matched
+
+    @property
+    def needs_web_search(self) -> bool:
+        return "web_search" in self.matched
+
+    @property
+    def wants_image(self) -> bool:
+        return "image" in self.matched
+
+
+class TriggerDetector:
+    """基于Aho-Corasick自动机的多模式触发检测器"""
+
+    def __init__(self, lexicons: Optional[Dict[str, Tuple[str, ...]]] = None, cache_size: Optional[int] = None):
+        """
+        初始化检测器并编译自动机
+
+        Args:
+            lexicons: 分组 -> 词表
+            cache_size: 按消息缓存的特征条数
+        """
+        self.lexicons = lexicons or TRIGGER_LEXICONS
+        self.cache_size = cache_size if cache_size is not None else Config.TRIGGER_CACHE_SIZE
+        self._term_groups: Dict[str, Tuple[str, ...]] = {}
+        for group, terms in self.lexicons.items():
+            for term in terms:
+                self._term_groups[term] = self._term_groups.get(term, ()) + (group,)
+        self._delta, self._outputs = self._compile(self._term_groups)
+
+        self._cache: "OrderedDict[str, TriggerFeatures]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.scans = 0
+        self.cache_hits = 0
+        self.total_seconds = 0.0
+
+    @staticmethod
+    def _compile(terms) -> Tuple[List[Dict[str, int]], List[Tuple[str, ...]]]:
+        """
+        构建自动机并展开为确定状态转移表
+
+        Returns:
+            (状态 -> {字符: 下一状态}（缺省回到根状态）, 状态 -> 在该状态结束的词)
+        """
+        goto: List[Dict[str, int]] = [{}]
+        outputs: List[Tuple[str, ...]] = [()]
+        for term in terms:
+            state = 0
+            for char in term:
+                if char not in goto[state]:
+                    goto[state][char] = len(goto)
+                    goto.append({})
+                    outputs.append(())
+                state = goto[state][char]
+            outputs[state] += (term,)
+
+        # 按广度优先计算失败链接，并把失败状态的转移合并进来，扫描时每个字符只需一次查表
+        fail = [0] * len(goto)
+        delta: List[Dict[str, int]] = [{} for _ in goto]
+        delta[0] = dict(goto[0])
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            delta[state] = {**delta[fail[state]], **goto[state]}
+            outputs[state] += outputs[fail[state]]
+            for char, child in goto[state].items():
+                fail[child] = delta[fail[state]].get(char, 0)
+                queue.append(child)
+        return delta, outputs
+
+    def scan(self, text: str) -> List[Tuple[int, str]]:
+        """
+        单次扫描消息，返回所有命中（含重叠的命中）
+
+        Args:
+            text: 已转为小写的消息
+
+        Returns:
+            [(起始位置, 词)]，按结束位置排序
+        """
+        delta, outputs = self._delta, self._outputs
+        hits = []
+        state = 0
+        for end, char in enumerate(text, 1):
+            state = delta[state].get(char, 0)
+            if outputs[state]:
+                hits.extend((end - len(term), term) for term in outputs[state])
+        return hits
+
+    def extract(self, text: str) -> TriggerFeatures:
+        """
+        不经过缓存直接提取消息的触发特征
+
+        Args:
+            text: 用户消息
+
+        Returns:
+            触发特征
+        """
+        text = (text or "").lower()
+        hits = self.scan(text)
+        matched: Dict[str, List[str]] = {}
+        for _, term in hits:
+            for group in self._term_groups[term]:
+                terms = matched.setdefault(group, [])
+                if term not in terms:
+                    terms.append(term)
+        return TriggerFeatures(
+            matched={group: tuple(terms) for group, terms in matched.items()},
+            greeting=self._is_greeting(text, hits)
+        )
+
+    def _is_greeting(self, text: str, hits: List[Tuple[int, str]]) -> bool:
+        """
+        问候语模式：以问候语开头；以“还好吗”结尾或“最近/身体”之后以“好吗”结尾；以“在/忙”开头且后面有“吗”
+        """
+        length = len(text)
+        starts = {term: start for start, term in reversed(hits)}  # 每个词最早出现的位置
+        if any(starts.get(term) == 0 for term in self.lexicons.get("greeting", ())):
+            return True
+        if text.endswith("好吗"):
+            if text.endswith("还好吗"):
+                return True
+            if any(starts.get(term, length) + len(term) <= length - 2 for term in self.lexicons.get("greeting_marker", ())):
+                return True
+        return text[:1] in ("在", "忙") and "吗" in text[1:]
+
+    def detect(self, text: str) -> TriggerFeatures:
+        """
+        获取消息的触发特征（按消息缓存，同一条消息只扫描一次）
+
+        Args:
+            text: 用户消息
+
+        Returns:
+            触发特征
+        """
+        text = text or ""
+        with self._lock:
+            features = self._cache.get(text)
+            if features is not None:
+                self._cache.move_to_end(text)
+                self.cache_hits += 1
+                return features
+
+        started_at = time.perf_counter()
+        features = self.extract(text)
+        elapsed = time.perf_counter() - started_at
+
+        with self._lock:
+            self.scans += 1
+            self.total_seconds += elapsed
+            if self.cache_size > 0:
+                self._cache[text] = features
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return features
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取扫描次数、缓存命中次数和平均扫描耗时"""
+        with self._lock:
+            lookups = self.scans + self.cache_hits
+            return {
+                "terms": len(self._term_groups),
+                "states": len(self._delta),
+                "scans": self.scans,
+                "cache_hits": self.cache_hits,
+                "hit_rate": round(self.cache_hits / lookups, 3) if lookups else None,
+                "avg_scan_us": round(self.total_seconds / self.scans * 1e6, 1) if self.scans else None,
+                "cached_messages": len(self._cache)
+            }
+
+
+# 全局关键词触发检测器实例
+trigger_detector = TriggerDetector()
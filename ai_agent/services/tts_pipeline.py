@@ -0,0 +1,285 @@
+"""
+分句流水线TTS - 与LLM流式生成重叠执行的语音合成
+把流式回复按中文句末标点（。！？~）切分，每凑齐一句就立即提交TTS，
+并按句子顺序产出音频片段，第一句可以在后续文本还在生成时就开始播放
+"""
+
+import asyncio
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from config import Config
+
+
+# 句末标点（包含全角波浪号和半角感叹/问号，兼容模型偶尔输出的半角标点）
+SENTENCE_ENDINGS = "。！？~～!?"
+# 紧跟句末标点的闭合符号归入同一句
+SENTENCE_CLOSERS = "”’」』）)\"'"
+
+
+class SentenceSplitter:
+    """增量分句器：逐段喂入流式文本，返回已完整的句子"""
+
+    def __init__(self, min_chars: Optional[int] = None):
+        """
+        初始化分句器
+
+        Args:
+            min_chars: 句子最少字数，过短的句子并入下一句，避免过碎的TTS请求
+        """
+        self.min_chars = min_chars if min_chars is not None else Config.TTS_PIPELINE_MIN_SENTENCE_CHARS
+        self._buffer = ""
+
+    def feed(self, text: str) -> List[str]:
+        """
+        喂入一段文本
+
+        Args:
+            text: 流式文本片段
+
+        Returns:
+            本次新凑齐的完整句子列表
+        """
+        self._buffer += text
+        sentences = []
+        start = 0
+        i = 0
+        length = len(self._buffer)
+
+        while i < length:
+            if self._buffer[i] not in SENTENCE_ENDINGS:
+                i += 1
+                continue
+
+            # 连续的句末标点和闭合符号（如"！！"、"？」"）属于同一句
+            end = i + 1
+            while end < length and (self._buffer[end] in SENTENCE_ENDINGS or self._buffer[end] in SENTENCE_CLOSERS):
+                end += 1
+
+            # 标点位于缓冲区末尾时，后续片段可能还有标点，等下一段再判断
+            if end == length:
+                break
+
+            if len(self._buffer[start:end].strip()) >= self.min_chars:
+                sentences.append(self._buffer[start:end].strip())
+                start = end
+            i = end
+
+        self._buffer = self._buffer[start:]
+        return sentences
+
+    def flush(self) -> Optional[str]:
+        """流结束时取出剩余文本作为最后一句"""
+        remainder = self._buffer.strip()
+        self._buffer = ""
+        return remainder or None
+
+
+def split_sentences(text: str, min_chars: Optional[int] = None) -> List[str]:
+    """
+    把完整文本切分为句子
+
+    Args:
+        text: 完整文本
+        min_chars: 句子最少字数
+
+    Returns:
+        句子列表
+    """
+    splitter = SentenceSplitter(min_chars)
+    sentences = splitter.feed(text)
+    remainder = splitter.flush()
+    if remainder:
+        sentences.append(remainder)
+    return sentences
+
+
+@dataclass
+class SpeechSegment:
+    """一个句子的语音合成结果"""
+    index: int
+    text: str
+    audio: Optional[bytes] = None
+    error: Optional[str] = None
+    elapsed: float = 0.0  # TTS耗时（秒）
+
+    @property
+    def success(self) -> bool:
+        return self.audio is not None
+
+
+@dataclass
+class _PendingSegment:
+    index: int
+    text: str
+    task: "asyncio.Task[SpeechSegment]"
+
+
+class TTSPipeline:
+    """单次回复的分句TTS流水线"""
+
+    def __init__(
+        self,
+        synthesize: Callable[[str], Awaitable[bytes]],
+        max_concurrency: Optional[int] = None,
+        min_chars: Optional[int] = None,
+        started_at: Optional[float] = None,
+        stats: Optional["TTSPipelineStats"] = None
+    ):
+        """
+        初始化流水线
+
+        Args:
+            synthesize: 单句TTS协程函数，输入文本返回音频数据
+            max_concurrency: 同时进行的TTS请求上限
+            min_chars: 句子最少字数
+            started_at: 计算首段音频时间的起点（time.perf_counter()，默认为创建时刻）
+            stats: 汇总指标的统计实例
+        """
+        self.synthesize = synthesize
+        self.splitter = SentenceSplitter(min_chars)
+        self.started_at = started_at if started_at is not None else time.perf_counter()
+        self.stats = stats if stats is not None else tts_pipeline_stats
+
+        self._semaphore = asyncio.Semaphore(max_concurrency or Config.TTS_PIPELINE_MAX_CONCURRENCY)
+        self._pending: List[_PendingSegment] = []
+        self._next_index = 0
+        self._emitted = 0
+        self._failed = 0
+        self.time_to_first_audio: Optional[float] = None
+
+    def feed(self, text: str):
+        """喂入流式文本片段，凑齐的句子立即提交TTS"""
+        for sentence in self.splitter.feed(text):
+            self._submit(sentence)
+
+    def _submit(self, sentence: str):
+        index = self._next_index
+        self._next_index += 1
+        task = asyncio.create_task(self._synthesize_segment(index, sentence))
+        self._pending.append(_PendingSegment(index=index, text=sentence, task=task))
+
+    async def _synthesize_segment(self, index: int, text: str) -> SpeechSegment:
+        async with self._semaphore:
+            start = time.perf_counter()
+            try:
+                audio = await self.synthesize(text)
+                return SpeechSegment(index=index, text=text, audio=audio or None,
+                                     error=None if audio else "TTS未返回音频数据",
+                                     elapsed=time.perf_counter() - start)
+            except Exception as e:
+                print(f"❌ 第{index + 1}句TTS失败: {e}")
+                return SpeechSegment(index=index, text=text, error=str(e),
+                                     elapsed=time.perf_counter() - start)
+
+    def _emit(self, segment: SpeechSegment) -> SpeechSegment:
+        self._emitted += 1
+        if not segment.success:
+            self._failed += 1
+        elif self.time_to_first_audio is None:
+            self.time_to_first_audio = time.perf_counter() - self.started_at
+            print(f"⏱️ 首段音频就绪: {self.time_to_first_audio * 1000:.0f}ms")
+        return segment
+
+    def pop_ready(self) -> List[SpeechSegment]:
+        """
+        取出已完成且按顺序可以发送的音频片段（不等待）
+
+        Returns:
+            按句子顺序排列的音频片段
+        """
+        ready = []
+        while self._pending and self._pending[0].task.done():
+            ready.append(self._emit(self._pending.pop(0).task.result()))
+        return ready
+
+    async def finish(self):
+        """
+        文本流结束：提交剩余文本，并按顺序等待产出所有音频片段
+
+        Yields:
+            音频片段
+        """
+        remainder = self.splitter.flush()
+        if remainder:
+            self._submit(remainder)
+
+        while self._pending:
+            pending = self._pending.pop(0)
+            yield self._emit(await pending.task)
+
+        self.stats.record(self.summary())
+
+    async def aclose(self):
+        """取消尚未完成的TTS任务（客户端断开或生成失败时调用）"""
+        for pending in self._pending:
+            pending.task.cancel()
+        self._pending.clear()
+
+    def summary(self) -> Dict[str, Any]:
+        """获取本次流水线的统计摘要"""
+        return {
+            "segments": self._next_index,
+            "emitted": self._emitted,
+            "failed": self._failed,
+            "time_to_first_audio_ms": round(self.time_to_first_audio * 1000, 1)
+            if self.time_to_first_audio is not None else None
+        }
+
+
+class TTSPipelineStats:
+    """分句流水线的全局统计（首段音频时间等）"""
+
+    def __init__(self, max_samples: int = 500):
+        """
+        初始化统计
+
+        Args:
+            max_samples: 保留的首段音频时间样本数
+        """
+        self.max_samples = max_samples
+        self.pipelines = 0
+        self.segments = 0
+        self.failed_segments = 0
+        self._ttfa_samples: List[float] = []
+        self._lock = threading.Lock()
+
+    def record(self, summary: Dict[str, Any]):
+        """记录一次流水线的统计摘要"""
+        with self._lock:
+            self.pipelines += 1
+            self.segments += summary["segments"]
+            self.failed_segments += summary["failed"]
+            ttfa = summary.get("time_to_first_audio_ms")
+            if ttfa is not None:
+                self._ttfa_samples.append(ttfa)
+                if len(self._ttfa_samples) > self.max_samples:
+                    self._ttfa_samples = self._ttfa_samples[-self.max_samples:]
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取首段音频时间统计（最近 max_samples 次）"""
+        with self._lock:
+            samples = sorted(self._ttfa_samples)
+
+        def percentile(p: float) -> Optional[float]:
+            if not samples:
+                return None
+            return samples[min(len(samples) - 1, int(len(samples) * p))]
+
+        return {
+            "pipelines": self.pipelines,
+            "segments": self.segments,
+            "failed_segments": self.failed_segments,
+            "time_to_first_audio_ms": {
+                "count": len(samples),
+                "avg": round(sum(samples) / len(samples), 1) if samples else None,
+                "p50": percentile(0.5),
+                "p95": percentile(0.95)
+            }
+        }
+
+
+# 全局流水线统计实例
+tts_pipeline_stats = TTSPipelineStats()
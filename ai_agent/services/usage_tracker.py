@@ -0,0 +1,308 @@
+"""
+用量与费用统计 - 按用户、角色、阶段和模型统计每次上游调用的用量和费用
+LLM调用记录输入/输出token（取自响应的usage），TTS记录合成字符数，图片记录生成张数；
+用户和角色通过上下文变量在请求入口绑定，并发子任务自动继承；
+用量先在内存中按 (日期, 用户, 角色, 阶段, 模型) 聚合，定期累加写入SQLite，供 /usage 接口查询
+"""
+
+import asyncio
+import sqlite3
+import threading
+import time
+from contextlib import closing
+from contextvars import ContextVar
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from config import Config
+
+
+# 计数字段
+USAGE_FIELDS = ("calls", "prompt_tokens", "completion_tokens", "tts_characters", "images", "turns")
+# 可用于分组的维度
+GROUP_FIELDS = ("day", "user_id", "character_id", "stage", "model")
+# 每轮对话记录在该阶段下，用于计算平均每轮的用量和费用
+TURN_STAGE = "turn"
+
+UsageKey = Tuple[str, str, str, str, str]
+
+# 当前请求的 (用户ID, 角色ID)
+_usage_scope: ContextVar[Tuple[str, str]] = ContextVar("usage_scope", default=("", ""))
+
+
+class UsageTracker:
+    """用量与费用统计：内存聚合 + 定期写入SQLite"""
+
+    def __init__(
+        self,
+        db_path: Optional[str] = None,
+        prices: Optional[Dict[str, Dict[str, float]]] = None,
+        flush_interval: Optional[float] = None
+    ):
+        """
+        初始化用量统计
+
+        Args:
+            db_path: SQLite数据库路径
+            prices: 模型 -> 单价（元）：prompt_per_1k、completion_per_1k、per_1k_chars、per_image
+            flush_interval: 定期写入SQLite的间隔（秒）
+        """
+        if not db_path:
+            db_path = Config.USAGE_DB or str(Path(__file__).parent.parent / "data" / "usage.db")
+        self.db_path = db_path
+        self.prices = prices if prices is not None else Config.USAGE_PRICES
+        self.flush_interval = flush_interval or Config.USAGE_FLUSH_INTERVAL_SECONDS
+
+        self._pending: Dict[UsageKey, Dict[str, float]] = {}
+        self._lock = threading.Lock()
+        self.flushes = 0
+        self.flushed_rows = 0
+        self.last_flush: Optional[float] = None
+        self._db_ready = False  # 首次写入或查询时才建库
+
+    def _connect(self) -> closing:
+        """打开数据库连接（首次使用时建表），调用方关闭连接"""
+        if not self._db_ready:
+            self._init_database()
+        return closing(sqlite3.connect(self.db_path))
+
+    def _init_database(self):
+        """初始化用量表"""
+        Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
+        with closing(sqlite3.connect(self.db_path)) as conn, conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS usage (
+                    day TEXT NOT NULL,
+                    user_id TEXT NOT NULL,
+                    character_id TEXT NOT NULL,
+                    stage TEXT NOT NULL,
+                    model TEXT NOT NULL,
+                    calls INTEGER DEFAULT 0,
+                    prompt_tokens INTEGER DEFAULT 0,
+                    completion_tokens INTEGER DEFAULT 0,
+                    tts_characters INTEGER DEFAULT 0,
+                    images INTEGER DEFAULT 0,
+                    turns INTEGER DEFAULT 0,
+                    cost REAL DEFAULT 0,
+                    PRIMARY KEY (day, user_id, character_id, stage, model)
+                )
+            """)
+        self._db_ready = True
+
+    @staticmethod
+    def bind(user_id: Optional[str], character_id: Optional[str]):
+        """
+        绑定当前请求的用户和角色（之后发起的上游调用都记在其名下，包括并发子任务）
+
+        Args:
+            user_id: 用户ID
+            character_id: 角色ID
+        """
+        _usage_scope.set((user_id or "", character_id or ""))
+
+    def begin_turn(self, user_id: Optional[str], character_id: Optional[str]):
+        """绑定用户和角色并记录一轮对话"""
+        self.bind(user_id, character_id)
+        self._record(TURN_STAGE, "", turns=1)
+
+    def cost(self, model: str, counts: Dict[str, float]) -> float:
+        """
+        按模型单价计算费用（元），未配置单价的模型费用为0
+
+        Args:
+            model: 模型名称
+            counts: 计数
+
+        Returns:
+            费用
+        """
+        price = self.prices.get(model, {})
+        return (
+            counts.get("prompt_tokens", 0) / 1000 * price.get("prompt_per_1k", 0)
+            + counts.get("completion_tokens", 0) / 1000 * price.get("completion_per_1k", 0)
+            + counts.get("tts_characters", 0) / 1000 * price.get("per_1k_chars", 0)
+            + counts.get("images", 0) * price.get("per_image", 0)
+        )
+
+    def _record(self, stage: str, model: str, **counts: int):
+        user_id, character_id = _usage_scope.get()
+        key = (datetime.now().strftime("%Y-%m-%d"), user_id, character_id, stage, model or "")
+        cost = self.cost(model, counts)
+        with self._lock:
+            entry = self._pending.setdefault(key, {**{name: 0 for name in USAGE_FIELDS}, "cost": 0.0})
+            for name, value in counts.items():
+                entry[name] += value
+            entry["cost"] += cost
+
+    def record_llm(self, stage: Optional[str], model: str, usage: Any = None):
+        """
+        记录一次LLM调用
+
+        Args:
+            stage: 阶段（LLM任务名称：route、expand、cot、reply、summarize等）
+            model: 模型名称
+            usage: 响应的usage（缺失时只记调用次数）
+        """
+        self._record(
+            stage or "other",
+            model,
+            calls=1,
+            prompt_tokens=getattr(usage, "prompt_tokens", 0) or 0,
+            completion_tokens=getattr(usage, "completion_tokens", 0) or 0
+        )
+
+    def record_tts(self, characters: int, model: Optional[str] = None):
+        """记录一次TTS合成的字符数"""
+        self._record("tts", model or Config.TTS_MODEL, calls=1, tts_characters=characters)
+
+    def record_image(self, model: str, count: int = 1):
+        """记录生成的图片张数"""
+        self._record("image", model, calls=1, images=count)
+
+    def flush(self) -> int:
+        """
+        把内存中聚合的用量累加写入SQLite
+
+        Returns:
+            写入的行数
+        """
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+
+        columns = USAGE_FIELDS + ("cost",)
+        try:
+            with self._connect() as conn, conn:
+                conn.executemany(
+                    f"""
+                    INSERT INTO usage ({", ".join(GROUP_FIELDS + columns)})
+                    VALUES ({", ".join("?" for _ in GROUP_FIELDS + columns)})
+                    ON CONFLICT ({", ".join(GROUP_FIELDS)}) DO UPDATE SET
+                    {", ".join(f"{name} = {name} + excluded.{name}" for name in columns)}
+                    """,
+                    [key + tuple(entry[name] for name in columns) for key, entry in pending.items()]
+                )
+        except sqlite3.Error as e:
+            # 写入失败时放回内存，下次再写
+            print(f"⚠️ 用量写入失败: {e}")
+            with self._lock:
+                for key, entry in pending.items():
+                    current = self._pending.setdefault(key, {name: 0 for name in columns})
+                    for name in columns:
+                        current[name] += entry[name]
+            return 0
+
+        with self._lock:
+            self.flushes += 1
+            self.flushed_rows += len(pending)
+            self.last_flush = time.time()
+        return len(pending)
+
+    async def run_periodic_flush(self):
+        """后台定期写入SQLite（应用关闭时由调用方取消并最后写入一次）"""
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await asyncio.to_thread(self.flush)
+
+    def query(
+        self,
+        group_by: Optional[List[str]] = None,
+        user_id: Optional[str] = None,
+        character_id: Optional[str] = None,
+        stage: Optional[str] = None,
+        days: int = 7
+    ) -> List[Dict[str, Any]]:
+        """
+        按维度汇总最近几天的用量（查询前先写入内存中的用量），按费用和token数从高到低排列
+
+        Args:
+            group_by: 分组维度（day、user_id、character_id、stage、model）
+            user_id: 只统计该用户
+            character_id: 只统计该角色
+            stage: 只统计该阶段
+            days: 统计最近几天（含今天）
+
+        Returns:
+            每组的计数、token总数和费用
+        """
+        group_by = [name for name in (group_by or ["stage"]) if name in GROUP_FIELDS]
+        self.flush()
+
+        conditions = ["day >= ?"]
+        params: List[Any] = [(datetime.now() - timedelta(days=max(days, 1) - 1)).strftime("%Y-%m-%d")]
+        for name, value in (("user_id", user_id), ("character_id", character_id), ("stage", stage)):
+            if value is not None:
+                conditions.append(f"{name} = ?")
+                params.append(value)
+
+        select = ", ".join(group_by + [f"SUM({name}) AS {name}" for name in USAGE_FIELDS + ("cost",)])
+        sql = f"SELECT {select} FROM usage WHERE {' AND '.join(conditions)}"
+        if group_by:
+            sql += f" GROUP BY {', '.join(group_by)}"
+
+        with self._connect() as conn, conn:
+            conn.row_factory = sqlite3.Row
+            rows = [dict(row) for row in conn.execute(sql, params)]
+
+        results = []
+        for row in rows:
+            if row["calls"] is None and row["turns"] is None:
+                continue
+            row = {name: (value or 0) if name in USAGE_FIELDS + ("cost",) else value for name, value in row.items()}
+            row["total_tokens"] = row["prompt_tokens"] + row["completion_tokens"]
+            row["cost"] = round(row["cost"], 6)
+            results.append(row)
+        results.sort(key=lambda row: (row["cost"], row["total_tokens"]), reverse=True)
+        return results
+
+    def summary(
+        self,
+        user_id: Optional[str] = None,
+        character_id: Optional[str] = None,
+        days: int = 7
+    ) -> Dict[str, Any]:
+        """
+        用量汇总：总量、平均每轮的token数和费用，以及按费用排序的各阶段
+
+        Args:
+            user_id: 只统计该用户
+            character_id: 只统计该角色
+            days: 统计最近几天
+
+        Returns:
+            汇总结果
+        """
+        stages = self.query(["stage"], user_id=user_id, character_id=character_id, days=days)
+        turns = sum(row["turns"] for row in stages)
+        stages = [row for row in stages if row["stage"] != TURN_STAGE]
+        totals = {name: sum(row[name] for row in stages) for name in USAGE_FIELDS + ("total_tokens", "cost")}
+        totals["turns"] = turns
+        totals["cost"] = round(totals["cost"], 6)
+        return {
+            "days": days,
+            "user_id": user_id,
+            "character_id": character_id,
+            "totals": totals,
+            "per_turn": {
+                "tokens": round(totals["total_tokens"] / turns, 1),
+                "tts_characters": round(totals["tts_characters"] / turns, 1),
+                "cost": round(totals["cost"] / turns, 6)
+            } if turns else None,
+            "stages": stages
+        }
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取待写入的分组数和写入统计"""
+        with self._lock:
+            return {
+                "pending_groups": len(self._pending),
+                "flushes": self.flushes,
+                "flushed_rows": self.flushed_rows,
+                "last_flush": datetime.fromtimestamp(self.last_flush).isoformat() if self.last_flush else None
+            }
+
+
+# 全局用量统计实例
+usage_tracker = UsageTracker()
@@ -7,7 +7,10 @@ import asyncio
 from typing import Dict, List, Any, Optional
 from datetime import datetime
 import json
-import re
+
+from services.concurrency_limiter import upstream_limiters
+from services.single_flight import single_flight
+from services.trigger_detector import trigger_detector
 
 
 class WebSearchTool:
@@ -32,35 +35,8 @@ class WebSearchTool:
         Returns:
             是否需要搜索
         """
-        # 实时信息关键词
-        real_time_keywords = [
-            '今天', '现在', '最新', '当前', '实时', '最近',
-            '新闻', '股价', '汇率', '天气', '疫情', '政策',
-            '发布', '更新', '宣布', '公布', '报道', '消息',
-            '今年', '2024', '2025', '本月', '这周', '昨天',
-            '价格', '市场', '股市', '比特币', '房价', '油价'
-        ]
-        
-        # 检查是否包含实时信息关键词
-        query_lower = query.lower()
-        for keyword in real_time_keywords:
-            if keyword in query:
-                return True
-                
-        # 检查问句模式
-        question_patterns = [
-            r'.*最新.*怎么样',
-            r'.*现在.*价格',
-            r'.*今天.*发生',
-            r'.*最近.*消息',
-            r'.*当前.*状况'
-        ]
-        
-        for pattern in question_patterns:
-            if re.search(pattern, query):
-                return True
-        
-        return False
+        # 实时信息关键词见 TRIGGER_LEXICONS["web_search"]，原来的问句模式（如“最新…怎么样”）都包含其中的关键词
+        return trigger_detector.detect(query).needs_web_search
     
     async def search(self, query: str, max_results: int = 5) -> Dict[str, Any]:
         """
@@ -73,6 +49,15 @@ class WebSearchTool:
         Returns:
             搜索结果字典
         """
+        # 热门问题会在短时间内触发相同的搜索，进行中的相同搜索只请求一次
+        return await single_flight.do(
+            "web_search",
+            (query.strip(), max_results),
+            lambda: self._search(query, max_results)
+        )
+    
+    async def _search(self, query: str, max_results: int) -> Dict[str, Any]:
+        """向搜索API发起请求"""
         try:
             print(f"🔍 开始联网搜索: {query}")
             
@@ -86,15 +71,16 @@ class WebSearchTool:
             
             # 发送异步请求
             loop = asyncio.get_event_loop()
-            response = await loop.run_in_executor(
-                None, 
-                lambda: requests.get(
-                    self.api_url, 
-                    headers=self.headers, 
-                    params=params,
-                    timeout=10
+            async with upstream_limiters.get("web_search").slot():
+                response = await loop.run_in_executor(
+                    None, 
+                    lambda: requests.get(
+                        self.api_url, 
+                        headers=self.headers, 
+                        params=params,
+                        timeout=10
+                    )
                 )
-            )
             
             if response.status_code == 200:
                 data = response.json()
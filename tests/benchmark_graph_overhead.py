@@ -0,0 +1,111 @@
+"""
+对话图每轮开销基准测试
+使用立即返回的本地OpenAI兼容模拟服务，使每轮耗时主要由对话图本身的开销构成，比较：
+    compile_per_turn  每轮重新编译图（改动前的行为）
+    compiled_once     图只编译一次，不保存检查点
+    memory            图只编译一次，进程内检查点
+    sqlite            图只编译一次，SQLite检查点
+报告单次编译耗时和各模式每轮耗时的p50/p95。不需要真实LLM，不属于pytest用例。
+
+用法：
+    python tests/benchmark_graph_overhead.py --turns 30
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+# 添加AI Agent路径
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'ai_agent'))
+
+from fake_llm import fake_llm
+from graph.conversation_graph import ConversationGraph
+from memory.conversation_memory import ConversationMemory
+
+
+SAMPLE_MESSAGES = ["你好", "在干嘛呢", "吃饭了吗", "今天天气不错", "晚安"]
+
+MODES = {
+    "compile_per_turn": "none",
+    "compiled_once": "none",
+    "memory": "memory",
+    "sqlite": "sqlite"
+}
+
+
+def _percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+async def run_benchmark(turns: int) -> Dict[str, Dict[str, float]]:
+    """
+    按模式运行多轮对话
+
+    Args:
+        turns: 每种模式的对话轮数
+
+    Returns:
+        模式 -> {p50_ms, p95_ms}，另含 compile -> {p50_ms, p95_ms}
+    """
+    results = {}
+    async with fake_llm(lambda body: "奶奶，我在呢！"):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            for mode, checkpointer in MODES.items():
+                graph = ConversationGraph(
+                    checkpointer=checkpointer,
+                    checkpoint_db=os.path.join(tmp_dir, f"{mode}_checkpoints.db")
+                )
+                graph.memory = ConversationMemory(db_path=os.path.join(tmp_dir, f"{mode}_conversations.db"))
+                # 预热：建立连接、SQLite检查点首次编译
+                await graph.process_conversation("你好", user_id=f"warmup-{mode}", character_id="lanyang")
+
+                latencies, compile_latencies = [], []
+                for turn in range(turns):
+                    started_at = time.perf_counter()
+                    if mode == "compile_per_turn":
+                        graph.graph.compile()
+                        compile_latencies.append((time.perf_counter() - started_at) * 1000)
+                    await graph.process_conversation(
+                        SAMPLE_MESSAGES[turn % len(SAMPLE_MESSAGES)],
+                        user_id=f"benchmark-{mode}",
+                        character_id="lanyang"
+                    )
+                    latencies.append((time.perf_counter() - started_at) * 1000)
+                await graph.aclose()
+
+                results[mode] = {
+                    "p50_ms": round(_percentile(latencies, 0.5), 2),
+                    "p95_ms": round(_percentile(latencies, 0.95), 2)
+                }
+                if compile_latencies:
+                    results["compile"] = {
+                        "p50_ms": round(_percentile(compile_latencies, 0.5), 2),
+                        "p95_ms": round(_percentile(compile_latencies, 0.95), 2)
+                    }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="对话图每轮开销基准测试")
+    parser.add_argument("--turns", type=int, default=30, help="每种模式的对话轮数")
+    args = parser.parse_args()
+
+    print(f"⏱️ 基准测试: {len(MODES)} 种模式 × {args.turns} 轮（模拟LLM立即返回）")
+    results = asyncio.run(run_benchmark(args.turns))
+
+    print("\n" + "mode".ljust(20) + "p50_ms".rjust(12) + "p95_ms".rjust(12))
+    for mode, stats in results.items():
+        print(mode.ljust(20) + str(stats["p50_ms"]).rjust(12) + str(stats["p95_ms"]).rjust(12))
+
+    before, after = results["compile_per_turn"], results["compiled_once"]
+    print(f"\n📊 只编译一次后每轮开销变化: p50 {after['p50_ms'] - before['p50_ms']:+.2f}ms，"
+          f"SQLite检查点额外开销: p50 {results['sqlite']['p50_ms'] - after['p50_ms']:+.2f}ms")
+
+
+if __name__ == "__main__":
+    main()
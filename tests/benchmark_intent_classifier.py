@@ -0,0 +1,212 @@
+"""
+本地意图分类器离线评估
+对人工标注路由类型的消息运行本地分类器，报告本地决策覆盖率（不需要调用LLM路由的比例）、
+本地决策的准确率、各路由类型的精确率，以及单条消息的分类耗时。样本分三组分别报告：
+    labelled   编写词表时参考的样本
+    held_out   编写词表后另外收集、没有用来调整词表的样本，反映真实准确率
+    negated    带否定词的样本（“头不疼了”“我不难过”），否定的主题不应作为本地路由
+不需要LLM，可以直接运行：
+
+用法：
+    python tests/benchmark_intent_classifier.py --margin 0.5 --min-score 1.5
+"""
+
+import argparse
+import os
+import sys
+import time
+from typing import Dict, List, Optional, Tuple
+
+# 添加AI Agent路径
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'ai_agent'))
+
+from graph.intent_classifier import LocalIntentClassifier
+
+
+# (消息, 标注的路由类型)
+LABELLED_SAMPLES: List[Tuple[str, str]] = [
+    ("儿子，你最近工作忙不忙？", "character-xiyang"),
+    ("喜羊羊，你什么时候回家？", "character-xiyang"),
+    ("儿子又出差了吗", "character-xiyang"),
+    ("听说你们公司最近在加班", "character-xiyang"),
+    ("儿子升职了没有", "character-xiyang"),
+    ("闺女，妈想你了", "character-meiyang"),
+    ("女儿，有空陪我说说话吗", "character-meiyang"),
+    ("美羊羊在吗", "character-meiyang"),
+    ("女儿最贴心了", "character-meiyang"),
+    ("想念我的闺女", "character-meiyang"),
+    ("孙子，考试考得怎么样", "character-lanyang"),
+    ("懒羊羊，给奶奶讲个笑话", "character-lanyang"),
+    ("乖孙放假了吗", "character-lanyang"),
+    ("孙子作业写完了没有", "character-lanyang"),
+    ("大孙子又在玩游戏吧", "character-lanyang"),
+    ("今天血压有点高，头晕", "health-concern"),
+    ("膝盖疼得走不了路", "health-concern"),
+    ("这两天一直咳嗽，是不是感冒了", "health-concern"),
+    ("降压药饭前吃还是饭后吃", "health-concern"),
+    ("晚上失眠，要不要去医院看看", "health-concern"),
+    ("血糖高吃什么好", "health-concern"),
+    ("胸闷气短，心脏不太舒服", "health-concern"),
+    ("昨天在厕所摔了一跤", "health-concern"),
+    ("我心情不好", "emotional-support"),
+    ("一个人在家好孤独", "emotional-support"),
+    ("老伴走了以后我很难过", "emotional-support"),
+    ("心里很委屈，想哭", "emotional-support"),
+    ("最近总觉得活着没意思", "emotional-support"),
+    ("家里没人管我，很寂寞", "emotional-support"),
+    ("我有点担心，心烦得很", "emotional-support"),
+    ("什么是阿尔茨海默病", "knowledge-query"),
+    ("为什么秋天树叶会变黄", "knowledge-query"),
+    ("介绍一下端午节的历史", "knowledge-query"),
+    ("帮我解释一下文档里这段话", "knowledge-query"),
+    ("微波炉的原理是什么", "knowledge-query"),
+    ("绿茶和红茶有什么区别", "knowledge-query"),
+    ("早上好", "general-query"),
+    ("你好呀", "general-query"),
+    ("吃了吗", "general-query"),
+    ("晚安", "general-query"),
+    ("在干嘛呢", "general-query"),
+    ("今天天气不错，出去散步了", "general-query"),
+    # 以下需要结合语境判断，本地分类应交给LLM
+    ("儿子，我最近头晕", "health-concern"),
+    ("孙子，我最近膝盖疼", "health-concern"),
+    ("女儿，一个人在家好孤单", "emotional-support"),
+    ("嗯", "general-query"),
+    ("那个东西放哪了", "general-query"),
+    ("你说的对", "general-query")
+]
+
+# 编写词表后另外收集的样本，不用来调整词表
+HELD_OUT_SAMPLES: List[Tuple[str, str]] = [
+    ("儿子，你们领导对你好不好", "character-xiyang"),
+    ("喜羊羊，周末还要上班吗", "character-xiyang"),
+    ("儿子，出差注意安全", "character-xiyang"),
+    ("闺女，妈就想跟你聊聊天", "character-meiyang"),
+    ("美羊羊，你什么时候来陪陪我", "character-meiyang"),
+    ("女儿，你那边冷不冷", "character-meiyang"),
+    ("懒羊羊，今天学校里好玩吗", "character-lanyang"),
+    ("乖孙，动画片看完了没有", "character-lanyang"),
+    ("孙子，来逗我开心一点", "character-lanyang"),
+    ("早上起来头痛得厉害", "health-concern"),
+    ("这几天老是发烧，浑身难受", "health-concern"),
+    ("医生说我血糖偏高", "health-concern"),
+    ("腰疼了好几天了", "health-concern"),
+    ("明天要去医院体检", "health-concern"),
+    ("牙疼", "health-concern"),
+    ("药吃完了", "health-concern"),
+    ("晚上一个人睡不着，心里闷得慌", "emotional-support"),
+    ("老伴不在了，我好孤单", "emotional-support"),
+    ("想起以前的事就伤心", "emotional-support"),
+    ("我害怕一个人过年", "emotional-support"),
+    ("血压计怎么用，说明书看不懂", "knowledge-query"),
+    ("为什么人老了腿脚不灵便", "knowledge-query"),
+    ("给我介绍一下重阳节", "knowledge-query"),
+    ("什么是骨质疏松", "knowledge-query"),
+    ("晚上好", "general-query"),
+    ("你在干什么呢", "general-query"),
+    ("今天天气怎么样", "general-query"),
+    ("吃饭了没", "general-query"),
+    ("中午好啊", "general-query"),
+    ("好的好的", "general-query")
+]
+
+# 带否定词的样本：否定的主题不是消息的意图
+NEGATED_SAMPLES: List[Tuple[str, str]] = [
+    ("我头不疼了，挺好的", "general-query"),
+    ("我不难过", "general-query"),
+    ("腿不疼了，放心吧", "general-query"),
+    ("没有发烧，别担心", "general-query"),
+    ("我不孤单，邻居天天来串门", "general-query"),
+    ("最近没失眠，睡得挺好", "general-query"),
+    ("不委屈，就是随口说说", "general-query"),
+    ("膝盖不痛了", "general-query")
+]
+
+SAMPLE_SETS: Dict[str, List[Tuple[str, str]]] = {
+    "labelled": LABELLED_SAMPLES,
+    "held_out": HELD_OUT_SAMPLES,
+    "negated": NEGATED_SAMPLES
+}
+
+
+def _percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+def evaluate(
+    classifier: LocalIntentClassifier,
+    samples: Optional[List[Tuple[str, str]]] = None,
+    repeats: int = 1
+) -> Dict[str, object]:
+    """
+    评估本地分类器
+
+    Args:
+        classifier: 本地意图分类器
+        samples: 标注样本，默认LABELLED_SAMPLES
+        repeats: 每条消息重复分类的次数（用于测量耗时）
+
+    Returns:
+        {samples, decided, coverage, accuracy, errors, routes, p50_us, p99_us}
+    """
+    samples = samples or LABELLED_SAMPLES
+    decided = correct = 0
+    errors = []
+    routes: Dict[str, Dict[str, int]] = {}
+    latencies = []
+    for text, label in samples:
+        for _ in range(repeats):
+            started_at = time.perf_counter()
+            result = classifier.classify(text)
+            latencies.append((time.perf_counter() - started_at) * 1e6)
+        if not result.decisive:
+            continue
+        decided += 1
+        counters = routes.setdefault(result.route, {"predicted": 0, "correct": 0})
+        counters["predicted"] += 1
+        if result.route == label:
+            correct += 1
+            counters["correct"] += 1
+        else:
+            errors.append((text, label, result.route))
+
+    return {
+        "samples": len(samples),
+        "decided": decided,
+        "coverage": round(decided / len(samples), 3),
+        "accuracy": round(correct / decided, 3) if decided else None,
+        "errors": errors,
+        "routes": {
+            route: {**counters, "precision": round(counters["correct"] / counters["predicted"], 3)}
+            for route, counters in sorted(routes.items())
+        },
+        "p50_us": round(_percentile(latencies, 0.5), 1),
+        "p99_us": round(_percentile(latencies, 0.99), 1)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地意图分类器离线评估")
+    parser.add_argument("--margin", type=float, default=None, help="本地决策要求的最小领先比例")
+    parser.add_argument("--min-score", type=float, default=None, help="本地决策要求的最低得分")
+    parser.add_argument("--repeats", type=int, default=200, help="每条消息重复分类的次数")
+    args = parser.parse_args()
+
+    for name, samples in SAMPLE_SETS.items():
+        classifier = LocalIntentClassifier(margin=args.margin, min_score=args.min_score)
+        report = evaluate(classifier, samples, repeats=args.repeats)
+
+        print(f"\n📋 {name}: 样本 {report['samples']} 条，本地决策 {report['decided']} 条"
+              f"（覆盖率 {report['coverage']:.1%}），其余交给LLM路由")
+        print(f"🎯 本地决策准确率: {report['accuracy']}")
+        print(f"⏱️ 分类耗时: p50 {report['p50_us']}µs, p99 {report['p99_us']}µs")
+        print("route".ljust(22) + "predicted".rjust(12) + "correct".rjust(12) + "precision".rjust(12))
+        for route, counters in report["routes"].items():
+            print(route.ljust(22) + "".join(str(counters[key]).rjust(12) for key in ("predicted", "correct", "precision")))
+        for text, label, predicted in report["errors"]:
+            print(f"❌ {text}: 标注 {label}，本地 {predicted}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+单次结构化回复 vs 多调用路径 基准测试
+对同一组消息分别以 multi_call（CoT推理 + 角色回复）和 structured（单次结构化调用）运行完整对话图，
+比较端到端延迟、LLM调用次数和token用量。需要可用的LLM供应商（按Config/环境变量配置），不属于pytest用例。
+
+用法：
+    python tests/benchmark_structured_reply.py --runs 3 --character xiyang
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+# 添加AI Agent路径
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'ai_agent'))
+
+from graph.conversation_graph import ConversationGraph
+from memory.conversation_memory import ConversationMemory
+from services.llm_client import llm_client_pool
+from services.llm_gateway import llm_gateway
+
+
+SAMPLE_MESSAGES = [
+    "我晚上睡不好",
+    "今天血压有点高，头晕",
+    "你小时候最喜欢吃我做的什么菜？",
+    "一个人在家有点闷",
+    "孙子下周要考试了"
+]
+
+MODE_TASKS = {
+    "multi_call": ("route", "cot", "reply"),
+    "structured": ("structured_reply",)
+}
+
+
+def _task_totals(tasks: List[str]) -> Dict[str, int]:
+    """汇总若干任务的调用次数和token用量"""
+    stats = llm_gateway.get_stats()["tasks"]
+    totals = {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0}
+    for task in tasks:
+        for key in totals:
+            totals[key] += stats.get(task, {}).get(key, 0)
+    return totals
+
+
+def _percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+async def run_benchmark(runs: int, character_id: str) -> Dict[str, Dict[str, float]]:
+    """
+    交替运行两种模式，返回每种模式的延迟和token统计
+
+    Args:
+        runs: 每条消息每种模式的运行次数
+        character_id: 角色ID
+
+    Returns:
+        模式 -> {turns, p50_ms, p95_ms, calls_per_turn, prompt_tokens_per_turn, completion_tokens_per_turn}
+    """
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        graph = ConversationGraph()
+        # 基准测试的对话不写入正式的记忆库
+        graph.memory = ConversationMemory(db_path=os.path.join(tmp_dir, "conversations.db"))
+
+        latencies = {mode: [] for mode in MODE_TASKS}
+        before = {mode: _task_totals(tasks) for mode, tasks in MODE_TASKS.items()}
+        for run in range(runs):
+            for index, message in enumerate(SAMPLE_MESSAGES):
+                # 两种模式交替执行，避免供应商负载随时间变化造成偏差
+                for mode in MODE_TASKS:
+                    started_at = time.perf_counter()
+                    await graph.process_conversation(
+                        message,
+                        user_id=f"benchmark-{mode}-{run}-{index}",
+                        character_id=character_id,
+                        reply_mode=mode
+                    )
+                    latencies[mode].append((time.perf_counter() - started_at) * 1000)
+        await llm_client_pool.aclose()
+
+    for mode, tasks in MODE_TASKS.items():
+        after = _task_totals(tasks)
+        turns = len(latencies[mode])
+        results[mode] = {
+            "turns": turns,
+            "p50_ms": round(_percentile(latencies[mode], 0.5), 1),
+            "p95_ms": round(_percentile(latencies[mode], 0.95), 1),
+            "calls_per_turn": round((after["calls"] - before[mode]["calls"]) / turns, 2),
+            "prompt_tokens_per_turn": round((after["prompt_tokens"] - before[mode]["prompt_tokens"]) / turns, 1),
+            "completion_tokens_per_turn": round(
+                (after["completion_tokens"] - before[mode]["completion_tokens"]) / turns, 1
+            )
+        }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="单次结构化回复 vs 多调用路径 基准测试")
+    parser.add_argument("--runs", type=int, default=3, help="每条消息每种模式的运行次数")
+    parser.add_argument("--character", default="xiyang", help="角色ID（xiyang/meiyang启用CoT推理）")
+    args = parser.parse_args()
+
+    print(f"⏱️ 基准测试: {len(SAMPLE_MESSAGES)} 条消息 × {args.runs} 次 × 2 种模式，角色 {args.character}")
+    results = asyncio.run(run_benchmark(args.runs, args.character))
+
+    columns = ["turns", "p50_ms", "p95_ms", "calls_per_turn", "prompt_tokens_per_turn", "completion_tokens_per_turn"]
+    print("\n" + "mode".ljust(12) + "".join(column.rjust(28) for column in columns))
+    for mode, stats in results.items():
+        print(mode.ljust(12) + "".join(str(stats[column]).rjust(28) for column in columns))
+
+    multi, structured = results["multi_call"], results["structured"]
+    print(f"\n📊 p50延迟变化: {structured['p50_ms'] - multi['p50_ms']:+.1f}ms，"
+          f"每轮token变化: {structured['prompt_tokens_per_turn'] + structured['completion_tokens_per_turn'] - multi['prompt_tokens_per_turn'] - multi['completion_tokens_per_turn']:+.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+"""
+关键词触发检测微基准
+比较一次对话中关键词规则的总耗时：
+    legacy     改动前各调用处分别用 `in` 循环和正则扫描消息（联网搜索判断执行三次，图片判断和聊天类型检测各两次，
+               加上上下文记忆更新和知识检索判断）
+    scan       触发检测器不经过缓存单次扫描
+    detect     各调用处都通过带缓存的触发检测器读取特征（首次扫描，其余命中缓存）
+同时检查检测器的特征与改动前的规则在所有样本上结果一致。不需要LLM，不属于pytest用例。
+
+用法：
+    python tests/benchmark_trigger_detector.py --repeats 2000
+"""
+
+import argparse
+import os
+import re
+import sys
+import time
+from typing import Dict, List
+
+# 添加AI Agent路径
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'ai_agent'))
+
+from benchmark_intent_classifier import LABELLED_SAMPLES
+from services.trigger_detector import MEMORY_CATEGORIES, TriggerDetector, TriggerFeatures
+
+
+SAMPLE_MESSAGES: List[str] = [text for text, _ in LABELLED_SAMPLES] + [
+    "你好", "早上好呀", "最近身体还好吗", "在家吗", "忙什么呢，忙吗", "妈，您身体好吗",
+    "最新的油价怎么样", "现在黄金什么价格", "帮我画一张小羊吃草的图", "Show me a picture of the sea",
+    "今天天气怎么样", "我头疼，怎么办", "想念小时候一家人吃饭的日子", "孩子们都去上班了，家里就我一个人",
+    "养生有什么讲究", "孤单的时候就看看电视", "睡觉前吃了降压药",
+    "这周末你们回不回家吃饭？我准备了很多菜，还想跟你们聊聊家里装修的事情，你爸也一直念叨着"
+]
+
+
+def _legacy_web_search(message: str) -> bool:
+    """改动前 WebSearchTool.should_search 的规则"""
+    real_time_keywords = [
+        '今天', '现在', '最新', '当前', '实时', '最近',
+        '新闻', '股价', '汇率', '天气', '疫情', '政策',
+        '发布', '更新', '宣布', '公布', '报道', '消息',
+        '今年', '2024', '2025', '本月', '这周', '昨天',
+        '价格', '市场', '股市', '比特币', '房价', '油价'
+    ]
+    question_patterns = [r'.*最新.*怎么样', r'.*现在.*价格', r'.*今天.*发生', r'.*最近.*消息', r'.*当前.*状况']
+    return (
+        any(keyword in message for keyword in real_time_keywords) or
+        any(re.search(pattern, message) for pattern in question_patterns)
+    )
+
+
+def _legacy_image(message: str) -> bool:
+    """改动前 ImageService.should_generate_image 的规则"""
+    image_keywords = [
+        "画", "画个", "画一个", "画一张", "画出",
+        "图", "图片", "生成图", "来张图", "来个图",
+        "画画", "绘制", "制作图片", "做张图",
+        "想看", "给我看看", "展示一下",
+        "创作", "设计", "描绘",
+        "draw", "paint", "image", "picture", "show me"
+    ]
+    return any(keyword in message.lower() for keyword in image_keywords)
+
+
+def _legacy_chat_type(message: str) -> Dict[str, bool]:
+    """改动前 CharacterAgent.detect_chat_type 的关键词规则（含其中的联网搜索判断）"""
+    problem_keywords = [
+        '怎么办', '如何', '什么原因', '为什么', '怎样', '方法', '建议', '帮助',
+        '问题', '困难', '麻烦', '不会', '不知道', '解决', '治疗', '病', '疼',
+        '头疼', '失眠', '感冒', '咳嗽', '血压', '糖尿病', '心脏'
+    ]
+    emotional_keywords = [
+        '想你', '想念', '孤独', '寂寞', '难过', '担心', '害怕', '紧张',
+        '开心', '高兴', '感动', '回忆', '以前', '小时候'
+    ]
+    greeting_patterns = [
+        r'^(你好|早上好|中午好|晚上好|晚安)',
+        r'(最近.*好吗|身体.*好吗|还好吗)$',
+        r'^(在.*吗|忙.*吗)'
+    ]
+    return {
+        "web_search": _legacy_web_search(message),
+        "problem": any(keyword in message for keyword in problem_keywords),
+        "emotional": any(keyword in message for keyword in emotional_keywords),
+        "greeting": any(re.search(pattern, message) for pattern in greeting_patterns)
+    }
+
+
+def _legacy_memory(message: str) -> tuple:
+    """改动前 CharacterAgent._update_context_memory 的分类规则"""
+    memory_keywords = {
+        "health": ["身体", "健康", "生病", "医院", "药"],
+        "family": ["家人", "孩子", "孙子", "女儿", "儿子"],
+        "mood": ["开心", "难过", "生气", "担心", "想念"],
+        "activity": ["吃饭", "睡觉", "散步", "看电视", "出门"]
+    }
+    return tuple(category for category, words in memory_keywords.items() if any(word in message for word in words))
+
+
+def _legacy_rag(message: str) -> Dict[str, bool]:
+    """改动前Graph RAG节点的知识检索和知识域规则"""
+    return {
+        "knowledge": any(
+            keyword in message.lower() for keyword in ["怎么", "为什么", "什么是", "如何", "健康", "养生", "疾病"]
+        ),
+        "health_domain": "健康" in message,
+        "emotion_domain": any(word in message for word in ["孤单", "难过", "开心"])
+    }
+
+
+def legacy_features(message: str) -> Dict[str, object]:
+    """改动前各调用处的关键词规则，返回与 signals() 相同结构的结果"""
+    return {
+        **_legacy_chat_type(message),
+        "image": _legacy_image(message),
+        "memory": _legacy_memory(message),
+        **_legacy_rag(message)
+    }
+
+
+def signals(features: TriggerFeatures) -> Dict[str, object]:
+    """把检测器特征转换为 legacy_features() 的结构"""
+    return {
+        "web_search": features.needs_web_search,
+        "image": features.wants_image,
+        "problem": features.has("problem"),
+        "emotional": features.has("emotional"),
+        "greeting": features.greeting,
+        "memory": tuple(category for category in MEMORY_CATEGORIES if features.has(f"memory_{category}")),
+        "knowledge": features.has("knowledge"),
+        "health_domain": features.has("health_domain"),
+        "emotion_domain": features.has("emotion_domain")
+    }
+
+
+def mismatches(detector: TriggerDetector, messages: List[str] = None) -> List[str]:
+    """返回检测器特征与改动前规则不一致的消息"""
+    return [
+        message for message in (messages or SAMPLE_MESSAGES)
+        if signals(detector.extract(message)) != legacy_features(message)
+    ]
+
+
+def _legacy_chat(message: str):
+    """改动前一次对话的关键词检测：联网搜索判断一次，图片判断两次，聊天类型检测两次（各含一次联网搜索判断），
+    上下文记忆和知识检索各一次"""
+    _legacy_web_search(message)
+    for _ in range(2):
+        _legacy_image(message)
+        _legacy_chat_type(message)
+    _legacy_memory(message)
+    _legacy_rag(message)
+
+
+# 改动后一次对话中读取触发特征的次数（与上面各调用处一一对应）
+DETECTIONS_PER_CHAT = 7
+
+
+def run_benchmark(repeats: int) -> Dict[str, Dict[str, float]]:
+    """
+    对所有样本消息按三种方式运行每次对话的关键词检测
+
+    Args:
+        repeats: 每条消息重复的次数
+
+    Returns:
+        方式 -> {p50_us, p99_us}（每次对话的耗时）
+    """
+    detector = TriggerDetector(cache_size=len(SAMPLE_MESSAGES))
+    modes = {
+        "legacy": _legacy_chat,
+        "scan": detector.extract,
+        "detect": lambda message: [detector.detect(message) for _ in range(DETECTIONS_PER_CHAT)]
+    }
+    results = {}
+    for mode, run in modes.items():
+        latencies = []
+        for _ in range(repeats):
+            for message in SAMPLE_MESSAGES:
+                started_at = time.perf_counter()
+                run(message)
+                latencies.append((time.perf_counter() - started_at) * 1e6)
+        latencies.sort()
+        results[mode] = {
+            "p50_us": round(latencies[len(latencies) // 2], 2),
+            "p99_us": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))], 2)
+        }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="关键词触发检测微基准")
+    parser.add_argument("--repeats", type=int, default=2000, help="每条消息重复的次数")
+    args = parser.parse_args()
+
+    detector = TriggerDetector()
+    different = mismatches(detector)
+    print(f"📋 样本 {len(SAMPLE_MESSAGES)} 条，自动机 {detector.get_stats()['states']} 个状态，"
+          f"与改动前规则不一致 {len(different)} 条")
+    for message in different:
+        print(f"❌ {message}: 改动前 {legacy_features(message)}，检测器 {signals(detector.extract(message))}")
+
+    results = run_benchmark(args.repeats)
+    print("\n" + "mode".ljust(12) + "p50_us".rjust(12) + "p99_us".rjust(12))
+    for mode, stats in results.items():
+        print(mode.ljust(12) + str(stats["p50_us"]).rjust(12) + str(stats["p99_us"]).rjust(12))
+    print(f"\n📊 每次对话关键词检测 p50: 改动前 {results['legacy']['p50_us']}µs → "
+          f"单次扫描 {results['scan']['p50_us']}µs，命中缓存后 {results['detect']['p50_us']}µs")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,25 @@
+"""
+pytest公共配置
+测试中LLM结果缓存、用量统计和对话图检查点的全局实例写入临时目录，不修改 ai_agent/data 下的数据库。
+conftest先于测试模块加载，此时各全局实例还没有创建，它们按这里设置的路径建库。
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+
+# 添加AI Agent路径
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'ai_agent'))
+
+from config import Config
+
+
+_TEST_DATA_DIR = tempfile.mkdtemp(prefix="familybot-tests-")
+Config.LLM_MEMO_CACHE_DB = os.path.join(_TEST_DATA_DIR, "llm_memo_cache.db")
+Config.USAGE_DB = os.path.join(_TEST_DATA_DIR, "usage.db")
+Config.GRAPH_CHECKPOINT_DB = os.path.join(_TEST_DATA_DIR, "graph_checkpoints.db")
+
+
+def pytest_unconfigure(config):
+    shutil.rmtree(_TEST_DATA_DIR, ignore_errors=True)
@@ -0,0 +1,137 @@
+"""
+测试用的本地OpenAI兼容模拟服务
+各测试只提供处理函数 handler(请求体)，返回值可以是：
+    str            回复内容，按请求的模型包装成 chat.completion（流式请求时分段发送 chat.completion.chunk）
+    dict           完整的响应JSON（如 completion(...) 附带usage）
+    web.Response   原样返回（如错误状态码）
+handler可以是普通函数或协程函数。
+"""
+
+import asyncio
+import inspect
+import json
+import os
+import sys
+import time
+from contextlib import asynccontextmanager
+from typing import Any, Callable, Optional, Tuple
+
+from aiohttp import web
+
+# 添加AI Agent路径
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'ai_agent'))
+
+from services.llm_client import llm_client_pool
+from services.llm_providers import ProviderConfig, provider_registry
+
+
+def completion(model: str, content: str, usage: Optional[Tuple[int, int]] = None) -> dict:
+    """
+    构建 chat.completion 响应
+
+    Args:
+        model: 模型名
+        content: 回复内容
+        usage: (prompt_tokens, completion_tokens)，为空时不附带usage
+    """
+    response = {
+        "id": "chatcmpl-test",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": content},
+            "finish_reason": "stop"
+        }]
+    }
+    if usage:
+        prompt_tokens, completion_tokens = usage
+        response["usage"] = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens
+        }
+    return response
+
+
+def _chunk(model: str, choices: list, **fields) -> str:
+    chunk = {"id": "chatcmpl-test", "object": "chat.completion.chunk", "created": int(time.time()),
+             "model": model, "choices": choices, **fields}
+    return f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+
+
+async def stream_completion(request: web.Request, model: str, content: str, piece_size: int = 4) -> web.StreamResponse:
+    """
+    以SSE分段发送回复，每段 piece_size 个字，最后发送带usage的分片和 [DONE]
+
+    Args:
+        request: aiohttp请求
+        model: 模型名
+        content: 回复内容（为空时只发送结束分片）
+        piece_size: 每段的字数
+    """
+    response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+    await response.prepare(request)
+    for start in range(0, len(content), piece_size):
+        delta = {"content": content[start:start + piece_size]}
+        await response.write(_chunk(model, [{"index": 0, "delta": delta, "finish_reason": None}]).encode("utf-8"))
+    await response.write(_chunk(model, [{"index": 0, "delta": {}, "finish_reason": "stop"}]).encode("utf-8"))
+    usage = {"prompt_tokens": 1, "completion_tokens": len(content), "total_tokens": 1 + len(content)}
+    await response.write(_chunk(model, [], usage=usage).encode("utf-8"))
+    await response.write(b"data: [DONE]\n\n")
+    await response.write_eof()
+    return response
+
+
+async def start_fake_llm(handler: Callable[[dict], Any]):
+    """
+    启动模拟服务
+
+    Returns:
+        (runner, base_url)，用完后调用 runner.cleanup()
+    """
+    async def chat_completions(request):
+        body = await request.json()
+        result = handler(body)
+        if inspect.isawaitable(result):
+            result = await result
+        if isinstance(result, web.StreamResponse):
+            return result
+        if isinstance(result, str):
+            if body.get("stream"):
+                return await stream_completion(request, body["model"], result)
+            result = completion(body["model"], result)
+        return web.json_response(result)
+
+    app = web.Application()
+    app.router.add_post("/v1/chat/completions", chat_completions)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}/v1"
+
+
+@asynccontextmanager
+async def fake_llm(handler: Callable[[dict], Any]):
+    """在模拟服务运行期间把全局供应商替换为该服务，退出时恢复并关闭客户端"""
+    runner, base_url = await start_fake_llm(handler)
+    original_providers = provider_registry.providers
+    provider_registry.providers = [ProviderConfig(name="fake", api_key="test-key", base_url=base_url)]
+    try:
+        yield base_url
+    finally:
+        provider_registry.providers = original_providers
+        await llm_client_pool.aclose()
+        await runner.cleanup()
+
+
+def run_with_fake_llm(handler: Callable[[dict], Any], scenario: Callable[[], Any]) -> Any:
+    """在模拟服务上运行 scenario()（协程函数），返回其结果"""
+    async def run():
+        async with fake_llm(handler):
+            return await scenario()
+
+    return asyncio.run(run())
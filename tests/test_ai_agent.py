@@ -4,6 +4,7 @@ AI Agent功能测试脚本
 测试AI Agent处理老人对话的能力
 """
 
+import asyncio
 import sys
 import os
 sys.path.append(os.path.join(os.path.dirname(__file__), 'ai_agent'))
@@ -31,7 +32,7 @@ def test_elder_conversation():
             selected_character="xiyang"
         )
         
-        response1 = xiyang_agent.generate_response(state1.user_input)
+        response1 = asyncio.run(xiyang_agent.generate_response(state1.user_input))
         print(f"👴 老人说：{state1.user_input}")
         print(f"🐑 喜羊羊回复：{response1.get('response', '抱歉，我无法回应')}")
         print(f"😊 情绪识别：{response1.get('emotion', '未知')}")
@@ -52,7 +53,7 @@ def test_elder_conversation():
             selected_character="meiyang"
         )
         
-        response2 = meiyang_agent.generate_response(state2.user_input)
+        response2 = asyncio.run(meiyang_agent.generate_response(state2.user_input))
         print(f"👴 老人说：{state2.user_input}")
         print(f"🐑 美羊羊回复：{response2.get('response', '抱歉，我无法回应')}")
         print(f"😊 情绪识别：{response2.get('emotion', '未知')}")
@@ -73,7 +74,7 @@ def test_elder_conversation():
             selected_character="lanyang"
         )
         
-        response3 = lanyang_agent.generate_response(state3.user_input)
+        response3 = asyncio.run(lanyang_agent.generate_response(state3.user_input))
         print(f"👴 老人说：{state3.user_input}")
         print(f"🐑 懒羊羊回复：{response3.get('response', '抱歉，我无法回应')}")
         print(f"😊 情绪识别：{response3.get('emotion', '未知')}")
@@ -0,0 +1,302 @@
+"""
+重复提问答案缓存测试
+验证问题归一化和近似匹配（只差一个实词的问题不匹配）、各聊天类型的保鲜时间（实时信息类不缓存）、按用户隔离和容量上限，
+追问和指代上文的消息只在上一轮回复相同时复用、询问时间日期不缓存，
+以及聊天接口重复提问时跳过LLM和TTS并统计命中率和节省的时间、语音聊天路由到其他角色的回复不缓存
+"""
+
+import asyncio
+import sys
+import os
+import tempfile
+import time
+
+# 添加AI Agent路径
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'ai_agent'))
+
+import main
+from fake_llm import run_with_fake_llm
+from memory.conversation_memory import ConversationMemory
+from services.answer_cache import (
+    AnswerCache, context_fingerprint, depends_on_context, normalize_question, question_similarity
+)
+from services.artifact_store import ArtifactStore
+
+
+TTL = {"greeting": 60, "casual": 60, "problem_solving": 60, "emotional_support": 60, "real_time_info": 0}
+
+
+def _store(cache: AnswerCache, question: str, chat_type: str = "casual", user_id: str = "u1", response: str = "回复",
+           context: str = ""):
+    cache.store(
+        user_id=user_id, character_id="xiyang", question=question, chat_type=chat_type,
+        response=response, emotion="caring", voice_config={"voice": "Cherry", "speed": 1.0},
+        audio_url="/audio/abc", latency_ms=3000, context=context
+    )
+
+
+def test_normalize_and_near_match():
+    """标点、语气词和句末疑问词不影响匹配；数字或否定词不同的问题不算相近"""
+    assert normalize_question("药吃了没有？") == normalize_question("药吃了吗") == "药吃了吗"
+    assert normalize_question("你好呀！") == normalize_question("你好")
+    assert question_similarity(normalize_question("最近身体还好吗"), normalize_question("最近身体好吗")) > 0.9
+    assert question_similarity("我血压130", "我血压150") == 0.0
+    assert question_similarity("膝盖疼怎么办", "膝盖不疼怎么办") == 0.0
+
+    cache = AnswerCache(ttl_seconds=TTL, similarity=0.8, enabled=True)
+    _store(cache, "最近身体还好吗？", chat_type="greeting", response="挺好的，您放心")
+
+    exact = cache.lookup("u1", "xiyang", "最近身体还好吗", "greeting")
+    near = cache.lookup("u1", "xiyang", "最近身体好吗", "greeting")
+    assert exact.exact and exact.response == "挺好的，您放心"
+    assert near and not near.exact
+    assert cache.lookup("u1", "xiyang", "最近身体还好吗", "casual") is None  # 聊天类型不同
+    print(f"✅ 归一化和近似匹配: 相似度 {near.similarity}")
+
+
+def test_medically_different_questions_not_matched():
+    """只差一个实词（部位、病名、药名）的问题不算相近；问题求助和情感支持类只做精确匹配"""
+    different = [
+        ("我头疼怎么办", "我牙疼怎么办"),
+        ("高血压怎么办", "低血压怎么办"),
+        ("降压药什么时候吃", "降糖药什么时候吃"),
+        ("腿疼怎么办", "头疼怎么办"),
+        ("我腿疼", "我头疼")
+    ]
+    for a, b in different:
+        assert question_similarity(normalize_question(a), normalize_question(b)) == 0.0, (a, b)
+    assert question_similarity(normalize_question("您吃饭了吗"), normalize_question("吃饭了吗")) > 0.8
+
+    cache = AnswerCache(ttl_seconds=TTL, similarity=0.5, enabled=True)
+    for a, b in different:
+        _store(cache, a, chat_type="problem_solving", response=f"关于{a}的回答")
+        assert cache.lookup("u1", "xiyang", b, "problem_solving") is None, (a, b)
+    _store(cache, "我头疼怎么办呀", chat_type="problem_solving")
+    assert cache.lookup("u1", "xiyang", "我头疼怎么办", "problem_solving").exact
+    _store(cache, "我还是很想你", chat_type="emotional_support")
+    assert cache.lookup("u1", "xiyang", "我很想你", "emotional_support") is None  # 情感支持只做精确匹配
+    print(f"✅ {len(different)} 组只差一个实词的问题都没有命中")
+
+
+def test_context_dependent_questions():
+    """追问和指代上文的消息只在上一轮回复相同时复用；询问时间日期归为实时信息类，不缓存"""
+    follow_ups = ["然后呢", "真的吗", "还有呢", "为什么呀", "怎么办", "那怎么办", "那个药怎么吃", "嗯"]
+    standalone = ["药吃了吗", "吃饭了吗", "膝盖疼怎么办", "最近身体还好吗", "在干嘛呢"]
+    assert all(depends_on_context(message) for message in follow_ups)
+    assert not any(depends_on_context(message) for message in standalone)
+
+    agent = main.conversation_graph.character_manager.get_agent("xiyang")
+    for message in ("几点了", "今天几号", "星期几了"):
+        assert agent.detect_chat_type(message)["type"] == "real_time_info", message
+    assert not agent.detect_chat_type("几点了")["needs_web_search"]
+
+    cache = AnswerCache(ttl_seconds=TTL, similarity=0.8, enabled=True)
+    about_walks = context_fingerprint("多出去散散步，对身体好")
+    about_sleep = context_fingerprint("晚上早点睡，别看太久电视")
+    _store(cache, "然后呢", response="散步回来记得喝水", context=about_walks)
+    assert cache.lookup("u1", "xiyang", "然后呢", "casual", about_sleep) is None
+    assert cache.lookup("u1", "xiyang", "然后呢", "casual") is None
+    assert cache.lookup("u1", "xiyang", "然后呢？", "casual", about_walks).response == "散步回来记得喝水"
+    print("✅ 追问只在上一轮回复相同时复用，询问时间不缓存")
+
+
+def test_freshness_and_skipped_types():
+    """超过保鲜时间的回答失效，实时信息类不缓存"""
+    cache = AnswerCache(ttl_seconds={"casual": 0.05, "real_time_info": 0}, similarity=0.8, enabled=True)
+    _store(cache, "今天天气怎么样", chat_type="real_time_info")
+    _store(cache, "吃饭了吗")
+
+    assert cache.lookup("u1", "xiyang", "今天天气怎么样", "real_time_info") is None
+    assert cache.lookup("u1", "xiyang", "吃饭了吗", "casual") is not None
+    time.sleep(0.1)
+    assert cache.lookup("u1", "xiyang", "吃饭了吗", "casual") is None
+
+    stats = cache.get_stats()
+    assert stats["skipped"] == 1
+    assert stats["expirations"] == 1
+    assert stats["entries"] == 0
+    print(f"✅ 保鲜时间和不缓存的类型: {stats}")
+
+
+def test_isolation_capacity_and_rephrase():
+    """按用户隔离，每个用户的问答数有上限，开启轻度改写时回复带引导语"""
+    cache = AnswerCache(ttl_seconds=TTL, similarity=0.8, max_entries=2, rephrase=True, enabled=True)
+    _store(cache, "吃饭了吗", response="吃过了")
+    _store(cache, "在干什么呢", response="在上班")
+    _store(cache, "晚上吃什么", response="吃面条")
+
+    assert cache.lookup("u2", "xiyang", "晚上吃什么", "casual") is None
+    assert cache.lookup("u1", "xiyang", "吃饭了吗", "casual") is None  # 最早的问答被淘汰
+
+    hit = cache.lookup("u1", "xiyang", "晚上吃什么", "casual")
+    assert hit.rephrased
+    assert hit.response.endswith("吃面条") and hit.response != "吃面条"
+
+    assert cache.invalidate(character_id="xiyang") == 2
+    print("✅ 用户隔离、容量上限和轻度改写")
+
+
+class FakeTTS:
+    """记录合成次数的TTS替身"""
+
+    def __init__(self):
+        self.calls = 0
+
+    async def generate_character_voice(self, character_id, text, speed=1.0, deadline=None):
+        self.calls += 1
+        await asyncio.sleep(0.05)
+        return b"RIFF\x24\x00\x00\x00WAVE" + text.encode("utf-8")
+
+
+def test_chat_repeated_question_served_from_cache():
+    """聊天接口：重复提问不再调用LLM和TTS，复用同一段音频并记入会话历史"""
+    state = {"requests": 0}
+    fake_tts = FakeTTS()
+
+    def handler(body):
+        state["requests"] += 1
+        return "爸，药要按时吃，我晚上打电话提醒您。"
+
+    async def run():
+        originals = (main.audio_service, main.artifact_store, main.answer_cache, main.conversation_graph.memory)
+        try:
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                main.audio_service = fake_tts
+                main.artifact_store = ArtifactStore(root_dir=os.path.join(tmp_dir, "artifacts"))
+                main.answer_cache = AnswerCache(ttl_seconds=TTL, similarity=0.8, enabled=True)
+                main.conversation_graph.memory = ConversationMemory(db_path=os.path.join(tmp_dir, "conversations.db"))
+
+                request = main.ChatRequest(message="药吃了吗", user_id="answer-cache-test", include_audio_base64=False)
+                first = await main.text_chat(request)
+                first_requests = state["requests"]
+                second = await main.text_chat(main.ChatRequest(
+                    message="药吃了没？", user_id="answer-cache-test", include_audio_base64=True
+                ))
+                session = main.conversation_graph.get_session("answer-cache-test", "xiyang", None)
+                return first, first_requests, second, session, main.answer_cache.get_stats()
+        finally:
+            main.audio_service, main.artifact_store, main.answer_cache, main.conversation_graph.memory = originals
+
+    first, first_requests, second, session, stats = run_with_fake_llm(handler, run)
+
+    assert first_requests > 0
+    assert not first.cached_answer
+    assert state["requests"] == first_requests  # 重复提问没有再调用LLM
+    assert fake_tts.calls == 1
+    assert second.cached_answer
+    assert second.response == first.response
+    assert second.audio_url == first.audio_url
+    assert second.audio_base64
+    assert [turn["user_message"] for turn in session.conversation_history[-2:]] == ["药吃了吗", "药吃了没？"]
+    assert stats["hits"] == 1
+    assert stats["hit_rate"] == 0.5
+    assert stats["saved_total_ms"] > 0
+    print(f"✅ 重复提问命中缓存: {stats}")
+
+
+def test_chat_follow_ups_and_clock_questions_not_replayed():
+    """聊天接口：上一轮回复不同时追问重新生成，询问时间每次都重新生成"""
+    state = {"requests": 0}
+
+    def handler(body):
+        state["requests"] += 1
+        return f"第{state['requests']}次回复"
+
+    async def ask(message):
+        before = state["requests"]
+        response = await main.text_chat(main.ChatRequest(
+            message=message, user_id="answer-cache-follow-up", include_audio_base64=False
+        ))
+        return response.cached_answer, state["requests"] > before
+
+    async def run():
+        originals = (main.audio_service, main.artifact_store, main.answer_cache, main.conversation_graph.memory)
+        try:
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                main.audio_service = FakeTTS()
+                main.artifact_store = ArtifactStore(root_dir=os.path.join(tmp_dir, "artifacts"))
+                main.answer_cache = AnswerCache(ttl_seconds=TTL, similarity=0.8, enabled=True)
+                main.conversation_graph.memory = ConversationMemory(db_path=os.path.join(tmp_dir, "conversations.db"))
+                return [await ask(message) for message in ("吃饭了吗", "然后呢", "在干嘛呢", "然后呢", "几点了", "几点了")]
+        finally:
+            main.audio_service, main.artifact_store, main.answer_cache, main.conversation_graph.memory = originals
+
+    results = run_with_fake_llm(handler, run)
+
+    assert [cached for cached, _ in results] == [False] * 6
+    assert all(called_llm for _, called_llm in results)
+    print("✅ 追问和询问时间都重新生成了回复")
+
+
+def test_voice_chat_routed_reply_not_cached():
+    """语音聊天：对话图路由到其他角色时回复不缓存；由请求的角色回复时缓存并在重复提问时复用音频"""
+    class FakeVoice(FakeTTS):
+        async def speech_to_text(self, audio_data, source_format="wav"):
+            return {"success": True, "text": audio_data.decode("utf-8")}
+
+    class FakeUpload:
+        filename = "question.wav"
+
+        def __init__(self, text):
+            self.text = text
+
+        async def read(self):
+            return self.text.encode("utf-8")
+
+    def routed_to(character_id):
+        config = main.conversation_graph.character_manager.get_agent(character_id).config
+
+        async def process_conversation(user_input, user_id, **kwargs):
+            return {
+                "character_id": character_id,
+                "character_name": config["name"],
+                "response": f"{character_id}的回复",
+                "emotion": "caring",
+                "voice_config": {"voice": config["voice"], "speed": config.get("voice_speed", 1.0)},
+                "timestamp": "2026-01-01T00:00:00"
+            }
+        return process_conversation
+
+    async def run():
+        originals = (main.audio_service, main.artifact_store, main.answer_cache,
+                     main.conversation_graph.memory, main.conversation_graph.process_conversation)
+        try:
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                main.audio_service = FakeVoice()
+                main.artifact_store = ArtifactStore(root_dir=os.path.join(tmp_dir, "artifacts"))
+                main.answer_cache = AnswerCache(ttl_seconds=TTL, similarity=0.8, enabled=True)
+                main.conversation_graph.memory = ConversationMemory(db_path=os.path.join(tmp_dir, "conversations.db"))
+
+                main.conversation_graph.process_conversation = routed_to("meiyang")
+                routed = await main.voice_chat(FakeUpload("药吃了吗"), user_id="voice-cache", character_id="xiyang")
+                routed_stores = main.answer_cache.get_stats()["stores"]
+
+                main.conversation_graph.process_conversation = routed_to("xiyang")
+                first = await main.voice_chat(FakeUpload("药吃了吗"), user_id="voice-cache", character_id="xiyang")
+                tts_calls = main.audio_service.calls
+                repeated = await main.voice_chat(FakeUpload("药吃了吗"), user_id="voice-cache", character_id="xiyang")
+                return routed, routed_stores, first, tts_calls, repeated, main.audio_service.calls
+        finally:
+            (main.audio_service, main.artifact_store, main.answer_cache,
+             main.conversation_graph.memory, main.conversation_graph.process_conversation) = originals
+
+    routed, routed_stores, first, tts_calls, repeated, total_tts_calls = asyncio.run(run())
+
+    assert routed.character_id == "meiyang" and routed_stores == 0
+    assert repeated.response == first.response == "xiyang的回复"
+    assert repeated.character_id == "xiyang"
+    assert repeated.audio_url == first.audio_url and total_tts_calls == tts_calls  # 复用了缓存的音频
+    print("✅ 路由到其他角色的语音回复没有缓存")
+
+
+if __name__ == "__main__":
+    print("🧪 测试重复提问答案缓存...")
+    test_normalize_and_near_match()
+    test_medically_different_questions_not_matched()
+    test_context_dependent_questions()
+    test_freshness_and_skipped_types()
+    test_isolation_capacity_and_rephrase()
+    test_chat_repeated_question_served_from_cache()
+    test_chat_follow_ups_and_clock_questions_not_replayed()
+    test_voice_chat_routed_reply_not_cached()
+    print("🎉 所有测试通过")
@@ -0,0 +1,94 @@
+"""
+音频产物存储测试
+验证内容寻址去重、TTL过期、容量淘汰和Range请求解析
+"""
+
+import sys
+import os
+import tempfile
+import time
+
+import pytest
+
+# 添加AI Agent路径
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'ai_agent'))
+
+from services.artifact_store import ArtifactStore, detect_audio_format, parse_range_header
+
+
+WAV_HEADER = b"RIFF\x24\x00\x00\x00WAVEfmt "
+
+
+def test_content_addressed_dedup():
+    """相同内容只保存一份，URL稳定"""
+    with tempfile.TemporaryDirectory() as root:
+        store = ArtifactStore(root_dir=root, ttl_seconds=60, max_bytes=1024 * 1024)
+
+        first = store.put(WAV_HEADER + b"hello")
+        second = store.put(WAV_HEADER + b"hello")
+        other = store.put(b"ID3" + b"world")
+
+        assert first.artifact_id == second.artifact_id
+        assert first.url == f"/audio/{first.artifact_id}"
+        assert first.content_type == "audio/wav"
+        assert other.content_type == "audio/mpeg"
+        assert store.get_stats()["writes"] == 2
+        assert store.get_stats()["dedup_hits"] == 1
+        assert len(os.listdir(root)) == 2
+        print(f"✅ 内容寻址: {first.url}")
+
+
+def test_ttl_and_size_cap():
+    """过期产物不可访问，超出容量时淘汰最久未访问的产物"""
+    with tempfile.TemporaryDirectory() as root:
+        store = ArtifactStore(root_dir=root, ttl_seconds=0.05, max_bytes=1024 * 1024)
+        artifact = store.put(b"x" * 10)
+        time.sleep(0.1)
+        assert store.get(artifact.artifact_id) is None
+        assert not artifact.path.exists()
+
+        store = ArtifactStore(root_dir=root, ttl_seconds=60, max_bytes=250)
+        a = store.put(b"a" * 100)
+        b = store.put(b"b" * 100)
+        store.get(a.artifact_id)  # 访问a，使b成为最久未访问
+        c = store.put(b"c" * 100)
+
+        assert store.get(b.artifact_id) is None
+        assert store.get(a.artifact_id) is not None
+        assert store.get(c.artifact_id) is not None
+        assert store.get_stats()["evictions"] == 1
+        print("✅ TTL过期和容量淘汰正常")
+
+
+def test_existing_artifacts_are_reloaded():
+    """重启后仍能访问磁盘上的产物"""
+    with tempfile.TemporaryDirectory() as root:
+        artifact = ArtifactStore(root_dir=root, ttl_seconds=60).put(WAV_HEADER + b"persist")
+        reloaded = ArtifactStore(root_dir=root, ttl_seconds=60)
+
+        assert reloaded.get(artifact.artifact_id).size == artifact.size
+        assert reloaded.get("../../etc/passwd") is None
+        print("✅ 重启后重新加载产物")
+
+
+def test_parse_range_header():
+    """解析Range请求头"""
+    assert parse_range_header("bytes=0-99", 1000) == (0, 99)
+    assert parse_range_header("bytes=900-", 1000) == (900, 999)
+    assert parse_range_header("bytes=-100", 1000) == (900, 999)
+    assert parse_range_header("bytes=500-5000", 1000) == (500, 999)
+    assert parse_range_header(None, 1000) is None
+    assert parse_range_header("bytes=0-1,5-9", 1000) is None
+    with pytest.raises(ValueError):
+        parse_range_header("bytes=1000-", 1000)
+    assert detect_audio_format(b"OggS....") == "ogg"
+    print("✅ Range解析正常")
+
+
+if __name__ == "__main__":
+    print("🧪 测试音频产物存储...")
+    test_content_addressed_dedup()
+    test_ttl_and_size_cap()
+    test_existing_artifacts_are_reloaded()
+    test_parse_range_header()
+    print("🎉 所有测试通过")
@@ -4,6 +4,7 @@
 测试真实音频文件的语音识别和AI回复
 """
 
+import asyncio
 import sys
 import os
 sys.path.append(os.path.join(os.path.dirname(__file__), 'ai_agent'))
@@ -73,7 +74,7 @@ def test_real_asr_input():
         print(f"📝 输入文本：{recognized_text}")
         
         # 使用喜羊羊角色处理
-        response = xiyang_agent.generate_response(recognized_text)
+        response = asyncio.run(xiyang_agent.generate_response(recognized_text))
         
         if response and 'response' in response:
             ai_response = response['response']
@@ -123,7 +123,7 @@ async def test_complete_voice_flow():
         print("⚡ AI处理中...")
         
         # AI生成回复
-        response = xiyang_agent.generate_response(recognized_text)
+        response = await xiyang_agent.generate_response(recognized_text)
         
         if response and 'response' in response:
             ai_response = response['response']
@@ -101,7 +101,7 @@ async def test_real_asr_async():
         print(f"🏷️  输入关键词分析：{', '.join(keywords) if keywords else '一般对话'}")
         
         # AI处理
-        response = xiyang_agent.generate_response(recognized_text)
+        response = await xiyang_agent.generate_response(recognized_text)
         
         if response and 'response' in response:
             ai_response = response['response']
@@ -84,7 +84,7 @@ async def test_json_asr_input():
         enhanced_input = f"用户通过语音说话，ASR识别结果为：{asr_json}，请作为喜羊羊（儿子角色）回应用户的话。"
         
         print("⚡ AI处理中（使用JSON感知提示）...")
-        response = xiyang_agent.generate_response(enhanced_input)
+        response = await xiyang_agent.generate_response(enhanced_input)
         
         if response and 'response' in response:
             ai_response = response['response']
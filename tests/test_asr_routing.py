@@ -202,7 +202,7 @@ async def test_asr_and_routing():
             
             try:
                 character_agent = CharacterAgent(character_id)
-                response = character_agent.generate_response(user_speech)
+                response = await character_agent.generate_response(user_speech)
                 
                 if response and 'response' in response:
                     char_response = response['response']
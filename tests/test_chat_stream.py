@@ -0,0 +1,164 @@
+"""
+流式聊天接口测试
+使用本地OpenAI兼容的流式模拟服务，验证 /chat/stream 的事件顺序（start → token → metadata → audio_segment → done）、
+LLM出错或返回空内容时发送error事件、会话历史只记录一次，以及结构化模式和图片请求只发送一次最终文本
+"""
+
+import asyncio
+import json
+import sys
+import os
+import tempfile
+
+from aiohttp import web
+
+# 添加AI Agent路径
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'ai_agent'))
+
+import main
+from fake_llm import run_with_fake_llm
+from memory.conversation_memory import ConversationMemory
+from services.answer_cache import AnswerCache
+from services.artifact_store import ArtifactStore
+
+
+REPLY = "爸，睡不好别硬撑。晚上少喝点茶，明天我陪您去医院看看。"
+STRUCTURED_CONTENT = json.dumps({
+    "route": "health-concern",
+    "analysis": "父母睡眠不好",
+    "emotion": "caring",
+    "reply": REPLY
+}, ensure_ascii=False)
+
+
+class FakeTTS:
+    """记录合成次数的TTS替身"""
+
+    def __init__(self):
+        self.calls = 0
+
+    async def generate_character_voice(self, character_id, text, speed=1.0, deadline=None):
+        self.calls += 1
+        await asyncio.sleep(0.01)
+        return b"RIFF\x24\x00\x00\x00WAVE" + text.encode("utf-8")
+
+
+def _handler(reply: str = REPLY, fail_stream: bool = False):
+    """模拟服务的处理函数：流式回复请求按 reply 分段返回（fail_stream 时返回400），要求JSON时返回结构化回复"""
+    def handler(body):
+        if body.get("stream") and fail_stream:
+            return web.json_response({"error": {"message": "bad request"}}, status=400)
+        if body.get("response_format", {}).get("type") == "json_object":
+            return STRUCTURED_CONTENT
+        return reply if body.get("stream") else "睡眠\n失眠"
+
+    return handler
+
+
+def _stream_chat(handler, message: str = "我晚上睡不好", user_id: str = "stream-test", **request_fields):
+    """
+    在模拟LLM服务上调用一次流式聊天接口
+
+    Returns:
+        ([(事件名, 数据)], 会话历史, 记忆系统中的对话, TTS合成次数)
+    """
+    fake_tts = FakeTTS()
+
+    async def run():
+        originals = (main.audio_service, main.artifact_store, main.answer_cache, main.conversation_graph.memory)
+        try:
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                main.audio_service = fake_tts
+                main.artifact_store = ArtifactStore(root_dir=os.path.join(tmp_dir, "artifacts"))
+                main.answer_cache = AnswerCache(enabled=False)
+                main.conversation_graph.memory = ConversationMemory(db_path=os.path.join(tmp_dir, "conversations.db"))
+
+                request = main.ChatRequest(message=message, user_id=user_id, include_audio_base64=False, **request_fields)
+                response = await main.text_chat_stream(request)
+                body = "".join([chunk async for chunk in response.body_iterator])
+                session = main.conversation_graph.get_session(user_id, request.character_id, None)
+                stored = main.conversation_graph.memory.get_conversation_history(user_id, request.character_id)
+                return body, list(session.conversation_history), stored
+        finally:
+            main.audio_service, main.artifact_store, main.answer_cache, main.conversation_graph.memory = originals
+
+    body, history, stored = run_with_fake_llm(handler, run)
+    events = []
+    for block in body.strip().split("\n\n"):
+        name, data = block.split("\n", 1)
+        events.append((name[len("event: "):], json.loads(data[len("data: "):])))
+    return events, history, stored, fake_tts.calls
+
+
+def test_event_order_and_history_recorded_once():
+    """流式回复按 start → token → metadata → audio_segment → done 发送，会话历史和记忆只记录一次"""
+    events, history, stored, tts_calls = _stream_chat(_handler(), user_id="stream-order")
+    names = [name for name, _ in events]
+
+    assert names[0] == "start" and names[-1] == "done"
+    assert names.count("metadata") == 1 and names.count("done") == 1
+    metadata_at = names.index("metadata")
+    tokens = [data["content"] for name, data in events if name == "token"]
+    assert len(tokens) > 1  # 逐段发送
+    assert all(name != "token" for name in names[metadata_at:])
+    assert "".join(tokens) == REPLY == events[metadata_at][1]["response"]
+
+    segments = [data for name, data in events if name == "audio_segment"]
+    assert segments and [segment["index"] for segment in segments] == list(range(len(segments)))
+    assert "".join(segment["text"] for segment in segments) == REPLY
+    assert all(segment["audio_url"] and not segment["error"] for segment in segments)
+    assert tts_calls == len(segments)
+    assert events[-1][1]["tts"]["segments"] == len(segments)
+
+    assert [turn["user_message"] for turn in history] == ["我晚上睡不好"]
+    assert len(stored) == 1
+    print(f"✅ 事件顺序: {names}")
+
+
+def test_error_event_on_llm_failure_or_empty_reply():
+    """LLM调用失败或返回空内容时发送error事件后结束，不记入会话历史"""
+    for name, handler in (("failure", _handler(fail_stream=True)), ("empty", _handler(reply=""))):
+        events, history, stored, tts_calls = _stream_chat(handler, user_id=f"stream-{name}")
+        names = [event for event, _ in events]
+
+        assert names[0] == "start" and names[-1] == "error", names
+        assert "metadata" not in names and "done" not in names
+        assert "AI Agent生成回应失败" in events[-1][1]["message"]
+        assert history == [] and stored == []
+        assert tts_calls == 0
+        print(f"✅ {name}: {events[-1][1]['message']}")
+
+
+def test_structured_and_image_replies_send_one_token():
+    """结构化模式和图片请求的回复需要完整结果，只发送一次最终文本"""
+    events, history, _, _ = _stream_chat(_handler(), user_id="stream-structured", reply_mode="structured")
+    tokens = [data["content"] for name, data in events if name == "token"]
+    assert tokens == [REPLY]
+    assert [name for name, _ in events][-1] == "done"
+    assert len(history) == 1
+
+    generate_image = main.image_service.generate_image
+
+    async def failed_image(user_prompt, character_id, style_preference=None):
+        return {"success": False, "error": "图片服务不可用", "character_id": character_id}
+
+    main.image_service.generate_image = failed_image
+    try:
+        events, history, _, _ = _stream_chat(_handler(), message="帮我画一张全家福", user_id="stream-image")
+    finally:
+        main.image_service.generate_image = generate_image
+
+    tokens = [data["content"] for name, data in events if name == "token"]
+    metadata = next(data for name, data in events if name == "metadata")
+    assert len(tokens) == 1 and tokens[0] == metadata["response"] != REPLY  # 回复替换为角色对图片结果的回应
+    assert [name for name, _ in events][-1] == "done"
+    assert len(history) == 1
+    print(f"✅ 结构化和图片请求各发送一次最终文本: {tokens[0]}")
+
+
+if __name__ == "__main__":
+    print("🧪 测试流式聊天接口...")
+    test_event_order_and_history_recorded_once()
+    test_error_event_on_llm_failure_or_empty_reply()
+    test_structured_and_image_replies_send_one_token()
+    print("🎉 所有测试通过")
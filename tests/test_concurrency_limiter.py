@@ -0,0 +1,207 @@
+"""
+上游并发限制测试
+验证最大在途调用数、有界队列的快速拒绝、排队超时以及排队时间统计，
+占用槽位的同步SDK调用不阻塞事件循环，以及下载成品图不占用图片生成槽位
+"""
+
+import asyncio
+import sys
+import os
+import time
+from types import SimpleNamespace
+
+import dashscope
+import pytest
+from aiohttp import web
+
+# 添加AI Agent路径
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'ai_agent'))
+
+from services.audio_service import audio_service
+from services.concurrency_limiter import LimiterRegistry, UpstreamLimiter, UpstreamOverloadedError, upstream_limiters
+from services.image_service import image_service
+
+
+def test_max_in_flight_respected():
+    """同时在途的调用数不超过上限，排队的调用依次获得槽位"""
+    limiter = UpstreamLimiter("llm", max_in_flight=2, max_queue=10, max_queue_wait=5)
+    active = 0
+    peak = 0
+
+    async def call():
+        nonlocal active, peak
+        async with limiter.slot():
+            active += 1
+            peak = max(peak, active)
+            await asyncio.sleep(0.02)
+            active -= 1
+
+    async def run():
+        await asyncio.gather(*[call() for _ in range(8)])
+
+    asyncio.run(run())
+
+    stats = limiter.get_stats()
+    assert peak == 2
+    assert stats["admitted"] == 8
+    assert stats["in_flight"] == 0
+    assert stats["peak_waiting"] == 6
+    assert stats["queue_time_max_ms"] >= 20
+    print(f"✅ 并发上限生效: {stats}")
+
+
+def test_queue_full_rejects_immediately():
+    """队列已满时立即拒绝，不等待上游"""
+    limiter = UpstreamLimiter("image", max_in_flight=1, max_queue=1, max_queue_wait=5)
+
+    async def run():
+        release = asyncio.Event()
+
+        async def hold():
+            async with limiter.slot():
+                await release.wait()
+
+        holders = [asyncio.create_task(hold()) for _ in range(2)]
+        await asyncio.sleep(0.01)  # 一个在途、一个排队
+
+        assert not limiter.has_capacity()
+        with pytest.raises(UpstreamOverloadedError) as early:
+            limiter.ensure_capacity()
+        started = asyncio.get_running_loop().time()
+        with pytest.raises(UpstreamOverloadedError) as rejected:
+            async with limiter.slot():
+                pass
+        elapsed = asyncio.get_running_loop().time() - started
+
+        release.set()
+        await asyncio.gather(*holders)
+        return early.value, rejected.value, elapsed
+
+    early, rejected, elapsed = asyncio.run(run())
+
+    assert early.reason == rejected.reason == "queue_full"
+    assert rejected.upstream == "image"
+    assert elapsed < 0.05
+    assert limiter.get_stats()["rejected_queue_full"] == 2
+    assert limiter.get_stats()["admitted"] == 2
+    print(f"✅ 队列已满快速拒绝: {rejected}")
+
+
+def test_queue_timeout():
+    """排队超过最长等待时间后拒绝，槽位释放后后续调用仍可进入"""
+    limiter = UpstreamLimiter("tts", max_in_flight=1, max_queue=5, max_queue_wait=0.05)
+
+    async def run():
+        async def hold():
+            async with limiter.slot():
+                await asyncio.sleep(0.2)
+
+        holder = asyncio.create_task(hold())
+        await asyncio.sleep(0.01)
+        with pytest.raises(UpstreamOverloadedError) as timed_out:
+            async with limiter.slot():
+                pass
+        await holder
+        async with limiter.slot():
+            pass
+        return timed_out.value
+
+    timed_out = asyncio.run(run())
+
+    stats = limiter.get_stats()
+    assert timed_out.reason == "queue_timeout"
+    assert stats["rejected_queue_timeout"] == 1
+    assert stats["waiting"] == 0
+    assert stats["admitted"] == 2
+    print(f"✅ 排队超时拒绝: {stats}")
+
+
+def test_registry_uses_named_limits():
+    """注册表按上游名称创建独立的并发池"""
+    registry = LimiterRegistry({
+        "llm": {"max_in_flight": 4, "max_queue": 8, "max_queue_wait": 1},
+        "asr": {"max_in_flight": 1, "max_queue": 2, "max_queue_wait": 1}
+    })
+
+    assert registry.get("llm") is registry.get("llm")
+    assert registry.get("asr").max_in_flight == 1
+    assert registry.get("unknown").max_in_flight == 4
+    assert set(registry.get_stats()) == {"llm", "asr", "unknown"}
+    print("✅ 按名称划分并发池")
+
+
+def test_blocking_sdk_call_leaves_event_loop_free():
+    """ASR的同步SDK调用在线程中执行，占用槽位期间其他请求照常运行"""
+    def blocking_call(**kwargs):
+        time.sleep(0.2)
+        return SimpleNamespace(status_code=500, message="upstream error")
+
+    async def run():
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        task = asyncio.create_task(ticker())
+        result = await audio_service.speech_to_text("UklGRg==")
+        task.cancel()
+        return result, ticks
+
+    call = dashscope.MultiModalConversation.call
+    dashscope.MultiModalConversation.call = blocking_call
+    try:
+        result, ticks = asyncio.run(run())
+    finally:
+        dashscope.MultiModalConversation.call = call
+
+    assert not result["success"] and "upstream error" in result["error"]
+    assert ticks >= 10, f"事件循环被阻塞: 200ms内只运行了 {ticks} 次"
+    print(f"✅ 同步SDK调用期间事件循环运行了 {ticks} 次")
+
+
+def test_image_download_outside_generation_slots():
+    """生成槽位全部被占用时，下载成品图仍然立即完成"""
+    limiter = upstream_limiters.get("image")
+
+    async def run():
+        app = web.Application()
+        app.router.add_get("/image.png", lambda request: web.Response(body=b"\x89PNG"))
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+
+        release = asyncio.Event()
+
+        async def hold():
+            async with limiter.slot():
+                await release.wait()
+
+        holders = [asyncio.create_task(hold()) for _ in range(limiter.max_in_flight)]
+        await asyncio.sleep(0.01)
+        try:
+            return await asyncio.wait_for(
+                image_service._download_and_encode_image(f"http://127.0.0.1:{port}/image.png"), timeout=1
+            )
+        finally:
+            release.set()
+            await asyncio.gather(*holders)
+            await runner.cleanup()
+
+    assert asyncio.run(run()) == "iVBORw=="
+    print("✅ 下载成品图不占用图片生成槽位")
+
+
+if __name__ == "__main__":
+    print("🧪 测试上游并发限制...")
+    test_max_in_flight_respected()
+    test_queue_full_rejects_immediately()
+    test_queue_timeout()
+    test_registry_uses_named_limits()
+    test_blocking_sdk_call_leaves_event_loop_free()
+    test_image_download_outside_generation_slots()
+    print("🎉 所有测试通过")
@@ -0,0 +1,79 @@
+"""
+请求时间预算测试
+验证剩余时间不足时跳过可选阶段、超时截断以及降级记录
+"""
+
+import asyncio
+import sys
+import os
+import time
+
+# 添加AI Agent路径
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'ai_agent'))
+
+from services.deadline import Deadline
+
+
+async def _sleep_and_return(value, delay):
+    await asyncio.sleep(delay)
+    return value
+
+
+def test_stage_timeout_is_capped_by_remaining_budget():
+    """阶段超时不超过剩余预算减去预留时间"""
+    deadline = Deadline(budget=10.0)
+
+    assert deadline.budget_for("rag", timeout=8.0, reserve=5.0) <= 5.0
+    assert deadline.budget_for("web_search", timeout=2.0, reserve=5.0) == 2.0
+    assert deadline.degraded_stages == {}
+    print("✅ 超时按剩余预算截短")
+
+
+def test_optional_stage_skipped_when_budget_low():
+    """剩余时间不足时跳过可选阶段并记录降级"""
+    deadline = Deadline(budget=1.0)
+    started = []
+
+    async def cot():
+        started.append("cot")
+        return "推理结果"
+
+    result = asyncio.run(deadline.run("cot", cot, timeout=20.0, min_seconds=5.0, default="跳过"))
+
+    assert result == "跳过"
+    assert started == []
+    assert deadline.degraded_stages == {"cot": "skipped"}
+    print(f"✅ 可选阶段被跳过: {deadline.summary()}")
+
+
+def test_stage_cut_short_on_timeout():
+    """阶段执行超过可用时间时被截断"""
+    deadline = Deadline(budget=0.2)
+
+    start = time.perf_counter()
+    result = asyncio.run(deadline.run("tts", lambda: _sleep_and_return(b"audio", 1.0), timeout=30.0))
+    elapsed = time.perf_counter() - start
+
+    assert result is None
+    assert elapsed < 0.5
+    assert deadline.degraded_stages == {"tts": "timeout"}
+    print(f"✅ 阶段被截断，耗时 {elapsed:.2f}s")
+
+
+def test_expired_deadline():
+    """预算耗尽后剩余时间为0"""
+    deadline = Deadline(budget=10.0, started_at=time.monotonic() - 11.0)
+
+    assert deadline.expired()
+    assert deadline.remaining() == 0
+    assert deadline.budget_for("query_expansion", timeout=5.0) is None
+    print("✅ 预算耗尽检测正常")
+
+
+if __name__ == "__main__":
+    print("🧪 测试请求时间预算...")
+    test_stage_timeout_is_capped_by_remaining_budget()
+    test_optional_stage_skipped_when_budget_low()
+    test_stage_cut_short_on_timeout()
+    test_expired_deadline()
+    print("🎉 所有测试通过")
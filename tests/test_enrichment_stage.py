@@ -0,0 +1,71 @@
+"""
+并发增强阶段测试
+验证各分支并发执行、独立超时以及失败隔离
+"""
+
+import asyncio
+import sys
+import os
+import time
+
+# 添加AI Agent路径
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'ai_agent'))
+
+from services.enrichment_service import EnrichmentStage, EnrichmentBranch
+
+
+async def _sleep_and_return(value, delay):
+    await asyncio.sleep(delay)
+    return value
+
+
+async def _fail_after(delay):
+    await asyncio.sleep(delay)
+    raise RuntimeError("模拟搜索失败")
+
+
+def test_branches_run_concurrently():
+    """三个分支并发执行，总耗时接近最慢的分支"""
+    stage = EnrichmentStage()
+    branches = {
+        name: EnrichmentBranch(name=name, factory=lambda n=name: _sleep_and_return(n, 0.2), timeout=1.0)
+        for name in ["web_search", "rag", "image"]
+    }
+
+    start = time.perf_counter()
+    result = asyncio.run(stage.run(branches))
+    elapsed = time.perf_counter() - start
+
+    assert elapsed < 0.5, f"分支没有并发执行: {elapsed:.2f}s"
+    for name in branches:
+        assert result.get(name) == name
+    print(f"✅ 并发执行耗时 {elapsed:.2f}s")
+
+
+def test_partial_results_on_timeout_and_error():
+    """超时和失败的分支不影响其他分支的结果"""
+    stage = EnrichmentStage()
+    branches = {
+        "web_search": EnrichmentBranch(name="web_search", factory=lambda: _fail_after(0.05), timeout=1.0),
+        "rag": EnrichmentBranch(name="rag", factory=lambda: _sleep_and_return("rag", 0.05), timeout=1.0),
+        "image": EnrichmentBranch(name="image", factory=lambda: _sleep_and_return("image", 2.0), timeout=0.1),
+    }
+
+    result = asyncio.run(stage.run(branches))
+
+    assert result.get("rag") == "rag"
+    assert result.get("web_search") is None
+    assert result.get("image", "fallback") == "fallback"
+
+    summary = result.summary()
+    assert summary["web_search"]["status"] == "error"
+    assert summary["image"]["status"] == "timeout"
+    assert summary["rag"]["status"] == "ok"
+    print(f"✅ 部分结果: {summary}")
+
+
+if __name__ == "__main__":
+    print("🧪 测试并发增强阶段...")
+    test_branches_run_concurrently()
+    test_partial_results_on_timeout_and_error()
+    print("🎉 所有测试通过")
@@ -0,0 +1,116 @@
+"""
+对话图并行分支测试
+使用本地OpenAI兼容的模拟服务（CoT请求按设定延迟返回），验证记忆查询、RAG检索和CoT推理并行执行并在回复前汇合、
+各节点耗时记录在context中、记忆分支超时时降级，以及CoT在汇合时仍未完成时由回复节点与草稿回复推测执行
+"""
+
+import asyncio
+import sys
+import os
+import tempfile
+import time
+
+# 添加AI Agent路径
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'ai_agent'))
+
+from fake_llm import fake_llm
+from config import Config
+from graph.conversation_graph import ConversationGraph
+from memory.conversation_memory import ConversationMemory
+
+
+def _fake_llm_handler(state: dict):
+    """模拟服务的处理函数：CoT请求（只有一条用户消息）延迟cot_delay秒返回"""
+    async def handler(body):
+        is_cot = len(body["messages"]) == 1 and body["messages"][0]["role"] == "user"
+        state["requests"].append("cot" if is_cot else "reply")
+        if is_cot:
+            await asyncio.sleep(state["cot_delay"])
+            return "1. 父母睡眠不好\n2. 建议规律作息"
+        return "爸，您早点休息，别太累了。"
+
+    return handler
+
+
+def _graph(tmp_dir: str, memory_delay: float) -> ConversationGraph:
+    """创建使用临时记忆库的对话图，记忆查询额外耗时memory_delay秒"""
+    graph = ConversationGraph(checkpointer="none")
+    graph.memory = ConversationMemory(db_path=os.path.join(tmp_dir, "conversations.db"))
+    lookup = graph.memory.get_relevant_memory
+
+    def slow_lookup(*args, **kwargs):
+        time.sleep(memory_delay)
+        return lookup(*args, **kwargs)
+
+    graph.memory.get_relevant_memory = slow_lookup
+    return graph
+
+
+def _run_turns(graph: ConversationGraph, state: dict, cot_delays):
+    """按给定的CoT延迟依次运行多轮对话，返回每轮的 (结果, 耗时, 模拟服务收到的请求)"""
+    async def run():
+        async with fake_llm(_fake_llm_handler(state)):
+            turns = []
+            for index, cot_delay in enumerate(cot_delays):
+                state["cot_delay"], state["requests"] = cot_delay, []
+                started_at = time.perf_counter()
+                result = await graph.process_conversation(
+                    "我晚上睡不好", user_id=f"branch-test-{index}", character_id="xiyang"
+                )
+                turns.append((result, time.perf_counter() - started_at, state["requests"]))
+            return turns
+
+    return asyncio.run(run())
+
+
+def test_branches_run_in_parallel():
+    """记忆查询和CoT推理同时进行，CoT在汇合前完成时直接生成CoT增强回复"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        state = {}
+        graph = _graph(tmp_dir, memory_delay=0.3)
+        [(result, elapsed, requests)] = _run_turns(graph, state, [0.3])
+
+    timings = result["context"]["node_timings"]
+    assert timings["memory_branch"] >= 250 and timings["cot_branch"] >= 250
+    # 串行执行至少需要两个分支的耗时之和
+    assert elapsed * 1000 < timings["memory_branch"] + timings["cot_branch"], f"分支没有并行执行: {elapsed:.2f}s"
+    assert {"start", "analyze_and_route_query", "rag_branch", "join_branches", "xiyang_node", "output"} <= set(timings)
+    assert sorted(requests) == ["cot", "reply"]
+    assert "speculative_cot" not in result["context"]
+    assert result["context"]["cot_reasoning"]
+    print(f"✅ 并行分支 {elapsed * 1000:.0f}ms，各节点耗时: {timings}")
+
+
+def test_branch_timeouts():
+    """记忆查询超时时降级；CoT超过分支超时后由回复节点继续等待，在预算内完成时使用增强回复，否则使用草稿"""
+    overrides = {"MEMORY_LOOKUP_TIMEOUT": 0.1, "COT_BRANCH_TIMEOUT": 0.1, "COT_SPECULATIVE_BUDGET_SECONDS": 0.4}
+    originals = {name: getattr(Config, name) for name in overrides}
+    for name, value in overrides.items():
+        setattr(Config, name, value)
+    try:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            state = {}
+            graph = _graph(tmp_dir, memory_delay=0.3)
+            (informed, _, informed_requests), (drafted, drafted_elapsed, _) = _run_turns(graph, state, [0.2, 1.0])
+    finally:
+        for name, value in originals.items():
+            setattr(Config, name, value)
+
+    assert informed["degraded_stages"]["memory"] == "timeout"
+    assert informed["context"]["node_timings"]["memory_branch"] < 250
+    assert informed["context"]["speculative_cot"] == "cot"
+    assert sorted(informed_requests) == ["cot", "reply", "reply"]  # CoT、草稿回复、CoT增强回复
+
+    assert drafted["context"]["speculative_cot"] == "draft_timeout"
+    assert drafted["degraded_stages"]["cot"] == "timeout"
+    assert drafted["response"] == "爸，您早点休息，别太累了。"
+    assert drafted_elapsed < 0.8, f"没有在CoT预算后使用草稿: {drafted_elapsed:.2f}s"
+    print(f"✅ 分支超时: 记忆降级 {informed['degraded_stages']}，CoT路径 "
+          f"{informed['context']['speculative_cot']} / {drafted['context']['speculative_cot']}")
+
+
+if __name__ == "__main__":
+    print("🧪 测试对话图并行分支...")
+    test_branches_run_in_parallel()
+    test_branch_timeouts()
+    print("🎉 所有测试通过")
@@ -0,0 +1,109 @@
+"""
+对话图编译与检查点测试
+使用本地OpenAI兼容的模拟服务，验证对话图只编译一次、启用SQLite检查点后同一线程的多轮对话
+从检查点恢复消息（重启后仍可恢复）、记忆上下文每轮按本轮消息重新查询，不同线程互不影响，且每个线程只保留最新的检查点
+"""
+
+import sys
+import os
+import tempfile
+
+# 添加AI Agent路径
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'ai_agent'))
+
+from fake_llm import run_with_fake_llm
+from graph.conversation_graph import ConversationGraph
+from memory.conversation_memory import ConversationMemory
+
+
+def _with_fake_llm(scenario):
+    """在返回固定回复的模拟LLM服务上运行场景"""
+    return run_with_fake_llm(lambda body: "奶奶，我在呢！", scenario)
+
+
+def _graph(tmp_dir: str, checkpointer: str) -> ConversationGraph:
+    graph = ConversationGraph(checkpointer=checkpointer, checkpoint_db=os.path.join(tmp_dir, "checkpoints.db"))
+    graph.memory = ConversationMemory(db_path=os.path.join(tmp_dir, "conversations.db"))
+    return graph
+
+
+def _record_memory_lookups(graph: ConversationGraph, queries: list):
+    """记录记忆上下文每次查询的消息"""
+    lookup = graph.memory.get_relevant_memory
+
+    def counted(*args, **kwargs):
+        queries.append(kwargs["query"])
+        return lookup(*args, **kwargs)
+
+    graph.memory.get_relevant_memory = counted
+
+
+def test_compiled_once_without_checkpointer():
+    """未启用检查点时图在初始化时编译一次，每轮从空的消息历史开始"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        graph = _graph(tmp_dir, "none")
+
+        async def scenario():
+            first = await graph.process_conversation("你好", user_id="plain", character_id="lanyang")
+            second = await graph.process_conversation("在干嘛呢", user_id="plain", character_id="lanyang")
+            return first, second
+
+        first, second = _with_fake_llm(scenario)
+
+    assert graph.compilations == 1
+    assert not first["context"]["resumed"] and not second["context"]["resumed"]
+    assert second["context"]["conversation_turn"] == 1
+    assert graph.get_stats() == {"checkpointer": "none", "compilations": 1, "turns": 2, "resumed_turns": 0}
+    print(f"✅ 只编译一次: {graph.get_stats()}")
+
+
+def test_sqlite_checkpoint_resumes_thread():
+    """同一线程的后续轮次从检查点恢复消息，重启后仍可恢复，其他线程不受影响；记忆上下文每轮按本轮消息查询"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        queries = []
+        graph = _graph(tmp_dir, "sqlite")
+        _record_memory_lookups(graph, queries)
+
+        async def scenario():
+            first = await graph.process_conversation("你好", user_id="alice", character_id="lanyang")
+            second = await graph.process_conversation("在干嘛呢", user_id="alice", character_id="lanyang")
+            other = await graph.process_conversation(
+                "你好", user_id="alice", character_id="lanyang", thread_id="another-thread"
+            )
+            await graph.aclose()
+
+            restarted = _graph(tmp_dir, "sqlite")
+            _record_memory_lookups(restarted, queries)
+            third = await restarted.process_conversation("吃饭了吗", user_id="alice", character_id="lanyang")
+            # 通过检查点保存器的公开接口统计每个线程保留的检查点
+            checkpoints = {
+                thread_id: len([
+                    checkpoint async for checkpoint in restarted._saver.alist({"configurable": {"thread_id": thread_id}})
+                ])
+                for thread_id in ("alice_lanyang", "another-thread")
+            }
+            await restarted.aclose()
+            return first, second, other, third, restarted, checkpoints
+
+        first, second, other, third, restarted, checkpoints = _with_fake_llm(scenario)
+
+    assert not first["context"]["resumed"]
+    assert second["context"]["resumed"]
+    assert second["context"]["conversation_turn"] == 3  # 上一轮的问答 + 本轮输入
+    assert second["response"] == "奶奶，我在呢！"
+    assert not other["context"]["resumed"]
+    assert third["context"]["resumed"] and third["context"]["conversation_turn"] == 5
+    # 恢复的线程也按本轮消息重新查询记忆
+    assert queries == ["你好", "在干嘛呢", "你好", "吃饭了吗"]
+    assert graph.compilations == 1
+    assert graph.get_stats()["resumed_turns"] == 1
+    assert restarted.get_stats()["resumed_turns"] == 1
+    assert checkpoints == {"alice_lanyang": 1, "another-thread": 1}
+    print(f"✅ 检查点恢复: {graph.get_stats()}，每个线程的检查点数 {checkpoints}")
+
+
+if __name__ == "__main__":
+    print("🧪 测试对话图编译与检查点...")
+    test_compiled_once_without_checkpointer()
+    test_sqlite_checkpoint_resumes_thread()
+    print("🎉 所有测试通过")
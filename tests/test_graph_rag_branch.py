@@ -0,0 +1,150 @@
+"""
+对话图知识检索分支测试
+使用本地OpenAI兼容的模拟服务，验证知识检索分支实际检索知识图谱并把结果用于生成回复、
+检索超时时降级且不阻塞回复、复用本次请求已完成的检索结果、不需要知识增强的对话（即使角色有上传文档）不检索，
+以及每轮记录检索状态和耗时
+"""
+
+import asyncio
+import sys
+import os
+import tempfile
+import time
+
+# 添加AI Agent路径
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'ai_agent'))
+
+from fake_llm import run_with_fake_llm
+from config import Config
+from graph.conversation_graph import ConversationGraph
+from memory.conversation_memory import ConversationMemory
+from models.state import GraphRAGResult
+from rag.graph_rag import graph_rag
+
+
+RAG_HEADER = "【📚 文档参考信息】"
+
+
+def _run(scenario):
+    """在模拟LLM服务上运行场景，返回 (场景结果, 角色回复请求的系统提示词)"""
+    reply_prompts = []
+
+    def handler(body):
+        messages = body["messages"]
+        if "请为以下查询生成相关的关键词" in messages[0]["content"]:
+            return "高血压\n血压"
+        if messages[0]["role"] == "system":
+            reply_prompts.append(messages[0]["content"])
+        return "爸，血压高要按时吃药，少吃盐。"
+
+    async def run():
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            graph = ConversationGraph(checkpointer="none")
+            graph.memory = ConversationMemory(db_path=os.path.join(tmp_dir, "conversations.db"))
+            return await scenario(graph)
+
+    return run_with_fake_llm(handler, run), reply_prompts
+
+
+def test_retrieval_feeds_reply():
+    """知识类问题实际检索知识图谱，检索结果进入角色回复的提示词，并记录检索耗时"""
+    async def scenario(graph):
+        result = await graph.process_conversation("什么是高血压，血压高怎么办", user_id="rag-test", character_id="xiyang")
+        return result, graph.get_rag_stats()
+
+    (result, stats), reply_prompts = _run(scenario)
+
+    retrieval = result["rag_retrieval"]
+    assert retrieval["status"] == "retrieved" and retrieval["contexts"] > 0
+    assert retrieval["latency_ms"] > 0
+    assert result["rag_enhanced"] and result["context"]["rag_retrieval"] == retrieval
+    assert reply_prompts and all(RAG_HEADER in prompt for prompt in reply_prompts)
+    assert stats["turns"] == {"retrieved": 1} and stats["latency_p50_ms"] == retrieval["latency_ms"]
+    print(f"✅ 检索 {retrieval['contexts']} 个知识上下文，耗时 {retrieval['latency_ms']}ms")
+
+
+def test_retrieval_timeout_and_reuse():
+    """检索超过RAG_TIMEOUT时降级且不阻塞回复；传入本次请求已完成的检索结果时直接复用，不再检索"""
+    calls = {"queries": 0}
+    query_knowledge = graph_rag.query_knowledge
+
+    async def slow_query(*args, **kwargs):
+        calls["queries"] += 1
+        await asyncio.sleep(1.0)
+        return await query_knowledge(*args, **kwargs)
+
+    reused = GraphRAGResult(relevant_contexts=[{
+        "content": "上传的体检报告显示血压偏高",
+        "domain": "document",
+        "type": "document_chunk",
+        "relevance_score": 0.9,
+        "metadata": {},
+        "source": "character_document"
+    }])
+
+    async def scenario(graph):
+        started_at = time.perf_counter()
+        timed_out = await graph.process_conversation("什么是高血压", user_id="rag-timeout", character_id="xiyang")
+        elapsed = time.perf_counter() - started_at
+        reuse = await graph.process_conversation(
+            "什么是高血压", user_id="rag-reuse", character_id="xiyang", rag_result=reused
+        )
+        return timed_out, elapsed, reuse
+
+    original_timeout = Config.RAG_TIMEOUT
+    Config.RAG_TIMEOUT = 0.1
+    graph_rag.query_knowledge = slow_query
+    try:
+        (timed_out, elapsed, reuse), reply_prompts = _run(scenario)
+    finally:
+        Config.RAG_TIMEOUT = original_timeout
+        graph_rag.query_knowledge = query_knowledge
+
+    assert timed_out["rag_retrieval"]["status"] == "timeout"
+    assert timed_out["degraded_stages"]["rag"] == "timeout"
+    assert not timed_out["rag_enhanced"]
+    assert elapsed < 1.0, f"检索超时阻塞了回复: {elapsed:.2f}s"
+
+    assert calls["queries"] == 1
+    assert reuse["rag_retrieval"]["status"] == "reused" and reuse["rag_retrieval"]["contexts"] == 1
+    assert "上传的体检报告显示血压偏高" in reply_prompts[-1]
+    print(f"✅ 检索超时降级 {timed_out['rag_retrieval']}，复用检索 {reuse['rag_retrieval']}")
+
+
+def test_small_talk_skips_retrieval():
+    """问候和闲聊不检索，角色有上传文档时也一样，也不读取文档列表"""
+    calls = {"queries": 0, "documents": 0}
+    query_knowledge = graph_rag.query_knowledge
+    get_character_documents = graph_rag.get_character_documents
+
+    async def counted_query(*args, **kwargs):
+        calls["queries"] += 1
+        return await query_knowledge(*args, **kwargs)
+
+    def documents(character_id):
+        calls["documents"] += 1
+        return [{"file_id": "report", "filename": "体检报告.pdf"}]
+
+    async def scenario(graph):
+        return await graph.process_conversation("早上好", user_id="rag-small-talk", character_id="xiyang")
+
+    graph_rag.query_knowledge = counted_query
+    graph_rag.get_character_documents = documents
+    try:
+        result, reply_prompts = _run(scenario)
+    finally:
+        graph_rag.query_knowledge = query_knowledge
+        graph_rag.get_character_documents = get_character_documents
+
+    assert result["rag_retrieval"]["status"] == "skipped"
+    assert calls == {"queries": 0, "documents": 0}
+    assert reply_prompts and all(RAG_HEADER not in prompt for prompt in reply_prompts)
+    print(f"✅ 问候不检索: {result['rag_retrieval']}")
+
+
+if __name__ == "__main__":
+    print("🧪 测试对话图知识检索分支...")
+    test_retrieval_feeds_reply()
+    test_retrieval_timeout_and_reuse()
+    test_small_talk_skips_retrieval()
+    print("🎉 所有测试通过")
@@ -0,0 +1,107 @@
+"""
+问候语音频缓存测试
+验证首次生成后命中缓存、磁盘持久化以及角色配置变化后失效
+"""
+
+import asyncio
+import sys
+import os
+import tempfile
+
+# 添加AI Agent路径
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'ai_agent'))
+
+import services.greeting_audio_cache as greeting_module
+from config import CHARACTER_CONFIGS
+from services.artifact_store import ArtifactStore
+from services.greeting_audio_cache import GreetingAudioCache
+
+
+class FakeTTS:
+    """记录合成次数的TTS替身"""
+
+    def __init__(self):
+        self.calls = []
+
+    async def generate_character_voice(self, character_id, text, speed=1.0, deadline=None):
+        self.calls.append((character_id, text, speed))
+        await asyncio.sleep(0.01)
+        return b"RIFF\x24\x00\x00\x00WAVE" + f"{character_id}:{text}:{speed}".encode("utf-8")
+
+
+def _with_fakes(test):
+    """把TTS和产物存储替换为测试替身，测试结束后还原"""
+    def wrapper():
+        original_audio, original_store = greeting_module.audio_service, greeting_module.artifact_store
+        with tempfile.TemporaryDirectory() as root:
+            fake_tts = FakeTTS()
+            greeting_module.audio_service = fake_tts
+            greeting_module.artifact_store = ArtifactStore(root_dir=os.path.join(root, "artifacts"))
+            try:
+                test(fake_tts, os.path.join(root, "greetings"))
+            finally:
+                greeting_module.audio_service = original_audio
+                greeting_module.artifact_store = original_store
+    wrapper.__name__ = test.__name__
+    return wrapper
+
+
+@_with_fakes
+def test_greeting_rendered_once(fake_tts, cache_dir):
+    """并发和重复请求只合成一次"""
+    cache = GreetingAudioCache(cache_dir=cache_dir)
+    greeting = CHARACTER_CONFIGS["xiyang"]["greeting"]
+
+    async def run():
+        results = await asyncio.gather(*[cache.get("xiyang", greeting) for _ in range(5)])
+        return results + [await cache.get("xiyang", greeting)]
+
+    results = asyncio.run(run())
+
+    assert len(fake_tts.calls) == 1
+    assert len({r.audio_url for r in results}) == 1
+    assert results[0].audio_url.startswith("/audio/")
+    print(f"✅ 只合成一次: {cache.get_stats()}")
+
+
+@_with_fakes
+def test_cache_persists_across_restarts(fake_tts, cache_dir):
+    """重启后从磁盘加载，不再调用TTS"""
+    asyncio.run(GreetingAudioCache(cache_dir=cache_dir).warm_up())
+    rendered = len(fake_tts.calls)
+
+    restarted = GreetingAudioCache(cache_dir=cache_dir)
+    summary = asyncio.run(restarted.warm_up())
+
+    assert rendered == summary["total"]
+    assert len(fake_tts.calls) == rendered
+    assert summary["ready"] == summary["total"]
+    print(f"✅ 重启后命中磁盘缓存: {summary}")
+
+
+@_with_fakes
+def test_config_change_invalidates(fake_tts, cache_dir):
+    """角色语速变化后重新合成，旧音频被清理"""
+    cache = GreetingAudioCache(cache_dir=cache_dir)
+    greeting = CHARACTER_CONFIGS["meiyang"]["greeting"]
+    original_speed = CHARACTER_CONFIGS["meiyang"]["voice_speed"]
+
+    try:
+        asyncio.run(cache.get("meiyang", greeting))
+        CHARACTER_CONFIGS["meiyang"]["voice_speed"] = original_speed + 0.2
+        asyncio.run(cache.get("meiyang", greeting))
+        removed = cache.prune_stale()
+    finally:
+        CHARACTER_CONFIGS["meiyang"]["voice_speed"] = original_speed
+
+    assert [call[2] for call in fake_tts.calls] == [original_speed, original_speed + 0.2]
+    assert removed == 1
+    print("✅ 配置变化后缓存失效")
+
+
+if __name__ == "__main__":
+    print("🧪 测试问候语音频缓存...")
+    test_greeting_rendered_once()
+    test_cache_persists_across_restarts()
+    test_config_change_invalidates()
+    print("🎉 所有测试通过")
@@ -0,0 +1,123 @@
+"""
+本地意图分类器测试
+验证标注样本和留出样本上本地决策的准确率和覆盖率、否定词和证据不足时不本地决策、明确的消息在本地直接路由、需要结合语境的消息交给LLM，
+以及路由器对本地能确定的消息不再调用LLM
+"""
+
+import sys
+import os
+from datetime import datetime
+
+# 添加AI Agent路径
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'ai_agent'))
+
+from fake_llm import run_with_fake_llm
+from benchmark_intent_classifier import HELD_OUT_SAMPLES, NEGATED_SAMPLES, evaluate
+from graph.intent_classifier import LocalIntentClassifier
+from graph.router import FamilyBotRouter
+from models.state import ConversationState
+
+
+def test_labelled_accuracy_and_coverage():
+    """标注样本上本地决策准确率不低于90%，且大部分消息不需要调用LLM"""
+    report = evaluate(LocalIntentClassifier(margin=0.5, min_score=1.5))
+
+    assert report["accuracy"] >= 0.9, report["errors"]
+    assert report["coverage"] >= 0.7
+    assert report["p99_us"] < 1000
+    print(f"✅ 覆盖率 {report['coverage']:.1%}，准确率 {report['accuracy']}，p99 {report['p99_us']}µs")
+
+
+def test_held_out_and_negated_samples():
+    """没有用来调整词表的留出样本上准确率不低于90%；带否定词的样本不按被否定的主题本地路由"""
+    held_out = evaluate(LocalIntentClassifier(margin=0.5, min_score=1.5), HELD_OUT_SAMPLES)
+    negated = evaluate(LocalIntentClassifier(margin=0.5, min_score=1.5), NEGATED_SAMPLES)
+
+    assert held_out["accuracy"] >= 0.9, held_out["errors"]
+    assert held_out["coverage"] >= 0.6
+    assert negated["errors"] == []
+    print(f"✅ 留出样本覆盖率 {held_out['coverage']:.1%}，准确率 {held_out['accuracy']}；否定样本 {negated['decided']} 条本地决策")
+
+
+def test_negation_and_weak_evidence():
+    """前面有“不/没”的词不计分；只命中一个低权重的词时交给LLM"""
+    classifier = LocalIntentClassifier(margin=0.5, min_score=1.5)
+
+    recovered = classifier.classify("我头不疼了，挺好的")
+    not_sad = classifier.classify("我不难过")
+    toothache = classifier.classify("牙疼")
+    headache = classifier.classify("我头疼")
+    knee = classifier.classify("膝盖疼")
+
+    assert recovered.negated == ["疼"] and "health-concern" not in recovered.scores and not recovered.decisive
+    assert not_sad.negated == ["难过"] and not not_sad.decisive
+    assert toothache.route == "health-concern" and not toothache.decisive  # 只有“疼”(1.5)
+    assert headache.decisive and headache.route == "health-concern"  # “头疼”是高权重词
+    assert knee.decisive and knee.matched == ["膝盖", "疼"]  # 两个低权重词
+    assert classifier.get_stats()["negated"] == 2
+    print(f"✅ 否定和证据不足: {recovered.negated}, {not_sad.negated}, 牙疼 -> LLM")
+
+
+def test_decisive_and_ambiguous():
+    """明确的消息本地给出路由和角色，角色称呼与主题冲突或没有命中任何词时交给LLM"""
+    classifier = LocalIntentClassifier(margin=0.5, min_score=1.5)
+
+    health = classifier.classify("今天血压有点高，头晕")
+    grandson = classifier.classify("孙子，考试考得怎么样")
+    conflicting = classifier.classify("儿子，我最近头晕")
+    unknown = classifier.classify("那个东西放哪了")
+
+    assert health.decisive and health.route == "health-concern" and health.character_preference is None
+    assert grandson.decisive and grandson.character_preference == "lanyang"
+    assert "头疼" not in health.matched and "头晕" in health.matched
+    assert not conflicting.decisive
+    assert not unknown.decisive and unknown.confidence == 0.0
+
+    stats = classifier.get_stats()
+    assert (stats["decisive"], stats["llm_fallbacks"]) == (2, 2)
+    assert stats["routes"] == {"health-concern": 1, "character-lanyang": 1}
+    print(f"✅ 本地决策统计: {stats}")
+
+
+def test_router_skips_llm_for_clear_messages():
+    """未指定角色时，本地能确定的消息不调用LLM，不确定的消息仍由LLM路由"""
+    state = {"requests": 0}
+
+    def conversation(text):
+        return ConversationState(
+            user_id="router-test",
+            timestamp=datetime.now().isoformat(),
+            user_input=text,
+            selected_character=""
+        )
+
+    def handler(body):
+        state["requests"] += 1
+        return '{"type": "health-concern", "logic": "LLM路由", "confidence": 0.8}'
+
+    async def scenario():
+        router = FamilyBotRouter()
+        clear = await router.analyze_and_route_query(conversation("闺女，妈想你了"))
+        requests_after_clear = state["requests"]
+        ambiguous = await router.analyze_and_route_query(conversation("儿子，我最近头晕"))
+        return clear, requests_after_clear, ambiguous
+
+    clear, requests_after_clear, ambiguous = run_with_fake_llm(handler, scenario)
+
+    assert requests_after_clear == 0
+    assert clear.router.type == "character-meiyang"
+    assert clear.selected_character == "meiyang"
+    assert clear.router.logic.startswith("本地意图分类")
+    assert state["requests"] == 1
+    assert ambiguous.router.logic == "LLM路由"
+    print(f"✅ 本地路由: {clear.router.logic}；LLM路由: {ambiguous.router.type}")
+
+
+if __name__ == "__main__":
+    print("🧪 测试本地意图分类器...")
+    test_labelled_accuracy_and_coverage()
+    test_held_out_and_negated_samples()
+    test_negation_and_weak_evidence()
+    test_decisive_and_ambiguous()
+    test_router_skips_llm_for_clear_messages()
+    print("🎉 所有测试通过")
@@ -0,0 +1,72 @@
+"""
+异步LLM客户端池测试
+使用本地OpenAI兼容的模拟服务，验证客户端复用和并发请求真正重叠
+"""
+
+import asyncio
+import sys
+import os
+import time
+
+# 添加AI Agent路径
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'ai_agent'))
+
+from fake_llm import start_fake_llm
+from services.llm_client import LLMClientPool
+
+
+def test_concurrent_calls_overlap():
+    """并发的LLM调用共享一个客户端且在事件循环中重叠执行"""
+    async def run():
+        async def echo_after_delay(body):
+            await asyncio.sleep(0.3)
+            return body["messages"][-1]["content"]
+
+        runner, base_url = await start_fake_llm(echo_after_delay)
+        pool = LLMClientPool(max_connections=10, max_retries=0)
+        try:
+            client = pool.get_client("test-key", base_url)
+            assert pool.get_client("test-key", base_url) is client
+
+            start = time.perf_counter()
+            responses = await asyncio.gather(*[
+                client.chat.completions.create(
+                    model="fake-model",
+                    messages=[{"role": "user", "content": f"消息{i}"}]
+                )
+                for i in range(5)
+            ])
+            elapsed = time.perf_counter() - start
+        finally:
+            await pool.aclose()
+            await runner.cleanup()
+        return responses, elapsed, pool.get_stats()
+
+    responses, elapsed, stats = asyncio.run(run())
+
+    assert [r.choices[0].message.content for r in responses] == [f"消息{i}" for i in range(5)]
+    assert elapsed < 1.0, f"LLM调用没有并发执行: {elapsed:.2f}s"
+    assert stats["clients_created"] == 1
+    print(f"✅ 5个并发调用耗时 {elapsed:.2f}s")
+
+
+def test_separate_event_loops_get_separate_clients():
+    """不同事件循环（如脚本中多次asyncio.run）使用各自的客户端"""
+    pool = LLMClientPool()
+
+    async def get_client():
+        return pool.get_client("test-key", "http://127.0.0.1:1/v1")
+
+    first = asyncio.run(get_client())
+    second = asyncio.run(get_client())
+
+    assert first is not second
+    assert pool.get_stats()["clients_created"] == 2
+    print("✅ 事件循环隔离正常")
+
+
+if __name__ == "__main__":
+    print("🧪 测试异步LLM客户端池...")
+    test_concurrent_calls_overlap()
+    test_separate_event_loops_get_separate_clients()
+    print("🎉 所有测试通过")
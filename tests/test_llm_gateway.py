@@ -0,0 +1,220 @@
+"""
+LLM网关测试
+使用本地OpenAI兼容的模拟服务，验证429/5xx重试、不可重试错误直接抛出、对冲请求（等待时间按任务和模型统计）、延迟直方图、按任务选择模型，以及调用受请求时间预算约束
+"""
+
+import asyncio
+import sys
+import os
+import time
+
+import openai
+import pytest
+from aiohttp import web
+
+# 添加AI Agent路径
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'ai_agent'))
+
+from fake_llm import start_fake_llm
+from services.concurrency_limiter import UpstreamLimiter
+from services.deadline import Deadline
+from services.llm_client import LLMClientPool
+from services.llm_gateway import LLMGateway
+from services.llm_providers import ProviderRegistry
+
+
+def _handler(behaviour, state: dict):
+    """模拟服务的处理函数，behaviour(第几次请求) 返回 (延迟秒数, 状态码)"""
+    async def handler(body):
+        state["requests"] += 1
+        delay, status = behaviour(state["requests"])
+        await asyncio.sleep(delay)
+        if status != 200:
+            return web.json_response({"error": {"message": f"status {status}"}}, status=status)
+        return f"第{state['requests']}次请求"
+
+    return handler
+
+
+def _run_with_gateway(behaviour, scenario, **gateway_options):
+    """启动模拟服务和网关，执行scenario(gateway)"""
+    async def run():
+        state = {"requests": 0}
+        runner, base_url = await start_fake_llm(_handler(behaviour, state))
+        pool = LLMClientPool(max_retries=0)
+        gateway = LLMGateway(
+            registry=ProviderRegistry(
+                [{"name": "fake", "api_key": "test-key", "base_url": base_url}], client_pool=pool
+            ),
+            limiter=UpstreamLimiter("llm", max_in_flight=10, max_queue=10, max_queue_wait=5),
+            retry_base_delay=0.01,
+            retry_max_delay=0.05,
+            **gateway_options
+        )
+        try:
+            return await scenario(gateway), gateway, state
+        finally:
+            await pool.aclose()
+            await runner.cleanup()
+
+    return asyncio.run(run())
+
+
+MESSAGES = [{"role": "user", "content": "你好"}]
+
+
+def test_retries_on_429_and_5xx():
+    """429和503按退避重试后成功"""
+    statuses = {1: 429, 2: 503}
+
+    async def scenario(gateway):
+        return await gateway.chat_completion(messages=MESSAGES, model="fake-model", hedge=False)
+
+    response, gateway, state = _run_with_gateway(
+        lambda n: (0, statuses.get(n, 200)), scenario, max_retries=2
+    )
+
+    assert response.choices[0].message.content == "第3次请求"
+    assert state["requests"] == 3
+    assert gateway.get_stats()["retries"] == 2
+    assert gateway.get_stats()["errors"] == 2
+    print(f"✅ 重试后成功: {gateway.get_stats()['retries']} 次重试")
+
+
+def test_non_retryable_error_raised():
+    """400等不可重试的错误直接抛出"""
+    async def scenario(gateway):
+        with pytest.raises(openai.BadRequestError):
+            await gateway.chat_completion(messages=MESSAGES, model="fake-model", hedge=False)
+
+    _, gateway, state = _run_with_gateway(lambda n: (0, 400), scenario, max_retries=3)
+
+    assert state["requests"] == 1
+    assert gateway.get_stats()["retries"] == 0
+    print("✅ 不可重试错误直接抛出")
+
+
+def test_hedged_request_wins_tail():
+    """超过p95延迟未返回时发出对冲请求，先返回者胜出，另一个被取消"""
+    async def scenario(gateway):
+        # 前20次请求建立延迟基线（约20ms）
+        for _ in range(20):
+            await gateway.chat_completion(messages=MESSAGES, model="fake-model")
+        started = time.perf_counter()
+        response = await gateway.chat_completion(messages=MESSAGES, model="fake-model")
+        elapsed = time.perf_counter() - started
+        return response, elapsed
+
+    # 第21次请求卡住2秒，对冲的第22次请求正常返回
+    (response, elapsed), gateway, state = _run_with_gateway(
+        lambda n: (2.0 if n == 21 else 0.02, 200), scenario,
+        hedge_enabled=True, hedge_min_samples=20, hedge_min_delay=0.05
+    )
+
+    stats = gateway.get_stats()
+    assert response.choices[0].message.content == "第22次请求"
+    assert elapsed < 1.0, f"对冲请求没有生效: {elapsed:.2f}s"
+    assert stats["hedges_fired"] == 1
+    assert stats["hedge_wins"] == 1
+    assert stats["latency"]["fake-model"]["count"] == 21
+    assert gateway.limiter.in_flight == 0  # 落后的请求已被取消并释放槽位
+    assert stats["latency"]["fake-model"]["buckets"]["le_250ms"] == 21
+    print(f"✅ 对冲请求胜出，耗时 {elapsed:.2f}s: {stats['latency']['fake-model']['p95_ms']}ms p95")
+
+
+def test_hedge_delay_per_task():
+    """对冲等待时间按 (任务, 模型) 统计：短任务的样本不会让同一模型上的长任务触发对冲"""
+    tasks = {"route": {"model": "fake-model"}, "reply": {"model": "fake-model"}}
+
+    async def scenario(gateway):
+        for _ in range(20):
+            await gateway.chat_completion(task="route", messages=MESSAGES)
+        route_delay = gateway.hedge_delay("fake-model", "route")
+        reply_delay = gateway.hedge_delay("fake-model", "reply")
+        await gateway.chat_completion(task="reply", messages=MESSAGES)
+        return route_delay, reply_delay
+
+    # 路由调用约20ms，角色回复要300ms
+    (route_delay, reply_delay), gateway, state = _run_with_gateway(
+        lambda n: (0.3 if n == 21 else 0.02, 200), scenario,
+        hedge_enabled=True, hedge_min_samples=20, hedge_min_delay=0.05, tasks=tasks
+    )
+
+    stats = gateway.get_stats()
+    assert route_delay is not None and reply_delay is None
+    assert stats["hedges_fired"] == 0 and state["requests"] == 21
+    assert stats["hedge_delay_ms"]["reply/fake-model"] is None
+    assert stats["latency"]["fake-model"]["count"] == 21  # 按模型的直方图仍包含所有任务
+    print(f"✅ 对冲等待时间按任务统计: {stats['hedge_delay_ms']}")
+
+
+def test_task_tiering():
+    """按任务选择模型和默认参数，并按任务统计调用次数和延迟"""
+    tasks = {
+        "expand": {"model": "fast-model", "max_tokens": 50, "temperature": 0.5, "timeout": 5},
+        "reply": {"model": "large-model", "max_tokens": 100, "temperature": 0.7, "timeout": 30}
+    }
+
+    async def scenario(gateway):
+        expand = await gateway.chat_completion(task="expand", messages=MESSAGES)
+        reply = await gateway.chat_completion(task="reply", messages=MESSAGES, max_tokens=20)
+        override = await gateway.chat_completion(task="expand", messages=MESSAGES, model="other-model")
+        with pytest.raises(ValueError):
+            await gateway.chat_completion(task="unknown", messages=MESSAGES)
+        return expand, reply, override
+
+    (expand, reply, override), gateway, _ = _run_with_gateway(
+        lambda n: (0, 200), scenario, hedge_enabled=False, tasks=tasks
+    )
+
+    stats = gateway.get_stats()["tasks"]
+    assert expand.model == "fast-model"
+    assert reply.model == "large-model"
+    assert override.model == "other-model"
+    assert stats["expand"]["calls"] == 2
+    assert stats["expand"]["model"] == "fast-model"
+    assert stats["reply"]["latency"]["count"] == 1
+    print(f"✅ 按任务选择模型: {stats}")
+
+
+def test_calls_bounded_by_request_deadline():
+    """单次调用的超时不超过请求剩余预算，预算用完后不再重试；预算已耗尽时不发出请求"""
+    async def scenario(gateway):
+        started = time.perf_counter()
+        with pytest.raises(openai.APITimeoutError):
+            await gateway.chat_completion(messages=MESSAGES, model="fake-model", deadline=Deadline(budget=0.3))
+        explicit_elapsed = time.perf_counter() - started
+
+        # 请求入口绑定的预算对本请求中的所有调用生效
+        Deadline(budget=0.3).bind()
+        started = time.perf_counter()
+        with pytest.raises(openai.APITimeoutError):
+            await gateway.chat_completion(messages=MESSAGES, model="fake-model")
+        bound_elapsed = time.perf_counter() - started
+
+        with pytest.raises(asyncio.TimeoutError):
+            await gateway.chat_completion(messages=MESSAGES, model="fake-model", deadline=Deadline(budget=0))
+        return explicit_elapsed, bound_elapsed
+
+    # 每次请求都要1秒，超过预算
+    (explicit_elapsed, bound_elapsed), gateway, state = _run_with_gateway(
+        lambda n: (1.0, 200), scenario, max_retries=2, hedge_enabled=False
+    )
+
+    stats = gateway.get_stats()
+    assert explicit_elapsed < 0.6 and bound_elapsed < 0.6, (explicit_elapsed, bound_elapsed)
+    assert state["requests"] == 2  # 没有重试，预算耗尽后不再发出请求
+    assert stats["retries"] == 0
+    assert stats["providers"]["fake/fake-model"]["failures"] == 0  # 被预算截短的超时不算供应商故障
+    print(f"✅ 调用受请求预算约束: {explicit_elapsed:.2f}s / {bound_elapsed:.2f}s")
+
+
+if __name__ == "__main__":
+    print("🧪 测试LLM网关...")
+    test_retries_on_429_and_5xx()
+    test_non_retryable_error_raised()
+    test_hedged_request_wins_tail()
+    test_hedge_delay_per_task()
+    test_task_tiering()
+    test_calls_bounded_by_request_deadline()
+    print("🎉 所有测试通过")
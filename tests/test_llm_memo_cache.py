@@ -0,0 +1,123 @@
+"""
+LLM辅助调用结果缓存测试
+使用本地OpenAI兼容的模拟服务，验证相同 (任务, 模型, 提示词) 只调用一次LLM且重启后仍然命中、
+TTL过期和LRU淘汰，以及同一文档内容再次上传时摘要和关键词不再调用LLM
+"""
+
+import asyncio
+import sys
+import os
+import tempfile
+
+# 添加AI Agent路径
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'ai_agent'))
+
+from fake_llm import run_with_fake_llm
+import rag.document_processor as document_module
+from rag.document_processor import DocumentChunk, document_processor
+from services.llm_memo_cache import LLMMemoCache
+
+
+def _with_fake_llm(scenario):
+    """在模拟LLM服务上运行场景，返回 (场景结果, 模拟服务收到的提示词)"""
+    prompts = []
+
+    def handler(body):
+        prompts.append(body["messages"][-1]["content"])
+        return f"结果{len(prompts)}\n高血压\n饮食"
+
+    return run_with_fake_llm(handler, scenario), prompts
+
+
+def test_memoized_across_restarts():
+    """相同任务和提示词只调用一次LLM，重启后从SQLite命中；任务或提示词不同时重新调用；首次使用时才建库"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = os.path.join(tmp_dir, "memo.db")
+        messages = [{"role": "user", "content": "为“血压高怎么办”生成关键词"}]
+
+        async def scenario():
+            cache = LLMMemoCache(db_path=db_path, enabled=True)
+            assert not os.path.exists(db_path)
+            first = await cache.complete("expand", messages)
+            second = await cache.complete("expand", messages)
+            restarted = LLMMemoCache(db_path=db_path, enabled=True)
+            third = await restarted.complete("expand", messages)
+            await restarted.complete("keywords", messages)
+            await restarted.complete("expand", [{"role": "user", "content": "为“睡不着”生成关键词"}])
+            return first, second, third, cache.get_stats(), restarted.get_stats()
+
+        (first, second, third, stats, restarted_stats), prompts = _with_fake_llm(scenario)
+
+    assert first == second == third
+    assert len(prompts) == 3
+    assert stats["tasks"]["expand"] == {"hits": 1, "misses": 1, "stores": 1, "hit_rate": 0.5}
+    assert restarted_stats["tasks"]["expand"]["hits"] == 1
+    assert restarted_stats["tasks"]["keywords"]["misses"] == 1
+    assert restarted_stats["entries"] == 3
+    print(f"✅ 重启后命中: {restarted_stats['tasks']}")
+
+
+def test_ttl_and_lru_eviction():
+    """超过TTL的结果重新调用；超出条目上限时淘汰最久未访问的结果"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        def prompt(text):
+            return [{"role": "user", "content": text}]
+
+        async def scenario():
+            lru = LLMMemoCache(db_path=os.path.join(tmp_dir, "lru.db"), max_entries=2, enabled=True)
+            await lru.complete("expand", prompt("甲"))
+            await lru.complete("expand", prompt("乙"))
+            await lru.complete("expand", prompt("甲"))  # 命中，甲成为最近访问
+            await lru.complete("expand", prompt("丙"))  # 淘汰乙
+            await lru.complete("expand", prompt("甲"))  # 仍然命中
+            await lru.complete("expand", prompt("乙"))  # 已被淘汰，重新调用
+
+            ttl = LLMMemoCache(db_path=os.path.join(tmp_dir, "ttl.db"), ttl_seconds=0.05, enabled=True)
+            await ttl.complete("expand", prompt("丁"))
+            await asyncio.sleep(0.1)
+            await ttl.complete("expand", prompt("丁"))
+            return lru.get_stats(), ttl.get_stats()
+
+        (lru_stats, ttl_stats), prompts = _with_fake_llm(scenario)
+
+    assert prompts == ["甲", "乙", "丙", "乙", "丁", "丁"]
+    assert lru_stats["entries"] == 2
+    assert lru_stats["evictions"] == 2
+    assert ttl_stats["expirations"] == 1
+    print(f"✅ LRU淘汰和TTL过期: {lru_stats['evictions']} 条淘汰, {ttl_stats['expirations']} 条过期")
+
+
+def test_reupload_skips_summary_calls():
+    """同一文档内容再次上传（如上传给另一个角色）时，摘要和关键词直接使用缓存"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        chunks = [
+            DocumentChunk(chunk_id=f"c{i}", file_id="f1", content=f"第{i}段：高血压患者要少盐饮食，按时服药。", chunk_index=i)
+            for i in range(3)
+        ]
+
+        async def scenario():
+            original_cache = document_module.llm_memo_cache
+            document_module.llm_memo_cache = LLMMemoCache(db_path=os.path.join(tmp_dir, "memo.db"), enabled=True)
+            try:
+                first = await document_processor._generate_document_summary(chunks)
+                second = await document_processor._generate_document_summary(chunks)
+                return first, second, document_module.llm_memo_cache.get_stats()
+            finally:
+                document_module.llm_memo_cache = original_cache
+
+        (first, second, stats), prompts = _with_fake_llm(scenario)
+
+    assert first == second
+    assert first[1] == ["结果2", "高血压", "饮食"]
+    assert len(prompts) == 2  # 首次上传：摘要 + 关键词
+    assert stats["tasks"]["summarize"]["hits"] == 1
+    assert stats["tasks"]["keywords"]["hits"] == 1
+    print(f"✅ 再次上传不再调用LLM: {stats['tasks']}")
+
+
+if __name__ == "__main__":
+    print("🧪 测试LLM辅助调用结果缓存...")
+    test_memoized_across_restarts()
+    test_ttl_and_lru_eviction()
+    test_reupload_skips_summary_calls()
+    print("🎉 所有测试通过")
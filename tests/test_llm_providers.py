@@ -0,0 +1,182 @@
+"""
+LLM多供应商切换测试
+使用两个本地OpenAI兼容的模拟服务，验证超时时请求中途切换、故障供应商降级、按延迟选择供应商、对冲请求不换模型以及模型映射
+"""
+
+import asyncio
+import sys
+import os
+import time
+from typing import Optional
+
+from aiohttp import web
+
+# 添加AI Agent路径
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'ai_agent'))
+
+from fake_llm import start_fake_llm
+from services.concurrency_limiter import UpstreamLimiter
+from services.llm_client import LLMClientPool
+from services.llm_gateway import LLMGateway
+from services.llm_providers import ProviderConfig, ProviderRegistry
+
+
+def _provider(name: str, settings: dict):
+    """模拟供应商的处理函数，settings中的delay/status可在测试过程中修改"""
+    async def handler(body):
+        settings["requests"] = settings.get("requests", 0) + 1
+        await asyncio.sleep(settings.get("delay", 0))
+        status = settings.get("status", 200)
+        if status != 200:
+            return web.json_response({"error": {"message": f"{name} status {status}"}}, status=status)
+        return f"{name}:{body['model']}"
+
+    return handler
+
+
+def _run_with_providers(primary: dict, backup: dict, scenario, gateway_options: Optional[dict] = None,
+                        **registry_options):
+    """启动主、备两个模拟供应商（备用供应商把所有模型映射为backup-model），执行scenario(gateway, registry)"""
+    async def run():
+        primary_runner, primary_url = await start_fake_llm(_provider("primary", primary))
+        backup_runner, backup_url = await start_fake_llm(_provider("backup", backup))
+        pool = LLMClientPool(max_retries=0)
+        registry = ProviderRegistry(
+            [
+                {"name": "primary", "api_key": "key-a", "base_url": primary_url, "models": {"*": None}},
+                {"name": "backup", "api_key": "key-b", "base_url": backup_url, "models": {"*": "backup-model"}}
+            ],
+            client_pool=pool,
+            **registry_options
+        )
+        gateway = LLMGateway(
+            registry=registry,
+            limiter=UpstreamLimiter("llm", max_in_flight=10, max_queue=10, max_queue_wait=5),
+            **{"max_retries": 0, "hedge_enabled": False, **(gateway_options or {})}
+        )
+        try:
+            return await scenario(gateway, registry)
+        finally:
+            await pool.aclose()
+            await primary_runner.cleanup()
+            await backup_runner.cleanup()
+
+    return asyncio.run(run())
+
+
+MESSAGES = [{"role": "user", "content": "你好"}]
+
+
+def _content(response) -> str:
+    return response.choices[0].message.content
+
+
+def test_failover_on_timeout():
+    """主供应商超时时请求中途切换到备用供应商"""
+    primary, backup = {"delay": 2.0}, {}
+
+    async def scenario(gateway, registry):
+        started = time.perf_counter()
+        response = await gateway.chat_completion(messages=MESSAGES, model="qwen-test")
+        return response, time.perf_counter() - started
+
+    response, elapsed = _run_with_providers(primary, backup, scenario, attempt_timeout=0.2)
+
+    assert _content(response) == "backup:backup-model"
+    assert elapsed < 1.5, f"没有在超时后切换: {elapsed:.2f}s"
+    print(f"✅ 超时切换到备用供应商，耗时 {elapsed:.2f}s")
+
+
+def test_unhealthy_provider_skipped():
+    """主供应商持续5xx后进入冷却，后续调用直接发往备用供应商"""
+    primary, backup = {"status": 503}, {}
+
+    async def scenario(gateway, registry):
+        responses = [await gateway.chat_completion(messages=MESSAGES, model="qwen-test") for _ in range(6)]
+        return responses, registry.get_stats(), gateway.get_stats()
+
+    responses, registry_stats, gateway_stats = _run_with_providers(primary, backup, scenario)
+
+    assert all(_content(r) == "backup:backup-model" for r in responses)
+    assert primary["requests"] == ProviderRegistry.MAX_CONSECUTIVE_FAILURES
+    assert registry_stats["primary/qwen-test"]["healthy"] is False
+    assert registry_stats["backup/backup-model"]["successes"] == 6
+    assert gateway_stats["failovers"] == 3
+    print(f"✅ 故障供应商降级: {registry_stats}")
+
+
+def test_latency_aware_selection():
+    """备用供应商明显更快时优先使用，主供应商恢复后重新优先"""
+    primary, backup = {"delay": 0.01}, {"delay": 0.01}
+
+    async def scenario(gateway, registry):
+        for _ in range(registry.MIN_SAMPLES):
+            registry.record_success("backup", "backup-model", 0.05)
+        first = await gateway.chat_completion(messages=MESSAGES, model="qwen-test")
+
+        for _ in range(registry.window):
+            registry.record_success("primary", "qwen-test", 0.5)
+        slow_primary = [provider.name for provider, _ in registry.candidates("qwen-test")]
+
+        for _ in range(registry.window):
+            registry.record_success("primary", "qwen-test", 0.06)
+        recovered = await gateway.chat_completion(messages=MESSAGES, model="qwen-test")
+        return first, slow_primary, recovered
+
+    first, slow_primary, recovered = _run_with_providers(primary, backup, scenario)
+
+    # 主供应商没有足够样本时按优先级选择
+    assert _content(first) == "primary:qwen-test"
+    assert slow_primary == ["backup", "primary"]
+    assert _content(recovered) == "primary:qwen-test"
+    print("✅ 按延迟选择供应商")
+
+
+def test_hedge_keeps_requested_model():
+    """对冲请求只发往提供同一模型的供应商，不会换成备用供应商映射的模型；延迟按供应商模型记录"""
+    primary, backup = {"delay": 0.01}, {}
+
+    async def scenario(gateway, registry):
+        for _ in range(20):
+            await gateway.chat_completion(messages=MESSAGES, model="qwen-test")
+        primary["delay"] = 0.3
+        response = await gateway.chat_completion(messages=MESSAGES, model="qwen-test")
+        return response, gateway.get_stats()
+
+    response, stats = _run_with_providers(
+        primary, backup, scenario,
+        gateway_options={"hedge_enabled": True, "hedge_min_samples": 20, "hedge_min_delay": 0.05}
+    )
+
+    assert stats["hedges_fired"] == 1
+    assert _content(response) == "primary:qwen-test"
+    assert primary["requests"] == 22 and backup.get("requests", 0) == 0
+    assert list(stats["latency"]) == ["qwen-test"]
+    print(f"✅ 对冲请求保持模型不变: {_content(response)}")
+
+
+def test_model_mapping():
+    """只能提供特定模型的供应商不参与其他模型的选择"""
+    provider = ProviderConfig(name="openai", api_key="k", base_url="http://x", models={"qwen-plus": "gpt-4o-mini"})
+    assert provider.resolve_model("qwen-plus") == "gpt-4o-mini"
+    assert provider.resolve_model("qwen-max") is None
+    assert ProviderConfig(name="dashscope", api_key="k", base_url="http://y").resolve_model("qwen-max") == "qwen-max"
+
+    registry = ProviderRegistry([
+        {"name": "dashscope", "api_key": "k", "base_url": "http://y"},
+        {"name": "openai", "api_key": "k", "base_url": "http://x", "models": {"qwen-plus": "gpt-4o-mini"}},
+        {"name": "disabled", "api_key": "", "base_url": "http://z"}
+    ])
+    assert [p.name for p, _ in registry.candidates("qwen-max")] == ["dashscope"]
+    assert [m for _, m in registry.candidates("qwen-plus")] == ["qwen-plus", "gpt-4o-mini"]
+    print("✅ 模型映射正常")
+
+
+if __name__ == "__main__":
+    print("🧪 测试LLM多供应商切换...")
+    test_failover_on_timeout()
+    test_unhealthy_provider_skipped()
+    test_latency_aware_selection()
+    test_hedge_keeps_requested_model()
+    test_model_mapping()
+    print("🎉 所有测试通过")
@@ -212,7 +212,7 @@ async def test_multiple_routing_scenarios():
                 print(f"\n🎭 {char_names[character_id]}角色激活")
                 try:
                     character_agent = CharacterAgent(character_id)
-                    response = character_agent.generate_response(user_input)
+                    response = await character_agent.generate_response(user_input)
                     if response and 'response' in response:
                         # 只显示前100个字符
                         preview = response['response'][:100]
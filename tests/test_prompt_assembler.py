@@ -0,0 +1,96 @@
+"""
+提示词token预算测试
+验证中文token估算、必须保留的段落不被裁剪、按优先级先裁剪低优先级段落、段落内先丢弃最旧的历史，
+以及角色代理组装的消息不超过预算并报告各段落token数
+"""
+
+import asyncio
+import sys
+import os
+
+# 添加AI Agent路径
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'ai_agent'))
+
+from agents.character_agent import CharacterAgent
+from agents.prompt_assembler import PromptAssembler, PromptSection, estimate_tokens, truncate_to_tokens
+from memory.session_store import SessionState
+
+
+def test_estimate_tokens():
+    """中文按字计、英文按约4个字符计，截断后不超过上限"""
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("今天天气很好") == 6
+    assert estimate_tokens("hello world!") == 3
+    assert estimate_tokens("血压130/85，还好。") == 4 + 2 + 2  # 中文4字 + 全角标点2个 + "130/85"6个字符
+
+    text = "爸，您最近身体怎么样？" * 20
+    truncated = truncate_to_tokens(text, 30)
+    assert estimate_tokens(truncated) <= 30
+    assert truncated.endswith("…")
+    assert truncate_to_tokens("你好", 30) == "你好"
+    print("✅ token估算正常")
+
+
+def test_budget_trims_lowest_priority_first():
+    """必须保留的段落完整计入，剩余预算按优先级分配，低优先级段落和最旧的条目先被裁剪"""
+    assembler = PromptAssembler(
+        budget=200,
+        priorities=["search", "history", "memory"],
+        shares={"search": 0.5, "history": 1.0, "memory": 1.0}
+    )
+    sections = [
+        PromptSection("persona", ["角" * 60], required=True),
+        PromptSection("search", ["搜" * 150], truncatable=True),
+        PromptSection("memory", ["记" * 10, "忆" * 10]),
+        PromptSection("history", ["新" * 20, "中" * 20, "旧" * 20])
+    ]
+
+    assembled = assembler.assemble(sections)
+
+    assert assembled.items["persona"] == ["角" * 60]
+    # 搜索结果最多占一半预算，超出部分被截断
+    assert assembled.tokens["search"] == 100
+    assert assembled.items["search"][0].endswith("…")
+    # 剩余40个token只够保留最新的两轮历史，记忆全部被裁剪
+    assert assembled.items["history"] == ["新" * 20, "中" * 20]
+    assert assembled.items["memory"] == []
+    assert assembled.trimmed == {"persona": 0, "search": 1, "history": 1, "memory": 2}
+    assert assembled.total_tokens <= 200
+    assert assembler.get_stats()["trimmed_items"]["memory"] == 2
+    print(f"✅ 按优先级裁剪: {assembled.report()}")
+
+
+def test_agent_messages_within_budget():
+    """角色代理组装的消息不超过预算：超长历史只保留最近几轮，并报告各段落token数"""
+    agent = CharacterAgent("xiyang")
+    session = SessionState(user_id="budget-test", character_id="xiyang", thread_id="t")
+    session.conversation_history = [
+        {"user_message": f"第{i}轮：" + "我今天去公园散步了，" * 20, "assistant_response": "爸，散步对身体好，" * 20}
+        for i in range(10)
+    ]
+    session.context_memory = {"health": [{"content": "膝盖疼", "timestamp": "2026-10-01T08:00:00"}]}
+
+    messages, chat_analysis, _ = asyncio.run(agent._prepare_messages(
+        "我晚上睡不好", {"time": "2026-10-18 09:00", "cot_analysis": "父母睡眠不好，需要关心"}, session
+    ))
+
+    report = chat_analysis["prompt_tokens"]
+    assert report["total_tokens"] <= report["budget"]
+    assert set(report["sections"]) >= {"prefix", "context", "cot", "memory", "history", "user"}
+    assert report["trimmed"]["history"] > 0
+    # 保留的是最近几轮，且按时间顺序排列在当前消息之前
+    history_users = [m["content"] for m in messages[1:-1] if m["role"] == "user"]
+    assert history_users[-1].startswith("第9轮")
+    assert not any(content.startswith("第0轮") for content in history_users)
+    assert messages[-1] == {"role": "user", "content": "我晚上睡不好"}
+    assert "父母睡眠不好，需要关心" in messages[0]["content"]
+    assert "膝盖疼" in messages[0]["content"]
+    print(f"✅ 角色消息在预算内: {report}")
+
+
+if __name__ == "__main__":
+    print("🧪 测试提示词token预算...")
+    test_estimate_tokens()
+    test_budget_trims_lowest_priority_first()
+    test_agent_messages_within_budget()
+    print("🎉 所有测试通过")
@@ -0,0 +1,95 @@
+"""
+系统提示词模板测试
+验证静态前缀在动态内容（时间、记忆、联网搜索）变化时逐字节不变且位于系统提示词开头，
+按角色、聊天类型和输出要求分别编译，以及模板复用统计
+"""
+
+import asyncio
+import sys
+import os
+
+# 添加AI Agent路径
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'ai_agent'))
+
+from agents.character_agent import CharacterAgent
+from agents.prompt_templates import PromptTemplateCache
+from memory.session_store import SessionState
+from prompts.structured_reply_prompts import STRUCTURED_REPLY_INSTRUCTION
+
+
+def test_prefix_byte_identical_across_turns():
+    """不同轮次的时间、记忆和搜索结果不同，系统提示词的静态前缀逐字节相同"""
+    agent = CharacterAgent("xiyang")
+    session = SessionState(user_id="template-test", character_id="xiyang", thread_id="t")
+    chat_analysis = {"type": "problem_solving"}
+    template = agent.prompt_template("problem_solving")
+
+    first = agent.get_system_prompt({"time": "2026-10-18 09:00"}, chat_analysis, session)
+    session.context_memory = {"health": [{"content": "膝盖疼", "timestamp": "2026-10-18T09:00:00"}]}
+    second = agent.get_system_prompt({
+        "time": "2026-10-18 21:30",
+        "web_search_result": {"status": "success", "results": [{"title": "天气"}], "summary": "明天降温"}
+    }, chat_analysis, session)
+
+    assert first != second
+    assert first.startswith(template.prefix)
+    assert second.startswith(template.prefix)
+    assert "深度思考指导" in template.prefix
+    assert "2026-10-18" not in template.prefix
+    # 同一个 (角色, 聊天类型) 始终返回同一个模板对象
+    assert agent.prompt_template("problem_solving") is template
+    print(f"✅ 静态前缀逐字节不变: {template.prefix_tokens} tokens, digest={template.digest}")
+
+
+def test_templates_per_character_and_chat_type():
+    """不同角色、聊天类型和输出要求分别编译各自的静态前缀"""
+    xiyang = CharacterAgent("xiyang")
+    meiyang = CharacterAgent("meiyang")
+
+    assert xiyang.prompt_template("greeting").prefix != xiyang.prompt_template("casual").prefix
+    assert xiyang.prompt_template("greeting").prefix != meiyang.prompt_template("greeting").prefix
+
+    structured = xiyang.prompt_template("casual", STRUCTURED_REPLY_INSTRUCTION)
+    assert structured.prefix == xiyang.prompt_template("casual").prefix + STRUCTURED_REPLY_INSTRUCTION
+
+    messages, _, _ = asyncio.run(xiyang._prepare_messages(
+        "你好呀", {"time": "2026-10-18 09:00"},
+        SessionState(user_id="template-test", character_id="xiyang", thread_id="t"),
+        instruction=STRUCTURED_REPLY_INSTRUCTION
+    ))
+    greeting = xiyang.prompt_template("greeting", STRUCTURED_REPLY_INSTRUCTION)
+    assert messages[0]["content"].startswith(greeting.prefix)
+    print("✅ 按角色、聊天类型和输出要求分别编译")
+
+
+def test_reuse_stats():
+    """首次使用时编译，之后复用，并统计静态前缀占系统提示词的比例"""
+    cache = PromptTemplateCache()
+    builds = []
+
+    def build():
+        builds.append(1)
+        return "角色设定"
+
+    first = cache.get("xiyang", "casual", build)
+    for _ in range(3):
+        assert cache.get("xiyang", "casual", build) is first
+    cache.get("xiyang", "greeting", build)
+    cache.record_usage(first.prefix_tokens, first.prefix_tokens * 4)
+
+    stats = cache.get_stats()
+    assert len(builds) == 2
+    assert stats["templates"] == 2
+    assert stats["compiled"] == 2
+    assert stats["reused"] == 3
+    assert stats["reuse_rate"] == 0.6
+    assert stats["prefix_token_ratio"] == 0.25
+    print(f"✅ 模板复用统计: {stats}")
+
+
+if __name__ == "__main__":
+    print("🧪 测试系统提示词模板...")
+    test_prefix_byte_identical_across_turns()
+    test_templates_per_character_and_chat_type()
+    test_reuse_stats()
+    print("🎉 所有测试通过")
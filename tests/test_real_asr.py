@@ -101,7 +101,7 @@ async def test_real_audio_content():
         print(f"🏷️  输入类型：{input_type}")
         
         # AI处理并生成回复
-        response = xiyang_agent.generate_response(recognized_text)
+        response = await xiyang_agent.generate_response(recognized_text)
         
         if response and 'response' in response:
             ai_response = response['response']
@@ -0,0 +1,65 @@
+"""
+会话状态存储测试
+验证会话隔离、LRU淘汰和TTL过期
+"""
+
+import sys
+import os
+import time
+
+# 添加AI Agent路径
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'ai_agent'))
+
+from memory.session_store import SessionStore
+
+
+def test_sessions_are_isolated():
+    """不同用户、不同线程的会话互不影响"""
+    store = SessionStore(max_sessions=10, ttl_seconds=60)
+
+    alice = store.get_or_create("alice", "xiyang")
+    bob = store.get_or_create("bob", "xiyang")
+    alice_other_thread = store.get_or_create("alice", "xiyang", "thread-2")
+
+    alice.conversation_history.append({"user_message": "你好", "assistant_response": "爸妈好"})
+
+    assert bob.conversation_history == []
+    assert alice_other_thread.conversation_history == []
+    assert store.get_or_create("alice", "xiyang", "alice_xiyang") is alice
+    print("✅ 会话隔离正常")
+
+
+def test_lru_eviction():
+    """超过容量时淘汰最久未使用的会话"""
+    store = SessionStore(max_sessions=2, ttl_seconds=60)
+
+    store.get_or_create("u1", "xiyang")
+    store.get_or_create("u2", "xiyang")
+    store.get_or_create("u1", "xiyang")  # 访问u1，使u2成为最久未使用
+    store.get_or_create("u3", "xiyang")
+
+    assert store.get("u2", "xiyang") is None
+    assert store.get("u1", "xiyang") is not None
+    assert store.get_stats()["evictions"] == 1
+    print("✅ LRU淘汰正常")
+
+
+def test_ttl_expiration():
+    """不活跃超过TTL的会话会被重新创建"""
+    store = SessionStore(max_sessions=10, ttl_seconds=0.05)
+
+    session = store.get_or_create("u1", "meiyang")
+    session.emotional_state = "happy"
+    time.sleep(0.1)
+
+    assert store.get_or_create("u1", "meiyang").emotional_state == "neutral"
+    assert store.get_stats()["expirations"] == 1
+    print("✅ TTL过期正常")
+
+
+if __name__ == "__main__":
+    print("🧪 测试会话状态存储...")
+    test_sessions_are_isolated()
+    test_lru_eviction()
+    test_ttl_expiration()
+    print("🎉 所有测试通过")
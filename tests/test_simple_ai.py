@@ -32,7 +32,7 @@ async def test_simple_response():
         print(f"💬 用户输入: {user_input}")
         
         # 直接调用角色生成方法
-        response = xiyang_agent.generate_response(user_input)
+        response = await xiyang_agent.generate_response(user_input)
         print(f"🤖 角色回复: {response}")
         
         return response
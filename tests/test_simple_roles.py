@@ -3,6 +3,7 @@
 简化的角色测试 - 直接测试角色特性
 """
 
+import asyncio
 import sys
 import os
 sys.path.append('/Users/jllulu/Desktop/familybot/ai_agent')
@@ -61,7 +62,7 @@ def test_character_responses():
                 agent = character_manager.get_agent(character_id)
                 if agent:
                     # 生成回复
-                    response = agent.generate_response(user_input, context={})
+                    response = asyncio.run(agent.generate_response(user_input, context={}))
                     print(f"💬 {response['content']}")
                     print(f"😊 情感: {response['emotion']}")
                     print(f"🎨 风格: {response['style']}")
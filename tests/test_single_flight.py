@@ -0,0 +1,115 @@
+"""
+请求合并（single-flight）测试
+验证相同调用只发起一次、异常共享、调用者取消不影响其他调用者，以及联网搜索的合并
+"""
+
+import asyncio
+import sys
+import os
+
+import pytest
+
+# 添加AI Agent路径
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'ai_agent'))
+
+from services.single_flight import SingleFlight
+
+
+def test_identical_calls_coalesced():
+    """相同键的并发调用只发起一次，不同键各自发起"""
+    flight = SingleFlight()
+    calls = []
+
+    async def fetch(key):
+        calls.append(key)
+        await asyncio.sleep(0.02)
+        return f"result:{key}"
+
+    async def run():
+        return await asyncio.gather(
+            *[flight.do("tts", "greeting", lambda: fetch("greeting")) for _ in range(5)],
+            flight.do("tts", "other", lambda: fetch("other"))
+        )
+
+    results = asyncio.run(run())
+
+    assert calls == ["greeting", "other"]
+    assert results[:5] == ["result:greeting"] * 5
+    assert flight.get_stats()["tts"] == {"issued": 2, "coalesced": 4, "in_flight": 0}
+
+    # 完成后再次调用会重新发起
+    asyncio.run(flight.do("tts", "greeting", lambda: fetch("greeting")))
+    assert len(calls) == 3
+    print(f"✅ 相同调用合并: {flight.get_stats()}")
+
+
+def test_errors_shared_and_cancellation_isolated():
+    """异常抛给所有等待者；某个等待者取消不影响其他等待者"""
+    flight = SingleFlight()
+
+    async def failing():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("upstream down")
+
+    async def slow():
+        await asyncio.sleep(0.05)
+        return "done"
+
+    async def run():
+        errors = await asyncio.gather(
+            *[flight.do("web_search", "q", failing) for _ in range(3)],
+            return_exceptions=True
+        )
+        impatient = asyncio.create_task(
+            asyncio.wait_for(flight.do("query_expansion", "q", slow), timeout=0.01)
+        )
+        patient = asyncio.create_task(flight.do("query_expansion", "q", slow))
+        with pytest.raises(asyncio.TimeoutError):
+            await impatient
+        return errors, await patient
+
+    errors, result = asyncio.run(run())
+
+    assert all(isinstance(e, RuntimeError) for e in errors)
+    assert flight.get_stats()["web_search"]["issued"] == 1
+    assert result == "done"
+    assert flight.get_stats()["query_expansion"] == {"issued": 1, "coalesced": 1, "in_flight": 0}
+    print("✅ 异常共享、取消隔离")
+
+
+def test_web_search_coalesced():
+    """热门问题同时触发的联网搜索只请求一次"""
+    from tools.web_search import WebSearchTool
+    import tools.web_search as web_search_module
+
+    tool = WebSearchTool()
+    requests_sent = []
+
+    async def fake_search(query, max_results):
+        requests_sent.append(query)
+        await asyncio.sleep(0.02)
+        return {"success": True, "query": query, "results": []}
+
+    tool._search = fake_search
+    original_flight = web_search_module.single_flight
+    web_search_module.single_flight = SingleFlight()
+    try:
+        async def run():
+            return await asyncio.gather(*[tool.search("今天天气怎么样") for _ in range(4)])
+        results = asyncio.run(run())
+        stats = web_search_module.single_flight.get_stats()
+    finally:
+        web_search_module.single_flight = original_flight
+
+    assert requests_sent == ["今天天气怎么样"]
+    assert all(r["success"] for r in results)
+    assert stats["web_search"]["coalesced"] == 3
+    print(f"✅ 联网搜索合并: {stats}")
+
+
+if __name__ == "__main__":
+    print("🧪 测试请求合并...")
+    test_identical_calls_coalesced()
+    test_errors_shared_and_cancellation_isolated()
+    test_web_search_coalesced()
+    print("🎉 所有测试通过")
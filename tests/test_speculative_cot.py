@@ -0,0 +1,104 @@
+"""
+推测执行CoT测试
+验证CoT在预算内完成时使用增强回复、超出预算时直接使用草稿、增强回复失败时回退到草稿，以及胜出统计和节省时间
+"""
+
+import asyncio
+import sys
+import os
+import time
+
+# 添加AI Agent路径
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'ai_agent'))
+
+from reasoning.speculative_cot import SpeculativeCoT
+
+
+def _factories(cot_delay: float, draft_delay: float, informed_delay: float, use_cot: bool = True, informed_error=None):
+    """构造CoT、草稿和增强回复的模拟协程工厂，calls记录实际执行的步骤"""
+    calls = []
+
+    async def cot():
+        calls.append("cot")
+        await asyncio.sleep(cot_delay)
+        return {"use_cot": use_cot, "final_analysis": "需要关心睡眠", "reasoning_steps": []}
+
+    async def draft():
+        calls.append("draft")
+        await asyncio.sleep(draft_delay)
+        return "草稿回复"
+
+    async def informed(cot_result):
+        calls.append("informed")
+        await asyncio.sleep(informed_delay)
+        if informed_error:
+            raise informed_error
+        return f"增强回复:{cot_result['final_analysis']}"
+
+    return cot, draft, informed, calls
+
+
+def test_cot_within_budget_uses_informed_reply():
+    """CoT在预算内完成时使用CoT增强回复"""
+    speculative = SpeculativeCoT()
+    cot, draft, informed, calls = _factories(cot_delay=0.05, draft_delay=0.05, informed_delay=0.05)
+
+    reply, cot_result, path = asyncio.run(speculative.run(cot, draft, informed, budget=1.0))
+
+    assert path == "cot"
+    assert reply == "增强回复:需要关心睡眠"
+    assert cot_result["use_cot"] is True
+    assert sorted(calls[:2]) == ["cot", "draft"]  # 草稿与CoT同时开始
+    assert calls[2] == "informed"
+    assert speculative.get_stats()["wins"]["cot"] == 1
+    print("✅ CoT在预算内完成，使用增强回复")
+
+
+def test_cot_over_budget_ships_draft():
+    """CoT超出预算时不等待CoT，直接使用草稿回复，并记录节省的时间"""
+    speculative = SpeculativeCoT()
+    cot, draft, informed, calls = _factories(cot_delay=2.0, draft_delay=0.1, informed_delay=0.1)
+
+    started = time.perf_counter()
+    reply, cot_result, path = asyncio.run(speculative.run(cot, draft, informed, budget=0.2))
+    elapsed = time.perf_counter() - started
+
+    stats = speculative.get_stats()
+    assert path == "draft_timeout"
+    assert reply == "草稿回复"
+    assert cot_result is None
+    assert "informed" not in calls
+    assert elapsed < 0.5, f"没有在预算后使用草稿: {elapsed:.2f}s"
+    # 串行执行至少需要 预算 + 草稿 = 0.3s，推测执行约0.2s
+    assert stats["saved_total_ms"] >= 50
+    assert stats["cot_win_rate"] == 0.0
+    print(f"✅ CoT超出预算，草稿回复胜出，节省 {stats['saved_total_ms']}ms")
+
+
+def test_draft_paths_without_cot_analysis():
+    """CoT未给出分析或增强回复失败时使用草稿回复"""
+    speculative = SpeculativeCoT()
+
+    cot, draft, informed, _ = _factories(cot_delay=0.01, draft_delay=0.05, informed_delay=0.01, use_cot=False)
+    reply, _, path = asyncio.run(speculative.run(cot, draft, informed, budget=1.0))
+    assert (reply, path) == ("草稿回复", "draft_no_cot")
+
+    cot, draft, informed, _ = _factories(
+        cot_delay=0.01, draft_delay=0.05, informed_delay=0.01, informed_error=RuntimeError("上游错误")
+    )
+    reply, cot_result, path = asyncio.run(speculative.run(cot, draft, informed, budget=1.0))
+    assert (reply, cot_result, path) == ("草稿回复", None, "draft_fallback")
+
+    stats = speculative.get_stats()
+    assert stats["turns"] == 2
+    assert stats["wins"]["draft_no_cot"] == 1
+    assert stats["wins"]["draft_fallback"] == 1
+    print(f"✅ 草稿回退路径: {stats['wins']}")
+
+
+if __name__ == "__main__":
+    print("🧪 测试推测执行CoT...")
+    test_cot_within_budget_uses_informed_reply()
+    test_cot_over_budget_ships_draft()
+    test_draft_paths_without_cot_analysis()
+    print("🎉 所有测试通过")
@@ -0,0 +1,104 @@
+"""
+单次结构化回复模式测试
+使用本地OpenAI兼容的模拟服务，验证结构化输出的解析、结构化模式只调用一次LLM（多调用路径为CoT和CoT增强回复），
+以及按任务统计的token用量
+"""
+
+import json
+import sys
+import os
+import tempfile
+
+# 添加AI Agent路径
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'ai_agent'))
+
+from fake_llm import completion, run_with_fake_llm
+from agents.character_agent import parse_structured_reply
+from graph.conversation_graph import ConversationGraph
+from memory.conversation_memory import ConversationMemory
+from services.llm_gateway import llm_gateway
+
+
+STRUCTURED_CONTENT = json.dumps({
+    "route": "health-concern",
+    "analysis": "父母睡眠不好，需要关心并给出简单建议",
+    "emotion": "caring",
+    "reply": "爸，睡不好别硬撑，晚上少喝点茶，明天我陪您去医院看看。"
+}, ensure_ascii=False)
+
+
+def _handler(state: dict):
+    """模拟服务的处理函数：要求JSON输出时返回结构化回复，否则返回普通文本，并附带token用量"""
+    def handler(body):
+        state["requests"] += 1
+        structured = body.get("response_format", {}).get("type") == "json_object"
+        content = STRUCTURED_CONTENT if structured else "1. 父母睡眠不好\n2. 建议规律作息\n爸，您早点休息，别太累了。"
+        prompt_tokens = sum(len(message["content"]) for message in body["messages"])
+        return completion(body["model"], content, usage=(prompt_tokens, len(content)))
+
+    return handler
+
+
+def test_parse_structured_reply():
+    """结构化输出的解析：合法JSON、夹带说明文字、非法取值和纯文本回退"""
+    parsed = parse_structured_reply(STRUCTURED_CONTENT)
+    assert parsed["route"] == "health-concern"
+    assert parsed["emotion"] == "caring"
+    assert parsed["reply"].startswith("爸")
+
+    wrapped = parse_structured_reply(f"好的，结果如下：\n{STRUCTURED_CONTENT}\n以上。")
+    assert wrapped == parsed
+
+    invalid = parse_structured_reply('{"route": "unknown", "emotion": "angry", "reply": "你好"}')
+    assert invalid["route"] == "general-query"
+    assert invalid["emotion"] == "neutral"
+
+    plain = parse_structured_reply("妈，我今天下班早点回来看您。")
+    assert plain["reply"] == "妈，我今天下班早点回来看您。"
+    assert plain["analysis"] == ""
+    print("✅ 结构化输出解析正常")
+
+
+def test_structured_mode_single_call():
+    """结构化模式一次LLM调用完成路由、分析、情绪和回复，多调用路径需要多次调用"""
+    state = {"requests": 0}
+
+    async def run():
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            graph = ConversationGraph()
+            graph.memory = ConversationMemory(db_path=os.path.join(tmp_dir, "conversations.db"))
+
+            multi = await graph.process_conversation(
+                "我晚上睡不好", user_id="structured-test", character_id="xiyang", reply_mode="multi_call"
+            )
+            multi_requests = state["requests"]
+
+            structured = await graph.process_conversation(
+                "我晚上睡不好", user_id="structured-test", character_id="xiyang", reply_mode="structured"
+            )
+            return multi, multi_requests, structured, state["requests"] - multi_requests
+
+    multi, multi_requests, structured, structured_requests = run_with_fake_llm(_handler(state), run)
+
+    # 多调用路径：CoT分支在汇合前完成，直接生成CoT增强回复，不再需要草稿回复
+    assert multi_requests == 2
+    assert multi["reply_mode"] == "multi_call"
+    assert structured_requests == 1
+    assert structured["reply_mode"] == "structured"
+    assert structured["response"].startswith("爸，睡不好别硬撑")
+    assert structured["emotion"] == "caring"
+    assert structured["router_info"]["type"] == "health-concern"
+    assert structured["context"]["response_type"] == "health_focused"
+
+    tasks = llm_gateway.get_stats()["tasks"]
+    assert tasks["structured_reply"]["completion_tokens"] >= len(STRUCTURED_CONTENT)
+    assert tasks["reply"]["prompt_tokens"] > 0
+    assert tasks["cot"]["prompt_tokens"] > 0
+    print(f"✅ 结构化模式 {structured_requests} 次调用，多调用路径 {multi_requests} 次调用")
+
+
+if __name__ == "__main__":
+    print("🧪 测试单次结构化回复模式...")
+    test_parse_structured_reply()
+    test_structured_mode_single_call()
+    print("🎉 所有测试通过")
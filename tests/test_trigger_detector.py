@@ -0,0 +1,85 @@
+"""
+关键词触发检测器测试
+验证单次扫描得到的特征与改动前各调用处的关键词规则一致、重叠命中和问候语位置规则、按消息缓存，
+以及联网搜索、图片、聊天类型和上下文记忆的调用处对同一条消息只扫描一次
+"""
+
+import sys
+import os
+
+# 添加AI Agent路径
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'ai_agent'))
+
+from benchmark_trigger_detector import SAMPLE_MESSAGES, legacy_features, mismatches
+from agents.character_agent import CharacterAgent
+from memory.session_store import SessionState
+from services.image_service import image_service
+from services.trigger_detector import TriggerDetector, trigger_detector
+from tools.web_search import web_search_tool
+
+
+def test_matches_legacy_rules():
+    """所有样本上的特征与改动前的 `in` 循环和正则规则一致"""
+    edge_cases = ["", "好吗", "你们好吗", "身体好吗？", "现在在吗", "DRAW a cat", "我不知道，你还好吗", "晚安啦"]
+    assert mismatches(TriggerDetector(), SAMPLE_MESSAGES + edge_cases) == []
+    print(f"✅ {len(SAMPLE_MESSAGES) + len(edge_cases)} 条消息与改动前规则一致")
+
+
+def test_overlapping_and_positional_matches():
+    """重叠的词都能命中，英文不区分大小写，问候语只在规定位置生效"""
+    detector = TriggerDetector()
+
+    headache = detector.extract("我头疼怎么办")
+    assert headache.matched["problem"] == ("头疼", "疼", "怎么办")
+    assert headache.matched["knowledge"] == ("怎么",)
+    assert detector.extract("Show Me a PICTURE").wants_image
+
+    assert detector.extract("你好").greeting
+    assert not detector.extract("我跟他说你好").greeting
+    assert detector.extract("妈最近好吗").greeting
+    assert not detector.extract("最近好吗，吃了没").greeting
+    assert detector.extract("在家吗").greeting and not detector.extract("在家").greeting
+    print(f"✅ 重叠命中: {headache.matched}")
+
+
+def test_detection_cached_per_message():
+    """同一条消息只扫描一次，缓存超过上限时淘汰最久未使用的消息"""
+    detector = TriggerDetector(cache_size=2)
+
+    first = detector.detect("今天天气怎么样")
+    assert detector.detect("今天天气怎么样") is first
+    detector.detect("你好")
+    detector.detect("在家吗")
+    detector.detect("今天天气怎么样")
+
+    stats = detector.get_stats()
+    assert (stats["scans"], stats["cache_hits"], stats["cached_messages"]) == (4, 1, 2)
+    print(f"✅ 缓存统计: {stats}")
+
+
+def test_call_sites_share_one_scan():
+    """一次对话中联网搜索、图片、聊天类型和上下文记忆的判断只扫描消息一次"""
+    message = "孩子们最近都好吗，帮我画一张全家福"
+    agent = CharacterAgent("xiyang")
+    session = SessionState(user_id="trigger-test", character_id="xiyang", thread_id="trigger-test")
+    scans_before = trigger_detector.scans
+
+    assert web_search_tool.should_search(message)
+    assert image_service.should_generate_image(message)
+    chat_type = agent.detect_chat_type(message)
+    agent.detect_chat_type(message)
+    agent._update_context_memory(message, "好的", session)
+
+    assert trigger_detector.scans - scans_before == 1
+    assert chat_type["type"] == "real_time_info" and legacy_features(message)["web_search"]
+    assert list(session.context_memory) == ["family"] and len(session.context_memory["family"]) == 1
+    print(f"✅ 共享扫描: {trigger_detector.get_stats()}")
+
+
+if __name__ == "__main__":
+    print("🧪 测试关键词触发检测器...")
+    test_matches_legacy_rules()
+    test_overlapping_and_positional_matches()
+    test_detection_cached_per_message()
+    test_call_sites_share_one_scan()
+    print("🎉 所有测试通过")
@@ -0,0 +1,98 @@
+"""
+分句流水线TTS测试
+验证流式分句、按顺序产出音频片段以及首段音频时间统计
+"""
+
+import asyncio
+import sys
+import os
+import time
+
+# 添加AI Agent路径
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'ai_agent'))
+
+from services.tts_pipeline import SentenceSplitter, TTSPipeline, TTSPipelineStats, split_sentences
+
+
+def test_streaming_sentence_split():
+    """逐字喂入时在句末标点处切分，连续标点归入同一句"""
+    splitter = SentenceSplitter(min_chars=2)
+    sentences = []
+    for char in "爸爸妈妈好！！今天天气不错。要出门散步吗？记得带伞~":
+        sentences.extend(splitter.feed(char))
+    sentences.append(splitter.flush())
+
+    assert sentences == ["爸爸妈妈好！！", "今天天气不错。", "要出门散步吗？", "记得带伞~"]
+    print(f"✅ 分句结果: {sentences}")
+
+
+def test_short_sentences_are_merged():
+    """过短的句子并入下一句"""
+    assert split_sentences("嗯。我知道了。", min_chars=4) == ["嗯。我知道了。"]
+    print("✅ 短句合并正常")
+
+
+def test_segments_are_ordered_and_overlap_generation():
+    """句子并发合成但按顺序产出，首句音频在文本生成结束前就绪"""
+    delays = {"第一句话。": 0.05, "第二句话很长很长。": 0.2, "第三句。": 0.01}
+
+    async def fake_tts(text):
+        await asyncio.sleep(delays[text])
+        return text.encode("utf-8")
+
+    async def fake_llm():
+        for token in ["第一句", "话。第二", "句话很长很长。", "第三句。"]:
+            await asyncio.sleep(0.1)
+            yield token
+
+    async def run():
+        stats = TTSPipelineStats()
+        pipeline = TTSPipeline(fake_tts, max_concurrency=3, min_chars=2, stats=stats)
+        segments = []
+        first_audio_before_end = False
+        async for token in fake_llm():
+            pipeline.feed(token)
+            ready = pipeline.pop_ready()
+            first_audio_before_end = first_audio_before_end or bool(ready)
+            segments.extend(ready)
+        generation_done = time.perf_counter() - pipeline.started_at
+        async for segment in pipeline.finish():
+            segments.append(segment)
+        return pipeline, stats, segments, first_audio_before_end, generation_done
+
+    pipeline, stats, segments, first_audio_before_end, generation_done = asyncio.run(run())
+
+    assert [s.index for s in segments] == [0, 1, 2]
+    assert [s.audio.decode("utf-8") for s in segments] == list(delays)
+    assert first_audio_before_end
+    assert pipeline.time_to_first_audio < generation_done
+    assert stats.get_stats()["time_to_first_audio_ms"]["count"] == 1
+    print(f"✅ 首段音频时间: {pipeline.summary()['time_to_first_audio_ms']}ms, 生成耗时: {generation_done * 1000:.0f}ms")
+
+
+def test_failed_segment_does_not_block_others():
+    """单句TTS失败时仍产出其余句子"""
+    async def flaky_tts(text):
+        if "失败" in text:
+            raise RuntimeError("模拟TTS失败")
+        return b"audio"
+
+    async def run():
+        pipeline = TTSPipeline(flaky_tts, min_chars=2, stats=TTSPipelineStats())
+        pipeline.feed("这句会失败。这句正常。")
+        return [segment async for segment in pipeline.finish()], pipeline.summary()
+
+    segments, summary = asyncio.run(run())
+
+    assert [s.success for s in segments] == [False, True]
+    assert summary["failed"] == 1
+    print(f"✅ 失败隔离: {summary}")
+
+
+if __name__ == "__main__":
+    print("🧪 测试分句流水线TTS...")
+    test_streaming_sentence_split()
+    test_short_sentences_are_merged()
+    test_segments_are_ordered_and_overlap_generation()
+    test_failed_segment_does_not_block_others()
+    print("🎉 所有测试通过")
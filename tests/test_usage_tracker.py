@@ -0,0 +1,195 @@
+"""
+用量与费用统计测试
+验证用量按 (用户, 角色, 阶段, 模型) 聚合并计算费用、并发请求之间的用户归属互不干扰、
+定期写入SQLite时累加、平均每轮费用汇总，以及LLM网关按响应的usage记录token数、
+切换供应商后记在实际应答的模型名下、被取消的对冲请求也计入调用次数
+"""
+
+import asyncio
+import sys
+import os
+import tempfile
+from types import SimpleNamespace
+
+from aiohttp import web
+
+# 添加AI Agent路径
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'ai_agent'))
+
+from fake_llm import completion, run_with_fake_llm, start_fake_llm
+import services.llm_gateway as gateway_module
+from services.concurrency_limiter import UpstreamLimiter
+from services.llm_client import LLMClientPool
+from services.llm_gateway import LLMGateway, llm_gateway
+from services.llm_providers import ProviderRegistry
+from services.usage_tracker import UsageTracker
+
+
+PRICES = {
+    "big-model": {"prompt_per_1k": 1.0, "completion_per_1k": 2.0},
+    "tts-model": {"per_1k_chars": 0.5},
+    "image-model": {"per_image": 0.3}
+}
+
+
+def _usage(prompt_tokens: int, completion_tokens: int):
+    return SimpleNamespace(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+
+
+def test_aggregate_cost_and_attribution():
+    """并发请求各自绑定用户和角色，子任务的用量记在发起请求的用户名下，费用按模型单价计算"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        tracker = UsageTracker(db_path=os.path.join(tmp_dir, "usage.db"), prices=PRICES)
+
+        async def turn(user_id: str, character_id: str, reply_tokens: int):
+            tracker.begin_turn(user_id, character_id)
+
+            async def branch(stage):
+                await asyncio.sleep(0.01)
+                tracker.record_llm(stage, "big-model", _usage(1000, reply_tokens))
+
+            await asyncio.gather(branch("cot"), branch("reply"))
+            tracker.record_tts(200, "tts-model")
+
+        async def run():
+            await asyncio.gather(turn("alice", "xiyang", 500), turn("bob", "meiyang", 100))
+            tracker.begin_turn("alice", "xiyang")
+            tracker.record_image("image-model")
+
+        asyncio.run(run())
+
+        by_user = {row["user_id"]: row for row in tracker.query(["user_id"])}
+        by_stage = {row["stage"]: row for row in tracker.query(["stage"], user_id="alice")}
+
+    assert by_user["alice"]["turns"] == 2
+    assert by_user["alice"]["prompt_tokens"] == 2000
+    assert by_user["alice"]["completion_tokens"] == 1000
+    assert by_user["bob"]["completion_tokens"] == 200
+    # alice: 2 × (1000输入 × 1.0 + 500输出 × 2.0)/1000 + 200字符 × 0.5/1000 + 1张图 × 0.3
+    assert by_user["alice"]["cost"] == round(4.0 + 0.1 + 0.3, 6)
+    assert by_stage["tts"]["tts_characters"] == 200
+    assert by_stage["image"]["images"] == 1
+    assert by_stage["cot"]["calls"] == 1
+    print(f"✅ 按用户聚合: alice {by_user['alice']['cost']}元, bob {by_user['bob']['cost']}元")
+
+
+def test_flush_accumulates_and_summary():
+    """多次写入SQLite时累加，汇总给出平均每轮用量和按费用排序的阶段"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = os.path.join(tmp_dir, "usage.db")
+        tracker = UsageTracker(db_path=db_path, prices=PRICES)
+
+        async def run():
+            for _ in range(2):
+                tracker.begin_turn("alice", "xiyang")
+                tracker.record_llm("expand", "fast-model", _usage(100, 20))
+                tracker.record_llm("reply", "big-model", _usage(800, 60))
+                assert tracker.flush() == 3
+
+        asyncio.run(run())
+        restarted = UsageTracker(db_path=db_path, prices=PRICES)
+        summary = restarted.summary(user_id="alice")
+
+    assert summary["totals"]["turns"] == 2
+    assert summary["totals"]["total_tokens"] == 2 * (120 + 860)
+    assert summary["per_turn"]["tokens"] == 980
+    assert summary["stages"][0]["stage"] == "reply"  # 费用最高的阶段排在最前
+    assert summary["stages"][1]["cost"] == 0  # 未配置单价的模型只统计用量
+    assert tracker.get_stats()["flushes"] == 2
+    print(f"✅ 每轮用量: {summary['per_turn']}")
+
+
+def test_gateway_records_usage():
+    """LLM网关按响应的usage记录阶段、模型和token数"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        tracker = UsageTracker(db_path=os.path.join(tmp_dir, "usage.db"), prices=PRICES)
+
+        async def run():
+            original_tracker = gateway_module.usage_tracker
+            gateway_module.usage_tracker = tracker
+            try:
+                tracker.bind("alice", "lanyang")
+                await llm_gateway.chat_completion(task="expand", messages=[{"role": "user", "content": "血压高"}])
+            finally:
+                gateway_module.usage_tracker = original_tracker
+
+        run_with_fake_llm(lambda body: completion(body["model"], "高血压\n饮食", usage=(42, 7)), run)
+        rows = tracker.query(["user_id", "character_id", "stage", "model"])
+
+    assert len(rows) == 1
+    row = rows[0]
+    assert (row["user_id"], row["character_id"], row["stage"]) == ("alice", "lanyang", "expand")
+    assert row["model"] == llm_gateway.task_model("expand")
+    assert (row["prompt_tokens"], row["completion_tokens"]) == (42, 7)
+    print(f"✅ 网关记录用量: {row}")
+
+
+def test_failover_and_cancelled_hedge_usage():
+    """切换到备用供应商时用量记在备用供应商实际使用的模型名下；对冲请求胜出时，被取消的请求也计入调用次数"""
+    slow_requests = {"count": 0}
+
+    async def primary(body):
+        content = body["messages"][-1]["content"]
+        if content == "切换":
+            return web.json_response({"error": {"message": "status 503"}}, status=503)
+        if content == "慢":
+            slow_requests["count"] += 1
+            if slow_requests["count"] == 1:
+                await asyncio.sleep(0.5)
+        return completion(body["model"], "高血压\n饮食", usage=(42, 7))
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        tracker = UsageTracker(db_path=os.path.join(tmp_dir, "usage.db"), prices=PRICES)
+
+        async def run():
+            primary_runner, primary_url = await start_fake_llm(primary)
+            backup_runner, backup_url = await start_fake_llm(
+                lambda body: completion(body["model"], "备用", usage=(30, 3))
+            )
+            pool = LLMClientPool(max_retries=0)
+            gateway = LLMGateway(
+                registry=ProviderRegistry([
+                    {"name": "primary", "api_key": "key-a", "base_url": primary_url},
+                    {"name": "backup", "api_key": "key-b", "base_url": backup_url, "models": {"*": "backup-model"}}
+                ], client_pool=pool),
+                limiter=UpstreamLimiter("llm", max_in_flight=10, max_queue=10, max_queue_wait=5),
+                max_retries=0,
+                hedge_enabled=True,
+                hedge_min_samples=20,
+                hedge_min_delay=0.05
+            )
+            original_tracker = gateway_module.usage_tracker
+            gateway_module.usage_tracker = tracker
+            try:
+                tracker.bind("alice", "lanyang")
+                await gateway.chat_completion(task="expand", model="qwen-test", messages=[{"role": "user", "content": "切换"}])
+                for _ in range(20):
+                    await gateway.chat_completion(task="route", model="qwen-test", messages=[{"role": "user", "content": "快"}])
+                # 对冲等待时间按 (任务, 模型) 统计，慢请求与建立基线的请求属于同一任务
+                await gateway.chat_completion(task="route", model="qwen-test", messages=[{"role": "user", "content": "慢"}])
+                return gateway.get_stats()
+            finally:
+                gateway_module.usage_tracker = original_tracker
+                await pool.aclose()
+                await primary_runner.cleanup()
+                await backup_runner.cleanup()
+
+        stats = asyncio.run(run())
+        rows = {row["stage"]: row for row in tracker.query(["stage", "model"])}
+
+    assert stats["failovers"] == 1 and stats["hedges_fired"] == 1
+    assert rows["expand"]["model"] == "backup-model"
+    assert (rows["expand"]["prompt_tokens"], rows["expand"]["completion_tokens"]) == (30, 3)
+    assert rows["route"]["model"] == "qwen-test"
+    assert rows["route"]["calls"] == 22  # 20次基线请求，加上胜出的对冲请求和被取消的原请求
+    assert (rows["route"]["prompt_tokens"], rows["route"]["completion_tokens"]) == (42 * 21, 7 * 21)
+    print(f"✅ 切换供应商和对冲请求的用量: {rows['expand']}, {rows['route']}")
+
+
+if __name__ == "__main__":
+    print("🧪 测试用量与费用统计...")
+    test_aggregate_cost_and_attribution()
+    test_flush_accumulates_and_summary()
+    test_gateway_records_usage()
+    test_failover_and_cancelled_hedge_usage()
+    print("🎉 所有测试通过")
@@ -4,6 +4,7 @@ AI Agent语音功能测试脚本
 测试ASR（语音识别）和TTS（文字转语音）功能
 """
 
+import asyncio
 import sys
 import os
 sys.path.append(os.path.join(os.path.dirname(__file__), 'ai_agent'))
@@ -39,7 +40,7 @@ def test_voice_conversation():
     
     # AI Agent处理并生成回复
     try:
-        response = xiyang_agent.generate_response(elder_voice_text)
+        response = asyncio.run(xiyang_agent.generate_response(elder_voice_text))
         ai_response_text = response.get('response', '抱歉，我无法回应')
         
         print(f"🐑 喜羊羊文字回复：{ai_response_text[:100]}...")